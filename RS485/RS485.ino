@@ -1,5 +1,7 @@
 #include <ModbusMaster.h>
 #include <SoftwareSerial.h>
+#include <util/crc16.h>
+#include "maf_lut.h" // LUT luu luong theo analogRead, sinh boi calibration.py header
 
 ModbusMaster node;
 String rxLine; 
@@ -13,32 +15,32 @@ const int RS485_RE = 9;
 
 // Sensor 1 
 const int vgPin_1 = A0; 
-float vgVoltage_1 = 0.0; 
-float airFlow_1 = 0.0; // Luu luong khong khi (g/s)
-int MAX_VALUE_1 = 120; // Thay doi gia tri max cua cam bien 
+int adcRaw_1 = 0; // Gia tri analogRead (0..1023)
+// Luu luong (g/s) = FLOW1_LUT[adcRaw_1] / 100. Doi gia tri max cam bien: sinh lai maf_lut.h (--max1)
 
 // Sensor 2
 const int vgPin_2 = A1; 
-float vgVoltage_2 = 0.0; 
-float airFlow_2 = 0.0; // Luu luong khong khi (g/s)
-int MAX_VALUE_2 = 120; // Thay doi gia tri max cua cam bien 
+int adcRaw_2 = 0;
+// Luu luong (g/s) = FLOW2_LUT[adcRaw_2] / 100, theo duong cong hieu chuan (--calib)
 
 // Frequency control parameters
 static const float SCALE = 166.6667f; // PWM 
 static const int MAX_RPM = 3000;
-int hzTarget = 0;
+float hzTarget = 0; // Hz dat (cho phep so le, vd 23.45 tu vong PID cua host)
 bool inverterRunning = false;
 bool stopHold = false;
 unsigned long lastAutoIncMs = 0;
+unsigned long statusSeq = 0; // So thu tu STATUS (host phat hien mat goi)
 
 // ------------------------- Modbus TX dir --------------------------------
 void preTransmission() { digitalWrite(RS485_DE, HIGH); digitalWrite(RS485_RE, HIGH); }
 void postTransmission(){ digitalWrite(RS485_DE, LOW);  digitalWrite(RS485_RE, LOW);  }
 
 // Write frequency (Hz) down to the inverter
-bool writeFreqHz(int hz) {
+bool writeFreqHz(float hz) {
   if (hz < 0) hz = 0;
   if (hz > 60) hz = 60;
+  hz = roundf(hz * 100.0f) / 100.0f; // do phan giai 0.01 Hz
   uint16_t raw = (uint16_t) lroundf(hz * SCALE);
   uint8_t res = node.writeSingleRegister(0x2000, raw);
   if (res == node.ku8MBSuccess) {
@@ -57,20 +59,25 @@ bool cmdStop() {
   return node.writeSingleRegister(0x1000, 0x0005) == node.ku8MBSuccess; 
 }
 
-int hzToRpm(int hz) {
-  return (hz * MAX_RPM) / 60;
+int hzToRpm(float hz) {
+  return (int) lroundf(hz * MAX_RPM / 60.0f);
+}
+
+// Hz nguyen in nhu cu (hz=23), so le in 2 chu so (hz=23.45)
+void printHz(float hz) {
+  if (hz == (float)(long)hz) Serial.print((long)hz);
+  else Serial.print(hz, 2);
 }
 
 void hzIncrease(int fHz, int secondsF){
-  vgVoltage_1 = analogRead(vgPin_1) * (5.0 / 1023.0);
-  vgVoltage_2 = analogRead(vgPin_2) * (5.0 / 1023.0);
-  airFlow_1 = (vgVoltage_1 - 0.5) * (MAX_VALUE_1 / (4.5 - 0.5));
-  airFlow_2 = (vgVoltage_2 - 0.5) * (MAX_VALUE_2 / (4.5 - 0.5));
+  // Chi doc ADC; doi sang dien ap / luu luong luc gui STATUS
+  adcRaw_1 = analogRead(vgPin_1);
+  adcRaw_2 = analogRead(vgPin_2);
   if (inverterRunning && !stopHold && (millis() - lastAutoIncMs >= secondsF)) {
     lastAutoIncMs = millis();
     if (hzTarget < 60) {
       writeFreqHz(hzTarget + fHz);
-      Serial.print("OK AUTO_INC "); Serial.println(hzTarget);
+      Serial.print("OK AUTO_INC "); printHz(hzTarget); Serial.println();
     }
   }
 }
@@ -78,14 +85,16 @@ void hzIncrease(int fHz, int secondsF){
 // Display send status
 void sendStatus() {
   int rpm = hzToRpm(hzTarget);
-  Serial.print("STATUS hz=");   Serial.print(hzTarget);
+  Serial.print("STATUS hz=");   printHz(hzTarget);
   Serial.print(" rpm=");        Serial.print(rpm);
   Serial.print(" run=");        Serial.print(inverterRunning ? 1 : 0);
   Serial.print(" hold=");       Serial.print(stopHold ? 1 : 0);
-  Serial.print(" flow1=");      Serial.print(airFlow_1);
-  Serial.print(" volt1=");      Serial.print(vgVoltage_1);
-  Serial.print(" flow2=");      Serial.print(airFlow_2);
-  Serial.print(" volt2=");      Serial.println(vgVoltage_2);
+  Serial.print(" flow1=");      Serial.print(flowLut(FLOW1_LUT, adcRaw_1) / (float)FLOW_LUT_SCALE);
+  Serial.print(" volt1=");      Serial.print(adcRaw_1 * (5.0 / 1023.0));
+  Serial.print(" flow2=");      Serial.print(flowLut(FLOW2_LUT, adcRaw_2) / (float)FLOW_LUT_SCALE);
+  Serial.print(" volt2=");      Serial.print(adcRaw_2 * (5.0 / 1023.0));
+  Serial.print(" seq=");        Serial.print(statusSeq++);
+  Serial.print(" t=");          Serial.println(millis());
 }
 
 // ======================= MAIN =========================
@@ -114,77 +123,40 @@ void setup() {
   sendStatus();
 }
 
-void loop() {
+// Lenh da nhan du dong, cho thuc thi (moi vong loop chay 1 lenh de van quet duoc '!')
+const int CMD_QUEUE = 8;
+String cmdQueue[CMD_QUEUE];
+int cmdHead = 0, cmdCount = 0;
+bool estopPending = false;
+
+// Dung khan cap: STOP + 0 Hz, bo moi lenh dang cho
+void emergencyStop() {
+  bool ok = cmdStop();
+  inverterRunning = false;
+  writeFreqHz(0);
+  Serial.println(ok ? "OK ESTOP" : "ERR ESTOP_FAIL");
+}
+
+// Doc het byte dang co: gom dong vao hang doi; ky tu '!' = dung khan cap, vuot len truoc hang doi
+void pollSerial() {
   while (Serial.available()) {
     char c = (char)Serial.read();
+    if (c == '!') {
+      estopPending = true;
+      cmdCount = 0;
+      rxLine = "";
+      continue;
+    }
     if (c == '\r') continue;
     if (c == '\n') {
       rxLine.trim();
       if (rxLine.length() > 0) {
-        // Command process
-        rxLine.toUpperCase();
-
-        // ----  Command Run -------
-        if (rxLine == "RUN") {
-          if (cmdRun()) { inverterRunning = true; Serial.println("OK RUN"); }
-          else Serial.println("ERR RUN_FAIL");
-
-        } 
-        
-        // ----  Command Stop -------
-        else if (rxLine == "STOP") {
-          if (cmdStop()) { inverterRunning = false; writeFreqHz(0); Serial.println("OK STOP"); }
-          else Serial.println("ERR STOP_FAIL");
-
-        } 
-        
-        // ----  Command Set Hz -------
-        else if (rxLine.startsWith("SET_HZ")) {
-          int spaceIdx = rxLine.indexOf(' ');
-          if (spaceIdx > 0) {
-            int val = rxLine.substring(spaceIdx + 1).toInt();
-            if (val < 0 || val > 60) {
-              Serial.println("ERR HZ_RANGE(0..60)");
-            } else {
-              if (writeFreqHz(val)) Serial.println("OK SET_HZ");
-              else Serial.println("ERR SET_FAIL");
-            }
-          } else {
-            Serial.println("ERR ARG_REQUIRED");
-          }
-
-        } 
-        
-        // ----  Command Reset -------
-        else if (rxLine == "RESET") {
-          inverterRunning = false;
-          if (writeFreqHz(0)) Serial.println("OK RESET");
-          else Serial.println("ERR RESET_FAIL");
-
-        } 
-        
-        // ----  Command Status -------
-        else if (rxLine == "STATUS") {
-          sendStatus();
-
-        } 
-        
-        // ----  Command Hold Stop -------
-        else if (rxLine.startsWith("HOLD_STOP")) {
-          // HOLD_STOP ON|OFF
-          int sp = rxLine.indexOf(' ');
-          if (sp > 0) {
-            String v = rxLine.substring(sp + 1);
-            v.trim();
-            if (v == "ON")  { stopHold = true;  Serial.println("OK HOLD_STOP ON"); }
-            else if (v == "OFF") { stopHold = false; Serial.println("OK HOLD_STOP OFF"); }
-            else Serial.println("ERR HOLD_ARG(ON|OFF)");
-          } else {
-            Serial.println("ERR ARG_REQUIRED");
-          }
-
+        if (cmdCount < CMD_QUEUE) {
+          rxLine.toUpperCase();
+          cmdQueue[(cmdHead + cmdCount) % CMD_QUEUE] = rxLine;
+          cmdCount++;
         } else {
-          Serial.println("ERR UNKNOWN_CMD");
+          Serial.println("ERR BUSY");
         }
       }
       rxLine = ""; // clear line 
@@ -193,6 +165,238 @@ void loop() {
       if (rxLine.length() > 100) rxLine = ""; 
     }
   }
+}
+
+// Trung binh tren thiet bi: lay mau A0/A1 lien tuc trong ms mili giay, tra 1 dong AVG
+// (mean + min/max dien ap, so mau n). Van quet Serial de '!' dung khan cap giua cua so.
+const unsigned long AVG_MAX_MS = 5000; // 5 s * ~4000 mau/s: tong LUT van vua long
+
+void sendAverage(unsigned long ms) {
+  unsigned long n = 0, sum1 = 0, sum2 = 0;
+  long fsum1 = 0, fsum2 = 0;
+  int min1 = 1023, max1 = 0, min2 = 1023, max2 = 0;
+  unsigned long t0 = millis();
+  while (millis() - t0 < ms) {
+    adcRaw_1 = analogRead(vgPin_1);
+    adcRaw_2 = analogRead(vgPin_2);
+    sum1 += adcRaw_1;  fsum1 += flowLut(FLOW1_LUT, adcRaw_1);
+    sum2 += adcRaw_2;  fsum2 += flowLut(FLOW2_LUT, adcRaw_2);
+    if (adcRaw_1 < min1) min1 = adcRaw_1;
+    if (adcRaw_1 > max1) max1 = adcRaw_1;
+    if (adcRaw_2 < min2) min2 = adcRaw_2;
+    if (adcRaw_2 > max2) max2 = adcRaw_2;
+    n++;
+    pollSerial();
+    if (estopPending) { Serial.println("ERR AVG_ABORT"); return; }
+  }
+  const float k = 5.0 / 1023.0;
+  Serial.print("AVG hz=");      printHz(hzTarget);
+  Serial.print(" rpm=");        Serial.print(hzToRpm(hzTarget));
+  Serial.print(" run=");        Serial.print(inverterRunning ? 1 : 0);
+  Serial.print(" hold=");       Serial.print(stopHold ? 1 : 0);
+  Serial.print(" flow1=");      Serial.print(fsum1 / (float)n / FLOW_LUT_SCALE, 3);
+  Serial.print(" volt1=");      Serial.print(sum1 * k / n, 4);
+  Serial.print(" flow2=");      Serial.print(fsum2 / (float)n / FLOW_LUT_SCALE, 3);
+  Serial.print(" volt2=");      Serial.print(sum2 * k / n, 4);
+  Serial.print(" n=");          Serial.print(n);
+  Serial.print(" ms=");         Serial.print(millis() - t0);
+  Serial.print(" v1min=");      Serial.print(min1 * k, 3);
+  Serial.print(" v1max=");      Serial.print(max1 * k, 3);
+  Serial.print(" v2min=");      Serial.print(min2 * k, 3);
+  Serial.print(" v2max=");      Serial.print(max2 * k, 3);
+  Serial.print(" seq=");        Serial.print(statusSeq++);
+  Serial.print(" t=");          Serial.println(millis());
+}
+
+// ------------------------- BURST: ADC toc do cao theo Timer1 --------------------------
+// Timer1 CTC tao nhip, Compare Match B tu kich ADC (auto trigger), ISR ADC cat mau vao RAM.
+// Mau 10 bit dong goi 1.25 byte: 8 bit thap o burstLo[i], 2 bit cao (4 mau/byte) o burstHi[i/4].
+// Tra ve: "BURST n=.. rate=.. ch=.. len=.. crc=.. t=..\r\n" + len byte nhi phan + "\r\n"
+const int BURST_MAX = 640;          // 800 byte RAM
+const long BURST_RATE_MIN = 50;     // Timer1 clk/8: OCR1A <= 65535
+const long BURST_RATE_MAX = 9000;   // ADC prescaler 128: ~9.6k chuyen doi/s
+uint8_t burstLo[BURST_MAX];
+uint8_t burstHi[BURST_MAX / 4];
+volatile int burstIdx = 0;
+volatile bool burstDone = false;
+int burstN = 0;
+
+EMPTY_INTERRUPT(TIMER1_COMPB_vect); // chi de xoa co OCF1B; ADC kich theo suon len cua co nay
+
+ISR(ADC_vect) {
+  uint8_t lo = ADCL;                // doc ADCL truoc ADCH
+  uint8_t hi = ADCH;
+  int i = burstIdx;
+  if (i >= burstN) return;
+  burstLo[i] = lo;
+  burstHi[i >> 2] |= hi << ((i & 3) * 2);
+  burstIdx = ++i;
+  if (i >= burstN) {
+    ADCSRA &= ~_BV(ADATE);          // du mau: ngung tu kich
+    burstDone = true;
+  }
+}
+
+void sendBurst(int n, long rate, int ch) {
+  uint16_t top = (uint16_t)(F_CPU / 8 / rate - 1);
+  float realRate = (float)F_CPU / 8 / (top + 1.0f);
+  memset(burstHi, 0, sizeof(burstHi));
+  // Luu cau hinh Timer1 / ADC cua Arduino core de tra lai sau khi chup
+  uint8_t tA = TCCR1A, tB = TCCR1B, tM = TIMSK1;
+  uint16_t oA = OCR1A, oB = OCR1B;
+  uint8_t aA = ADCSRA, aB = ADCSRB, mux = ADMUX;
+  burstN = n; burstIdx = 0; burstDone = false;
+  unsigned long t0 = millis();
+
+  noInterrupts();
+  TCCR1B = 0; TCCR1A = 0; TCNT1 = 0;
+  OCR1A = top; OCR1B = top;
+  ADMUX = _BV(REFS0) | ((ch == 1 ? vgPin_1 : vgPin_2) - A0);          // AVcc, kenh A0/A1
+  ADCSRB = _BV(ADTS2) | _BV(ADTS0);                                    // kich: Timer1 Compare Match B
+  ADCSRA = _BV(ADEN) | _BV(ADATE) | _BV(ADIE) | _BV(ADIF) | 0x07;      // prescaler 128
+  TIFR1 = _BV(OCF1B);
+  TIMSK1 = _BV(OCIE1B);
+  TCCR1B = _BV(WGM12) | _BV(CS11);                                     // CTC (TOP = OCR1A), clk/8
+  interrupts();
+
+  unsigned long limit = (unsigned long)n * 1000UL / rate + 100;
+  bool aborted = false;
+  while (!burstDone) {
+    pollSerial();                   // '!' van dung khan cap duoc giua luc chup
+    if (estopPending || millis() - t0 > limit) { aborted = true; break; }
+  }
+
+  noInterrupts();
+  TIMSK1 = tM; TCCR1B = 0; TCCR1A = tA; OCR1A = oA; OCR1B = oB; TCNT1 = 0; TCCR1B = tB;
+  ADCSRA = aA; ADCSRB = aB; ADMUX = mux;
+  interrupts();
+  if (aborted) { Serial.println("ERR BURST_ABORT"); return; }
+
+  int hiLen = (n + 3) / 4;
+  uint16_t crc = 0;                 // CRC-16/XMODEM (binascii.crc_hqx(data, 0) tren host)
+  for (int i = 0; i < n; i++) crc = _crc_xmodem_update(crc, burstLo[i]);
+  for (int i = 0; i < hiLen; i++) crc = _crc_xmodem_update(crc, burstHi[i]);
+  Serial.print("BURST n=");   Serial.print(n);
+  Serial.print(" rate=");     Serial.print(realRate, 2);
+  Serial.print(" ch=");       Serial.print(ch);
+  Serial.print(" len=");      Serial.print(n + hiLen);
+  Serial.print(" crc=");      Serial.print(crc);
+  Serial.print(" t=");        Serial.println(t0);
+  Serial.write(burstLo, n);
+  Serial.write(burstHi, hiLen);
+  Serial.println();
+}
+
+void handleCommand(String &cmd) {
+  // ----  Command Run -------
+  if (cmd == "RUN") {
+    if (cmdRun()) { inverterRunning = true; Serial.println("OK RUN"); }
+    else Serial.println("ERR RUN_FAIL");
+
+  } 
+  
+  // ----  Command Stop -------
+  else if (cmd == "STOP") {
+    if (cmdStop()) { inverterRunning = false; writeFreqHz(0); Serial.println("OK STOP"); }
+    else Serial.println("ERR STOP_FAIL");
+
+  } 
+  
+  // ----  Command Set Hz -------
+  else if (cmd.startsWith("SET_HZ")) {
+    int spaceIdx = cmd.indexOf(' ');
+    if (spaceIdx > 0) {
+      float val = cmd.substring(spaceIdx + 1).toFloat();
+      if (val < 0 || val > 60) {
+        Serial.println("ERR HZ_RANGE(0..60)");
+      } else {
+        if (writeFreqHz(val)) Serial.println("OK SET_HZ");
+        else Serial.println("ERR SET_FAIL");
+      }
+    } else {
+      Serial.println("ERR ARG_REQUIRED");
+    }
+
+  } 
+  
+  // ----  Command Reset -------
+  else if (cmd == "RESET") {
+    inverterRunning = false;
+    if (writeFreqHz(0)) Serial.println("OK RESET");
+    else Serial.println("ERR RESET_FAIL");
+
+  } 
+  
+  // ----  Command Status -------
+  else if (cmd == "STATUS") {
+    sendStatus();
+
+  } 
+  
+  // ----  Command Average -------
+  else if (cmd.startsWith("AVG")) {
+    // AVG <ms>: lay mau lien tuc ms mili giay roi tra 1 dong AVG
+    int sp = cmd.indexOf(' ');
+    if (sp > 0) {
+      long ms = cmd.substring(sp + 1).toInt();
+      if (ms < 1 || ms > (long)AVG_MAX_MS) Serial.println("ERR AVG_RANGE(1..5000)");
+      else sendAverage((unsigned long)ms);
+    } else {
+      Serial.println("ERR ARG_REQUIRED");
+    }
+
+  }
+
+  // ----  Command Burst -------
+  else if (cmd.startsWith("BURST")) {
+    // BURST <n> <rate> [1|2]: chup n mau kenh 1/2 (mac dinh 2 = MAF) o rate Hz
+    int a = cmd.indexOf(' ');
+    int b = a > 0 ? cmd.indexOf(' ', a + 1) : -1;
+    int c = b > 0 ? cmd.indexOf(' ', b + 1) : -1;
+    if (b < 0) {
+      Serial.println("ERR ARG_REQUIRED");
+    } else {
+      long n = cmd.substring(a + 1, b).toInt();
+      long rate = (c > 0 ? cmd.substring(b + 1, c) : cmd.substring(b + 1)).toInt();
+      long ch = c > 0 ? cmd.substring(c + 1).toInt() : 2;
+      if (n < 1 || n > BURST_MAX) Serial.println("ERR BURST_N(1..640)");
+      else if (rate < BURST_RATE_MIN || rate > BURST_RATE_MAX) Serial.println("ERR BURST_RATE(50..9000)");
+      else if (ch != 1 && ch != 2) Serial.println("ERR BURST_CH(1|2)");
+      else sendBurst((int)n, rate, (int)ch);
+    }
+
+  }
+
+  // ----  Command Hold Stop -------
+  else if (cmd.startsWith("HOLD_STOP")) {
+    // HOLD_STOP ON|OFF
+    int sp = cmd.indexOf(' ');
+    if (sp > 0) {
+      String v = cmd.substring(sp + 1);
+      v.trim();
+      if (v == "ON")  { stopHold = true;  Serial.println("OK HOLD_STOP ON"); }
+      else if (v == "OFF") { stopHold = false; Serial.println("OK HOLD_STOP OFF"); }
+      else Serial.println("ERR HOLD_ARG(ON|OFF)");
+    } else {
+      Serial.println("ERR ARG_REQUIRED");
+    }
+
+  } else {
+    Serial.println("ERR UNKNOWN_CMD");
+  }
+}
+
+void loop() {
+  pollSerial();
+  if (estopPending) {
+    estopPending = false;
+    emergencyStop();
+  } else if (cmdCount > 0) {
+    String cmd = cmdQueue[cmdHead];
+    cmdHead = (cmdHead + 1) % CMD_QUEUE;
+    cmdCount--;
+    handleCommand(cmd);
+  }
 
   // Tang tang so 
   hzIncrease(1, 2000);
@@ -0,0 +1,158 @@
+// Tu dong sinh boi calibration.py header -- KHONG sua tay.
+// Cam bien 1 (ABB): tuyen tinh 0.5..4.5 V | Cam bien 2 (MAF): tuyen tinh 0.5..4.5 V, MAX=120
+// Don vi: 0.01 g/s | index = analogRead() (0..1023)
+#ifndef MAF_LUT_H
+#define MAF_LUT_H
+
+#include <stdint.h>
+#ifdef __AVR__
+#include <avr/pgmspace.h>
+#else
+#define PROGMEM
+#define pgm_read_word(addr) (*(const uint16_t *)(addr))
+#endif
+
+#define FLOW_LUT_SIZE  1024
+#define FLOW_LUT_SCALE 100
+
+static const int16_t FLOW1_LUT[FLOW_LUT_SIZE] PROGMEM = {
+  -1500, -1485, -1471, -1456, -1441, -1427, -1412, -1397, -1383, -1368, -1353, -1339, -1324, -1309, -1295, -1280,
+  -1265, -1251, -1236, -1221, -1207, -1192, -1177, -1163, -1148, -1133, -1119, -1104, -1089, -1075, -1060, -1045,
+  -1031, -1016, -1001, -987, -972, -957, -943, -928, -913, -899, -884, -870, -855, -840, -826, -811,
+  -796, -782, -767, -752, -738, -723, -708, -694, -679, -664, -650, -635, -620, -606, -591, -576,
+  -562, -547, -532, -518, -503, -488, -474, -459, -444, -430, -415, -400, -386, -371, -356, -342,
+  -327, -312, -298, -283, -268, -254, -239, -224, -210, -195, -180, -166, -151, -136, -122, -107,
+  -92, -78, -63, -48, -34, -19, -4, 10, 25, 40, 54, 69, 84, 98, 113, 128,
+  142, 157, 172, 186, 201, 216, 230, 245, 260, 274, 289, 304, 318, 333, 348, 362,
+  377, 391, 406, 421, 435, 450, 465, 479, 494, 509, 523, 538, 553, 567, 582, 597,
+  611, 626, 641, 655, 670, 685, 699, 714, 729, 743, 758, 773, 787, 802, 817, 831,
+  846, 861, 875, 890, 905, 919, 934, 949, 963, 978, 993, 1007, 1022, 1037, 1051, 1066,
+  1081, 1095, 1110, 1125, 1139, 1154, 1169, 1183, 1198, 1213, 1227, 1242, 1257, 1271, 1286, 1301,
+  1315, 1330, 1345, 1359, 1374, 1389, 1403, 1418, 1433, 1447, 1462, 1477, 1491, 1506, 1521, 1535,
+  1550, 1565, 1579, 1594, 1609, 1623, 1638, 1652, 1667, 1682, 1696, 1711, 1726, 1740, 1755, 1770,
+  1784, 1799, 1814, 1828, 1843, 1858, 1872, 1887, 1902, 1916, 1931, 1946, 1960, 1975, 1990, 2004,
+  2019, 2034, 2048, 2063, 2078, 2092, 2107, 2122, 2136, 2151, 2166, 2180, 2195, 2210, 2224, 2239,
+  2254, 2268, 2283, 2298, 2312, 2327, 2342, 2356, 2371, 2386, 2400, 2415, 2430, 2444, 2459, 2474,
+  2488, 2503, 2518, 2532, 2547, 2562, 2576, 2591, 2606, 2620, 2635, 2650, 2664, 2679, 2694, 2708,
+  2723, 2738, 2752, 2767, 2782, 2796, 2811, 2826, 2840, 2855, 2870, 2884, 2899, 2913, 2928, 2943,
+  2957, 2972, 2987, 3001, 3016, 3031, 3045, 3060, 3075, 3089, 3104, 3119, 3133, 3148, 3163, 3177,
+  3192, 3207, 3221, 3236, 3251, 3265, 3280, 3295, 3309, 3324, 3339, 3353, 3368, 3383, 3397, 3412,
+  3427, 3441, 3456, 3471, 3485, 3500, 3515, 3529, 3544, 3559, 3573, 3588, 3603, 3617, 3632, 3647,
+  3661, 3676, 3691, 3705, 3720, 3735, 3749, 3764, 3779, 3793, 3808, 3823, 3837, 3852, 3867, 3881,
+  3896, 3911, 3925, 3940, 3955, 3969, 3984, 3999, 4013, 4028, 4043, 4057, 4072, 4087, 4101, 4116,
+  4130, 4145, 4160, 4174, 4189, 4204, 4218, 4233, 4248, 4262, 4277, 4292, 4306, 4321, 4336, 4350,
+  4365, 4380, 4394, 4409, 4424, 4438, 4453, 4468, 4482, 4497, 4512, 4526, 4541, 4556, 4570, 4585,
+  4600, 4614, 4629, 4644, 4658, 4673, 4688, 4702, 4717, 4732, 4746, 4761, 4776, 4790, 4805, 4820,
+  4834, 4849, 4864, 4878, 4893, 4908, 4922, 4937, 4952, 4966, 4981, 4996, 5010, 5025, 5040, 5054,
+  5069, 5084, 5098, 5113, 5128, 5142, 5157, 5172, 5186, 5201, 5216, 5230, 5245, 5260, 5274, 5289,
+  5304, 5318, 5333, 5348, 5362, 5377, 5391, 5406, 5421, 5435, 5450, 5465, 5479, 5494, 5509, 5523,
+  5538, 5553, 5567, 5582, 5597, 5611, 5626, 5641, 5655, 5670, 5685, 5699, 5714, 5729, 5743, 5758,
+  5773, 5787, 5802, 5817, 5831, 5846, 5861, 5875, 5890, 5905, 5919, 5934, 5949, 5963, 5978, 5993,
+  6007, 6022, 6037, 6051, 6066, 6081, 6095, 6110, 6125, 6139, 6154, 6169, 6183, 6198, 6213, 6227,
+  6242, 6257, 6271, 6286, 6301, 6315, 6330, 6345, 6359, 6374, 6389, 6403, 6418, 6433, 6447, 6462,
+  6477, 6491, 6506, 6521, 6535, 6550, 6565, 6579, 6594, 6609, 6623, 6638, 6652, 6667, 6682, 6696,
+  6711, 6726, 6740, 6755, 6770, 6784, 6799, 6814, 6828, 6843, 6858, 6872, 6887, 6902, 6916, 6931,
+  6946, 6960, 6975, 6990, 7004, 7019, 7034, 7048, 7063, 7078, 7092, 7107, 7122, 7136, 7151, 7166,
+  7180, 7195, 7210, 7224, 7239, 7254, 7268, 7283, 7298, 7312, 7327, 7342, 7356, 7371, 7386, 7400,
+  7415, 7430, 7444, 7459, 7474, 7488, 7503, 7518, 7532, 7547, 7562, 7576, 7591, 7606, 7620, 7635,
+  7650, 7664, 7679, 7694, 7708, 7723, 7738, 7752, 7767, 7782, 7796, 7811, 7826, 7840, 7855, 7870,
+  7884, 7899, 7913, 7928, 7943, 7957, 7972, 7987, 8001, 8016, 8031, 8045, 8060, 8075, 8089, 8104,
+  8119, 8133, 8148, 8163, 8177, 8192, 8207, 8221, 8236, 8251, 8265, 8280, 8295, 8309, 8324, 8339,
+  8353, 8368, 8383, 8397, 8412, 8427, 8441, 8456, 8471, 8485, 8500, 8515, 8529, 8544, 8559, 8573,
+  8588, 8603, 8617, 8632, 8647, 8661, 8676, 8691, 8705, 8720, 8735, 8749, 8764, 8779, 8793, 8808,
+  8823, 8837, 8852, 8867, 8881, 8896, 8911, 8925, 8940, 8955, 8969, 8984, 8999, 9013, 9028, 9043,
+  9057, 9072, 9087, 9101, 9116, 9130, 9145, 9160, 9174, 9189, 9204, 9218, 9233, 9248, 9262, 9277,
+  9292, 9306, 9321, 9336, 9350, 9365, 9380, 9394, 9409, 9424, 9438, 9453, 9468, 9482, 9497, 9512,
+  9526, 9541, 9556, 9570, 9585, 9600, 9614, 9629, 9644, 9658, 9673, 9688, 9702, 9717, 9732, 9746,
+  9761, 9776, 9790, 9805, 9820, 9834, 9849, 9864, 9878, 9893, 9908, 9922, 9937, 9952, 9966, 9981,
+  9996, 10010, 10025, 10040, 10054, 10069, 10084, 10098, 10113, 10128, 10142, 10157, 10172, 10186, 10201, 10216,
+  10230, 10245, 10260, 10274, 10289, 10304, 10318, 10333, 10348, 10362, 10377, 10391, 10406, 10421, 10435, 10450,
+  10465, 10479, 10494, 10509, 10523, 10538, 10553, 10567, 10582, 10597, 10611, 10626, 10641, 10655, 10670, 10685,
+  10699, 10714, 10729, 10743, 10758, 10773, 10787, 10802, 10817, 10831, 10846, 10861, 10875, 10890, 10905, 10919,
+  10934, 10949, 10963, 10978, 10993, 11007, 11022, 11037, 11051, 11066, 11081, 11095, 11110, 11125, 11139, 11154,
+  11169, 11183, 11198, 11213, 11227, 11242, 11257, 11271, 11286, 11301, 11315, 11330, 11345, 11359, 11374, 11389,
+  11403, 11418, 11433, 11447, 11462, 11477, 11491, 11506, 11521, 11535, 11550, 11565, 11579, 11594, 11609, 11623,
+  11638, 11652, 11667, 11682, 11696, 11711, 11726, 11740, 11755, 11770, 11784, 11799, 11814, 11828, 11843, 11858,
+  11872, 11887, 11902, 11916, 11931, 11946, 11960, 11975, 11990, 12004, 12019, 12034, 12048, 12063, 12078, 12092,
+  12107, 12122, 12136, 12151, 12166, 12180, 12195, 12210, 12224, 12239, 12254, 12268, 12283, 12298, 12312, 12327,
+  12342, 12356, 12371, 12386, 12400, 12415, 12430, 12444, 12459, 12474, 12488, 12503, 12518, 12532, 12547, 12562,
+  12576, 12591, 12606, 12620, 12635, 12650, 12664, 12679, 12694, 12708, 12723, 12738, 12752, 12767, 12782, 12796,
+  12811, 12826, 12840, 12855, 12870, 12884, 12899, 12913, 12928, 12943, 12957, 12972, 12987, 13001, 13016, 13031,
+  13045, 13060, 13075, 13089, 13104, 13119, 13133, 13148, 13163, 13177, 13192, 13207, 13221, 13236, 13251, 13265,
+  13280, 13295, 13309, 13324, 13339, 13353, 13368, 13383, 13397, 13412, 13427, 13441, 13456, 13471, 13485, 13500
+};
+
+static const int16_t FLOW2_LUT[FLOW_LUT_SIZE] PROGMEM = {
+  -1500, -1485, -1471, -1456, -1441, -1427, -1412, -1397, -1383, -1368, -1353, -1339, -1324, -1309, -1295, -1280,
+  -1265, -1251, -1236, -1221, -1207, -1192, -1177, -1163, -1148, -1133, -1119, -1104, -1089, -1075, -1060, -1045,
+  -1031, -1016, -1001, -987, -972, -957, -943, -928, -913, -899, -884, -870, -855, -840, -826, -811,
+  -796, -782, -767, -752, -738, -723, -708, -694, -679, -664, -650, -635, -620, -606, -591, -576,
+  -562, -547, -532, -518, -503, -488, -474, -459, -444, -430, -415, -400, -386, -371, -356, -342,
+  -327, -312, -298, -283, -268, -254, -239, -224, -210, -195, -180, -166, -151, -136, -122, -107,
+  -92, -78, -63, -48, -34, -19, -4, 10, 25, 40, 54, 69, 84, 98, 113, 128,
+  142, 157, 172, 186, 201, 216, 230, 245, 260, 274, 289, 304, 318, 333, 348, 362,
+  377, 391, 406, 421, 435, 450, 465, 479, 494, 509, 523, 538, 553, 567, 582, 597,
+  611, 626, 641, 655, 670, 685, 699, 714, 729, 743, 758, 773, 787, 802, 817, 831,
+  846, 861, 875, 890, 905, 919, 934, 949, 963, 978, 993, 1007, 1022, 1037, 1051, 1066,
+  1081, 1095, 1110, 1125, 1139, 1154, 1169, 1183, 1198, 1213, 1227, 1242, 1257, 1271, 1286, 1301,
+  1315, 1330, 1345, 1359, 1374, 1389, 1403, 1418, 1433, 1447, 1462, 1477, 1491, 1506, 1521, 1535,
+  1550, 1565, 1579, 1594, 1609, 1623, 1638, 1652, 1667, 1682, 1696, 1711, 1726, 1740, 1755, 1770,
+  1784, 1799, 1814, 1828, 1843, 1858, 1872, 1887, 1902, 1916, 1931, 1946, 1960, 1975, 1990, 2004,
+  2019, 2034, 2048, 2063, 2078, 2092, 2107, 2122, 2136, 2151, 2166, 2180, 2195, 2210, 2224, 2239,
+  2254, 2268, 2283, 2298, 2312, 2327, 2342, 2356, 2371, 2386, 2400, 2415, 2430, 2444, 2459, 2474,
+  2488, 2503, 2518, 2532, 2547, 2562, 2576, 2591, 2606, 2620, 2635, 2650, 2664, 2679, 2694, 2708,
+  2723, 2738, 2752, 2767, 2782, 2796, 2811, 2826, 2840, 2855, 2870, 2884, 2899, 2913, 2928, 2943,
+  2957, 2972, 2987, 3001, 3016, 3031, 3045, 3060, 3075, 3089, 3104, 3119, 3133, 3148, 3163, 3177,
+  3192, 3207, 3221, 3236, 3251, 3265, 3280, 3295, 3309, 3324, 3339, 3353, 3368, 3383, 3397, 3412,
+  3427, 3441, 3456, 3471, 3485, 3500, 3515, 3529, 3544, 3559, 3573, 3588, 3603, 3617, 3632, 3647,
+  3661, 3676, 3691, 3705, 3720, 3735, 3749, 3764, 3779, 3793, 3808, 3823, 3837, 3852, 3867, 3881,
+  3896, 3911, 3925, 3940, 3955, 3969, 3984, 3999, 4013, 4028, 4043, 4057, 4072, 4087, 4101, 4116,
+  4130, 4145, 4160, 4174, 4189, 4204, 4218, 4233, 4248, 4262, 4277, 4292, 4306, 4321, 4336, 4350,
+  4365, 4380, 4394, 4409, 4424, 4438, 4453, 4468, 4482, 4497, 4512, 4526, 4541, 4556, 4570, 4585,
+  4600, 4614, 4629, 4644, 4658, 4673, 4688, 4702, 4717, 4732, 4746, 4761, 4776, 4790, 4805, 4820,
+  4834, 4849, 4864, 4878, 4893, 4908, 4922, 4937, 4952, 4966, 4981, 4996, 5010, 5025, 5040, 5054,
+  5069, 5084, 5098, 5113, 5128, 5142, 5157, 5172, 5186, 5201, 5216, 5230, 5245, 5260, 5274, 5289,
+  5304, 5318, 5333, 5348, 5362, 5377, 5391, 5406, 5421, 5435, 5450, 5465, 5479, 5494, 5509, 5523,
+  5538, 5553, 5567, 5582, 5597, 5611, 5626, 5641, 5655, 5670, 5685, 5699, 5714, 5729, 5743, 5758,
+  5773, 5787, 5802, 5817, 5831, 5846, 5861, 5875, 5890, 5905, 5919, 5934, 5949, 5963, 5978, 5993,
+  6007, 6022, 6037, 6051, 6066, 6081, 6095, 6110, 6125, 6139, 6154, 6169, 6183, 6198, 6213, 6227,
+  6242, 6257, 6271, 6286, 6301, 6315, 6330, 6345, 6359, 6374, 6389, 6403, 6418, 6433, 6447, 6462,
+  6477, 6491, 6506, 6521, 6535, 6550, 6565, 6579, 6594, 6609, 6623, 6638, 6652, 6667, 6682, 6696,
+  6711, 6726, 6740, 6755, 6770, 6784, 6799, 6814, 6828, 6843, 6858, 6872, 6887, 6902, 6916, 6931,
+  6946, 6960, 6975, 6990, 7004, 7019, 7034, 7048, 7063, 7078, 7092, 7107, 7122, 7136, 7151, 7166,
+  7180, 7195, 7210, 7224, 7239, 7254, 7268, 7283, 7298, 7312, 7327, 7342, 7356, 7371, 7386, 7400,
+  7415, 7430, 7444, 7459, 7474, 7488, 7503, 7518, 7532, 7547, 7562, 7576, 7591, 7606, 7620, 7635,
+  7650, 7664, 7679, 7694, 7708, 7723, 7738, 7752, 7767, 7782, 7796, 7811, 7826, 7840, 7855, 7870,
+  7884, 7899, 7913, 7928, 7943, 7957, 7972, 7987, 8001, 8016, 8031, 8045, 8060, 8075, 8089, 8104,
+  8119, 8133, 8148, 8163, 8177, 8192, 8207, 8221, 8236, 8251, 8265, 8280, 8295, 8309, 8324, 8339,
+  8353, 8368, 8383, 8397, 8412, 8427, 8441, 8456, 8471, 8485, 8500, 8515, 8529, 8544, 8559, 8573,
+  8588, 8603, 8617, 8632, 8647, 8661, 8676, 8691, 8705, 8720, 8735, 8749, 8764, 8779, 8793, 8808,
+  8823, 8837, 8852, 8867, 8881, 8896, 8911, 8925, 8940, 8955, 8969, 8984, 8999, 9013, 9028, 9043,
+  9057, 9072, 9087, 9101, 9116, 9130, 9145, 9160, 9174, 9189, 9204, 9218, 9233, 9248, 9262, 9277,
+  9292, 9306, 9321, 9336, 9350, 9365, 9380, 9394, 9409, 9424, 9438, 9453, 9468, 9482, 9497, 9512,
+  9526, 9541, 9556, 9570, 9585, 9600, 9614, 9629, 9644, 9658, 9673, 9688, 9702, 9717, 9732, 9746,
+  9761, 9776, 9790, 9805, 9820, 9834, 9849, 9864, 9878, 9893, 9908, 9922, 9937, 9952, 9966, 9981,
+  9996, 10010, 10025, 10040, 10054, 10069, 10084, 10098, 10113, 10128, 10142, 10157, 10172, 10186, 10201, 10216,
+  10230, 10245, 10260, 10274, 10289, 10304, 10318, 10333, 10348, 10362, 10377, 10391, 10406, 10421, 10435, 10450,
+  10465, 10479, 10494, 10509, 10523, 10538, 10553, 10567, 10582, 10597, 10611, 10626, 10641, 10655, 10670, 10685,
+  10699, 10714, 10729, 10743, 10758, 10773, 10787, 10802, 10817, 10831, 10846, 10861, 10875, 10890, 10905, 10919,
+  10934, 10949, 10963, 10978, 10993, 11007, 11022, 11037, 11051, 11066, 11081, 11095, 11110, 11125, 11139, 11154,
+  11169, 11183, 11198, 11213, 11227, 11242, 11257, 11271, 11286, 11301, 11315, 11330, 11345, 11359, 11374, 11389,
+  11403, 11418, 11433, 11447, 11462, 11477, 11491, 11506, 11521, 11535, 11550, 11565, 11579, 11594, 11609, 11623,
+  11638, 11652, 11667, 11682, 11696, 11711, 11726, 11740, 11755, 11770, 11784, 11799, 11814, 11828, 11843, 11858,
+  11872, 11887, 11902, 11916, 11931, 11946, 11960, 11975, 11990, 12004, 12019, 12034, 12048, 12063, 12078, 12092,
+  12107, 12122, 12136, 12151, 12166, 12180, 12195, 12210, 12224, 12239, 12254, 12268, 12283, 12298, 12312, 12327,
+  12342, 12356, 12371, 12386, 12400, 12415, 12430, 12444, 12459, 12474, 12488, 12503, 12518, 12532, 12547, 12562,
+  12576, 12591, 12606, 12620, 12635, 12650, 12664, 12679, 12694, 12708, 12723, 12738, 12752, 12767, 12782, 12796,
+  12811, 12826, 12840, 12855, 12870, 12884, 12899, 12913, 12928, 12943, 12957, 12972, 12987, 13001, 13016, 13031,
+  13045, 13060, 13075, 13089, 13104, 13119, 13133, 13148, 13163, 13177, 13192, 13207, 13221, 13236, 13251, 13265,
+  13280, 13295, 13309, 13324, 13339, 13353, 13368, 13383, 13397, 13412, 13427, 13441, 13456, 13471, 13485, 13500
+};
+
+static inline int16_t flowLut(const int16_t *lut, int adc) {
+  if (adc < 0) adc = 0;
+  if (adc >= FLOW_LUT_SIZE) adc = FLOW_LUT_SIZE - 1;
+  return (int16_t)pgm_read_word(lut + adc);
+}
+
+#endif
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Phân tích hàng loạt các file runlog*.csv cũ (save_data.py và run.py) song song
+# trên nhiều lõi bằng ProcessPoolExecutor.
+#
+# Mỗi worker đọc 1 file bằng NumPy (np.loadtxt, không lặp từng dòng Python),
+# nhận dạng loại file theo header, tính lại cột dẫn xuất rồi trả về:
+#   - 1 dòng tóm tắt cho cả lần chạy (số dòng, thời lượng, dải hz, lưu lượng,
+#     điện áp, seq bị mất, kết quả fit hiệu chuẩn voltMaf -> flowABB)
+#   - các dòng trung bình theo từng mức hz
+# Tiến trình chính gộp lại thành 1 bảng tóm tắt (+ 1 bảng theo hz nếu cần).
+#
+#   python3 batch_analyze.py logs/ --workers 8 --out summary.csv --points points.csv
+#   python3 batch_analyze.py logs/ --bench          # đo thông lượng theo số worker
+# Thư mục được quét cả *.csv.gz / .bz2 / .xz (đoạn log đã xoay + nén).
+#
+# Loại file (theo header):
+#   run   hz, rpm, flowABB, voltABB, voltMaf, analog                    (run.py)
+#   log   [t, t_dev, seq, t_dev_ms,] hz, rpm, flow1, volt1, flow2, volt2 (save_data.py)
+# Với "log": flowABB = flow1 * 3.6 (g/s -> kg/h), voltABB = volt1, voltMaf = volt2.
+# Cả hai loại: analog = voltMaf * 1023 / 5 (file run.py: so với cột đã ghi).
+
+import os, io, sys, csv, time, glob, argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from calibration import METHODS, fit_curve, residual_report
+from log_writer import COMPRESSORS
+
+FLOW_SCALE = 3.6            # g/s -> kg/h (như run.py)
+ADC_MAX, ADC_VREF = 1023.0, 5.0
+ANALOG_TOL = 0.01           # lệch cột analog đã ghi so với tính lại
+
+RUN_COLS = ("hz", "rpm", "flowABB", "voltABB", "voltMaf", "analog")
+LOG_COLS = ("hz", "rpm", "flow1", "volt1", "flow2", "volt2")
+SKIP_SUFFIXES = (".part", ".cache.npz", ".state.json")
+CSV_SUFFIXES = (".csv",) + tuple(f".csv.{c}" for c in COMPRESSORS)     # cả đoạn đã xoay + nén của log_writer
+
+SUMMARY_COLS = ("file", "kind", "rows", "t_start", "duration_s", "seq_lost",
+                "hz_min", "hz_max", "n_hz", "flowABB_mean", "flowABB_max",
+                "voltMaf_min", "voltMaf_max", "analog_bad",
+                "fit_method", "fit_n", "fit_rmse", "fit_max_abs", "fit_r2", "error")
+POINT_COLS = ("file", "hz", "n", "rpm", "flowABB", "flowABB_std",
+              "voltABB", "voltMaf", "voltMaf_std", "analog")
+
+
+# ====== Đọc 1 file ======
+def detect_kind(header):
+    cols = [c.strip() for c in header]
+    if all(c in cols for c in RUN_COLS):
+        return "run"
+    if all(c in cols for c in LOG_COLS):
+        return "log"
+    return None
+
+
+def load_run(path):
+    """Đọc CSV -> (kind, dict tên cột -> mảng float64). Ô trống (vd seq) thành NaN."""
+    ext = path.rsplit(".", 1)[-1]
+    opener = COMPRESSORS.get(ext, open)
+    with opener(path, "rt", encoding="utf-8-sig", newline="") as f:
+        header = f.readline()
+        body = f.read()
+    header = next(csv.reader([header]), [])
+    kind = detect_kind(header)
+    if kind is None:
+        raise ValueError(f"header không nhận ra: {header}")
+    names = [c.strip() for c in header]
+    if not body.strip():
+        return kind, {n: np.empty(0) for n in names}
+    try:
+        arr = np.loadtxt(io.StringIO(body), delimiter=",", ndmin=2, dtype=np.float64, comments=None)
+    except ValueError:
+        # Có ô trống hoặc dòng hỏng (mất điện giữa chừng): chậm hơn nhưng bỏ qua được
+        arr = np.genfromtxt(io.StringIO(body), delimiter=",", dtype=np.float64,
+                            invalid_raise=False, usecols=range(len(names)))
+        arr = np.atleast_2d(arr)
+    if arr.shape[1] != len(names):
+        raise ValueError(f"{arr.shape[1]} cột dữ liệu, header có {len(names)}")
+    return kind, {n: arr[:, i] for i, n in enumerate(names)}
+
+
+def derive(kind, cols):
+    """Chuẩn hóa về cột của run.py và tính lại cột dẫn xuất. Trả về (dict, số dòng analog lệch)."""
+    if kind == "log":
+        volt2 = cols["volt2"]
+        out = {"hz": cols["hz"], "rpm": cols["rpm"], "flowABB": cols["flow1"] * FLOW_SCALE,
+               "voltABB": cols["volt1"], "voltMaf": volt2}
+        bad = ""
+        out["analog"] = volt2 * ADC_MAX / ADC_VREF
+    else:
+        out = {k: cols[k] for k in RUN_COLS[:5]}
+        out["analog"] = cols["voltMaf"] * ADC_MAX / ADC_VREF
+        bad = int(np.count_nonzero(np.abs(cols["analog"] - out["analog"]) > ANALOG_TOL))
+    ok = np.isfinite(out["hz"]) & np.isfinite(out["flowABB"]) & np.isfinite(out["voltMaf"])
+    return {k: v[ok] for k, v in out.items()}, bad
+
+
+def per_hz(d):
+    """Trung bình / độ lệch chuẩn theo từng mức hz (np.unique + bincount, không lặp Python)."""
+    if d["hz"].size == 0:
+        return []
+    levels, inv, n = np.unique(np.round(d["hz"]).astype(int), return_inverse=True, return_counts=True)
+    mean = lambda x: np.bincount(inv, weights=x) / n
+    def std(x):
+        m = mean(x)[inv]
+        return np.sqrt(np.bincount(inv, weights=(x - m) ** 2) / np.maximum(n - 1, 1))
+    cols = {"rpm": mean(d["rpm"]), "flowABB": mean(d["flowABB"]), "flowABB_std": std(d["flowABB"]),
+            "voltABB": mean(d["voltABB"]), "voltMaf": mean(d["voltMaf"]),
+            "voltMaf_std": std(d["voltMaf"]), "analog": mean(d["analog"])}
+    return [dict({"hz": int(h), "n": int(n[i])}, **{k: round(float(v[i]), 4) for k, v in cols.items()})
+            for i, h in enumerate(levels)]
+
+
+def analyze_file(path, method="pchip", knots=12):
+    """Worker: 1 file -> {"summary": dict, "points": [dict]}. Lỗi không làm hỏng cả lô."""
+    s = dict.fromkeys(SUMMARY_COLS, "")
+    s["file"] = path
+    try:
+        kind, cols = load_run(path)
+        d, s["analog_bad"] = derive(kind, cols)
+        s["kind"], s["rows"] = kind, int(d["hz"].size)
+        if "t" in cols and np.isfinite(cols["t"]).any():
+            t = cols["t"][np.isfinite(cols["t"])]
+            s["t_start"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(float(t[0])))
+            s["duration_s"] = round(float(t[-1] - t[0]), 1)
+        if "seq" in cols:
+            seq = cols["seq"][np.isfinite(cols["seq"])]
+            if seq.size > 1:
+                gaps = np.diff(seq)
+                s["seq_lost"] = int(np.sum(gaps[gaps > 1] - 1))   # gap <= 0: Arduino reset
+        if not d["hz"].size:
+            return {"summary": s, "points": []}
+        s.update(hz_min=int(d["hz"].min()), hz_max=int(d["hz"].max()),
+                 n_hz=int(np.unique(np.round(d["hz"])).size),
+                 flowABB_mean=round(float(d["flowABB"].mean()), 3),
+                 flowABB_max=round(float(d["flowABB"].max()), 3),
+                 voltMaf_min=round(float(d["voltMaf"].min()), 4),
+                 voltMaf_max=round(float(d["voltMaf"].max()), 4))
+        points = per_hz(d)
+        for p in points:
+            p["file"] = path
+        x, y = d["voltMaf"], d["flowABB"]
+        if np.unique(x).size >= 2:
+            fit = fit_curve(x, y, method, n_knots=knots)
+            rep = residual_report(fit, x, y)
+            s.update(fit_method=method, fit_n=rep["n"], fit_rmse=round(rep["rmse"], 4),
+                     fit_max_abs=round(rep["max_abs"], 4), fit_r2=round(rep["r2"], 6))
+        return {"summary": s, "points": points}
+    except Exception as e:
+        s["error"] = f"{type(e).__name__}: {e}"
+        return {"summary": s, "points": []}
+
+
+def _analyze_one(job):
+    return analyze_file(*job)
+
+
+# ====== Chạy cả lô ======
+def find_files(inputs):
+    files = []
+    for p in inputs:
+        if os.path.isdir(p):
+            found = [f for f in glob.glob(os.path.join(p, "**", "*.csv*"), recursive=True)
+                     if f.endswith(CSV_SUFFIXES)]
+        else:
+            found = glob.glob(p) or [p]
+        files.extend(f for f in found if not f.endswith(SKIP_SUFFIXES))
+    return sorted(set(files))
+
+
+def run_batch(files, workers=None, method="pchip", knots=12):
+    """Phân tích song song -> (list summary, list points, giây). workers=1: chạy ngay trong tiến trình."""
+    jobs = [(f, method, knots) for f in files]
+    t0 = time.perf_counter()
+    if workers == 1:
+        results = list(map(_analyze_one, jobs))
+    else:
+        workers = workers or os.cpu_count() or 1
+        # chunksize: vài trăm file nhỏ thì chi phí gửi job qua pipe đáng kể hơn việc đọc file
+        chunk = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(_analyze_one, jobs, chunksize=chunk))
+    dt = time.perf_counter() - t0
+    summaries = [r["summary"] for r in results]
+    points = [p for r in results for p in r["points"]]
+    return summaries, points, dt
+
+
+def write_table(path, cols, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=cols, extrasaction="ignore")
+        w.writeheader()
+        w.writerows(rows)
+
+
+def throughput(summaries, dt):
+    rows = sum(s["rows"] or 0 for s in summaries)
+    return f"{len(summaries)} file, {rows} dòng trong {dt:.2f}s ({len(summaries) / dt:.1f} file/s, {rows / dt:,.0f} dòng/s)"
+
+
+def bench(files, method, knots):
+    """Đo thông lượng với 1, 2, 4, ... worker tới số lõi."""
+    n_cpu = os.cpu_count() or 1
+    counts = sorted({1, n_cpu} | {2 ** k for k in range(1, 8) if 2 ** k < n_cpu})
+    base = None
+    for w in counts:
+        summaries, _, dt = run_batch(files, w, method, knots)
+        base = base or dt
+        print(f"⏱️ workers={w:3d}: {throughput(summaries, dt)}  x{base / dt:.2f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Phân tích song song các runlog CSV (save_data.py / run.py).")
+    ap.add_argument("inputs", nargs="+", help="File, glob hoặc thư mục (quét đệ quy *.csv)")
+    ap.add_argument("--workers", type=int, default=0, help="Số tiến trình (0 = số lõi, 1 = không song song)")
+    ap.add_argument("--method", choices=METHODS, default="pchip", help="Kiểu fit hiệu chuẩn mỗi file")
+    ap.add_argument("--knots", type=int, default=12, help="Số knot (pwl/pchip)")
+    ap.add_argument("--out", default="summary.csv", help="Bảng tóm tắt (1 dòng / file)")
+    ap.add_argument("--points", help="Bảng trung bình theo hz (1 dòng / file / hz)")
+    ap.add_argument("--bench", action="store_true", help="Đo thông lượng theo số worker rồi thoát")
+    args = ap.parse_args()
+
+    files = find_files(args.inputs)
+    if not files:
+        sys.exit("❌ Không tìm thấy file CSV nào")
+    if args.bench:
+        bench(files, args.method, args.knots)
+        return
+
+    summaries, points, dt = run_batch(files, args.workers or None, args.method, args.knots)
+    write_table(args.out, SUMMARY_COLS, summaries)
+    if args.points:
+        write_table(args.points, POINT_COLS, points)
+    errors = [s for s in summaries if s["error"]]
+    for s in errors:
+        print(f"⚠️ {s['file']}: {s['error']}")
+    print(f"✅ {throughput(summaries, dt)}")
+    print(f"🧾 Tóm tắt → {os.path.abspath(args.out)}" + (f", theo hz → {os.path.abspath(args.points)}" if args.points else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Chụp burst điện áp cảm biến tốc độ cao (kHz) cho phân tích xung / thời gian đáp ứng.
+#
+# Firmware "BURST <n> <rate> [1|2]" lấy mẫu ADC theo Timer1 vào RAM (tối đa 640 mẫu,
+# 50..9000 Hz, mặc định kênh 2 = MAF) rồi gửi một khối nhị phân:
+#   BURST n=640 rate=5000.00 ch=2 len=800 crc=4660 t=123456\r\n
+#   <n byte 8 bit thấp><ceil(n/4) byte 2 bit cao, 4 mẫu/byte>\r\n
+# crc = CRC-16/XMODEM của len byte dữ liệu.
+#
+#   python3 burst.py capture --port /dev/ttyACM0 -n 640 --rate 5000 --out burst.npz --show
+#   python3 burst.py capture --port /dev/pts/3 --count 10 --out b.npz   (simulator.py, không cần Arduino)
+#   python3 burst.py show burst.npz
+
+import sys, re, time, argparse, binascii
+import numpy as np
+
+PORT = "/dev/ttyACM0"
+BURST_MAX = 640
+RATE_MIN, RATE_MAX = 50, 9000
+ADC_MAX = 1023
+ADC_VREF = 5.0
+TIMEOUT_PAD_S = 2.0      # ngoài n/rate: thời gian gửi khối + trễ lệnh
+
+HEADER_RE = re.compile(
+    r"^BURST\s+n=(?P<n>\d+)\s+rate=(?P<rate>\d+(?:\.\d+)?)\s+ch=(?P<ch>[12])\s+"
+    r"len=(?P<len>\d+)\s+crc=(?P<crc>\d+)(?:\s+t=(?P<t>\d+))?\s*$"
+)
+
+
+# ====== Đóng gói 10 bit (1.25 byte/mẫu) ======
+def packed_len(n):
+    return n + (n + 3) // 4
+
+
+def pack10(raw):
+    """Mảng ADC 0..1023 -> bytes theo định dạng firmware (dùng cho simulator.py)."""
+    raw = np.asarray(raw, dtype=np.uint16)
+    n = len(raw)
+    hi2 = np.zeros(((n + 3) // 4) * 4, dtype=np.uint8)
+    hi2[:n] = raw >> 8
+    hi = hi2[0::4] | (hi2[1::4] << 2) | (hi2[2::4] << 4) | (hi2[3::4] << 6)
+    return (raw & 0xFF).astype(np.uint8).tobytes() + hi.astype(np.uint8).tobytes()
+
+
+def unpack10(data, n):
+    """bytes của khối BURST -> mảng uint16 n mẫu ADC."""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if len(buf) != packed_len(n):
+        raise ValueError(f"khối BURST {len(buf)} byte, cần {packed_len(n)} cho {n} mẫu")
+    hi = buf[n:]
+    shift = (np.arange(n) & 3) * 2
+    return buf[:n].astype(np.uint16) | (((hi[np.arange(n) >> 2] >> shift) & 3).astype(np.uint16) << 8)
+
+
+class Burst:
+    """Một lần chụp: raw (ADC uint16), rate thật (Hz), kênh, millis() lúc bắt đầu."""
+
+    def __init__(self, raw, rate, ch=2, t_ms=None):
+        self.raw = np.asarray(raw, dtype=np.uint16)
+        self.rate = float(rate)
+        self.ch = int(ch)
+        self.t_ms = t_ms
+
+    @property
+    def volts(self):
+        return self.raw * (ADC_VREF / ADC_MAX)
+
+    @property
+    def t(self):
+        return np.arange(len(self.raw)) / self.rate
+
+    def describe(self):
+        v = self.volts
+        return (f"kênh {self.ch} | {len(v)} mẫu @ {self.rate:.2f} Hz ({len(v) / self.rate * 1000:.1f} ms) | "
+                f"mean={v.mean():.4f} V std={v.std():.4f} min={v.min():.3f} max={v.max():.3f} "
+                f"p2p={v.max() - v.min():.3f} V")
+
+
+def save_bursts(path, bursts):
+    """Nhiều burst cùng n -> .npz (raw 2 chiều, rate/ch/t_ms theo từng lần)."""
+    np.savez_compressed(path, raw=np.stack([b.raw for b in bursts]),
+                        rate=np.array([b.rate for b in bursts]), ch=np.array([b.ch for b in bursts]),
+                        t_ms=np.array([-1 if b.t_ms is None else b.t_ms for b in bursts], dtype=np.int64))
+
+
+def load_bursts(path):
+    with np.load(path) as z:
+        raw = np.atleast_2d(z["raw"])
+        return [Burst(r, rate, ch, None if t < 0 else int(t))
+                for r, rate, ch, t in zip(raw, z["rate"], z["ch"], z["t_ms"])]
+
+
+# ====== Nhận từ cổng serial ======
+def _read_exact(ser, n, deadline):
+    data = bytearray()
+    while len(data) < n:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"khối BURST thiếu {n - len(data)}/{n} byte")
+        data += ser.read(n - len(data))
+    return bytes(data)
+
+
+def read_burst(ser, timeout):
+    """Đọc tới header BURST (bỏ qua STATUS / OK ...), rồi đúng len byte nhị phân.
+
+    ERR ... từ firmware -> RuntimeError; sai CRC -> ValueError.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        if time.monotonic() > deadline:
+            raise TimeoutError("không nhận được header BURST")
+        line = ser.readline().decode("utf-8", errors="ignore").strip()
+        if line.startswith("ERR"):
+            raise RuntimeError(line)
+        m = HEADER_RE.match(line)
+        if m:
+            break
+    n, size = int(m.group("n")), int(m.group("len"))
+    data = _read_exact(ser, size, deadline)
+    ser.readline()                                  # "\r\n" sau khối
+    crc = binascii.crc_hqx(data, 0)
+    if crc != int(m.group("crc")):
+        raise ValueError(f"CRC BURST sai: {crc} != {m.group('crc')}")
+    t = m.group("t")
+    return Burst(unpack10(data, n), float(m.group("rate")), int(m.group("ch")), int(t) if t else None)
+
+
+def request_burst(ser, n=BURST_MAX, rate=5000, ch=2, timeout=None):
+    """Gửi BURST rồi chờ khối trả về; timeout mặc định n/rate + TIMEOUT_PAD_S."""
+    if hasattr(ser, "reset_input_buffer"):
+        ser.reset_input_buffer()                    # bỏ STATUS cũ còn trong bộ đệm
+    ser.write(f"BURST {n} {rate} {ch}\n".encode("utf-8"))
+    ser.flush()
+    return read_burst(ser, timeout or n / rate + TIMEOUT_PAD_S)
+
+
+# ====== Xem (PyQt5 QtChart, chỉ import khi cần) ======
+def show_bursts(bursts, title="Burst"):
+    from PyQt5.QtWidgets import QApplication, QMainWindow
+    from PyQt5.QtGui import QPainter
+    from PyQt5.QtCore import QPointF, Qt
+    from PyQt5.QtChart import QChart, QChartView, QLineSeries, QValueAxis
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    chart = QChart()
+    chart.setTitle(f"{title} — {bursts[-1].describe()}")
+    ax_x, ax_y = QValueAxis(), QValueAxis()
+    ax_x.setTitleText("t (ms)")
+    ax_y.setTitleText("Điện áp (V)")
+    chart.addAxis(ax_x, Qt.AlignBottom)
+    chart.addAxis(ax_y, Qt.AlignLeft)
+    for i, b in enumerate(bursts):
+        s = QLineSeries()
+        s.setName(f"#{i} kênh {b.ch} @ {b.rate:.0f} Hz")
+        s.replace([QPointF(t, v) for t, v in zip((b.t * 1000).tolist(), b.volts.tolist())])
+        chart.addSeries(s)
+        s.attachAxis(ax_x)
+        s.attachAxis(ax_y)
+    ax_x.setRange(0, max(len(b.raw) / b.rate for b in bursts) * 1000)
+    lo = min(float(b.volts.min()) for b in bursts)
+    hi = max(float(b.volts.max()) for b in bursts)
+    pad = max(0.01, (hi - lo) * 0.1)
+    ax_y.setRange(lo - pad, hi + pad)
+
+    view = QChartView(chart)
+    view.setRenderHint(QPainter.Antialiasing)
+    win = QMainWindow()
+    win.setWindowTitle(title)
+    win.setCentralWidget(view)
+    win.resize(1000, 500)
+    win.show()
+    return app.exec_()
+
+
+# ====== CLI ======
+def cmd_capture(args):
+    from ports import open_port
+    if not 1 <= args.n <= BURST_MAX:
+        sys.exit(f"❌ -n phải trong 1..{BURST_MAX}")
+    if not RATE_MIN <= args.rate <= RATE_MAX:
+        sys.exit(f"❌ --rate phải trong {RATE_MIN}..{RATE_MAX} Hz")
+    try:
+        ser = open_port(args.port, args.baud, timeout=0.2)
+    except Exception as e:
+        sys.exit(f"❌ Không mở được cổng {args.port}: {e}")
+    bursts = []
+    try:
+        for i in range(args.count):
+            t0 = time.monotonic()
+            try:
+                b = request_burst(ser, args.n, args.rate, args.ch)
+            except (RuntimeError, ValueError, TimeoutError) as e:
+                print(f"⚠️ Burst #{i}: {e}")
+                continue
+            bursts.append(b)
+            print(f"✅ #{i} {b.describe()} | {(time.monotonic() - t0) * 1000:.0f} ms")
+    finally:
+        ser.close()
+    if not bursts:
+        sys.exit("❌ Không chụp được burst nào")
+    if args.out:
+        save_bursts(args.out, bursts)
+        print(f"💾 {len(bursts)} burst → {args.out}")
+    if args.show:
+        return show_bursts(bursts, args.out or "Burst")
+    return 0
+
+
+def cmd_show(args):
+    bursts = load_bursts(args.file)
+    for i, b in enumerate(bursts):
+        print(f"#{i} {b.describe()}")
+    return show_bursts(bursts, args.file)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Chụp / xem burst điện áp MAF tốc độ cao (lệnh BURST của firmware)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("capture", help="Gửi BURST và lưu các lần chụp vào .npz")
+    p.add_argument("--port", default=PORT, help="Cổng nối tiếp (/dev/ttyACM0, COM3, /dev/pts/N của simulator.py)")
+    p.add_argument("--baud", type=int, default=115200)
+    p.add_argument("-n", type=int, default=BURST_MAX, help=f"Số mẫu mỗi burst (≤ {BURST_MAX})")
+    p.add_argument("--rate", type=int, default=5000, help=f"Tần số lấy mẫu Hz ({RATE_MIN}..{RATE_MAX})")
+    p.add_argument("--ch", type=int, choices=(1, 2), default=2, help="Kênh: 1 = ABB (A0), 2 = MAF (A1)")
+    p.add_argument("--count", type=int, default=1, help="Số lần chụp liên tiếp")
+    p.add_argument("--out", help="File .npz lưu kết quả")
+    p.add_argument("--show", action="store_true", help="Mở cửa sổ xem sau khi chụp (cần PyQt5)")
+    p.set_defaults(func=cmd_capture)
+
+    p = sub.add_parser("show", help="Xem file .npz đã chụp")
+    p.add_argument("file")
+    p.set_defaults(func=cmd_show)
+
+    args = ap.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
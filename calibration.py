@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Hiệu chuẩn cảm biến MAF: fit voltMaf -> flowABB từ các file sweep của run.py
+# (cột hz, rpm, flowABB, voltABB, voltMaf, analog) bằng bình phương tối thiểu NumPy,
+# rồi sinh bảng tra (LUT) dày để host đổi điện áp -> lưu lượng O(1) mỗi mẫu.
+#
+#   python3 calibration.py fit runlog*.csv --method pchip --out maf_calib.npz
+#   python3 calibration.py show maf_calib.npz
+#   python3 calibration.py header --calib maf_calib.npz --out RS485/maf_lut.h
+#   python3 calibration.py check-header RS485/maf_lut.h --calib maf_calib.npz
+#
+# Bảng tra ngược (feed-forward): Hz cần đặt để đạt một lưu lượng / RPM, dựng từ
+# cột hz, flowABB, rpm của cùng các file sweep:
+#   python3 calibration.py inverse runlog*.csv --out hz_table.npz
+#   python3 calibration.py hz hz_table.npz --flow 120 --rpm 1500
+
+import os, sys, csv, argparse, subprocess, tempfile
+import numpy as np
+
+METHODS = ("poly", "pwl", "pchip")
+LUT_SIZE = 4096
+V_MIN, V_MAX = 0.0, 5.0
+
+# Firmware: analogRead 10 bit, Vref 5 V; LUT lưu lưu lượng theo 0.01 g/s (int16)
+ADC_SIZE = 1024
+ADC_VREF = 5.0
+FW_SCALE = 100
+FW_MAX_VALUE = 120      # MAX_VALUE của cảm biến tuyến tính 0.5..4.5 V (RS485.ino)
+
+
+# ====== Đọc dữ liệu sweep ======
+def load_sweeps(paths, x_col="voltMaf", y_col="flowABB"):
+    xs, ys = [], []
+    for path in paths:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.reader(f))
+        if not rows:
+            continue
+        header = [c.strip() for c in rows[0]]
+        if x_col not in header or y_col not in header:
+            raise ValueError(f"{path}: thiếu cột {x_col}/{y_col} (header: {header})")
+        ix, iy = header.index(x_col), header.index(y_col)
+        for r in rows[1:]:
+            try:
+                xs.append(float(r[ix]))
+                ys.append(float(r[iy]))
+            except (ValueError, IndexError):
+                continue
+    x = np.asarray(xs, dtype=float)
+    y = np.asarray(ys, dtype=float)
+    ok = np.isfinite(x) & np.isfinite(y)
+    return x[ok], y[ok]
+
+
+# ====== Các kiểu fit ======
+def _knots(x, n_knots):
+    k = np.unique(np.quantile(x, np.linspace(0.0, 1.0, n_knots)))
+    if k.size < 2:
+        k = np.array([x.min() - 0.5, x.max() + 0.5])
+    return k
+
+
+def _pwl_basis(x, knots):
+    # Hàm "mũ" (hat) tại từng knot -> đường gấp khúc liên tục
+    x = np.clip(x, knots[0], knots[-1])
+    idx = np.clip(np.searchsorted(knots, x, side="right") - 1, 0, knots.size - 2)
+    w = (x - knots[idx]) / (knots[idx + 1] - knots[idx])
+    A = np.zeros((x.size, knots.size))
+    rows = np.arange(x.size)
+    A[rows, idx] = 1.0 - w
+    A[rows, idx + 1] = w
+    return A
+
+
+def _pava(y, w):
+    """Hồi quy isotonic (không giảm) có trọng số."""
+    vals, wts, cnt = [], [], []
+    for yi, wi in zip(y, w):
+        vals.append(yi); wts.append(wi); cnt.append(1)
+        while len(vals) > 1 and vals[-2] > vals[-1]:
+            w2 = wts[-2] + wts[-1]
+            v2 = (vals[-2] * wts[-2] + vals[-1] * wts[-1]) / w2
+            c2 = cnt[-2] + cnt[-1]
+            del vals[-1], wts[-1], cnt[-1]
+            vals[-1], wts[-1], cnt[-1] = v2, w2, c2
+    return np.repeat(vals, cnt)
+
+
+def _pchip_slopes(xk, yk):
+    # Fritsch–Carlson: đạo hàm tại knot giữ đơn điệu
+    h = np.diff(xk)
+    d = np.diff(yk) / h
+    m = np.zeros_like(yk)
+    if yk.size == 2:
+        m[:] = d[0]
+        return m
+    same = (d[:-1] * d[1:]) > 0
+    w1 = 2 * h[1:] + h[:-1]
+    w2 = h[1:] + 2 * h[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hm = (w1 + w2) / (w1 / d[:-1] + w2 / d[1:])
+    m[1:-1] = np.where(same, hm, 0.0)
+    m[0] = _end_slope(h[0], h[1], d[0], d[1])
+    m[-1] = _end_slope(h[-1], h[-2], d[-1], d[-2])
+    return m
+
+
+def _end_slope(h0, h1, d0, d1):
+    s = ((2 * h0 + h1) * d0 - h0 * d1) / (h0 + h1)
+    if np.sign(s) != np.sign(d0):
+        return 0.0
+    if np.sign(d0) != np.sign(d1) and abs(s) > abs(3 * d0):
+        return 3 * d0
+    return s
+
+
+def _pchip_eval(xk, yk, mk, x):
+    x = np.clip(np.asarray(x, dtype=float), xk[0], xk[-1])
+    i = np.clip(np.searchsorted(xk, x, side="right") - 1, 0, xk.size - 2)
+    h = xk[i + 1] - xk[i]
+    t = (x - xk[i]) / h
+    t2, t3 = t * t, t * t * t
+    return ((2 * t3 - 3 * t2 + 1) * yk[i] + (t3 - 2 * t2 + t) * h * mk[i]
+            + (-2 * t3 + 3 * t2) * yk[i + 1] + (t3 - t2) * h * mk[i + 1])
+
+
+class Fit:
+    """Kết quả fit: gọi fit(v) (vectorized) -> lưu lượng.
+
+    Ngoài khoảng điện áp đã đo thì giữ giá trị ở biên (không ngoại suy đa thức).
+    """
+
+    def __init__(self, method, predict, params, domain):
+        self.method = method
+        self._predict = predict
+        self.params = params
+        self.domain = domain
+
+    def __call__(self, v):
+        return self._predict(np.clip(np.asarray(v, dtype=float), *self.domain))
+
+
+def fit_curve(x, y, method="pchip", degree=3, n_knots=12):
+    if x.size < 2:
+        raise ValueError("Cần ít nhất 2 điểm để fit")
+    domain = (float(x.min()), float(x.max()))
+    if method == "poly":
+        deg = min(degree, x.size - 1)
+        p = np.polynomial.Polynomial.fit(x, y, deg)
+        return Fit("poly", p, {"coef": p.convert().coef.tolist()}, domain)
+
+    knots = _knots(x, n_knots)
+    A = _pwl_basis(x, knots)
+    yk, *_ = np.linalg.lstsq(A, y, rcond=None)
+    if method == "pwl":
+        return Fit("pwl", lambda v: np.interp(v, knots, yk), {"knots": knots.tolist(), "values": yk.tolist()}, domain)
+
+    if method == "pchip":
+        # Ép giá trị knot không giảm (lưu lượng tăng theo điện áp) rồi nội suy PCHIP
+        w = A.sum(axis=0) + 1e-9
+        yk = _pava(yk, w)
+        mk = _pchip_slopes(knots, yk)
+        return Fit("pchip", lambda v: _pchip_eval(knots, yk, mk, v),
+                   {"knots": knots.tolist(), "values": yk.tolist()}, domain)
+
+    raise ValueError(f"method phải là một trong {METHODS}")
+
+
+def residual_report(fit, x, y):
+    r = y - fit(x)
+    ss_tot = float(np.sum((y - y.mean()) ** 2))
+    return {
+        "n": int(x.size),
+        "rmse": float(np.sqrt(np.mean(r ** 2))),
+        "max_abs": float(np.max(np.abs(r))),
+        "bias": float(np.mean(r)),
+        "r2": 1.0 - float(np.sum(r ** 2)) / ss_tot if ss_tot > 0 else 1.0,
+        "residuals": r,
+    }
+
+
+# ====== Bảng tra runtime ======
+class CalibrationTable:
+    """LUT đều theo điện áp: flow(v) là 1 phép nhân + 1 lần index, không cần fit lúc chạy."""
+
+    def __init__(self, table, v0=V_MIN, v1=V_MAX, method="", unit="kg/h"):
+        self.table = np.asarray(table, dtype=float)
+        self.v0 = float(v0)
+        self.v1 = float(v1)
+        self.method = method
+        self.unit = unit
+        self._n = self.table.size
+        self._scale = (self._n - 1) / (self.v1 - self.v0)
+        self._list = self.table.tolist()     # index list Python nhanh hơn numpy cho 1 mẫu
+
+    @classmethod
+    def from_fit(cls, fit, size=LUT_SIZE, v0=V_MIN, v1=V_MAX, unit="kg/h"):
+        v = np.linspace(v0, v1, size)
+        return cls(fit(v), v0, v1, fit.method, unit)
+
+    def flow(self, v: float) -> float:
+        i = int((v - self.v0) * self._scale + 0.5)
+        if i < 0:
+            i = 0
+        elif i >= self._n:
+            i = self._n - 1
+        return self._list[i]
+
+    def interp(self, v):
+        """Nội suy tuyến tính trên LUT (dùng khi sinh bảng cho firmware)."""
+        grid = np.linspace(self.v0, self.v1, self._n)
+        return np.interp(np.asarray(v, dtype=float), grid, self.table)
+
+    def flow_array(self, v):
+        # floor(x + 0.5) như flow(): np.rint làm tròn nửa về số chẵn -> lệch 1 ô ở điểm giữa 2 ô
+        i = np.floor((np.asarray(v, dtype=float) - self.v0) * self._scale + 0.5).astype(np.intp)
+        np.clip(i, 0, self._n - 1, out=i)
+        return self.table[i]
+
+    def save(self, path):
+        np.savez(path, table=self.table, v0=self.v0, v1=self.v1,
+                 method=np.array(self.method), unit=np.array(self.unit))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            return cls(z["table"], float(z["v0"]), float(z["v1"]), str(z["method"]), str(z["unit"]))
+
+
+# ====== Bảng tra ngược: lưu lượng / RPM -> Hz (feed-forward) ======
+HZ_MIN, HZ_MAX = 0.0, 60.0
+HZ_GRID_STEP = 0.01         # độ phân giải SET_HZ của firmware
+INV_SIZE = 2048
+KGH_PER_GS = 3.6
+
+
+def invert_curve(fit, hz0=HZ_MIN, hz1=HZ_MAX, size=INV_SIZE):
+    """fit(hz) -> y đơn điệu không giảm; trả (y0, y1, bảng hz đều theo y)."""
+    # Chỉ đảo trong khoảng Hz đã đo (ngoài đó fit giữ giá trị biên -> phẳng)
+    hz0, hz1 = max(hz0, fit.domain[0]), min(hz1, fit.domain[1])
+    hz = np.arange(hz0, hz1 + HZ_GRID_STEP / 2, HZ_GRID_STEP)
+    y = np.maximum.accumulate(fit(hz))
+    y0, y1 = float(y[0]), float(y[-1])
+    if y1 <= y0:
+        raise ValueError("Đường cong phẳng, không đảo được")
+    # Đoạn phẳng (y lặp lại) -> lấy Hz nhỏ nhất cho cùng y
+    y, first = np.unique(y, return_index=True)
+    return y0, y1, np.interp(np.linspace(y0, y1, size), y, hz[first])
+
+
+class SetpointTable:
+    """Bảng tra ngược từ sweep của run.py: Hz cần đặt cho một lưu lượng / RPM.
+
+    Mỗi đại lượng là 1 LUT đều theo giá trị: tra = 1 phép nhân + nội suy 2 ô, không fit lúc chạy.
+    Gọi table(flow) -> hz để cắm thẳng vào FlowController(feedforward=...).
+    """
+
+    def __init__(self, tables, method="", unit="kg/h", n_points=0):
+        self.tables = {k: (float(y0), float(y1), np.asarray(t, dtype=float)) for k, (y0, y1, t) in tables.items()}
+        self.method = method
+        self.unit = unit
+        self.n_points = n_points
+        self._fast = {}
+        for k, (y0, y1, t) in self.tables.items():
+            self._fast[k] = (y0, y1, (t.size - 1) / (y1 - y0), t.tolist())
+
+    @classmethod
+    def from_sweeps(cls, paths, flow_col="flowABB", method="pchip", n_knots=12, size=INV_SIZE):
+        tables, n = {}, 0
+        for key, col in (("flow", flow_col), ("rpm", "rpm")):
+            hz, y = load_sweeps(paths, "hz", col)
+            if hz.size < 2:
+                if key == "flow":
+                    raise ValueError(f"Cần ít nhất 2 điểm hz/{col}")
+                continue
+            # pchip đã ép đơn điệu; poly/pwl được làm phẳng phần đi xuống trong invert_curve
+            tables[key] = invert_curve(fit_curve(hz, y, method, n_knots=n_knots), size=size)
+            n = max(n, hz.size)
+        return cls(tables, method, "kg/h" if flow_col == "flowABB" else "", n)
+
+    def range(self, key="flow"):
+        y0, y1, _ = self.tables[key]
+        return y0, y1
+
+    def hz_for(self, key, value):
+        y0, y1, scale, t = self._fast[key]
+        x = (value - y0) * scale
+        if x <= 0:
+            return t[0]
+        if x >= len(t) - 1:
+            return t[-1]
+        i = int(x)
+        return t[i] + (t[i + 1] - t[i]) * (x - i)
+
+    def hz_for_flow(self, flow):
+        return self.hz_for("flow", flow)
+
+    def hz_for_rpm(self, rpm):
+        return self.hz_for("rpm", rpm)
+
+    __call__ = hz_for_flow
+
+    def feedforward(self, unit=None):
+        """Hàm flow -> hz theo đơn vị của vòng điều khiển (g/s của STATUS hoặc kg/h của bảng)."""
+        if unit == "g/s" and self.unit == "kg/h":
+            return lambda flow: self.hz_for_flow(flow * KGH_PER_GS)
+        return self.hz_for_flow
+
+    def save(self, path):
+        arrays = {}
+        for k, (y0, y1, t) in self.tables.items():
+            arrays[f"{k}_table"] = t
+            arrays[f"{k}_range"] = np.array([y0, y1])
+        np.savez(path, method=np.array(self.method), unit=np.array(self.unit),
+                 n_points=np.array(self.n_points), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            tables = {k[:-6]: (*z[f"{k[:-6]}_range"], z[k]) for k in z.files if k.endswith("_table")}
+            return cls(tables, str(z["method"]), str(z["unit"]), int(z["n_points"]))
+
+
+def add_target_arguments(parser):
+    """Tùy chọn chung cho script chạy tay: đặt theo lưu lượng / RPM thay cho --hz."""
+    g = parser.add_mutually_exclusive_group()
+    g.add_argument("--flow", type=float, help="Lưu lượng cần đạt (đơn vị của bảng, vd kg/h) — tra --hz-table ra Hz")
+    g.add_argument("--rpm", type=float, help="RPM cần đạt — tra --hz-table ra Hz")
+    parser.add_argument("--hz-table", help="Bảng tra ngược .npz (calibration.py inverse)")
+
+
+def target_hz_from_args(args, parser):
+    """Hz đặt cho chế độ fixed: từ --flow/--rpm qua bảng tra, không thì --hz."""
+    if args.flow is None and args.rpm is None:
+        return args.hz
+    if not args.hz_table:
+        parser.error("--flow/--rpm cần --hz-table")
+    if args.mode != "fixed":
+        parser.error("--flow/--rpm chỉ dùng với --mode fixed")
+    table = SetpointTable.load(args.hz_table)
+    key, value = ("flow", args.flow) if args.flow is not None else ("rpm", args.rpm)
+    if key not in table.tables:
+        parser.error(f"{args.hz_table} không có bảng {key}")
+    hz = round(table.hz_for(key, value), 2)
+    y0, y1 = table.range(key)
+    note = "" if y0 <= value <= y1 else f" (⚠️ ngoài khoảng đã đo {y0:.2f}..{y1:.2f})"
+    print(f"[FF] {key}={value:g} → {hz:.2f} Hz{note}")
+    return hz
+
+
+# ====== Bảng tra cho firmware (index = analogRead) ======
+def linear_flow_gs(v, max_value=FW_MAX_VALUE):
+    # Công thức cũ trong hzIncrease(): (v - 0.5) * (MAX / (4.5 - 0.5))
+    return (np.asarray(v, dtype=float) - 0.5) * (max_value / 4.0)
+
+
+def firmware_lut(flow_gs):
+    """flow_gs(volt) -> mảng int 1024 phần tử theo 0.01 g/s, index là giá trị ADC."""
+    v = np.arange(ADC_SIZE) * (ADC_VREF / (ADC_SIZE - 1))
+    return np.clip(np.rint(flow_gs(v) * FW_SCALE), -32768, 32767).astype(np.int64)
+
+
+def model_luts(calib_path=None, max1=FW_MAX_VALUE, max2=FW_MAX_VALUE):
+    """(FLOW1_LUT, FLOW2_LUT, mô tả nguồn): cảm biến 1 (ABB) tuyến tính, cảm biến 2 (MAF) theo hiệu chuẩn."""
+    lut1 = firmware_lut(lambda v: linear_flow_gs(v, max1))
+    if calib_path:
+        t = CalibrationTable.load(calib_path)
+        to_gs = 1.0 / 3.6 if t.unit == "kg/h" else 1.0
+        lut2 = firmware_lut(lambda v: t.interp(v) * to_gs)
+        src = f"{os.path.basename(calib_path)} ({t.method})"
+    else:
+        lut2 = firmware_lut(lambda v: linear_flow_gs(v, max2))
+        src = f"tuyen tinh 0.5..4.5 V, MAX={max2}"
+    return lut1, lut2, src
+
+
+def render_header(lut1, lut2, src):
+    def rows(lut):
+        vals = [str(int(x)) for x in lut]
+        return ",\n".join("  " + ", ".join(vals[i:i + 16]) for i in range(0, len(vals), 16))
+
+    return f"""// Tu dong sinh boi calibration.py header -- KHONG sua tay.
+// Cam bien 1 (ABB): tuyen tinh 0.5..4.5 V | Cam bien 2 (MAF): {src}
+// Don vi: 0.01 g/s | index = analogRead() (0..1023)
+#ifndef MAF_LUT_H
+#define MAF_LUT_H
+
+#include <stdint.h>
+#ifdef __AVR__
+#include <avr/pgmspace.h>
+#else
+#define PROGMEM
+#define pgm_read_word(addr) (*(const uint16_t *)(addr))
+#endif
+
+#define FLOW_LUT_SIZE  {ADC_SIZE}
+#define FLOW_LUT_SCALE {FW_SCALE}
+
+static const int16_t FLOW1_LUT[FLOW_LUT_SIZE] PROGMEM = {{
+{rows(lut1)}
+}};
+
+static const int16_t FLOW2_LUT[FLOW_LUT_SIZE] PROGMEM = {{
+{rows(lut2)}
+}};
+
+static inline int16_t flowLut(const int16_t *lut, int adc) {{
+  if (adc < 0) adc = 0;
+  if (adc >= FLOW_LUT_SIZE) adc = FLOW_LUT_SIZE - 1;
+  return (int16_t)pgm_read_word(lut + adc);
+}}
+
+#endif
+"""
+
+
+_CHECK_C = r"""
+#include <stdio.h>
+#include "%s"
+int main(void) {
+  for (int i = 0; i < FLOW_LUT_SIZE; i++) printf("%%d %%d\n", flowLut(FLOW1_LUT, i), flowLut(FLOW2_LUT, i));
+  printf("%%d %%d\n", flowLut(FLOW2_LUT, -5), flowLut(FLOW2_LUT, 5000));
+  return 0;
+}
+"""
+
+
+def check_header(header, lut1, lut2, cc="cc"):
+    """Biên dịch header bằng C compiler của host, so từng phần tử với mô hình Python."""
+    header = os.path.abspath(header)
+    with tempfile.TemporaryDirectory() as tmp:
+        src, exe = os.path.join(tmp, "check.c"), os.path.join(tmp, "check")
+        with open(src, "w") as f:
+            f.write(_CHECK_C % header)
+        subprocess.run([cc, "-std=c99", "-Wall", "-Werror", "-o", exe, src], check=True)
+        out = subprocess.run([exe], check=True, capture_output=True, text=True).stdout.split("\n")
+    got = np.array([[int(x) for x in line.split()] for line in out if line.strip()])
+    errors = []
+    if got.shape != (ADC_SIZE + 1, 2):
+        return [f"số dòng kết quả {got.shape[0]} != {ADC_SIZE + 1}"]
+    for name, col, lut in (("FLOW1_LUT", 0, lut1), ("FLOW2_LUT", 1, lut2)):
+        bad = np.nonzero(got[:ADC_SIZE, col] != lut)[0]
+        if bad.size:
+            i = int(bad[0])
+            errors.append(f"{name}: {bad.size} phần tử lệch, vd [{i}] = {got[i, col]} (mong đợi {lut[i]})")
+    if got[ADC_SIZE, 0] != lut2[0] or got[ADC_SIZE, 1] != lut2[-1]:
+        errors.append("flowLut() không kẹp index ngoài 0..1023")
+    return errors
+
+
+# ====== CLI ======
+def cmd_fit(args):
+    x, y = load_sweeps(args.files, args.x_col, args.y_col)
+    print(f"📥 {x.size} điểm từ {len(args.files)} file")
+    fits = {}
+    for method in (METHODS if args.method == "all" else (args.method,)):
+        fit = fit_curve(x, y, method, degree=args.degree, n_knots=args.knots)
+        rep = residual_report(fit, x, y)
+        fits[method] = (fit, rep)
+        print(f"[{method:5s}] RMSE={rep['rmse']:.3f} max|r|={rep['max_abs']:.3f} "
+              f"bias={rep['bias']:+.3f} R²={rep['r2']:.5f}")
+    best = min(fits, key=lambda k: fits[k][1]["rmse"]) if args.method == "all" else args.method
+    fit, rep = fits[best]
+    if args.verbose:
+        order = np.argsort(x)
+        for xi, yi, ri in zip(x[order], y[order], rep["residuals"][order]):
+            print(f"  v={xi:.3f}  flow={yi:.3f}  r={ri:+.3f}")
+    table = CalibrationTable.from_fit(fit, args.size, args.v0, args.v1)
+    table.save(args.out)
+    print(f"🧾 LUT {table.table.size} điểm ({best}) [{args.v0}..{args.v1} V] → {args.out}")
+
+
+def cmd_show(args):
+    t = CalibrationTable.load(args.table)
+    print(f"{args.table}: {t.table.size} điểm, {t.v0}..{t.v1} V, method={t.method}, đơn vị={t.unit}")
+    for v in np.linspace(t.v0, t.v1, 11):
+        print(f"  {v:5.2f} V → {t.flow(v):8.3f} {t.unit}")
+
+
+def cmd_inverse(args):
+    table = SetpointTable.from_sweeps(args.files, args.flow_col, args.method, args.knots, args.size)
+    table.save(args.out)
+    print(f"📥 {table.n_points} điểm từ {len(args.files)} file")
+    for key, (y0, y1, t) in table.tables.items():
+        unit = table.unit if key == "flow" else "rpm"
+        print(f"  {key:4s}: {y0:8.2f} .. {y1:8.2f} {unit} → {t[0]:.2f} .. {t[-1]:.2f} Hz ({t.size} ô)")
+    print(f"🧾 Bảng tra ngược ({table.method}) → {args.out}")
+
+
+def cmd_hz(args):
+    table = SetpointTable.load(args.table)
+    for key, values in (("flow", args.flow), ("rpm", args.rpm)):
+        if key not in table.tables:
+            if values:
+                print(f"⚠️ {args.table} không có bảng {key}")
+            continue
+        y0, y1 = table.range(key)
+        for v in values or ():
+            note = "" if y0 <= v <= y1 else f"  ⚠️ ngoài khoảng đã đo {y0:.2f}..{y1:.2f}, kẹp biên"
+            print(f"  {key}={v:g} → SET_HZ {table.hz_for(key, v):.2f}{note}")
+
+
+def cmd_header(args):
+    lut1, lut2, src = model_luts(args.calib, args.max1, args.max2)
+    with open(args.out, "w", encoding="ascii", newline="\n") as f:
+        f.write(render_header(lut1, lut2, src))
+    print(f"🧾 {args.out}: 2 × {ADC_SIZE} phần tử int16 (0.01 g/s), nguồn: {src}")
+
+
+def cmd_check_header(args):
+    lut1, lut2, _ = model_luts(args.calib, args.max1, args.max2)
+    errors = check_header(args.header, lut1, lut2, args.cc)
+    if errors:
+        for e in errors:
+            print(f"❌ {e}")
+        return 1
+    print(f"✅ {args.header} khớp mô hình Python ({2 * ADC_SIZE} phần tử + kẹp biên)")
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fit hiệu chuẩn MAF (voltMaf → flowABB) và sinh bảng tra.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("fit", help="Fit từ một hoặc nhiều file sweep của run.py")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--method", choices=METHODS + ("all",), default="pchip",
+                   help="poly = đa thức, pwl = gấp khúc, pchip = spline đơn điệu, all = chọn RMSE nhỏ nhất")
+    p.add_argument("--degree", type=int, default=3, help="Bậc đa thức (poly)")
+    p.add_argument("--knots", type=int, default=12, help="Số knot (pwl/pchip)")
+    p.add_argument("--x-col", default="voltMaf")
+    p.add_argument("--y-col", default="flowABB")
+    p.add_argument("--size", type=int, default=LUT_SIZE, help="Số điểm LUT")
+    p.add_argument("--v0", type=float, default=V_MIN)
+    p.add_argument("--v1", type=float, default=V_MAX)
+    p.add_argument("--out", default="maf_calib.npz")
+    p.add_argument("-v", "--verbose", action="store_true", help="In residual từng điểm")
+    p.set_defaults(func=cmd_fit)
+
+    p = sub.add_parser("show", help="In tóm tắt một bảng tra")
+    p.add_argument("table")
+    p.set_defaults(func=cmd_show)
+
+    p = sub.add_parser("inverse", help="Dựng bảng tra ngược lưu lượng/RPM → Hz từ file sweep của run.py")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--method", choices=METHODS, default="pchip")
+    p.add_argument("--knots", type=int, default=12, help="Số knot (pwl/pchip)")
+    p.add_argument("--flow-col", default="flowABB")
+    p.add_argument("--size", type=int, default=INV_SIZE, help="Số ô mỗi bảng")
+    p.add_argument("--out", default="hz_table.npz")
+    p.set_defaults(func=cmd_inverse)
+
+    p = sub.add_parser("hz", help="Tra Hz cần đặt cho lưu lượng / RPM")
+    p.add_argument("table")
+    p.add_argument("--flow", type=float, nargs="+")
+    p.add_argument("--rpm", type=float, nargs="+")
+    p.set_defaults(func=cmd_hz)
+
+    p = sub.add_parser("header", help="Sinh header C (LUT 1024 phần tử theo analogRead) cho RS485.ino")
+    p.add_argument("--calib", help="Bảng hiệu chuẩn .npz cho cảm biến 2; bỏ trống = công thức tuyến tính cũ")
+    p.add_argument("--max1", type=float, default=FW_MAX_VALUE, help="MAX_VALUE cảm biến 1 (g/s)")
+    p.add_argument("--max2", type=float, default=FW_MAX_VALUE, help="MAX_VALUE cảm biến 2 khi không có --calib")
+    p.add_argument("--out", default=os.path.join("RS485", "maf_lut.h"))
+    p.set_defaults(func=cmd_header)
+
+    p = sub.add_parser("check-header", help="Biên dịch header bằng cc trên host và so với mô hình Python")
+    p.add_argument("header")
+    p.add_argument("--calib")
+    p.add_argument("--max1", type=float, default=FW_MAX_VALUE)
+    p.add_argument("--max2", type=float, default=FW_MAX_VALUE)
+    p.add_argument("--cc", default=os.environ.get("CC", "cc"))
+    p.set_defaults(func=cmd_check_header)
+
+    args = ap.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Danh mục SQLite cho mọi lần chạy run.py / save_data.py: 1 dòng metadata / lần
+# chạy (bảng runs) + 1 dòng trung bình / mức hz (bảng setpoints). Hỏi "trôi bao
+# nhiêu ở 40 Hz trên rig 2" chỉ còn là 1 câu SQL có index, không đọc lại CSV.
+#
+#   python3 catalog.py ingest logs/ --rig rig2 --sensor maf-07 --workers 4
+#   python3 catalog.py runs --rig rig2 --since 2024-05-01
+#   python3 catalog.py drift --rig rig2 --hz 40 --col voltMaf --min-pct 2
+#   python3 catalog.py hz --rig rig2 --hz 40          # lịch sử 1 mức hz
+#
+# Ingest dùng batch_analyze (song song nhiều lõi), rồi ghi cả lô bằng executemany
+# trong 1 transaction. File đã có và không đổi (mtime, size) thì bỏ qua; file đổi
+# thì thay bản cũ. drift so với lần chạy sớm nhất cùng rig / cảm biến ở mức hz đó
+# (hoặc --baseline ID).
+
+import os, time, sqlite3, argparse
+
+from batch_analyze import find_files, run_batch
+from results_cache import default_rig
+
+DEFAULT_PATH = "maf_catalog.sqlite"
+POINT_VALUES = ("n", "rpm", "flowABB", "flowABB_std", "voltABB", "voltMaf", "voltMaf_std", "analog")
+DRIFT_COLS = ("voltMaf", "flowABB", "voltABB", "rpm", "analog")
+
+_SCHEMA = """
+PRAGMA foreign_keys = ON;
+CREATE TABLE IF NOT EXISTS runs (
+    id           INTEGER PRIMARY KEY,
+    path         TEXT NOT NULL UNIQUE,
+    rig          TEXT NOT NULL,
+    sensor       TEXT NOT NULL DEFAULT '',
+    kind         TEXT NOT NULL,
+    date         TEXT NOT NULL,            -- YYYY-MM-DD
+    t_start      TEXT NOT NULL,            -- YYYY-MM-DD HH:MM:SS (giờ máy)
+    duration_s   REAL,
+    rows         INTEGER,
+    seq_lost     INTEGER,
+    hz_min       INTEGER, hz_max INTEGER,
+    flowABB_mean REAL, voltMaf_min REAL, voltMaf_max REAL,
+    fit_method   TEXT, fit_rmse REAL, fit_r2 REAL,
+    mtime_ns     INTEGER NOT NULL,
+    size         INTEGER NOT NULL,
+    ingested     REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS setpoints (
+    run_id      INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    hz          INTEGER NOT NULL,
+    n           INTEGER,
+    rpm REAL, flowABB REAL, flowABB_std REAL, voltABB REAL, voltMaf REAL, voltMaf_std REAL, analog REAL,
+    PRIMARY KEY (run_id, hz)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS runs_rig_date ON runs (rig, date);
+CREATE INDEX IF NOT EXISTS runs_date ON runs (date);
+CREATE INDEX IF NOT EXISTS setpoints_hz ON setpoints (hz, run_id);
+"""
+
+RUN_COLS = ("path", "rig", "sensor", "kind", "date", "t_start", "duration_s", "rows", "seq_lost",
+            "hz_min", "hz_max", "flowABB_mean", "voltMaf_min", "voltMaf_max",
+            "fit_method", "fit_rmse", "fit_r2", "mtime_ns", "size", "ingested")
+
+
+def _null(v):
+    return None if v == "" else v
+
+
+class Catalog:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    # ====== Nạp dữ liệu ======
+    def stale(self, files):
+        """Các file chưa có hoặc đã đổi (mtime/size) so với lần ingest trước."""
+        known = {p: (m, s) for p, m, s in self.db.execute("SELECT path, mtime_ns, size FROM runs")}
+        out = []
+        for f in files:
+            st = os.stat(f)
+            if known.get(os.path.abspath(f)) != (st.st_mtime_ns, st.st_size):
+                out.append(f)
+        return out
+
+    def ingest(self, summaries, points, rig, sensor=""):
+        """Ghi kết quả batch_analyze. Trả về (số run, số setpoint, danh sách lỗi)."""
+        now = time.time()
+        rows, errors = [], []
+        for s in summaries:
+            if s["error"]:
+                errors.append(s)
+                continue
+            st = os.stat(s["file"])
+            t_start = s["t_start"] or time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(st.st_mtime))
+            vals = {k: _null(s.get(k, "")) for k in RUN_COLS}
+            vals.update(path=os.path.abspath(s["file"]), rig=rig, sensor=sensor, date=t_start[:10],
+                        t_start=t_start, mtime_ns=st.st_mtime_ns, size=st.st_size, ingested=now)
+            rows.append(tuple(vals[k] for k in RUN_COLS))
+        paths = [r[0] for r in rows]
+        with self.db:
+            # Thay bản cũ (setpoints xóa theo nhờ ON DELETE CASCADE)
+            self.db.executemany("DELETE FROM runs WHERE path=?", [(p,) for p in paths])
+            self.db.executemany(f"INSERT INTO runs ({', '.join(RUN_COLS)}) VALUES "
+                                f"({', '.join('?' * len(RUN_COLS))})", rows)
+            ids = {}
+            for i in range(0, len(paths), 500):          # giới hạn số tham số của SQLite
+                chunk = paths[i:i + 500]
+                q = f"SELECT path, id FROM runs WHERE path IN ({', '.join('?' * len(chunk))})"
+                ids.update(self.db.execute(q, chunk))
+            pts = [(ids[os.path.abspath(p["file"])], p["hz"], *(p[k] for k in POINT_VALUES))
+                   for p in points if os.path.abspath(p["file"]) in ids]
+            self.db.executemany(f"INSERT INTO setpoints (run_id, hz, {', '.join(POINT_VALUES)}) "
+                                f"VALUES ({', '.join('?' * (len(POINT_VALUES) + 2))})", pts)
+        return len(rows), len(pts), errors
+
+    # ====== Truy vấn ======
+    def runs(self, rig=None, sensor=None, since=None, until=None, kind=None):
+        q = ("SELECT id, rig, sensor, kind, t_start, duration_s, rows, hz_min, hz_max, fit_rmse, path "
+             "FROM runs WHERE (:rig IS NULL OR rig=:rig) AND (:sensor IS NULL OR sensor=:sensor) "
+             "AND (:since IS NULL OR date>=:since) AND (:until IS NULL OR date<=:until) "
+             "AND (:kind IS NULL OR kind=:kind) ORDER BY t_start")
+        return self.db.execute(q, dict(rig=rig, sensor=sensor, since=since, until=until, kind=kind)).fetchall()
+
+    def history(self, hz, col="voltMaf", rig=None, sensor=None, since=None, until=None, baseline=None):
+        """[(id, rig, sensor, t_start, value, base, pct)] ở 1 mức hz, theo thời gian.
+
+        base = giá trị của lần chạy --baseline, hoặc lần sớm nhất cùng rig + cảm biến.
+        """
+        if col not in DRIFT_COLS:
+            raise ValueError(f"col phải là một trong {DRIFT_COLS}")
+        # Mốc gốc tính trên mọi lần chạy của rig + cảm biến (chưa lọc ngày), rồi mới lọc
+        # since/until cho các dòng trả về — lần sớm nhất trong cửa sổ không phải là gốc.
+        q = f"""
+            WITH pts AS (
+                SELECT r.id, r.rig, r.sensor, r.t_start, r.date, s.{col} AS v
+                FROM setpoints s JOIN runs r ON r.id = s.run_id
+                WHERE s.hz = :hz AND (:rig IS NULL OR r.rig = :rig)
+                  AND (:sensor IS NULL OR r.sensor = :sensor)
+            ), base AS (
+                SELECT DISTINCT rig, sensor,
+                       FIRST_VALUE(v) OVER (PARTITION BY rig, sensor ORDER BY t_start, id) AS v0
+                FROM pts
+            ), b AS (
+                SELECT p.id, p.rig, p.sensor, p.t_start, p.v,
+                       COALESCE((SELECT {col} FROM setpoints WHERE run_id = :base AND hz = :hz), base.v0) AS v0
+                FROM pts p JOIN base ON base.rig = p.rig AND base.sensor = p.sensor
+                WHERE (:since IS NULL OR p.date >= :since) AND (:until IS NULL OR p.date <= :until)
+            )
+            SELECT id, rig, sensor, t_start, v, v0,
+                   CASE WHEN ABS(v0) > 1e-9 THEN 100.0 * (v - v0) / ABS(v0) END AS pct
+            FROM b ORDER BY rig, sensor, t_start, id"""
+        return self.db.execute(q, dict(hz=int(hz), rig=rig, sensor=sensor, since=since,
+                                       until=until, base=baseline)).fetchall()
+
+    def drift(self, hz, min_pct, **kw):
+        return [r for r in self.history(hz, **kw) if r[6] is not None and abs(r[6]) > min_pct]
+
+
+# ====== CLI ======
+def _timed(fn, *a, **kw):
+    t0 = time.perf_counter()
+    out = fn(*a, **kw)
+    return out, (time.perf_counter() - t0) * 1000
+
+
+def cmd_ingest(cat, args):
+    files = find_files(args.inputs)
+    todo = files if args.force else cat.stale(files)
+    print(f"📥 {len(files)} file, {len(todo)} mới / đã đổi")
+    if not todo:
+        return
+    summaries, points, dt = run_batch(todo, args.workers or None)
+    (n_run, n_pt, errors), ms = _timed(cat.ingest, summaries, points, args.rig, args.sensor)
+    for s in errors:
+        print(f"⚠️ {s['file']}: {s['error']}")
+    print(f"✅ {n_run} run, {n_pt} setpoint (phân tích {dt:.2f}s, ghi DB {ms:.0f} ms)")
+
+
+def cmd_runs(cat, args):
+    rows, ms = _timed(cat.runs, args.rig, args.sensor, args.since, args.until, args.kind)
+    for rid, rig, sensor, kind, t0, dur, n, h0, h1, rmse, path in rows:
+        dur = f"{dur / 60:7.1f}m" if dur is not None else "      --"
+        rmse = f"{rmse:.3f}" if rmse is not None else "--"
+        print(f"#{rid:<5d} {rig:10s} {sensor:10s} {kind:3s} {t0} {dur} {n:7d} dòng "
+              f"hz {h0}..{h1}  rmse={rmse}  {path}")
+    print(f"🔎 {len(rows)} run ({ms:.1f} ms)")
+
+
+def cmd_hist(cat, args, drift_only):
+    kw = dict(col=args.col, rig=args.rig, sensor=args.sensor, since=args.since,
+              until=args.until, baseline=args.baseline)
+    if drift_only:
+        rows, ms = _timed(cat.drift, args.hz, args.min_pct, **kw)
+    else:
+        rows, ms = _timed(cat.history, args.hz, **kw)
+    for rid, rig, sensor, t0, v, v0, pct in rows:
+        pct = f"{pct:+7.2f}%" if pct is not None else "     --"
+        print(f"#{rid:<5d} {rig:10s} {sensor:10s} {t0}  {args.col}@{args.hz}Hz={v:.4f} (gốc {v0:.4f}) {pct}")
+    label = f"lệch > {args.min_pct}%" if drift_only else "điểm"
+    print(f"🔎 {len(rows)} {label} ({ms:.1f} ms)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Danh mục SQLite các lần chạy run.py / save_data.py.")
+    ap.add_argument("--db", default=DEFAULT_PATH)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("ingest", help="Nạp file / thư mục CSV vào danh mục")
+    p.add_argument("inputs", nargs="+")
+    p.add_argument("--rig", default=default_rig(), help="Tên rig (mặc định: hostname)")
+    p.add_argument("--sensor", default="", help="Mã cảm biến MAF đang gắn")
+    p.add_argument("--workers", type=int, default=0, help="Số tiến trình phân tích (0 = số lõi)")
+    p.add_argument("--force", action="store_true", help="Nạp lại cả file không đổi")
+
+    filters = argparse.ArgumentParser(add_help=False)
+    filters.add_argument("--rig")
+    filters.add_argument("--sensor")
+    filters.add_argument("--since", help="Từ ngày YYYY-MM-DD")
+    filters.add_argument("--until", help="Tới ngày YYYY-MM-DD")
+
+    p = sub.add_parser("runs", parents=[filters], help="Liệt kê các lần chạy")
+    p.add_argument("--kind", choices=("run", "log"))
+
+    for name, help_ in (("hz", "Lịch sử 1 mức hz qua các lần chạy"),
+                        ("drift", "Các lần chạy lệch gốc quá ngưỡng ở 1 mức hz")):
+        p = sub.add_parser(name, parents=[filters], help=help_)
+        p.add_argument("--hz", type=int, required=True)
+        p.add_argument("--col", choices=DRIFT_COLS, default="voltMaf")
+        p.add_argument("--baseline", type=int, help="ID run làm gốc (mặc định: lần sớm nhất)")
+        if name == "drift":
+            p.add_argument("--min-pct", type=float, default=2.0, help="Ngưỡng lệch (%%)")
+    args = ap.parse_args()
+
+    cat = Catalog(args.db)
+    try:
+        if args.cmd == "ingest":
+            cmd_ingest(cat, args)
+        elif args.cmd == "runs":
+            cmd_runs(cat, args)
+        else:
+            cmd_hist(cat, args, args.cmd == "drift")
+    finally:
+        cat.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# File trạng thái nhỏ (JSON) ghi nguyên tử: tmp -> fsync -> os.replace.
+# Mất điện lúc đang ghi thì vẫn còn bản cũ nguyên vẹn, không bao giờ nửa nọ nửa kia.
+
+import os, json, time, hashlib
+
+STATE_VERSION = 1
+
+
+def fingerprint(obj):
+    """sha1 của obj (JSON, sắp key) — dùng để chắc chắn resume đúng profile."""
+    data = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """dict trạng thái hoặc None nếu chưa có / hỏng / khác phiên bản."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+            return None
+        return state
+
+    def save(self, state):
+        state = dict(state, version=STATE_VERSION, updated=time.strftime("%Y-%m-%d %H:%M:%S"))
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        # fsync thư mục để chính việc đổi tên cũng bền qua mất điện
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+    def clear(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Đọc 2 cột lưu lượng / điện áp từ CSV bằng NumPy, có cache nhị phân cạnh file.
+#
+# Lần đầu: dò delimiter + header trên vài KB đầu (bỏ qua dòng tiêu đề không phải
+# bảng), phần thân đưa thẳng cho np.loadtxt (C); thân có ô trong ngoặc kép
+# ("1,5";"2,25") thì tách bằng module csv. Kết quả ghi ra <file>.cache.npz kèm khóa (đường dẫn, mtime,
+# size); lần sau khóa khớp thì chỉ việc nạp lại 2 mảng float64.
+
+import os, io, re, csv, sys, json, time, hashlib, tempfile
+import numpy as np
+
+CACHE_VERSION = 2
+CACHE_SUFFIX = ".cache.npz"
+SNIFF_BYTES = 4096
+DELIMITERS = (";", "\t", "|", ",")     # ';' trước ',' vì file Excel VN dùng dấu phẩy thập phân
+
+FLOW_KEYS = ["lưu lượng", "luu luong", "flow"]
+VOLT_KEYS = ["volt", "điện áp", "dien ap", "voltage"]
+
+
+def _cache_key(path):
+    st = os.stat(path)
+    return json.dumps({"v": CACHE_VERSION, "path": os.path.abspath(path),
+                       "mtime_ns": st.st_mtime_ns, "size": st.st_size}, sort_keys=True)
+
+
+def cache_path(path):
+    """Sidecar cạnh file CSV; thư mục không ghi được thì dùng thư mục tạm."""
+    side = path + CACHE_SUFFIX
+    folder = os.path.dirname(os.path.abspath(path))
+    if os.access(folder, os.W_OK):
+        return side
+    h = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"maf_csv_{h}{CACHE_SUFFIX}")
+
+
+def _load_cache(path, key):
+    cp = cache_path(path)
+    try:
+        with np.load(cp, allow_pickle=False) as z:
+            if str(z["key"]) != key:
+                return None
+            names = [str(s) for s in z["names"]]
+            return {"x": z["x"], "y": z["y"], "x_name": names[0], "y_name": names[1]}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_cache(path, key, data):
+    cp = cache_path(path)
+    tmp = f"{cp}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.savez(f, key=np.array(key), x=data["x"], y=data["y"],
+                     names=np.array([data["x_name"], data["y_name"]]))
+        os.replace(tmp, cp)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+_QUOTED_RE = re.compile(r'"[^"]*"')
+
+
+def sniff_delimiter(lines):
+    """Delimiter xuất hiện đều (cùng số lần, > 0) trên khối dòng cuối của mẫu.
+
+    Đếm ngoài ngoặc kép; dòng tiêu đề / ghi chú ở đầu file (số delimiter khác) không
+    làm hỏng kết quả: chọn delimiter có khối dòng cuối đều nhau dài nhất.
+    """
+    rows = [_QUOTED_RE.sub('""', l) for l in lines if l.strip()]
+    best, best_run = ",", 0
+    for d in DELIMITERS:
+        counts = [l.count(d) for l in rows]
+        if not counts or counts[-1] == 0:
+            continue
+        run = 1
+        while run < len(counts) and counts[-run - 1] == counts[-1]:
+            run += 1
+        if run > best_run and (run >= 2 or len(rows) == 1):
+            best, best_run = d, run
+    return best
+
+
+def find_header(rows):
+    """Chỉ số dòng header trong 10 dòng đầu + vị trí cột flow/volt (giống bản cũ)."""
+    header_idx = None
+    for i, row in enumerate(rows[:10]):
+        low = [c.strip().lower() for c in row]
+        has_flow = any(k in c for c in low for k in FLOW_KEYS)
+        has_volt = any(k in c for c in low for k in VOLT_KEYS)
+        if has_flow and has_volt:
+            header_idx = i
+            break
+    if header_idx is None:
+        header_idx = 2 if len(rows) > 2 else 0
+    header = [c.strip().strip('"') for c in rows[header_idx]]
+    low = [c.lower() for c in header]
+
+    def find_idx(keys):
+        for j, name in enumerate(low):
+            if any(k in name for k in keys):
+                return j
+        return None
+
+    idx_flow = find_idx(FLOW_KEYS) or 0
+    idx_volt = find_idx(VOLT_KEYS) or 1
+    return header_idx, header, idx_flow, idx_volt
+
+
+def _parse_slow(lines, delim, cols):
+    # Dự phòng khi thân file có dòng hỏng: bỏ qua dòng lỗi như bản cũ
+    xs, ys = [], []
+    n = max(cols) + 1
+    for line in lines:
+        r = line.split(delim)
+        if len(r) < n:
+            continue
+        try:
+            x = float(r[cols[0]].strip().strip('"'))
+            y = float(r[cols[1]].strip().strip('"'))
+        except ValueError:
+            continue
+        xs.append(x); ys.append(y)
+    return np.array(xs, dtype=np.float64), np.array(ys, dtype=np.float64)
+
+
+def _parse_quoted(body, delim, cols):
+    # Ô trong ngoặc kép có thể chứa delimiter / dấu phẩy thập phân: module csv tách, đổi ',' từng ô
+    xs, ys = [], []
+    n = max(cols) + 1
+    for r in csv.reader(io.StringIO(body), delimiter=delim, quotechar='"'):
+        if len(r) < n:
+            continue
+        try:
+            x = float(r[cols[0]].strip().replace(",", "."))
+            y = float(r[cols[1]].strip().replace(",", "."))
+        except ValueError:
+            continue
+        xs.append(x); ys.append(y)
+    return np.array(xs, dtype=np.float64), np.array(ys, dtype=np.float64)
+
+
+def parse_csv(path):
+    """Đọc CSV -> dict x (lưu lượng), y (điện áp), x_name, y_name. Không dùng cache."""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        text = f.read()
+    if not text.strip():
+        raise ValueError("File CSV không có dữ liệu.")
+
+    head_lines = text[:SNIFF_BYTES].splitlines()
+    if len(text) > SNIFF_BYTES and head_lines:
+        head_lines = head_lines[:-1]           # dòng cuối có thể bị cắt giữa chừng
+    delim = sniff_delimiter(head_lines)
+    header_idx, header, idx_flow, idx_volt = find_header(list(csv.reader(head_lines[:10], delimiter=delim)))
+
+    # Cắt phần thân sau dòng header
+    pos = 0
+    for _ in range(header_idx + 1):
+        nl = text.find("\n", pos)
+        pos = len(text) if nl < 0 else nl + 1
+    body = text[pos:]
+    cols = (idx_flow, idx_volt)
+    if '"' in body:
+        xs, ys = _parse_quoted(body, delim, cols)
+    else:
+        if delim != "," and "," in body:
+            body = body.replace(",", ".")      # dấu phẩy thập phân: thay một lần cho cả khối
+        try:
+            arr = np.loadtxt(io.StringIO(body), delimiter=delim, usecols=cols, ndmin=2,
+                             dtype=np.float64, comments=None)
+            xs, ys = arr[:, 0].copy(), arr[:, 1].copy()
+        except ValueError:
+            xs, ys = _parse_slow(body.splitlines(), delim, cols)
+
+    name = lambda j, default: header[j] if j < len(header) and header[j] else default
+    return {"x": xs, "y": ys, "x_name": name(idx_flow, "Lưu lượng"), "y_name": name(idx_volt, "Volt (V)")}
+
+
+def load_columns(path, use_cache=True):
+    """Như parse_csv nhưng dùng/ghi cache nhị phân. Thêm khóa 'cached' (True nếu lấy từ cache)."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    key = _cache_key(path)
+    if use_cache:
+        data = _load_cache(path, key)
+        if data is not None:
+            data["cached"] = True
+            return data
+    data = parse_csv(path)
+    if use_cache:
+        _save_cache(path, key, data)
+    data["cached"] = False
+    return data
+
+
+def decimate(x, y, max_points):
+    """Giảm số điểm để vẽ: mỗi nhóm giữ điểm y nhỏ nhất và lớn nhất (giữ nguyên đường bao)."""
+    n = len(x)
+    if n <= max_points:
+        return x, y
+    buckets = max(1, max_points // 2)
+    size = n // buckets
+    m = buckets * size
+    yb = y[:m].reshape(buckets, size)
+    base = np.arange(buckets) * size
+    i_min = base + yb.argmin(axis=1)
+    i_max = base + yb.argmax(axis=1)
+    idx = np.sort(np.concatenate([i_min, i_max, np.arange(m, n)[-1:]]))
+    return x[idx], y[idx]
+
+
+if __name__ == "__main__":
+    # python3 csv_loader.py data.csv -> đo thời gian đọc lần đầu / lần có cache
+    p = sys.argv[1]
+    for label, cache in (("không cache", False), ("cache", True), ("cache", True)):
+        t0 = time.perf_counter()
+        d = load_columns(p, use_cache=cache)
+        dt = time.perf_counter() - t0
+        print(f"{label:12s} {len(d['x'])} dòng  {dt * 1000:8.1f} ms  cached={d['cached']}  "
+              f"[{d['x_name']} / {d['y_name']}]")
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Ghi CSV liên tục ở thread nền: GUI chỉ đẩy dòng vào hàng đợi, thread ghi
+# gom thành lô rồi flush + fsync một lần cho cả lô (group commit).
+#
+# Dữ liệu đang ghi nằm ở <path>.part; save() chốt file (đổi tên nguyên tử
+# thành <tên>.<YYYYmmdd-HHMMSS>.csv, không ghi đè lần lưu trước) rồi mở đoạn mới.
+# Mất điện giữa chừng thì .part vẫn còn tới lần commit gần nhất; lần chạy sau
+# chốt nó thành một file có mốc thời gian trước khi mở .part mới (self.recovered).
+# Phần ghi file / fsync / đổi tên dùng chung log_writer.LogWriter.
+
+import os, glob, time, queue, atexit, threading
+
+from log_writer import LogWriter, segment_name
+
+PART_SUFFIX = ".part"
+BATCH_ROWS = 500          # ghi ngay khi đủ số dòng này
+COMMIT_S = 1.0            # hoặc khi dòng cũ nhất đã đợi quá chừng này giây
+
+_SAVE = object()
+_STOP = object()
+
+
+class CsvRecorder:
+    def __init__(self, path, header, batch_rows=BATCH_ROWS, commit_s=COMMIT_S, fsync=True):
+        self.path = path
+        self.part = path + PART_SUFFIX
+        self.header = list(header)
+        self.batch_rows = batch_rows
+        self.commit_s = commit_s
+        self.fsync = fsync
+
+        self.rows = 0             # số dòng trong đoạn hiện tại
+        self.rows_total = 0
+        self.commits = 0
+        self.last_commit_ms = 0.0
+        self.error = None
+
+        self.recovered = self._recover()
+
+        # Lô do thread này gom (batch_rows / commit_s) nên LogWriter chỉ flush khi được gọi commit()
+        self._log = LogWriter(self.part, self.header, flush_rows=1 << 30, flush_ms=1 << 30,
+                              fsync="flush" if fsync else "never", append=False)
+        self._q = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._loop, name="csv-recorder", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _recover(self):
+        """.part còn dòng dữ liệu từ lần chạy trước (mất điện / bị kill) -> chốt thành file riêng."""
+        try:
+            with open(self.part, "r", encoding="utf-8", errors="ignore") as f:
+                f.readline()
+                has_rows = any(line.strip() for line in f)
+        except FileNotFoundError:
+            return None
+        if not has_rows:
+            return None
+        dest = segment_name(self.path, os.path.getmtime(self.part))
+        os.replace(self.part, dest)
+        return dest
+
+    # ====== API cho GUI (không chặn) ======
+    def append(self, row):
+        self._q.put(row)
+
+    def save(self, on_done=None):
+        """Chốt đoạn đang ghi thành <tên>.<mốc thời gian>.csv rồi bắt đầu đoạn mới.
+
+        on_done(path đã lưu, số dòng, lỗi hoặc None) được gọi từ thread ghi; ở Qt hãy emit
+        một signal trong callback thay vì đụng trực tiếp vào widget.
+        """
+        self._q.put((_SAVE, on_done))
+
+    def close(self):
+        if self._thread.is_alive():
+            self._q.put((_STOP, None))
+            self._thread.join()
+
+    # ====== Thread ghi ======
+    def _commit(self, batch):
+        if not batch:
+            return
+        t0 = time.perf_counter()
+        self._log.writerows(batch)
+        self._log.commit()
+        self.rows += len(batch)
+        self.rows_total += len(batch)
+        self.commits += 1
+        self.last_commit_ms = (time.perf_counter() - t0) * 1000
+        batch.clear()
+
+    def _finalize(self):
+        # fsync, đổi tên nguyên tử sang tên chưa có, mở .part mới có header
+        dest = self._log.rotate(segment_name(self.path, self._log.opened_at))
+        self.rows = 0
+        return dest
+
+    def _loop(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._q.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            ctrl = item[0] if isinstance(item, tuple) and item and item[0] in (_SAVE, _STOP) else None
+            if item is not None and ctrl is None:
+                if not batch:
+                    deadline = time.monotonic() + self.commit_s
+                batch.append(item)
+                if len(batch) < self.batch_rows:
+                    continue
+            try:
+                self._commit(batch)
+                if ctrl is _SAVE:
+                    n = self.rows
+                    dest = self._finalize()
+                    if item[1]:
+                        item[1](dest, n, None)
+                elif ctrl is _STOP:
+                    self._log.close()
+                    return
+            except Exception as e:
+                self.error = e
+                batch.clear()
+                if ctrl is _SAVE and item[1]:
+                    item[1](self.path, 0, e)
+                elif ctrl is _STOP:
+                    return
+            deadline = None
+
+    def stats(self):
+        return {"rows": self.rows, "rows_total": self.rows_total, "commits": self.commits,
+                "last_commit_ms": round(self.last_commit_ms, 2), "pending": self._q.qsize()}
+
+
+def latest_saved(path):
+    """File đã save() mới nhất của path (hoặc chính path nếu là file cũ kiểu một tên); None nếu chưa có."""
+    stem, ext = os.path.splitext(path)
+    found = glob.glob(f"{glob.escape(stem)}.[0-9]*{ext}")
+    if os.path.exists(path):
+        found.append(path)
+    return max(found, key=os.path.getmtime) if found else None
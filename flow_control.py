@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Điều khiển vòng kín lưu lượng: PID trên host chạy ở thread riêng, nhịp cố định.
+#
+#   lưu lượng đo (STATUS) ──feed()──► FlowController ──send_hz(hz)──► SET_HZ
+#
+# - PID đạo hàm theo giá trị đo (không giật khi đổi setpoint), lọc thông thấp
+#   phần D (chỉ cập nhật khi có mẫu STATUS mới, theo khoảng cách giữa 2 mẫu), chống bão hòa tích phân (chỉ tích phân khi đầu ra không bị kẹp theo
+#   đúng chiều sai số) và giới hạn tốc độ thay đổi Hz/s.
+# - Lệnh SET_HZ được gộp (CommandCoalescer): tối đa 1 lệnh mỗi MIN_CMD_S, bỏ qua
+#   thay đổi nhỏ hơn DEADBAND_HZ — vòng điều khiển chạy 20 Hz nhưng Arduino chỉ
+#   phải ghi Modbus khi thật sự cần.
+# - Mỗi lần đổi setpoint, StepMonitor đo thời gian xác lập và độ vọt lố rồi báo
+#   qua on_event.
+# - Giá trị đo cũ quá STALE_S (mất STATUS) thì giữ nguyên đầu ra, không tích phân.
+# - Có feedforward (vd calibration.SetpointTable): mỗi lần đổi setpoint đầu ra nhảy
+#   ngay tới Hz tra bảng bằng 1 lệnh SET_HZ rồi giữ nguyên tới khi lưu lượng vào dải
+#   xác lập (hoặc hết FF_HOLD_S) — quá độ tăng tốc của biến tần không bị tích phân
+#   thành vọt lố; sau đó PID chỉ bù phần sai số còn lại của bảng.
+#
+#   python3 flow_control.py     -> mô phỏng quạt + trễ STATUS, in kết quả các bước
+
+import math, time, threading
+
+CONTROL_HZ = 20.0           # nhịp vòng điều khiển
+HZ_MIN, HZ_MAX = 0.0, 60.0
+RATE_LIMIT = 6.0            # Hz/s tối đa đầu ra được đổi
+MIN_CMD_S = 0.2             # khoảng cách tối thiểu giữa 2 lệnh SET_HZ
+DEADBAND_HZ = 0.05          # thay đổi nhỏ hơn thì không gửi
+STALE_S = 1.0               # giá trị đo cũ hơn -> giữ đầu ra
+FF_HOLD_S = 8.0             # có feed-forward: PID chờ tối đa chừng này sau cú nhảy rồi mới bù
+GAINS = {"kp": 0.15, "ki": 0.25, "kd": 0.0}     # Hz / đơn vị lưu lượng (STATUS flow2 hoặc bảng hiệu chuẩn)
+
+SETTLE_BAND = 0.02          # ±2% setpoint ...
+SETTLE_ABS = 0.5            # ... nhưng không hẹp hơn ±0.5 đơn vị lưu lượng
+SETTLE_HOLD_S = 2.0         # phải nằm trong dải liên tục chừng này giây
+SETTLE_TIMEOUT_S = 60.0
+
+
+def _clamp(x, lo, hi):
+    return lo if x < lo else hi if x > hi else x
+
+
+class PID:
+    def __init__(self, kp, ki, kd=0.0, out_min=HZ_MIN, out_max=HZ_MAX, rate_limit=RATE_LIMIT, d_tau=0.5):
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.out_min, self.out_max = out_min, out_max
+        self.rate_limit = rate_limit
+        self.d_tau = d_tau
+        self.reset(0.0)
+
+    def reset(self, output, ff=0.0):
+        """Chuyển mạch không giật: tích phân nhận phần còn lại để đầu ra giữ nguyên."""
+        self.output = output
+        self.i = output - ff
+        self._d = 0.0
+        self._last_meas = self._last_t_meas = None
+
+    def jump(self, ff, ff_old):
+        """Feed-forward đổi: đầu ra nhảy thẳng tới ff + tích phân (không qua giới hạn tốc độ).
+
+        Sai số bảng tra chủ yếu là sai số hệ số, nên phần tích phân co giãn theo ff mới / ff cũ.
+        """
+        if ff_old > 0:
+            self.i *= ff / ff_old
+        self.output = _clamp(ff + self.i, self.out_min, self.out_max)
+        self.i = self.output - ff
+
+    def update(self, setpoint, meas, dt, ff=0.0, t_meas=None):
+        """1 nhịp điều khiển. t_meas = thời điểm của mẫu đo: nhịp (50 ms) nhanh hơn STATUS nên
+        phần D chỉ cập nhật khi có mẫu mới, với dt = khoảng cách giữa 2 mẫu (None = mỗi nhịp là 1 mẫu)."""
+        e = setpoint - meas
+        if t_meas is None or t_meas != self._last_t_meas:
+            dt_d = dt if t_meas is None or self._last_t_meas is None else t_meas - self._last_t_meas
+            if self._last_meas is not None and dt_d > 0:
+                d_raw = -(meas - self._last_meas) / dt_d
+                self._d += (d_raw - self._d) * dt_d / (self.d_tau + dt_d)
+            self._last_meas, self._last_t_meas = meas, t_meas
+
+        i_new = self.i + self.ki * e * dt
+        u_raw = ff + self.kp * e + i_new + self.kd * self._d
+        u = _clamp(u_raw, self.out_min, self.out_max)
+        if self.rate_limit and dt > 0:
+            step = self.rate_limit * dt
+            u = _clamp(u, self.output - step, self.output + step)
+        # Anti-windup: đầu ra bị kẹp (biên hoặc tốc độ) theo chiều sai số -> không tích phân thêm
+        if not ((u < u_raw and e > 0) or (u > u_raw and e < 0)):
+            self.i = i_new
+        self.output = u
+        return u
+
+
+class CommandCoalescer:
+    """Giữ giá trị mới nhất; chỉ trả về giá trị cần gửi khi đã đủ MIN_CMD_S và đổi ≥ deadband."""
+
+    def __init__(self, min_interval=MIN_CMD_S, deadband=DEADBAND_HZ):
+        self.min_interval = min_interval
+        self.deadband = deadband
+        self.last_value = None
+        self.last_t = None
+        self.offered = self.sent = 0
+
+    def offer(self, value, now):
+        self.offered += 1
+        if self.last_value is not None:
+            if abs(value - self.last_value) < self.deadband:
+                return None
+            if now - self.last_t < self.min_interval:
+                return None
+        self.last_value, self.last_t = value, now
+        self.sent += 1
+        return value
+
+    def reset(self, value=None):
+        self.last_value = value
+        self.last_t = None if value is None else -math.inf
+
+
+class StepMonitor:
+    """Đo đáp ứng 1 lần đổi setpoint: thời gian xác lập, vọt lố, thời gian lên 10→90%."""
+
+    def __init__(self, band=SETTLE_BAND, abs_band=SETTLE_ABS, hold_s=SETTLE_HOLD_S, timeout_s=SETTLE_TIMEOUT_S):
+        self.band, self.abs_band = band, abs_band
+        self.hold_s, self.timeout_s = hold_s, timeout_s
+        self.active = False
+
+    def start(self, t, setpoint, y0):
+        self.active = True
+        self.t0, self.sp, self.y0 = t, setpoint, y0
+        self.peak = y0
+        self.t_in = None            # lần gần nhất đi vào dải xác lập
+        self.t10 = self.t90 = None
+
+    def add(self, t, y):
+        """Thêm 1 giá trị đo; trả về dict kết quả khi xác lập (hoặc quá hạn), còn lại None."""
+        if not self.active:
+            return None
+        up = self.sp >= self.y0
+        if (up and y > self.peak) or (not up and y < self.peak):
+            self.peak = y
+        span = self.sp - self.y0
+        if span:
+            frac = (y - self.y0) / span
+            if self.t10 is None and frac >= 0.1:
+                self.t10 = t
+            if self.t90 is None and frac >= 0.9:
+                self.t90 = t
+        tol = max(self.band * abs(self.sp), self.abs_band)
+        if abs(y - self.sp) <= tol:
+            if self.t_in is None:
+                self.t_in = t
+            if t - self.t_in >= self.hold_s:
+                return self._finish(self.t_in - self.t0)
+        else:
+            self.t_in = None
+        if t - self.t0 >= self.timeout_s:
+            return self._finish(None)
+        return None
+
+    def _finish(self, settle_s):
+        self.active = False
+        span = abs(self.sp - self.y0)
+        over = (self.peak - self.sp) if self.sp >= self.y0 else (self.sp - self.peak)
+        return {"setpoint": self.sp, "from": self.y0, "settle_s": settle_s,
+                "overshoot_pct": 100.0 * max(0.0, over) / span if span else 0.0,
+                "rise_s": (self.t90 - self.t10) if self.t10 is not None and self.t90 is not None else None}
+
+
+def format_step(r, unit=""):
+    settle = f"{r['settle_s']:.1f}s" if r["settle_s"] is not None else "chưa xác lập"
+    rise = f"{r['rise_s']:.1f}s" if r["rise_s"] is not None else "--"
+    return (f"{r['from']:.1f} → {r['setpoint']:.1f}{unit}: xác lập {settle}, "
+            f"vọt lố {r['overshoot_pct']:.1f}%, lên 10→90% {rise}")
+
+
+class FlowController(threading.Thread):
+    """Vòng PID lưu lượng ở thread riêng.
+
+    send_hz(hz) và on_event(msg, report) được gọi từ thread điều khiển; ở Qt hãy
+    emit signal trong callback. feedforward(flow) -> hz (tùy chọn) cộng vào đầu ra PID.
+    """
+
+    def __init__(self, send_hz, on_event=None, gains=GAINS, rate_hz=CONTROL_HZ, feedforward=None,
+                 clock=time.monotonic):
+        super().__init__(daemon=True, name="flow-control")
+        self.send_hz = send_hz
+        self.on_event = on_event or (lambda msg, report=None: print(msg))
+        self.pid = PID(**gains)
+        self.coalescer = CommandCoalescer()
+        self.monitor = StepMonitor()
+        self.period = 1.0 / rate_hz
+        self.feedforward = feedforward
+        self.clock = clock
+        self.target = None
+        self.ff_hold_until = None   # sau cú nhảy feed-forward: PID đứng yên tới mốc này / tới khi vào dải
+        self.late_max = 0.0
+        self._meas = None           # (t, flow, hz)
+        self._meas_new = False
+        self._last_t = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    # ====== Gọi từ thread GUI / đọc serial ======
+    def feed(self, t, flow, hz):
+        if flow is None:
+            return
+        with self._lock:
+            self._meas = (t, float(flow), float(hz))
+            self._meas_new = True
+
+    def set_target(self, flow):
+        """Bật / đổi setpoint lưu lượng (None = tắt vòng kín, giữ nguyên Hz hiện tại)."""
+        with self._lock:
+            meas = self._meas
+            was = self.target
+            self.target = None if flow is None else float(flow)
+            if self.target is None:
+                self.monitor.active = False
+                self.ff_hold_until = None
+                return
+            now = self.clock()
+            hz_now = meas[2] if meas else 0.0
+            ff = self.feedforward(self.target) if self.feedforward else 0.0
+            if self.feedforward:
+                self.ff_hold_until = now + FF_HOLD_S
+                if was is None:
+                    self.pid.reset(ff, ff)
+                    self._last_t = None
+                else:
+                    self.pid.jump(ff, self.feedforward(was))
+                self.coalescer.reset(None)      # nhịp kế tiếp gửi ngay, không chờ MIN_CMD_S
+            elif was is None:
+                self.pid.reset(hz_now, ff)
+                self.coalescer.reset(hz_now)
+                self._last_t = None
+            if meas:
+                self.monitor.start(now, self.target, meas[1])
+
+    def stop(self):
+        self._stop.set()
+
+    # ====== Thread điều khiển ======
+    def run(self):
+        next_t = self.clock()
+        while not self._stop.is_set():
+            next_t += self.period               # lịch tuyệt đối, không trôi
+            delay = next_t - self.clock()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                self.late_max = max(self.late_max, -delay)
+                if -delay > self.period:
+                    next_t = self.clock()       # trễ quá 1 nhịp: bỏ nhịp, không bắn dồn
+            try:
+                self.step(self.clock())
+            except Exception as e:
+                self.on_event(f"[CTRL ERR] {e}", None)
+
+    def step(self, now):
+        # Cả nhịp chạy dưới _lock: set_target (thread GUI) đổi cùng pid / monitor / ff_hold_until.
+        # Callback gọi sau khi nhả khóa để on_event có thể gọi lại set_target.
+        with self._lock:
+            rep, out = self._step(now)
+        if rep:
+            self.on_event(f"🎯 {format_step(rep)}", rep)
+        if out is not None:
+            self.send_hz(out)
+
+    def _step(self, now):
+        target, meas, new = self.target, self._meas, self._meas_new
+        self._meas_new = False
+        if target is None or meas is None:
+            self._last_t = None
+            return None, None
+        t_meas, flow, _ = meas
+        rep = self.monitor.add(t_meas, flow) if new and self.monitor.active else None
+        if now - t_meas > STALE_S:
+            self._last_t = None                 # mất STATUS: giữ đầu ra
+            return rep, None
+        dt = self.period if self._last_t is None else now - self._last_t
+        self._last_t = now
+        if self.ff_hold_until is not None:
+            if now < self.ff_hold_until and abs(target - flow) > max(SETTLE_BAND * abs(target), SETTLE_ABS):
+                hz = self.pid.output            # cú nhảy feed-forward đang có hiệu lực
+            else:
+                self.ff_hold_until = None
+                self.pid.reset(self.pid.output, self.feedforward(target))
+                hz = self.pid.output
+        else:
+            ff = self.feedforward(target) if self.feedforward else 0.0
+            hz = self.pid.update(target, flow, dt, ff, t_meas)
+        return rep, self.coalescer.offer(round(hz, 2), now)
+
+    def report(self):
+        c = self.coalescer
+        return (f"PID out={self.pid.output:.2f}Hz | SET_HZ gửi {c.sent}/{c.offered} nhịp | "
+                f"trễ nhịp max {self.late_max * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    # Mô phỏng: quạt bậc 1 (τ = 1.5 s), biến tần tăng tốc 10 Hz/s, lưu lượng ~ 2.4·hz^1.1,
+    # STATUS mỗi 0.2 s trễ 0.1 s, nhiễu đo ±0.3. Chạy bằng đồng hồ ảo (không cần thread).
+    import random
+    random.seed(3)
+    sim = {"t": 0.0, "cmd": 0.0, "hz": 0.0, "flow": 0.0}
+    sent = []
+    reports = []
+
+    def send(hz):
+        sim["cmd"] = hz
+        sent.append((sim["t"], hz))
+
+    def simulate(feedforward=None):
+        sim.update(t=0.0, cmd=0.0, hz=0.0, flow=0.0)
+        del sent[:], reports[:]
+        ctl = FlowController(send, on_event=lambda msg, rep=None: (print(msg), rep and reports.append(rep)),
+                             clock=lambda: sim["t"], feedforward=feedforward)
+        ctl.feed(0.0, 0.0, 0.0)
+        dt = 0.01
+        pending = []
+        schedule = [(0.0, 60.0), (25.0, 100.0), (50.0, 40.0), (75.0, 70.0)]
+        steps = 0
+        while sim["t"] < 100.0:
+            t = sim["t"]
+            if schedule and t >= schedule[0][0]:
+                ctl.set_target(schedule.pop(0)[1])
+            d = sim["cmd"] - sim["hz"]
+            sim["hz"] += max(-10 * dt, min(10 * dt, d))
+            target_flow = 2.4 * sim["hz"] ** 1.1
+            sim["flow"] += (target_flow - sim["flow"]) * dt / 1.5
+            if steps % 20 == 0:
+                pending.append((t + 0.1, sim["flow"] + random.uniform(-0.3, 0.3), sim["hz"]))
+            while pending and pending[0][0] <= t:
+                ctl.feed(*pending.pop(0))
+            if steps % 5 == 0:
+                ctl.step(t)
+            sim["t"] = round(t + dt, 6)
+            steps += 1
+        print(ctl.report())
+        assert len(reports) == 4 and all(r["settle_s"] is not None for r in reports), reports
+        return max(r["settle_s"] for r in reports), len(sent)
+
+    settle_pid, n_pid = simulate()
+    print("— có feed-forward (bảng lệch 5% so với quạt thật) —")
+    settle_ff, n_ff = simulate(lambda flow: (flow / (2.4 * 1.05)) ** (1 / 1.1))
+    print(f"✅ xác lập chậm nhất: PID {settle_pid:.1f}s ({n_pid} lệnh) → PID+FF {settle_ff:.1f}s ({n_ff} lệnh)")
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Lịch sử mẫu dạng cột (NumPy chunk) có giới hạn RAM, phần cũ tràn ra file memmap.
+#
+# Bộ nhớ cho 1 triệu mẫu (đo bằng `python3 history.py`):
+#   list các tuple (volt, flow)          ~ 112 MB  (tuple 56 B + 2 float 24 B + con trỏ 8 B)
+#   SampleHistory 2 cột float64          ~ 17 MB   (8 B x số cột, cộng chunk đang ghi dở)
+#   SampleHistory 3 cột float64          ~ 25 MB
+# Khi vượt ram_budget, chunk cũ nhất được ghi xuống file: RAM giữ quanh
+# ram_budget + 1 chunk, phần còn lại do page cache của OS quản lý.
+
+import os, sys, time, tempfile
+import numpy as np
+
+CHUNK_ROWS = 65536
+RAM_BUDGET = 64 * 1024 * 1024      # byte
+
+
+class SampleHistory:
+    """Chuỗi mẫu chỉ thêm vào cuối; h[a:b] / h.tail(n) trả về mảng (n, số cột)."""
+
+    def __init__(self, columns, chunk_rows=CHUNK_ROWS, ram_budget=RAM_BUDGET,
+                 dtype=np.float64, spill_dir=None):
+        self.columns = tuple(columns)
+        self.ncol = len(self.columns)
+        self.dtype = np.dtype(dtype)
+        self.chunk_rows = chunk_rows
+        self.row_bytes = self.ncol * self.dtype.itemsize
+        self.ram_chunks = max(1, ram_budget // (chunk_rows * self.row_bytes))
+        self.spill_dir = spill_dir
+
+        self._chunks = []           # chunk đầy còn trong RAM
+        self._cur = self._new_chunk()
+        self._n_cur = 0
+        self._n_spilled = 0         # số dòng đã nằm trong file
+        self._spill = None          # file ghi nối tiếp
+        self._mm = None             # memmap đọc (tạo lại khi file dài thêm)
+        self._mm_rows = 0
+
+    def _new_chunk(self):
+        return np.empty((self.chunk_rows, self.ncol), dtype=self.dtype)
+
+    def __len__(self):
+        return self._n_spilled + len(self._chunks) * self.chunk_rows + self._n_cur
+
+    # ====== Thêm mẫu ======
+    def append(self, *values):
+        self._cur[self._n_cur] = values
+        self._n_cur += 1
+        if self._n_cur == self.chunk_rows:
+            self._roll()
+
+    def extend(self, rows):
+        """Thêm nhiều dòng một lần (mảng/list shape (n, số cột))."""
+        rows = np.asarray(rows, dtype=self.dtype).reshape(-1, self.ncol)
+        i = 0
+        while i < len(rows):
+            k = min(len(rows) - i, self.chunk_rows - self._n_cur)
+            self._cur[self._n_cur:self._n_cur + k] = rows[i:i + k]
+            self._n_cur += k
+            i += k
+            if self._n_cur == self.chunk_rows:
+                self._roll()
+
+    def _roll(self):
+        self._chunks.append(self._cur)
+        self._cur = self._new_chunk()
+        self._n_cur = 0
+        while len(self._chunks) > self.ram_chunks:
+            self._spill_oldest()
+
+    def _spill_oldest(self):
+        if self._spill is None:
+            fd, path = tempfile.mkstemp(prefix="maf_hist_", suffix=".bin", dir=self.spill_dir)
+            self._spill = os.fdopen(fd, "w+b")
+            os.unlink(path)          # file tự mất khi đóng / tiến trình thoát
+        chunk = self._chunks.pop(0)
+        self._spill.write(chunk.tobytes())
+        self._spill.flush()
+        self._n_spilled += self.chunk_rows
+
+    def _mapped(self):
+        if self._mm_rows != self._n_spilled:
+            self._mm = np.memmap(self._spill, dtype=self.dtype, mode="r",
+                                 shape=(self._n_spilled, self.ncol))
+            self._mm_rows = self._n_spilled
+        return self._mm
+
+    # ====== Đọc theo khoảng ======
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self[:][:, self.columns.index(key)]
+        if not isinstance(key, slice):
+            raise TypeError("chỉ hỗ trợ h[a:b] hoặc h['cột']")
+        start, stop, step = key.indices(len(self))
+        out = self.range(start, max(start, stop))
+        return out[::step] if step != 1 else out
+
+    def range(self, start, stop):
+        """Các dòng [start, stop) thành một mảng liền (copy)."""
+        out = np.empty((stop - start, self.ncol), dtype=self.dtype)
+        pos = 0
+        for _, block in self.iter_blocks(start, stop):
+            out[pos:pos + len(block)] = block
+            pos += len(block)
+        return out
+
+    def iter_blocks(self, start=0, stop=None):
+        """Sinh (chỉ số đầu, view) từng khối liền nhau trong [start, stop) — không copy."""
+        n = len(self)
+        stop = n if stop is None else min(stop, n)
+        i = max(0, start)
+        S = self._n_spilled
+        if i < min(stop, S):
+            yield i, self._mapped()[i:min(stop, S)]
+            i = min(stop, S)
+        base = S
+        for c in self._chunks + [self._cur[:self._n_cur]]:
+            end = base + len(c)
+            if i < stop and i < end:
+                hi = min(stop, end)
+                yield i, c[i - base:hi - base]
+                i = hi
+            base = end
+            if i >= stop:
+                break
+
+    def tail(self, n):
+        total = len(self)
+        return self.range(max(0, total - n), total)
+
+    def export_csv(self, path, start=0, stop=None, fmt="%.6g"):
+        """Ghi [start, stop) ra CSV theo từng khối, không dựng cả mảng trong RAM."""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(",".join(self.columns) + "\n")
+            for _, block in self.iter_blocks(start, stop):
+                np.savetxt(f, block, fmt=fmt, delimiter=",")
+
+    def memory_bytes(self):
+        """Byte NumPy đang chiếm trong RAM (không tính file spill)."""
+        return (len(self._chunks) + 1) * self.chunk_rows * self.row_bytes
+
+    def close(self):
+        self._mm = None
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+
+if __name__ == "__main__":
+    # python3 history.py [số mẫu] -> đo RAM/mẫu so với list tuple và kiểm tra đọc lại sau khi spill
+    import tracemalloc
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    tracemalloc.start()
+    lst = [(i * 0.001, i * 0.01) for i in range(n)]
+    tuples_b = tracemalloc.get_traced_memory()[0]
+    del lst
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    h = SampleHistory(("volt", "flow"), ram_budget=1 << 40)
+    t0 = time.perf_counter()
+    for i in range(n):
+        h.append(i * 0.001, i * 0.01)
+    t_app = time.perf_counter() - t0
+    hist_b = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    h.close()
+
+    print(f"list tuple    : {tuples_b / n:6.1f} B/mẫu  ({tuples_b / 1e6:.1f} MB / {n} mẫu)")
+    print(f"SampleHistory : {hist_b / n:6.1f} B/mẫu  ({hist_b / 1e6:.1f} MB / {n} mẫu), "
+          f"append {t_app / n * 1e6:.2f} µs/mẫu")
+
+    # Spill: RAM 4 chunk nhỏ, đo thời gian đọc lại một đoạn nằm trên đĩa
+    # (kiểm tra đúng dữ liệu + giới hạn RAM: test/test_history.py)
+    ref = np.column_stack([np.arange(n) * 0.001, np.arange(n) * 0.01])
+    h = SampleHistory(("volt", "flow"), chunk_rows=4096, ram_budget=4 * 4096 * 16)
+    h.extend(ref)
+    t0 = time.perf_counter()
+    h[n // 4:n // 4 + 100_000]
+    t_rng = time.perf_counter() - t0
+    print(f"spill         : {h._n_spilled} dòng trên đĩa, RAM {h.memory_bytes() / 1e6:.2f} MB, "
+          f"đọc 100k dòng {t_rng * 1000:.1f} ms")
+    h.close()
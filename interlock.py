@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Khóa liên động an toàn: luật đánh giá ngay trong thread đọc serial, trip -> STOP trước mọi lệnh đang chờ.
+#
+# GuardedPort bọc cổng (giống replay.CaptureTap): mọi dòng đi qua read()/readline() của
+# thread đọc được đưa vào Interlock trước khi tới main.py / run.py, nên thời gian phản
+# ứng không phụ thuộc GUI hay hàng đợi xử lý. Khi một luật trip:
+#   - bỏ các byte còn nằm trong bộ đệm gửi của OS (reset_output_buffer)
+#   - gửi "!" (firmware bỏ hàng đợi lệnh, STOP + 0 Hz ngay) rồi "STOP" (firmware cũ)
+#   - chốt trạng thái: lệnh khác STOP / STATUS / RESET / SET_HZ 0 bị chặn tới khi reset()
+#   - đo thời gian từ lúc nhận mẫu vi phạm tới lúc ghi xong STOP
+#
+# Luật (--rule, lặp lại được):
+#   volt2>=4.5@2     ngưỡng: trường STATUS so với giới hạn, @N = N mẫu liên tiếp
+#                    (dòng AVG: so min/max của cửa sổ thay cho trung bình)
+#   rate(flow2)>40   tốc độ thay đổi |Δ/Δt| (đơn vị/giây, theo đồng hồ thiết bị nếu có)
+#   stale>5          quá N giây không có STATUS/AVG (watchdog riêng); mặc định
+#                    max(5, 2 × chu kỳ hỏi STATUS của script gọi), xem default_rules()
+#   err>=3/10        ≥ 3 dòng "ERR ..._FAIL" trong 10 giây
+#
+#   python3 interlock.py [số lần trip]   -> đo độ trễ mẫu -> STOP khi có thread khác đang gửi lệnh
+
+import re, time, operator, threading
+from collections import deque
+
+from telemetry import parse_status, parse_avg, FIELDS
+
+DEFAULT_RULES = ("volt1>=4.5@2", "volt2>=4.5@2", "stale>5", "err>=3/10")
+STALE_MIN_S = 5.0
+STALE_FACTOR = 2.0          # stale mặc định = 2 × chu kỳ hỏi STATUS (trễ 1 nhịp không trip)
+WATCHDOG_S = 0.05
+ESTOP_BYTES = b"!\nSTOP\n"
+SAFE_CMDS = ("STOP", "STATUS", "RESET", "HOLD_STOP")
+FAIL_RE = re.compile(r"^ERR\s+\w*FAIL")
+LAT_KEEP = 1000
+
+_OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+_THRESH_RE = re.compile(r"^(?P<field>\w+)\s*(?P<op>[<>]=?)\s*(?P<limit>-?[\d.]+)(?:@(?P<n>\d+))?$")
+_RATE_RE = re.compile(r"^rate\((?P<field>\w+)\)\s*>\s*(?P<limit>[\d.]+)$")
+_STALE_RE = re.compile(r"^stale\s*>\s*(?P<s>[\d.]+)$")
+_ERR_RE = re.compile(r"^err\s*>=\s*(?P<n>\d+)/(?P<s>[\d.]+)$")
+
+
+# ====== Luật ======
+class Threshold:
+    def __init__(self, field, op, limit, count=1):
+        self.field, self.op, self.limit, self.count = field, op, limit, count
+        self._cmp = _OPS[op]
+        self._hits = 0
+        self.name = f"{field}{op}{limit:g}" + (f"@{count}" if count > 1 else "")
+
+    def feed(self, t, rec):
+        # AVG có min/max: đỉnh trong cửa sổ không bị trung bình che mất
+        v = rec.get(self.field + ("_max" if self.op[0] == ">" else "_min"), rec[self.field])
+        if self._cmp(v, self.limit):
+            self._hits += 1
+            if self._hits >= self.count:
+                return f"{self.name} ({self.field}={v:g})"
+        else:
+            self._hits = 0
+        return None
+
+    def reset(self):
+        self._hits = 0
+
+
+class RateLimit:
+    def __init__(self, field, max_per_s):
+        self.field, self.max_per_s = field, max_per_s
+        self.name = f"rate({field})>{max_per_s:g}"
+        self._last = None
+
+    def feed(self, t, rec):
+        # Ưu tiên millis() của Arduino: không bị jitter USB / lịch thread của host
+        tt = rec["t_dev_ms"] / 1000.0 if rec["t_dev_ms"] is not None else t
+        v = rec[self.field]
+        last, self._last = self._last, (tt, v)
+        if last is None or tt <= last[0]:
+            return None
+        rate = abs(v - last[1]) / (tt - last[0])
+        if rate > self.max_per_s:
+            return f"{self.name} ({rate:.1f}/s)"
+        return None
+
+    def reset(self):
+        self._last = None
+
+
+class ErrorCount:
+    def __init__(self, n, window_s):
+        self.n, self.window_s = n, window_s
+        self.name = f"err>={n}/{window_s:g}"
+        self._times = deque()
+
+    def feed_line(self, t, line):
+        if not FAIL_RE.match(line):
+            return None
+        self._times.append(t)
+        while self._times and t - self._times[0] > self.window_s:
+            self._times.popleft()
+        if len(self._times) >= self.n:
+            return f"{self.name} ({line})"
+        return None
+
+    def reset(self):
+        self._times.clear()
+
+
+def parse_rule(spec):
+    """Chuỗi luật -> đối tượng luật, hoặc ("stale", giây). ValueError nếu sai cú pháp."""
+    s = spec.strip()
+    m = _STALE_RE.match(s)
+    if m:
+        return ("stale", float(m.group("s")))
+    m = _ERR_RE.match(s)
+    if m:
+        return ErrorCount(int(m.group("n")), float(m.group("s")))
+    m = _RATE_RE.match(s)
+    if m:
+        if m.group("field") not in FIELDS:
+            raise ValueError(f"{spec}: trường phải là một trong {FIELDS}")
+        return RateLimit(m.group("field"), float(m.group("limit")))
+    m = _THRESH_RE.match(s)
+    if m:
+        if m.group("field") not in FIELDS:
+            raise ValueError(f"{spec}: trường phải là một trong {FIELDS}")
+        return Threshold(m.group("field"), m.group("op"), float(m.group("limit")), int(m.group("n") or 1))
+    raise ValueError(f"Luật không hiểu: {spec!r} (vd volt2>=4.5@2, rate(flow2)>40, stale>5, err>=3/10)")
+
+
+# ====== Bộ máy ======
+class Interlock:
+    """Đánh giá luật trên từng dòng; trip -> gọi estop() đúng 1 lần cho tới khi reset()."""
+
+    def __init__(self, rules=DEFAULT_RULES, on_trip=None, watchdog_s=WATCHDOG_S):
+        self.sample_rules, self.line_rules = [], []
+        self.stale_s = None
+        for spec in rules:
+            r = parse_rule(spec) if isinstance(spec, str) else spec
+            if isinstance(r, tuple):
+                self.stale_s = r[1]
+            elif hasattr(r, "feed_line"):
+                self.line_rules.append(r)
+            else:
+                self.sample_rules.append(r)
+        self.on_trip = on_trip
+        self.watchdog_s = watchdog_s
+        self.estop = None               # gắn bởi GuardedPort
+        self.tripped = None             # lý do trip đang chốt
+        self.trips = 0
+        self.samples = 0
+        self.blocked = 0
+        self.latencies = deque(maxlen=LAT_KEEP)
+        self.latency_max = 0.0
+        self.eval_max = 0.0
+        self._t_last = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watchdog = None
+
+    def describe(self):
+        names = [r.name for r in self.sample_rules + self.line_rules]
+        if self.stale_s:
+            names.append(f"stale>{self.stale_s:g}")
+        return ", ".join(names)
+
+    # ====== Thread đọc ======
+    def on_line(self, t, line):
+        t0 = time.perf_counter()
+        reason = None
+        if line.startswith(("STATUS", "AVG")):
+            rec = parse_status(line, t) if line[0] == "S" else parse_avg(line, t)
+            if rec is not None:
+                self._t_last = t
+                self.samples += 1
+                for r in self.sample_rules:
+                    reason = r.feed(t, rec) or reason
+        elif line.startswith("ERR"):
+            for r in self.line_rules:
+                reason = r.feed_line(t, line) or reason
+        self.eval_max = max(self.eval_max, time.perf_counter() - t0)
+        if reason:
+            self.trip(reason, t)
+
+    # ====== Watchdog dữ liệu cũ ======
+    def start(self, now=None):
+        """Chạy watchdog; hạn stale tính từ lúc này (luồng STATUS không bao giờ bắt đầu cũng trip)."""
+        if self._t_last is None:
+            self._t_last = time.monotonic() if now is None else now
+        if self.stale_s and self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch, name="interlock-watchdog", daemon=True)
+            self._watchdog.start()
+
+    def close(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.watchdog_s):
+            self.check_stale(time.monotonic())
+
+    def check_stale(self, now):
+        """Trip nếu quá stale_s giây chưa có STATUS/AVG kể từ mẫu cuối / start() / reset()."""
+        t_last = self._t_last
+        if not self.stale_s or t_last is None or self.tripped:
+            return
+        due = t_last + self.stale_s
+        if now >= due:
+            self.trip(f"stale>{self.stale_s:g} (không có STATUS {now - t_last:.1f} s)", due)
+
+    # ====== Trip ======
+    def trip(self, reason, t_cause):
+        with self._lock:
+            if self.tripped:
+                return
+            self.tripped = reason
+            self.trips += 1
+            if self.estop:
+                self.estop()
+            latency = time.monotonic() - t_cause
+        self.latencies.append(latency)
+        self.latency_max = max(self.latency_max, latency)
+        if self.on_trip:
+            self.on_trip(reason, latency)
+
+    def reset(self, now=None):
+        """Bỏ chốt sau khi người vận hành đã xử lý; xóa trạng thái các luật, hạn stale tính lại từ lúc này."""
+        with self._lock:
+            self.tripped = None
+            for r in self.sample_rules + self.line_rules:
+                r.reset()
+            self._t_last = time.monotonic() if now is None else now
+
+    def stats(self):
+        lat = sorted(self.latencies)
+        pct = (lambda p: lat[min(len(lat) - 1, int(p * len(lat)))] * 1000) if lat else (lambda p: float("nan"))
+        return {"trips": self.trips, "samples": self.samples, "blocked": self.blocked,
+                "latency_ms_p50": round(pct(0.5), 3), "latency_ms_max": round(self.latency_max * 1000, 3),
+                "eval_us_max": round(self.eval_max * 1e6, 1)}
+
+    def report(self):
+        s = self.stats()
+        return (f"interlock: {s['trips']} trip, {s['samples']} mẫu, chặn {s['blocked']} lệnh | "
+                f"mẫu→STOP p50 {s['latency_ms_p50']:.2f} ms, max {s['latency_ms_max']:.2f} ms | "
+                f"đánh giá max {s['eval_us_max']:.0f} µs/dòng")
+
+
+class GuardedPort:
+    """Bọc cổng serial: dòng đọc được đi qua Interlock; ghi bị chặn khi đang trip."""
+
+    def __init__(self, ser, interlock):
+        self._ser = ser
+        self.interlock = interlock
+        self._rx = bytearray()
+        self._wlock = threading.Lock()
+        interlock.estop = self._estop
+        interlock.start()
+
+    def _feed(self, data):
+        for b in data:
+            if b in (0x0A, 0x0D):
+                if self._rx:
+                    line = self._rx.decode("utf-8", errors="ignore").strip()
+                    self._rx.clear()
+                    if line:
+                        self.interlock.on_line(time.monotonic(), line)
+            else:
+                self._rx.append(b)
+
+    def read(self, size=1):
+        data = self._ser.read(size)
+        if data:
+            self._feed(data)
+        return data
+
+    def readline(self):
+        data = self._ser.readline()
+        if data:
+            self._feed(data)
+        return data
+
+    def write(self, data):
+        # Kiểm tra trong _wlock: trip giữa lúc kiểm tra và lúc ghi thì _estop phải chờ lệnh này
+        # ghi xong (STOP đi sau nó), còn lệnh chờ khóa sau _estop sẽ thấy tripped và bị chặn
+        with self._wlock:
+            if self.interlock.tripped:
+                cmds = bytes(data).decode("utf-8", errors="ignore").upper().split()
+                if cmds and not (cmds[0] in SAFE_CMDS or (cmds[0] == "SET_HZ" and len(cmds) > 1 and _is_zero(cmds[1]))):
+                    self.interlock.blocked += 1
+                    return 0
+            return self._ser.write(data)
+
+    def _estop(self):
+        # Gọi từ thread đọc / watchdog: bỏ lệnh còn chờ trong bộ đệm gửi rồi ghi STOP ngay
+        with self._wlock:
+            reset = getattr(self._ser, "reset_output_buffer", None)
+            if reset:
+                try:
+                    reset()
+                except Exception:
+                    pass
+            self._ser.write(ESTOP_BYTES)
+            self._ser.flush()
+
+    def close(self):
+        self.interlock.close()
+        self._ser.close()
+
+    def __getattr__(self, name):
+        return getattr(self._ser, name)
+
+
+def _is_zero(s):
+    try:
+        return float(s) == 0.0
+    except ValueError:
+        return False
+
+
+# ====== Dùng chung cho script ======
+def default_rules(poll_s=None):
+    """DEFAULT_RULES với ngưỡng stale theo chu kỳ hỏi STATUS poll_s (giây) của script gọi."""
+    stale = max(STALE_MIN_S, STALE_FACTOR * poll_s) if poll_s else STALE_MIN_S
+    return tuple(f"stale>{stale:g}" if r.startswith("stale") else r for r in DEFAULT_RULES)
+
+
+def add_arguments(parser):
+    parser.add_argument("--rule", action="append", metavar="LUẬT",
+                        help=f"Luật interlock (lặp lại được; mặc định {' '.join(DEFAULT_RULES)}, "
+                             f"stale tối thiểu {STALE_FACTOR:g} × chu kỳ hỏi STATUS)")
+    parser.add_argument("--no-interlock", action="store_true", help="Tắt khóa liên động an toàn")
+
+
+def from_args(args, on_trip=None, poll_s=None):
+    """Interlock theo tùy chọn dòng lệnh (None khi --no-interlock); ValueError nếu luật sai.
+
+    poll_s: chu kỳ hỏi STATUS dài nhất của script -> ngưỡng stale của luật mặc định.
+    """
+    if args.no_interlock:
+        return None
+    return Interlock(args.rule or default_rules(poll_s), on_trip)
+
+
+def guard(ser, il):
+    return GuardedPort(ser, il) if il else ser
+
+
+if __name__ == "__main__":
+    # Đo: thread đọc nhận STATUS liên tục, thỉnh thoảng 1 mẫu bão hòa; thread khác gửi
+    # lệnh SET_HZ mỗi ~1 ms (mỗi lần ghi giả lập 0.2 ms trên dây). Mỗi trip đo mẫu -> STOP.
+    import sys, queue
+    n_trips = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+
+    class FakeSerial:
+        def __init__(self):
+            self.rx = queue.Queue()
+            self.stops = 0
+
+        def readline(self):
+            try:
+                return self.rx.get(timeout=0.1)
+            except queue.Empty:
+                return b""
+
+        def write(self, data):
+            time.sleep(0.0002)
+            if data.startswith(b"!"):
+                self.stops += 1
+            return len(data)
+
+        def flush(self):
+            pass
+
+        def reset_output_buffer(self):
+            pass
+
+        def close(self):
+            pass
+
+    fake = FakeSerial()
+    done = threading.Event()
+    il = Interlock(DEFAULT_RULES + ("rate(flow2)>500",), on_trip=lambda reason, lat: done.set())
+    port = GuardedPort(fake, il)
+
+    def reader():
+        while True:
+            port.readline()
+
+    def sender():
+        while True:
+            port.write(b"SET_HZ 23.45\n")
+            time.sleep(0.001)
+
+    threading.Thread(target=reader, daemon=True).start()
+    threading.Thread(target=sender, daemon=True).start()
+    ok = b"STATUS hz=30 rpm=1500 run=1 hold=0 flow1=40.00 volt1=2.10 flow2=41.00 volt2=2.20 seq=%d t=%d\n"
+    bad = b"STATUS hz=30 rpm=1500 run=1 hold=0 flow1=40.00 volt1=2.10 flow2=41.00 volt2=4.60 seq=%d t=%d\n"
+    seq = 0
+    t0 = time.perf_counter()
+    for k in range(n_trips):
+        for _ in range(20):
+            seq += 1
+            fake.rx.put(ok % (seq, seq * 10))
+        seq += 1
+        fake.rx.put(bad % (seq, seq * 10))
+        seq += 1
+        fake.rx.put(bad % (seq, seq * 10))
+        if not done.wait(2.0):
+            raise SystemExit("❌ không trip")
+        done.clear()
+        il.reset()
+    dt = time.perf_counter() - t0
+    print(il.report())
+    print(f"✅ {n_trips} trip / {fake.stops} lần ghi STOP trong {dt:.1f} s, {il.samples / dt:,.0f} mẫu/s")
+    assert fake.stops == n_trips
+
+    # Dữ liệu cũ: watchdog 50 ms -> độ trễ tính từ hạn stale
+    il2 = Interlock(("stale>0.2",), watchdog_s=WATCHDOG_S)
+    GuardedPort(FakeSerial(), il2)
+    il2.on_line(time.monotonic(), (ok % (1, 10)).decode().strip())
+    time.sleep(0.5)
+    print(f"stale: {il2.report()}")
+    assert il2.trips == 1
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Ghi log CSV có group commit dùng chung cho save_data.py, run.py và recorder của chart.
+#
+# Thay cho f.flush() sau mỗi dòng (1 syscall / dòng mà vẫn chưa chắc xuống thẻ SD):
+#   - dòng nằm trong buffer của Python, flush khi đủ flush_rows dòng hoặc dòng cũ
+#     nhất đã chờ flush_ms (gọi tick() trong vòng lặp chính để hạn thời gian chạy
+#     cả khi không có dòng mới)
+#   - fsync theo chính sách: "flush" = mỗi lần flush, "barrier" = chỉ ở barrier()
+#     (ranh giới bước đo, checkpoint), "never" = để hệ điều hành tự ghi
+#   - xoay file theo dung lượng / thời gian: file đang ghi giữ nguyên tên, đoạn cũ
+#     đổi tên thành <tên>.<YYYYmmdd-HHMMSS>.csv rồi (tùy chọn) nén gz/bz2/xz ở thread nền
+#   - ghi tiếp vào file có sẵn mà header khác: file cũ được đổi tên như trên (self.moved),
+#     không trộn 2 kiểu cột trong một file
+#
+# Chính sách có sẵn (POLICIES), từ an toàn nhất tới nhanh nhất:
+#   row     flush + fsync mỗi dòng
+#   group   flush mỗi 100 dòng / 1 s, fsync mỗi lần flush (mặc định)
+#   step    flush mỗi 1000 dòng / 5 s, fsync chỉ ở barrier()
+#   os      flush mỗi 1000 dòng / 5 s, không fsync
+#
+#   python3 log_writer.py [số dòng]  -> đo dòng/s của từng chính sách
+
+import os, csv, bz2, gzip, lzma, time, shutil, threading
+
+FSYNC_MODES = ("flush", "barrier", "never")
+POLICIES = {
+    "row":   {"flush_rows": 1,    "flush_ms": 0,    "fsync": "flush"},
+    "group": {"flush_rows": 100,  "flush_ms": 1000, "fsync": "flush"},
+    "step":  {"flush_rows": 1000, "flush_ms": 5000, "fsync": "barrier"},
+    "os":    {"flush_rows": 1000, "flush_ms": 5000, "fsync": "never"},
+}
+DEFAULT_POLICY = "group"
+COMPRESSORS = {"gz": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+BUFFER_BYTES = 1 << 16
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def compress_file(path, method):
+    """Nén path -> path.<method> (ghi tmp rồi đổi tên), xóa bản gốc. Trả về tên file nén."""
+    dst = f"{path}.{method}"
+    tmp = dst + ".tmp"
+    with open(path, "rb") as src, COMPRESSORS[method](tmp, "wb") as out:
+        shutil.copyfileobj(src, out, 1 << 20)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, dst)
+    os.unlink(path)
+    _fsync_dir(dst)
+    return dst
+
+
+def segment_name(path, t, compress=None):
+    """<tên>.<YYYYmmdd-HHMMSS>.csv theo mốc t, thêm -1, -2... nếu đã có file trùng (kể cả bản nén)."""
+    stem, ext = os.path.splitext(path)
+    base = f"{stem}.{time.strftime('%Y%m%d-%H%M%S', time.localtime(t))}"
+    name, k = base + ext, 1
+    while os.path.exists(name) or (compress and os.path.exists(f"{name}.{compress}")):
+        name, k = f"{base}-{k}{ext}", k + 1
+    return name
+
+
+class _Utf8Counter:
+    """csv.writer ghi qua đây: write() trả số byte UTF-8 (không phải số ký tự) để writerow() đếm đúng byte."""
+
+    def __init__(self, f):
+        self._write = f.write
+
+    def write(self, s):
+        self._write(s)
+        return len(s.encode("utf-8"))
+
+
+class LogWriter:
+    def __init__(self, path, header=None, policy=DEFAULT_POLICY, flush_rows=None, flush_ms=None, fsync=None,
+                 rotate_bytes=0, rotate_s=0, compress=None, append=True):
+        p = dict(POLICIES[policy])
+        for k, v in (("flush_rows", flush_rows), ("flush_ms", flush_ms), ("fsync", fsync)):
+            if v is not None:
+                p[k] = v
+        if p["fsync"] not in FSYNC_MODES:
+            raise ValueError(f"fsync phải là một trong {FSYNC_MODES}")
+        if compress is not None and compress not in COMPRESSORS:
+            raise ValueError(f"compress phải là một trong {tuple(COMPRESSORS)}")
+        self.path = path
+        self.header = list(header) if header else None
+        self.flush_rows = max(1, int(p["flush_rows"]))
+        self.flush_s = p["flush_ms"] / 1000.0
+        self.fsync = p["fsync"]
+        self.rotate_bytes = rotate_bytes
+        self.rotate_s = rotate_s
+        self.compress = compress
+
+        self.pending = 0              # dòng đã ghi vào buffer, chưa flush
+        self.unsynced = False         # đã flush nhưng chưa fsync
+        self.rows_total = self.flushes = self.fsyncs = self.rotations = 0
+        self.fsync_ms_max = 0.0
+        self.error = None
+        self._deadline = None
+        self._workers = []
+
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self.moved = self._move_mismatched() if append and self.header else None
+        self._open(append)
+
+    def _move_mismatched(self):
+        """File có sẵn mà header khác (cột kiểu cũ) -> đổi tên sang <tên>.<mốc>.csv để không ghi lẫn 2 schema."""
+        try:
+            with open(self.path, "r", encoding="utf-8-sig", newline="") as f:
+                first = next(csv.reader(f), None)
+        except FileNotFoundError:
+            return None
+        if first is None or [c.strip() for c in first] == [str(c) for c in self.header]:
+            return None
+        dest = segment_name(self.path, os.path.getmtime(self.path), self.compress)
+        os.replace(self.path, dest)
+        _fsync_dir(dest)
+        return dest
+
+    # ====== File đang ghi ======
+    def _open(self, append=True):
+        self._f = open(self.path, "a" if append else "w", newline="", encoding="utf-8", buffering=BUFFER_BYTES)
+        self._w = csv.writer(_Utf8Counter(self._f))
+        self.bytes = self._f.tell()
+        self.opened_at = time.time()
+        self.seg_rows = 0             # dòng dữ liệu trong đoạn hiện tại (không tính header)
+        if self.bytes == 0 and self.header:
+            self.bytes += self._w.writerow(self.header)
+            self.pending += 1
+            self._deadline = time.monotonic() + self.flush_s
+
+    def tell(self):
+        """Số byte của file đang ghi sau khi flush hết (vd: mốc cắt khi resume)."""
+        return self.bytes
+
+    # ====== Ghi dòng ======
+    def writerow(self, row):
+        self.bytes += self._w.writerow(row)
+        self.rows_total += 1
+        self.seg_rows += 1
+        self._after_write(1)
+
+    def writerows(self, rows):
+        n = 0
+        for row in rows:
+            self.bytes += self._w.writerow(row)
+            n += 1
+        self.rows_total += n
+        self.seg_rows += n
+        self._after_write(n)
+
+    def _after_write(self, n):
+        if not n:
+            return
+        if self.pending == 0:
+            self._deadline = time.monotonic() + self.flush_s
+        self.pending += n
+        if self.pending >= self.flush_rows or time.monotonic() >= self._deadline:
+            self.commit()
+        self._maybe_rotate()
+
+    def tick(self):
+        """Gọi định kỳ trong vòng lặp: flush dòng đã chờ quá flush_ms, xoay file khi tới giờ."""
+        if self.pending and time.monotonic() >= self._deadline:
+            self.commit()
+        self._maybe_rotate()
+
+    def commit(self):
+        """Flush buffer xuống hệ điều hành; fsync nếu chính sách là "flush"."""
+        if self.pending:
+            self._f.flush()
+            self.flushes += 1
+            self.pending = 0
+            self.unsynced = True
+        if self.fsync == "flush":
+            self._sync()
+
+    def barrier(self):
+        """Ranh giới bước / checkpoint: flush và fsync (trừ chính sách "never")."""
+        self.commit()
+        if self.fsync != "never":
+            self._sync()
+
+    def _sync(self):
+        if not self.unsynced:
+            return
+        t0 = time.perf_counter()
+        os.fsync(self._f.fileno())
+        self.fsync_ms_max = max(self.fsync_ms_max, (time.perf_counter() - t0) * 1000)
+        self.fsyncs += 1
+        self.unsynced = False
+
+    # ====== Xoay file ======
+    def _maybe_rotate(self):
+        if not self.seg_rows:
+            return
+        if self.rotate_bytes and self.bytes >= self.rotate_bytes:
+            self.rotate()
+        elif self.rotate_s and time.time() - self.opened_at >= self.rotate_s:
+            self.rotate()
+
+    def _segment_name(self):
+        return segment_name(self.path, self.opened_at, self.compress)
+
+    def rotate(self, dest=None):
+        """Chốt file đang ghi thành dest (mặc định tên có mốc thời gian) rồi mở file mới.
+
+        Đổi tên nguyên tử sau fsync; nén (nếu có) chạy ở thread nền. Trả về tên đoạn vừa chốt.
+        """
+        self._f.flush()
+        self.unsynced = True
+        self.pending = 0
+        self._sync()
+        self._f.close()
+        dest = dest or self._segment_name()
+        os.replace(self.path, dest)
+        _fsync_dir(dest)
+        self.rotations += 1
+        self._open(append=False)
+        if self.compress:
+            self._workers = [w for w in self._workers if w.is_alive()]
+            w = threading.Thread(target=self._compress, args=(dest,), name="log-compress", daemon=True)
+            w.start()
+            self._workers.append(w)
+        return dest
+
+    def _compress(self, path):
+        try:
+            compress_file(path, self.compress)
+        except Exception as e:
+            self.error = e
+
+    def close(self):
+        if self._f.closed:
+            return
+        self.barrier()
+        self._f.close()
+        for w in self._workers:
+            w.join()
+
+    def stats(self):
+        return {"rows": self.rows_total, "flushes": self.flushes, "fsyncs": self.fsyncs,
+                "rotations": self.rotations, "bytes": self.bytes, "fsync_ms_max": round(self.fsync_ms_max, 2)}
+
+
+def add_arguments(parser):
+    """Các tùy chọn chung cho script ghi log."""
+    parser.add_argument("--durability", choices=tuple(POLICIES), default=DEFAULT_POLICY,
+                        help="Chính sách flush/fsync CSV (row = an toàn nhất, os = nhanh nhất)")
+    parser.add_argument("--rotate-mb", type=float, default=0.0, help="Xoay file CSV khi vượt N MB (0 = không)")
+    parser.add_argument("--rotate-h", type=float, default=0.0, help="Xoay file CSV mỗi N giờ (0 = không)")
+    parser.add_argument("--compress", choices=tuple(COMPRESSORS), help="Nén các đoạn CSV đã xoay")
+
+
+def from_args(path, header, args):
+    return LogWriter(path, header, policy=args.durability, rotate_bytes=int(args.rotate_mb * 1e6),
+                     rotate_s=args.rotate_h * 3600, compress=args.compress)
+
+
+if __name__ == "__main__":
+    # Đo: dòng/s và số fsync của từng chính sách, ghi N dòng kiểu run.py vào thư mục tạm
+    import sys, tempfile
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    row = [30, 885.123, 61.25, 2.41, 2.405, 492.063]
+    with tempfile.TemporaryDirectory(dir=".") as d:
+        f = open(os.path.join(d, "legacy.csv"), "w", newline="")
+        w = csv.writer(f)
+        t0 = time.perf_counter()
+        for _ in range(n):
+            w.writerow(row)
+            f.flush()
+        f.close()
+        dt = time.perf_counter() - t0
+        print(f"{'flush/dòng (cũ)':16s} {n / dt:10,.0f} dòng/s  fsync=0  (mất điện: mất tới cache của OS)")
+        for name in POLICIES:
+            rows = n if name != "row" else min(n, 2000)
+            lw = LogWriter(os.path.join(d, f"{name}.csv"), ["hz", "rpm", "flowABB", "voltABB", "voltMaf", "analog"],
+                           policy=name)
+            t0 = time.perf_counter()
+            for i in range(rows):
+                lw.writerow(row)
+                if i % 500 == 499:
+                    lw.barrier()            # như ranh giới bước của run.py
+            lw.close()
+            dt = time.perf_counter() - t0
+            p = POLICIES[name]
+            risk = "≤ 0 dòng" if p["fsync"] == "flush" and p["flush_rows"] == 1 else (
+                f"≤ {p['flush_rows']} dòng / {p['flush_ms']} ms" if p["fsync"] == "flush" else
+                "≤ 1 bước (500 dòng)" if p["fsync"] == "barrier" else "tới cache của OS")
+            s = lw.stats()
+            print(f"{name:16s} {rows / dt:10,.0f} dòng/s  fsync={s['fsyncs']:<5d} max {s['fsync_ms_max']:.1f} ms"
+                  f"  (mất điện: {risk})")
+        lw = LogWriter(os.path.join(d, "rot.csv"), ["a", "b"], policy="os", rotate_bytes=50_000, compress="gz")
+        for i in range(20000):
+            lw.writerow((i, i * 2))
+        lw.close()
+        segs = sorted(os.listdir(d))
+        print(f"xoay 50 kB + gz: {lw.rotations} đoạn, ví dụ {[s for s in segs if s.startswith('rot')][:3]}")
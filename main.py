@@ -7,7 +7,8 @@ from typing import Optional
 
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QPushButton, QLabel, QVBoxLayout,
-    QHBoxLayout, QGridLayout, QProgressBar, QMessageBox, QTextEdit, QFrame
+    QHBoxLayout, QGridLayout, QProgressBar, QMessageBox, QTextEdit, QFrame,
+    QGroupBox, QComboBox, QDoubleSpinBox
 )
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer
 from PyQt5.QtGui import QFont
@@ -15,6 +16,14 @@ from PyQt5.QtGui import QFont
 import serial
 import serial.tools.list_ports
 
+from ports import open_port
+from telemetry import parse_status, SeqTracker
+from rolling import RollingStats
+from polling import StatusPoller, POLL_MAX_S
+from flow_control import FlowController, GAINS
+from log_writer import LogWriter
+import interlock as safety
+
 
 # ====== Serial background reader ======
 class SerialReader(QThread):
@@ -44,18 +53,31 @@ class SerialReader(QThread):
 
 
 class MotorPanel(QWidget):
+    control_hz = pyqtSignal(float)          # từ thread PID -> gửi SET_HZ ở thread GUI
+    control_event = pyqtSignal(str, object) # (thông báo, kết quả bước hoặc None)
+    interlock_tripped = pyqtSignal(str, float)  # (lý do, giây từ mẫu vi phạm tới lúc ghi STOP)
+
     # Mapping an toàn: 50 RPM/Hz
     RPM_PER_HZ = (3000/380*345)/60
     HZ_MIN = 0.0
     HZ_MAX = 60.0
+    STATS_WINDOWS = [(10.0, "10 s"), (60.0, "1 phút"), (600.0, "10 phút")]
+    CONTROL_POLL_MAX_S = 0.3                # khi giữ lưu lượng: STATUS không thưa hơn mức này
 
-    def __init__(self, ser: serial.Serial, port_name: str):
+    def __init__(self, ser: serial.Serial, port_name: str, calib=None, gains=None, control_log=None, hz_table=None,
+                 interlock=None):
         super().__init__()
         self.ser = ser
         self.port_name = port_name
+        self.calib = calib                  # CalibrationTable: volt2 -> lưu lượng (None = dùng flow2 của Arduino)
+        self.hz_table = hz_table            # SetpointTable: lưu lượng / RPM -> Hz (feed-forward, None = không có)
+        self.interlock = interlock          # interlock.Interlock: luật chạy trong thread đọc (ser là GuardedPort)
+        self.feedforward = None
+        if hz_table:
+            self.feedforward = hz_table.feedforward(calib.unit if calib else "g/s")
 
         self.setWindowTitle(f"Điều khiển tốc độ | PyQt5 (Port: {self.port_name})")
-        self.resize(760, 520)
+        self.resize(760, 720)
 
         # ====== Trạng thái (đồng bộ từ Arduino) ======
         self.hz: float = 0.0
@@ -64,6 +86,17 @@ class MotorPanel(QWidget):
         self.volt: Optional[float] = None   # Điện áp (có thể None khi chưa có)
         self.power_on = False               # run=1
         self.freq_running = True            # hold=0
+        self.telemetry = SeqTracker()       # seq/t của STATUS: mất gói, jitter
+        self.poller = StatusPoller()        # hỏi STATUS thích nghi, tối đa 1 yêu cầu đang chờ
+        self.stats = RollingStats(("rpm", "flow", "volt"), windows=[w for w, _ in self.STATS_WINDOWS])
+
+        # ====== Vòng kín lưu lượng (PID ở thread riêng) ======
+        self.flow_ctl = FlowController(self.control_hz.emit, self.control_event.emit, gains=gains or GAINS,
+                                       feedforward=self.feedforward)
+        self.control_log = None
+        if control_log:
+            self.control_log = LogWriter(control_log, ["t", "setpoint", "from", "settle_s", "overshoot_pct", "rise_s"],
+                                         policy="row")
 
         # ====== Giới hạn hiển thị RPM ======
         self.RPM_MIN = 0.0
@@ -103,7 +136,7 @@ class MotorPanel(QWidget):
         self.bar.setTextVisible(False)
 
         # Lưu lượng dưới RPM
-        lbl_flow_title = QLabel("Lưu lượng")
+        lbl_flow_title = QLabel(f"Lưu lượng ({self.calib.unit}, hiệu chuẩn)" if self.calib else "Lưu lượng")
         lbl_flow_title.setAlignment(Qt.AlignCenter)
         lbl_flow_title.setFont(QFont("Arial", 11, QFont.Bold))
 
@@ -203,6 +236,67 @@ class MotorPanel(QWidget):
         stat_row.addWidget(self.lbl_power, stretch=1, alignment=Qt.AlignLeft)
         stat_row.addWidget(self.lbl_freq,  stretch=1, alignment=Qt.AlignRight)
 
+        # ====== Thống kê trượt (mean/std/min/max/xu hướng) ======
+        stats_box = QGroupBox("Thống kê trượt")
+        stats_grid = QGridLayout(stats_box)
+        self.cmb_window = QComboBox()
+        for _, name in self.STATS_WINDOWS:
+            self.cmb_window.addItem(name)
+        self.cmb_window.currentIndexChanged.connect(self.refresh_stats)
+        stats_grid.addWidget(self.cmb_window, 0, 0)
+        for j, head in enumerate(["TB", "σ", "Min", "Max", "Xu hướng /phút", "n"], start=1):
+            lbl = QLabel(head)
+            lbl.setAlignment(Qt.AlignCenter)
+            lbl.setFont(QFont("Arial", 10, QFont.Bold))
+            stats_grid.addWidget(lbl, 0, j)
+        self.stats_cells = {}
+        for i, (key, name) in enumerate([("rpm", "RPM"), ("flow", "Lưu lượng"), ("volt", "Điện áp")], start=1):
+            stats_grid.addWidget(QLabel(name), i, 0)
+            cells = []
+            for j in range(1, 7):
+                cell = QLabel("--")
+                cell.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                cell.setFont(QFont("Consolas", 11))
+                cell.setTextInteractionFlags(Qt.TextSelectableByMouse)
+                stats_grid.addWidget(cell, i, j)
+                cells.append(cell)
+            self.stats_cells[key] = cells
+
+        # ====== Giữ lưu lượng (vòng kín) ======
+        ctl_box = QGroupBox("Giữ lưu lượng (PID)")
+        ctl_row = QHBoxLayout(ctl_box)
+        self.spn_target = QDoubleSpinBox()
+        self.spn_target.setRange(0.0, 1000.0)
+        self.spn_target.setDecimals(1)
+        self.spn_target.setSingleStep(1.0)
+        self.spn_target.setSuffix(f" {self.calib.unit}" if self.calib else "")
+        self.spn_target.valueChanged.connect(self.on_target_changed)
+        self.btn_hold_flow = QPushButton("Giữ")
+        self.btn_hold_flow.setCheckable(True)
+        self.btn_hold_flow.clicked.connect(self.on_toggle_flow_control)
+        self.btn_hold_flow.setToolTip("Tự chỉnh Hz để lưu lượng bám giá trị đặt (▲/▼ sẽ tắt chế độ này)")
+        self.lbl_ctl = QLabel("Tắt")
+        self.btn_goto_flow = QPushButton("Đi tới")
+        self.btn_goto_flow.setToolTip("Tra bảng Hz → lưu lượng (--hz-table) và đặt Hz bằng 1 lệnh, không vòng kín")
+        self.btn_goto_flow.clicked.connect(self.on_goto_flow)
+        self.spn_rpm = QDoubleSpinBox()
+        self.spn_rpm.setRange(0.0, self.HZ_MAX * self.RPM_PER_HZ)
+        self.spn_rpm.setDecimals(0)
+        self.spn_rpm.setSingleStep(self.RPM_STEP)
+        self.spn_rpm.setSuffix(" RPM")
+        self.btn_goto_rpm = QPushButton("Đi tới")
+        self.btn_goto_rpm.clicked.connect(self.on_goto_rpm)
+        ctl_row.addWidget(QLabel("Đặt:"))
+        ctl_row.addWidget(self.spn_target)
+        ctl_row.addWidget(self.btn_goto_flow)
+        ctl_row.addWidget(self.btn_hold_flow)
+        ctl_row.addWidget(self.spn_rpm)
+        ctl_row.addWidget(self.btn_goto_rpm)
+        ctl_row.addWidget(self.lbl_ctl, stretch=1)
+        if self.hz_table is None:
+            self.btn_goto_flow.setEnabled(False)
+            self.btn_goto_flow.setToolTip("Cần --hz-table (calibration.py inverse)")
+
         # ====== Log Serial ======
         self.log = QTextEdit()
         self.log.setReadOnly(True)
@@ -218,6 +312,18 @@ class MotorPanel(QWidget):
         root.addSpacing(8)
         root.addLayout(stat_row)
         root.addSpacing(8)
+        root.addWidget(stats_box)
+        root.addWidget(ctl_box)
+        if self.interlock:
+            il_row = QHBoxLayout()
+            self.lbl_interlock = QLabel(f"🛡️ Interlock: {self.interlock.describe()}")
+            self.lbl_interlock.setWordWrap(True)
+            self.btn_il_reset = QPushButton("Bỏ chốt")
+            self.btn_il_reset.setEnabled(False)
+            self.btn_il_reset.clicked.connect(self.on_interlock_reset)
+            il_row.addWidget(self.lbl_interlock, stretch=1)
+            il_row.addWidget(self.btn_il_reset)
+            root.addLayout(il_row)
         root.addWidget(QLabel("Serial log:"))
         root.addWidget(self.log)
 
@@ -229,24 +335,51 @@ class MotorPanel(QWidget):
         self.reader.error_signal.connect(self.on_serial_error)
         self.reader.start()
 
-        # ====== Timer: hỏi STATUS định kỳ ======
+        # ====== Timer: hỏi STATUS (single-shot, khoảng cách do poller quyết định) ======
         self.status_timer = QTimer(self)
+        self.status_timer.setSingleShot(True)
         self.status_timer.timeout.connect(self.request_status)
-        self.status_timer.start(800)  # ms
+        self.status_timer.start(0)
+
+        self.control_hz.connect(self.on_control_hz)
+        self.control_event.connect(self.on_control_event)
+        self.flow_ctl.start()
+
+        if self.interlock:
+            self.interlock_tripped.connect(self.on_interlock_trip)
+            self.interlock.on_trip = self.interlock_tripped.emit
 
     # ====== Serial helpers ======
     def send_cmd(self, cmd: str):
         try:
             if not cmd.endswith("\n"):
                 cmd += "\n"
-            self.ser.write(cmd.encode())
+            if self.ser.write(cmd.encode()) == 0 and self.interlock and self.interlock.tripped:
+                self.append_log(f"[INTERLOCK] Chặn lệnh {cmd.strip()} — bấm \"Bỏ chốt\" trước")
+                return
             self.ser.flush()
             self.append_log(f">>> {cmd.strip()}")
+            if cmd.strip() != "STATUS":
+                self.poke_status()
         except Exception as e:
             self.append_log(f"[ERR] send_cmd: {e}")
 
     def request_status(self):
-        self.send_cmd("STATUS")
+        now = time.monotonic()
+        timeouts = self.poller.timeouts
+        if not self.poller.in_flight(now):
+            if self.poller.timeouts != timeouts:
+                self.append_log(f"[WARN] STATUS không trả lời | {self.poller.report()}")
+            self.send_cmd("STATUS")
+            self.poller.on_sent(now)
+        self.status_timer.start(int(self.poller.next_delay(now) * 1000))
+
+    def poke_status(self):
+        # Sau lệnh điều khiển: hỏi sớm (nếu không có STATUS đang chờ) và giữ nhịp nhanh một lúc
+        now = time.monotonic()
+        self.poller.poke(now)
+        if not self.poller.in_flight(now):
+            self.status_timer.start(int(self.poller.next_delay(now) * 1000))
 
     def append_log(self, text: str):
         self.log.append(text)
@@ -266,6 +399,13 @@ class MotorPanel(QWidget):
             m_flow = re.search(rf"flow2={fnum}", line)
             m_volt = re.search(rf"volt2={fnum}", line)
 
+            rec = parse_status(line)
+            t_rx = rec["t_host"] if rec is not None else time.monotonic()
+            if rec is not None:
+                lost = self.telemetry.add(rec)
+                if lost:
+                    self.append_log(f"[WARN] Mất {lost} STATUS | {self.telemetry.report()}")
+
             if m_hz:
                 self.hz = float(m_hz.group(1))
             if m_rpm:
@@ -280,8 +420,20 @@ class MotorPanel(QWidget):
 
             if m_volt:
                 self.volt = float(m_volt.group(1))
+                if self.calib is not None:
+                    self.flow = self.calib.flow(self.volt)
             # nếu không có volt -> giữ nguyên
 
+            self.stats.add(t_rx, rpm=self.rpm,
+                           flow=self.flow if m_flow or (m_volt and self.calib) else None,
+                           volt=self.volt if m_volt else None)
+            if m_flow or (m_volt and self.calib):
+                self.flow_ctl.feed(t_rx, self.flow, self.hz)
+            self.refresh_stats()
+
+            delay = self.poller.on_reply(t_rx, (self.hz, self.rpm, self.volt))
+            self.status_timer.start(int(delay * 1000))
+
             if m_run:
                 self.power_on = (m_run.group(1) == "1")
                 self.btn_power.blockSignals(True)
@@ -312,6 +464,17 @@ class MotorPanel(QWidget):
         self.lbl_flow.setText(f"{self.flow:.1f}" if self.flow is not None else "--")
         self.lbl_volt.setText(f"{self.volt:.1f} V" if self.volt is not None else "--")
 
+    def refresh_stats(self):
+        window = self.STATS_WINDOWS[self.cmb_window.currentIndex()][0]
+        summary = self.stats.summary(window, now=time.monotonic())
+        for key, cells in self.stats_cells.items():
+            st = summary[key]
+            prec = 1 if key == "rpm" else 3
+            for cell, k in zip(cells, ("mean", "std", "min", "max")):
+                cell.setText(f"{st[k]:.{prec}f}" if st[k] is not None else "--")
+            cells[4].setText(f"{st['slope'] * 60:+.{prec}f}" if st["slope"] is not None else "--")
+            cells[5].setText(str(st["n"]))
+
     def style_status_badges(self):
         if self.power_on:
             self.lbl_power.setText("Nguồn: BẬT")
@@ -342,6 +505,113 @@ class MotorPanel(QWidget):
         can_adjust = enabled and self.freq_running
         self.btn_up.setEnabled(can_adjust)
         self.btn_down.setEnabled(can_adjust)
+        self.btn_hold_flow.setEnabled(can_adjust)
+        self.btn_goto_flow.setEnabled(can_adjust and self.hz_table is not None)
+        self.btn_goto_rpm.setEnabled(can_adjust)
+        if not can_adjust and self.flow_ctl.target is not None:
+            self.stop_flow_control("nguồn tắt / dừng tần số")
+
+    # ====== Vòng kín lưu lượng ======
+    def on_toggle_flow_control(self, checked: bool):
+        if checked:
+            if self.flow is None:
+                self.btn_hold_flow.setChecked(False)
+                QMessageBox.information(self, "Thông báo", "Chưa có giá trị lưu lượng từ STATUS.")
+                return
+            self.poller.max_s = self.CONTROL_POLL_MAX_S
+            self.flow_ctl.set_target(self.spn_target.value())
+            self.lbl_ctl.setText(f"Đang giữ {self.spn_target.value():.1f}")
+            self.append_log(f"[CTRL] Bật giữ lưu lượng = {self.spn_target.value():.1f}")
+            self.poke_status()
+        else:
+            self.stop_flow_control("tắt bằng tay")
+
+    def goto_hz(self, hz: float, what: str):
+        """Đặt thẳng Hz (1 lệnh SET_HZ) thay cho nhấn ▲/▼ nhiều lần."""
+        hz = round(min(self.HZ_MAX, max(self.HZ_MIN, hz)), 2)
+        self.hz = hz
+        self.rpm = hz * self.RPM_PER_HZ
+        self.send_cmd(f"SET_HZ {hz:.2f}")
+        self.append_log(f"[FF] {what} → SET_HZ {hz:.2f}")
+        self.refresh_display()
+        self.poke_status()
+
+    def on_goto_flow(self):
+        if not (self.power_on and self.freq_running) or self.feedforward is None:
+            return
+        self.stop_flow_control("đặt Hz tra bảng")
+        flow = self.spn_target.value()
+        self.goto_hz(self.feedforward(flow), f"lưu lượng {flow:.1f}")
+
+    def on_goto_rpm(self):
+        if not (self.power_on and self.freq_running):
+            return
+        self.stop_flow_control("đặt RPM")
+        rpm = self.spn_rpm.value()
+        # Bảng tra từ sweep (RPM đo) nếu có, không thì mapping RPM/Hz cố định
+        if self.hz_table and "rpm" in self.hz_table.tables:
+            hz = self.hz_table.hz_for_rpm(rpm)
+        else:
+            hz = self.rpm_to_hz(rpm)
+        self.goto_hz(hz, f"{rpm:.0f} RPM")
+
+    def on_target_changed(self, value: float):
+        if self.flow_ctl.target is not None:
+            self.flow_ctl.set_target(value)
+            self.lbl_ctl.setText(f"Đang giữ {value:.1f}")
+
+    def stop_flow_control(self, reason: str):
+        if self.flow_ctl.target is None:
+            return
+        self.flow_ctl.set_target(None)
+        self.poller.max_s = POLL_MAX_S
+        self.btn_hold_flow.blockSignals(True)
+        self.btn_hold_flow.setChecked(False)
+        self.btn_hold_flow.blockSignals(False)
+        self.lbl_ctl.setText("Tắt")
+        self.append_log(f"[CTRL] Tắt giữ lưu lượng ({reason}) | {self.flow_ctl.report()}")
+
+    def on_control_hz(self, hz: float):
+        # Lệnh đã được gộp ở thread PID; thread GUI chỉ việc gửi
+        if self.flow_ctl.target is None or not (self.power_on and self.freq_running):
+            return
+        self.hz = hz
+        self.rpm = hz * self.RPM_PER_HZ
+        self.send_cmd(f"SET_HZ {hz:.2f}")
+        self.refresh_display()
+
+    def on_control_event(self, msg: str, report):
+        self.append_log(f"[CTRL] {msg}")
+        if report:
+            self.lbl_ctl.setText(msg)
+            if self.control_log:
+                self.control_log.writerow([round(time.time(), 3), report["setpoint"], round(report["from"], 3),
+                                           report["settle_s"] if report["settle_s"] is None else round(report["settle_s"], 2),
+                                           round(report["overshoot_pct"], 2),
+                                           report["rise_s"] if report["rise_s"] is None else round(report["rise_s"], 2)])
+
+    # ====== Interlock ======
+    def on_interlock_trip(self, reason: str, latency: float):
+        # STOP đã được ghi ở thread đọc; ở đây chỉ đồng bộ giao diện
+        self.stop_flow_control("interlock")
+        self.power_on = False
+        self.hz = 0.0
+        self.rpm = 0.0
+        st = self.interlock.stats()
+        self.lbl_interlock.setText(f"⛔ TRIP: {reason} | STOP sau {latency * 1000:.1f} ms "
+                                   f"(max {st['latency_ms_max']:.1f} ms)")
+        self.lbl_interlock.setStyleSheet("QLabel { background:#d64545; }")
+        self.btn_il_reset.setEnabled(True)
+        self.append_log(f"[INTERLOCK] {reason} → STOP sau {latency * 1000:.1f} ms | {self.interlock.report()}")
+        self.update_ui_state()
+        self.poke_status()
+
+    def on_interlock_reset(self):
+        self.interlock.reset()
+        self.btn_il_reset.setEnabled(False)
+        self.lbl_interlock.setStyleSheet("")
+        self.lbl_interlock.setText(f"🛡️ Interlock: {self.interlock.describe()}")
+        self.append_log("[INTERLOCK] Đã bỏ chốt")
 
     # ====== Xử lý nút ======
     def on_toggle_power(self, checked: bool):
@@ -357,6 +627,7 @@ class MotorPanel(QWidget):
     def on_reset(self):
         if not self.power_on:
             return
+        self.stop_flow_control("reset")
         self.send_cmd("RESET")
         self.hz = 0.0
         self.rpm = 0.0
@@ -384,6 +655,7 @@ class MotorPanel(QWidget):
     def increase_rpm(self):
         if not (self.power_on and self.freq_running):
             return
+        self.stop_flow_control("chỉnh tay ▲")
         self.rpm += self.RPM_STEP
         hz = self.rpm_to_hz(self.rpm)
         self.hz = hz
@@ -393,6 +665,7 @@ class MotorPanel(QWidget):
     def decrease_rpm(self):
         if not (self.power_on and self.freq_running):
             return
+        self.stop_flow_control("chỉnh tay ▼")
         self.rpm -= self.RPM_STEP
         hz = self.rpm_to_hz(self.rpm)
         self.hz = hz
@@ -420,6 +693,9 @@ class MotorPanel(QWidget):
         super().keyPressEvent(e)
 
     def closeEvent(self, event):
+        self.flow_ctl.stop()
+        if self.control_log:
+            self.control_log.close()
         try:
             self.reader.stop()
             self.reader.wait(500)
@@ -433,15 +709,40 @@ class MotorPanel(QWidget):
         event.accept()
 
 
-def open_serial(port: str, baud: int = 115200, timeout: float = 1.0) -> serial.Serial:
-    return serial.Serial(port, baudrate=baud, timeout=timeout)
+def open_serial(port: str, baud: int = 115200, timeout: float = 1.0, capture: Optional[str] = None) -> serial.Serial:
+    # port có thể là "replay:file.cap@10" để phát lại capture thay cho Arduino thật
+    return open_port(port, baud=baud, timeout=timeout, capture=capture)
 
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--port", help="Cổng serial: COMx hoặc /dev/ttyACM0")
+    ap.add_argument("--port", help="Cổng serial: COMx hoặc /dev/ttyACM0 (hoặc replay:file.cap[@tốc độ|@max], shm:maf_bus)")
     ap.add_argument("--baud", type=int, default=115200)
+    ap.add_argument("--capture", help="Ghi toàn bộ dòng vào/ra serial ra file capture để phát lại sau")
+    ap.add_argument("--calib", help="Bảng tra hiệu chuẩn (.npz từ calibration.py) để hiển thị lưu lượng")
+    ap.add_argument("--pid", default=",".join(str(GAINS[k]) for k in ("kp", "ki", "kd")),
+                    help="Hệ số PID giữ lưu lượng: kp,ki,kd (Hz / đơn vị lưu lượng)")
+    ap.add_argument("--control-log", help="CSV ghi thời gian xác lập / vọt lố mỗi lần đổi setpoint")
+    ap.add_argument("--hz-table", help="Bảng tra ngược lưu lượng/RPM → Hz (.npz từ calibration.py inverse)")
+    safety.add_arguments(ap)
     args = ap.parse_args()
+    try:
+        kp, ki, kd = (float(x) for x in args.pid.split(","))
+    except ValueError:
+        ap.error("--pid cần 3 số: kp,ki,kd")
+
+    calib = None
+    if args.calib:
+        from calibration import CalibrationTable
+        calib = CalibrationTable.load(args.calib)
+    try:
+        interlock = safety.from_args(args, poll_s=POLL_MAX_S)
+    except ValueError as e:
+        ap.error(str(e))
+    hz_table = None
+    if args.hz_table:
+        from calibration import SetpointTable
+        hz_table = SetpointTable.load(args.hz_table)
 
     # Nếu không chỉ định --port, thử autodetect 1 vài cổng Arduino
     port = args.port
@@ -458,13 +759,15 @@ def main():
             sys.exit(1)
 
     try:
-        ser = open_serial(port, args.baud, timeout=1.0)
+        ser = open_serial(port, args.baud, timeout=1.0, capture=args.capture)
     except Exception as e:
         print(f"Không mở được cổng {port}: {e}")
         sys.exit(1)
+    ser = safety.guard(ser, interlock)
 
     app = QApplication(sys.argv)
-    w = MotorPanel(ser, port)
+    w = MotorPanel(ser, port, calib, gains={"kp": kp, "ki": ki, "kd": kd}, control_log=args.control_log,
+                   hz_table=hz_table, interlock=interlock)
     w.show()
     sys.exit(app.exec_())
 
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Lịch hỏi STATUS thích nghi: tối đa 1 yêu cầu đang chờ trả lời.
+#
+# - Nhịp hỏi không nhỏ hơn ~1.5 lần độ trễ trả lời đo được (Arduino đang kẹt
+#   ghi Modbus thì tự giãn ra, không dồn lệnh vào buffer 64 byte của nó).
+# - Giá trị đang đổi (ramp, vừa gửi lệnh) -> hỏi nhanh; ổn định -> giãn dần
+#   tới POLL_MAX_S.
+# - Không có trả lời trong thời hạn -> coi như mất, hỏi lại với nhịp giãn ra.
+
+POLL_MIN_S = 0.15
+POLL_MAX_S = 2.0
+POLL_START_S = 0.8
+BACKOFF = 1.5               # hệ số giãn mỗi lần thấy hệ ổn định
+BUSY_S = 3.0                # sau lệnh điều khiển, coi như đang ramp trong chừng này giây
+
+# Ngưỡng coi là "đang thay đổi" giữa 2 lần STATUS
+CHANGE_HZ = 0.5
+CHANGE_RPM = 0.01           # tương đối
+CHANGE_VOLT = 0.02          # V
+
+
+class StatusPoller:
+    def __init__(self, min_s=POLL_MIN_S, max_s=POLL_MAX_S, start_s=POLL_START_S):
+        self.min_s = min_s
+        self.max_s = max_s
+        self.interval = start_s
+        self.latency = None         # EWMA độ trễ trả lời (s)
+        self.sent_at = None         # thời điểm gửi STATUS đang chờ
+        self.deadline = None
+        self.busy_until = 0.0
+        self._last = None           # (hz, rpm, volt) lần trả lời trước
+        self.sent = self.replies = self.timeouts = 0
+
+    # ====== Trạng thái yêu cầu ======
+    def timeout_s(self):
+        if self.latency is None:
+            return 1.0
+        return min(3.0, max(0.5, 4 * self.latency))
+
+    def in_flight(self, now):
+        """True nếu còn STATUS chưa trả lời và chưa quá hạn; quá hạn thì ghi nhận mất."""
+        if self.sent_at is None:
+            return False
+        if now < self.deadline:
+            return True
+        self.timeouts += 1
+        self.sent_at = None
+        self.interval = min(self.max_s, max(self.interval, self.timeout_s()) * BACKOFF)
+        return False
+
+    def on_sent(self, now):
+        self.sent += 1
+        self.sent_at = now
+        self.deadline = now + self.timeout_s()
+
+    def on_reply(self, now, values):
+        """Ghi nhận 1 STATUS (hz, rpm, volt). Trả về số giây tới lần hỏi kế tiếp."""
+        self.replies += 1
+        if self.sent_at is not None:
+            lat = now - self.sent_at
+            self.latency = lat if self.latency is None else 0.8 * self.latency + 0.2 * lat
+            self.sent_at = None
+        changing = now < self.busy_until or self._changed(values)
+        self._last = values
+        floor = max(self.min_s, 1.5 * (self.latency or 0.0))
+        if changing:
+            self.interval = floor
+        else:
+            self.interval = min(self.max_s, max(floor, self.interval * BACKOFF))
+        return self.interval
+
+    def poke(self, now):
+        """Vừa gửi lệnh điều khiển: hỏi nhanh trong BUSY_S giây tới."""
+        self.busy_until = now + BUSY_S
+        self.interval = max(self.min_s, 1.5 * (self.latency or 0.0))
+
+    def _changed(self, values):
+        if self._last is None:
+            return True
+        hz, rpm, volt = values
+        hz0, rpm0, volt0 = self._last
+        if abs(hz - hz0) >= CHANGE_HZ:
+            return True
+        if abs(rpm - rpm0) > CHANGE_RPM * max(abs(rpm0), 1.0):
+            return True
+        return volt is not None and volt0 is not None and abs(volt - volt0) >= CHANGE_VOLT
+
+    def next_delay(self, now):
+        """Số giây nên đợi trước khi gọi lại request (khi đang có yêu cầu chờ thì tới hạn của nó)."""
+        if self.sent_at is not None:
+            return max(0.0, self.deadline - now)
+        return self.interval
+
+    def report(self):
+        lat = f"{self.latency * 1000:.0f}ms" if self.latency is not None else "--"
+        return (f"poll {self.interval * 1000:.0f}ms | trễ {lat} | "
+                f"gửi={self.sent} nhận={self.replies} quá hạn={self.timeouts}")
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Mở "cổng" dữ liệu theo chuỗi mô tả, dùng chung cho main.py, test/chart.py, run.py, save_data.py:
+#   /dev/ttyACM0, COM3        -> serial.Serial thật
+#   replay:run1.cap           -> phát lại capture theo thời gian thực
+#   replay:run1.cap@10        -> nhanh gấp 10 lần
+#   replay:run1.cap@max       -> nhanh nhất có thể (benchmark / xử lý lại dữ liệu cũ)
+#   shm:maf_bus               -> đọc từ bus shared memory (telemetry_bus.py serve)
+#   mux:/tmp/maf_mux.sock     -> client của serial_mux.py (Unix socket hoặc mux:127.0.0.1:5485)
+
+
+def open_port(spec: str, baud: int = 115200, timeout: float = 1.0, capture: str = None):
+    if spec.startswith("replay:"):
+        from replay import ReplayPort, parse_speed
+        path, _, speed = spec[len("replay:"):].partition("@")
+        return ReplayPort(path, speed=parse_speed(speed or "1"), timeout=timeout)
+
+    if spec.startswith("shm:"):
+        from telemetry_bus import BusPort
+        return BusPort(spec[len("shm:"):] or "maf_bus", timeout=timeout)
+
+    if spec.startswith("mux:"):
+        from serial_mux import MuxPort
+        return MuxPort(spec[len("mux:"):], timeout=timeout)
+
+    import serial
+    ser = serial.Serial(spec, baudrate=baud, timeout=timeout)
+    if capture:
+        from replay import CaptureTap
+        ser = CaptureTap(ser, capture)
+    return ser
+
+
+def is_replay(ser) -> bool:
+    return hasattr(ser, "finished") and hasattr(ser, "clock")
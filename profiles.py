@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Profile thử nghiệm (CSV / JSON / TOML) -> dòng thời gian tuyệt đối cho run.py.
+#
+# Mỗi bước:
+#   hz      tần số đặt (SET_HZ, số nguyên 0..60)
+#   ramp    giây để đi từ tần số trước tới hz (0 = nhảy thẳng), gửi SET_HZ từng 1 Hz
+#   dwell   giây chờ ổn định sau khi tới hz (không lấy trung bình)
+#   avg     giây lấy trung bình sau dwell; > 0 thì ghi 1 dòng CSV khi hết cửa sổ
+#   hold    tổng giây giữ ở hz (mặc định dwell + avg; có hold mà không có avg thì avg = hold - dwell)
+#   rate    tần số hỏi STATUS (Hz) trong bước
+#   repeat  lặp lại bước N lần
+#   label   tên hiển thị
+#
+# JSON / TOML:
+#   {"name": "...", "defaults": {"dwell": 0.3, "avg": 20, "rate": 1},
+#    "steps": [ {"hz": 10, "ramp": 5, "hold": 30},
+#               {"sweep": {"start": 0, "stop": 60, "step": 5}, "avg": 10},
+#               {"repeat": 3, "steps": [{"hz": 20}, {"hz": 40}]} ]}
+# TOML viết bằng [defaults] và [[steps]]. CSV: mỗi dòng 1 bước, header là tên
+# các trường ở trên (ô trống = dùng mặc định).
+
+import os, sys, csv, json
+
+HZ_MIN, HZ_MAX = 0, 60
+DEFAULTS = {"ramp": 0.0, "dwell": 0.3, "rate": 1.0}
+DEFAULT_AVG = 20.0
+STEP_KEYS = ("hz", "ramp", "dwell", "avg", "hold", "rate", "repeat", "label")
+
+
+class ProfileError(ValueError):
+    pass
+
+
+class Step:
+    """Một bước đã biên dịch; mọi mốc thời gian tính bằng giây kể từ đầu profile."""
+
+    def __init__(self, index, hz, t_begin, sets, t_avg0, t_avg1, t_end, rate, record, label):
+        self.index = index
+        self.hz = hz
+        self.t_begin = t_begin      # bắt đầu bước (bắt đầu ramp)
+        self.sets = sets            # [(t, hz)] các lệnh SET_HZ
+        self.t_avg0 = t_avg0        # cửa sổ trung bình [t_avg0, t_avg1)
+        self.t_avg1 = t_avg1
+        self.t_end = t_end          # hết bước (hết hold)
+        self.rate = rate
+        self.record = record        # ghi dòng CSV khi kết thúc bước
+        self.label = label
+        self.skipped = False        # bỏ qua khi biên dịch (compile_profile(skip=...))
+
+    def __repr__(self):
+        return (f"Step#{self.index}(hz={self.hz} {self.t_begin:.1f}→{self.t_end:.1f}s "
+                f"avg {self.t_avg0:.1f}..{self.t_avg1:.1f}s rate={self.rate:g})")
+
+
+# ====== Đọc file ======
+def _load_toml(path):
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ProfileError("Cần Python 3.11+ (tomllib) hoặc gói tomli để đọc profile TOML")
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def _load_csv(path):
+    steps = []
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            step = {}
+            for k, v in row.items():
+                k = (k or "").strip().lower()
+                v = (v or "").strip()
+                if not v or k not in STEP_KEYS:
+                    continue
+                step[k] = v if k == "label" else float(v)
+            if step:
+                steps.append(step)
+    return {"name": os.path.basename(path), "steps": steps}
+
+
+def load_profile(path):
+    """Đọc profile theo đuôi file -> dict {name, defaults, steps}."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    elif ext == ".toml":
+        data = _load_toml(path)
+    elif ext == ".csv":
+        data = _load_csv(path)
+    else:
+        raise ProfileError(f"Không hỗ trợ profile '{ext}' (dùng .csv, .json, .toml)")
+    if not isinstance(data, dict) or not data.get("steps"):
+        raise ProfileError(f"{path}: profile không có bước nào")
+    data.setdefault("name", os.path.basename(path))
+    return data
+
+
+def sweep_profile(start, stop, step, dwell, avg, rate):
+    """Profile tương đương chế độ --mode sweep cũ."""
+    return {"name": f"sweep {start}..{stop}/{step}",
+            "defaults": {"dwell": dwell, "avg": avg, "rate": rate},
+            "steps": [{"sweep": {"start": start, "stop": stop, "step": step}}]}
+
+
+# ====== Biên dịch ======
+def _expand(items, defaults):
+    """Trải phẳng repeat / sweep / nhóm -> list dict bước đơn."""
+    out = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise ProfileError(f"Bước không hợp lệ: {item!r}")
+        repeat = int(item.get("repeat", 1))
+        if repeat < 1:
+            raise ProfileError(f"repeat phải >= 1: {item!r}")
+        if "steps" in item:
+            inner = dict(defaults)
+            inner.update({k: v for k, v in item.items() if k not in ("steps", "repeat")})
+            body = _expand(item["steps"], inner)
+        elif "sweep" in item:
+            sw = item["sweep"]
+            base = {k: v for k, v in item.items() if k not in ("sweep", "repeat")}
+            lo, hi, st = int(sw.get("start", 0)), int(sw.get("stop", HZ_MAX)), int(sw.get("step", 1))
+            if st == 0:
+                raise ProfileError("sweep.step phải khác 0")
+            if (hi - lo) * st < 0:
+                st = -st
+            body = [dict(defaults, **base, hz=h) for h in range(lo, hi + (1 if st > 0 else -1), st)]
+        else:
+            if "hz" not in item:
+                raise ProfileError(f"Bước thiếu 'hz': {item!r}")
+            body = [dict(defaults, **{k: v for k, v in item.items() if k != "repeat"})]
+        out.extend(body * repeat)
+    return out
+
+
+def compile_profile(profile, start_hz=0, skip=()):
+    """Profile -> list Step với thời gian tuyệt đối (giây từ lúc bắt đầu).
+
+    skip: chỉ số bước không cần chạy (vd: đã có trong cache kết quả). Các bước này
+    vẫn có mặt, nhưng thời lượng 0 và không gửi lệnh, nên các bước sau dồn lên sớm hơn.
+    """
+    defaults = dict(DEFAULTS)
+    defaults.update(profile.get("defaults") or {})
+    steps = []
+    t = 0.0
+    prev = int(start_hz)
+    for i, s in enumerate(_expand(profile["steps"], defaults)):
+        hz = int(round(float(s["hz"])))
+        if not HZ_MIN <= hz <= HZ_MAX:
+            raise ProfileError(f"Bước {i}: hz={hz} ngoài {HZ_MIN}..{HZ_MAX}")
+        ramp = float(s.get("ramp", 0.0))
+        dwell = float(s.get("dwell", 0.0))
+        rate = float(s.get("rate", 1.0))
+        if rate <= 0 or ramp < 0 or dwell < 0:
+            raise ProfileError(f"Bước {i}: rate phải > 0, ramp/dwell phải >= 0")
+        if s.get("avg") is not None:
+            avg = float(s["avg"])
+        elif s.get("hold") is not None:
+            avg = float(s["hold"]) - dwell
+        else:
+            avg = DEFAULT_AVG
+        hold = float(s["hold"]) if s.get("hold") is not None else dwell + avg
+        if avg < 0 or hold < dwell + avg - 1e-9:
+            raise ProfileError(f"Bước {i}: hold ({hold}) phải >= dwell ({dwell}) + avg ({avg})")
+
+        t_begin = t
+        if i in skip:
+            steps.append(Step(i, hz, t, [], t, t, t, rate, avg > 0, s.get("label") or f"hz={hz}"))
+            steps[-1].skipped = True
+            continue
+        sets = []
+        n = abs(hz - prev)
+        if ramp > 0 and n > 1:
+            direction = 1 if hz > prev else -1
+            for k in range(1, n + 1):
+                sets.append((t_begin + ramp * k / n, prev + direction * k))
+            sets[-1] = (t_begin + ramp, hz)
+        else:
+            sets.append((t_begin + (ramp if n else 0.0), hz))
+        t_reach = t_begin + ramp
+        t_avg0 = t_reach + dwell
+        t_end = t_reach + hold
+        steps.append(Step(i, hz, t_begin, sets, t_avg0, t_avg0 + avg, t_end,
+                          rate, avg > 0, s.get("label") or f"hz={hz}"))
+        t = t_end
+        prev = hz
+    return steps
+
+
+def total_time(steps):
+    return steps[-1].t_end if steps else 0.0
+
+
+def fmt_duration(s):
+    s = int(round(s))
+    h, rem = divmod(s, 3600)
+    m, sec = divmod(rem, 60)
+    return f"{h}h{m:02d}m{sec:02d}s" if h else f"{m}m{sec:02d}s"
+
+
+def describe(steps):
+    n_rec = sum(1 for s in steps if s.record and not s.skipped)
+    n_skip = sum(1 for s in steps if s.skipped)
+    polls = sum((s.t_end - s.t_begin) * s.rate for s in steps)
+    return (f"{len(steps)} bước, {n_rec} dòng CSV đo mới" + (f" (+{n_skip} bỏ qua)" if n_skip else "")
+            + f", ~{int(polls)} lần hỏi STATUS, "
+            f"tổng {fmt_duration(total_time(steps))}")
+
+
+if __name__ == "__main__":
+    # python3 profiles.py profile.json -> in dòng thời gian đã biên dịch + ước tính thời gian
+    prof = load_profile(sys.argv[1])
+    st = compile_profile(prof)
+    for s in st:
+        sets = ", ".join(f"{t:.1f}s→{h}" for t, h in s.sets[:4]) + (" …" if len(s.sets) > 4 else "")
+        print(f"{s.index:3d} {s.label:12s} SET[{sets}] avg {s.t_avg0:8.1f}..{s.t_avg1:8.1f}s "
+              f"hết {s.t_end:8.1f}s rate={s.rate:g}Hz{' 🧾' if s.record else ''}")
+    print(f"⏱️ {prof['name']}: {describe(st)}")
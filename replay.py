@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Phát lại file capture serial như một cổng thật (thay cho serial.Serial).
+#
+# Định dạng capture (mỗi dòng):
+#   <t giây> < <dòng Arduino gửi lên>
+#   <t giây> > <lệnh host gửi xuống>
+# File text thô (vd: `cat /dev/ttyACM0 > raw.txt`) cũng đọc được: mỗi dòng cách
+# nhau line_period giây.
+
+import sys, re, time, argparse, threading
+
+CAPTURE_RE = re.compile(r"^(?P<t>\d+(?:\.\d+)?) (?P<dir>[<>]) (?P<line>.*)$")
+
+
+def load_capture(path, line_period=0.1):
+    """Đọc capture -> list (t, line) các dòng thiết bị gửi lên."""
+    events = []
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for raw in f:
+            raw = raw.rstrip("\r\n")
+            if not raw.strip():
+                continue
+            m = CAPTURE_RE.match(raw)
+            if m:
+                if m.group("dir") == "<":
+                    events.append((float(m.group("t")), m.group("line")))
+            else:
+                t = events[-1][0] + line_period if events else 0.0
+                events.append((t, raw.strip()))
+    return events
+
+
+def parse_speed(text):
+    """'1' / '10' / '10x' -> hệ số tốc độ; 'max' / '0' -> 0 (nhanh nhất có thể)."""
+    text = (text or "1").strip().lower()
+    if text in ("max", "fast", "0"):
+        return 0.0
+    return float(text.rstrip("x"))
+
+
+class ReplayPort:
+    """Giả lập serial.Serial: read/readline/write/flush/in_waiting/is_open/close.
+
+    speed = 1   : thời gian thực
+    speed = N   : nhanh gấp N lần
+    speed = 0   : nhanh nhất có thể (dùng làm benchmark)
+    """
+
+    def __init__(self, path, speed=1.0, timeout=1.0, line_period=0.1):
+        self.port = f"replay:{path}"
+        self.path = path
+        self.speed = float(speed)
+        self.timeout = timeout
+        self.events = load_capture(path, line_period)
+        self.is_open = True
+        self.finished = not self.events
+        self.sent = []              # lệnh host gửi xuống (chỉ ghi lại, không phản hồi)
+
+        self._idx = 0
+        self._buf = bytearray()
+        self._t0_cap = self.events[0][0] if self.events else 0.0
+        self._t_cap = self._t0_cap
+        self._t0_wall = None
+        self._t_end_wall = None
+
+        self.lines_out = 0
+        self.bytes_out = 0
+
+    # ====== Thời gian ảo (theo capture) ======
+    def _start(self):
+        if self._t0_wall is None:
+            self._t0_wall = time.monotonic()
+
+    def _due(self, idx):
+        if self.speed <= 0:
+            return 0.0
+        return self._t0_wall + (self.events[idx][0] - self._t0_cap) / self.speed
+
+    def clock(self):
+        """Giây kể từ đầu capture (thay cho time.time() của script khi phát lại)."""
+        if self.speed > 0 and self._t0_wall is not None and not self.finished:
+            return (time.monotonic() - self._t0_wall) * self.speed
+        return self._t_cap - self._t0_cap
+
+    def sleep(self, seconds):
+        if self.speed > 0:
+            time.sleep(max(0.0, seconds) / self.speed)
+
+    # ====== Đẩy dòng đến hạn vào buffer ======
+    def _emit(self):
+        t, line = self.events[self._idx]
+        data = (line + "\n").encode("utf-8")
+        self._buf.extend(data)
+        self._idx += 1
+        self._t_cap = t
+        self.lines_out += 1
+        self.bytes_out += len(data)
+        if self._idx >= len(self.events):
+            self.finished = True
+            self._t_end_wall = time.monotonic()
+
+    def _pump(self, deadline):
+        """Đợi (tối đa tới deadline) rồi nạp 1 dòng. Trả về False nếu hết giờ/hết file."""
+        self._start()
+        if self._idx >= len(self.events):
+            self.finished = True
+            time.sleep(max(0.0, min(deadline - time.monotonic(), 0.05)))
+            return False
+        due = self._due(self._idx)
+        now = time.monotonic()
+        if due > deadline:
+            time.sleep(max(0.0, deadline - now))
+            return False
+        if due > now:
+            time.sleep(due - now)
+        self._emit()
+        return True
+
+    def _deadline(self):
+        return time.monotonic() + (self.timeout if self.timeout is not None else 1e9)
+
+    # ====== API kiểu pyserial ======
+    def read(self, size=1):
+        deadline = self._deadline()
+        while len(self._buf) < size:
+            if not self._pump(deadline):
+                break
+        out = bytes(self._buf[:size])
+        del self._buf[:size]
+        return out
+
+    def readline(self):
+        deadline = self._deadline()
+        while b"\n" not in self._buf:
+            if not self._pump(deadline):
+                break
+        i = self._buf.find(b"\n")
+        n = len(self._buf) if i < 0 else i + 1
+        out = bytes(self._buf[:n])
+        del self._buf[:n]
+        return out
+
+    @property
+    def in_waiting(self):
+        self._start()
+        now = time.monotonic()
+        # Giới hạn số dòng nạp mỗi lần để chế độ "max" không dồn cả file vào RAM
+        for _ in range(64):
+            if self._idx >= len(self.events) or self._due(self._idx) > now:
+                break
+            self._emit()
+        return len(self._buf)
+
+    def write(self, data):
+        self.sent.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self._buf.clear()
+
+    def close(self):
+        self.is_open = False
+
+    # ====== Thống kê ======
+    def stats(self):
+        start = self._t0_wall or time.monotonic()
+        end = self._t_end_wall or time.monotonic()
+        wall = max(1e-9, end - start)
+        return {
+            "lines": self.lines_out,
+            "bytes": self.bytes_out,
+            "wall_s": wall,
+            "capture_s": self._t_cap - self._t0_cap,
+            "lines_per_s": self.lines_out / wall,
+        }
+
+    def report(self):
+        s = self.stats()
+        return (f"[REPLAY] {s['lines']} dòng / {s['bytes']} byte | capture {s['capture_s']:.1f}s "
+                f"→ {s['wall_s']:.3f}s thực | {s['lines_per_s']:.0f} dòng/s")
+
+
+class CaptureTap:
+    """Bọc một cổng serial thật, ghi mọi dòng vào/ra thành file capture để phát lại sau."""
+
+    def __init__(self, ser, path):
+        self._ser = ser
+        self._f = open(path, "a", encoding="utf-8")
+        self._t0 = time.monotonic()
+        self._rx = bytearray()
+        self._lock = threading.Lock()
+
+    def _log(self, direction, line):
+        line = line.strip()
+        if not line:
+            return
+        with self._lock:
+            self._f.write(f"{time.monotonic() - self._t0:.4f} {direction} {line}\n")
+            self._f.flush()
+
+    def _feed(self, data):
+        for b in data:
+            if b in (0x0A, 0x0D):
+                if self._rx:
+                    self._log("<", self._rx.decode("utf-8", errors="ignore"))
+                    self._rx.clear()
+            else:
+                self._rx.append(b)
+
+    def read(self, size=1):
+        data = self._ser.read(size)
+        self._feed(data)
+        return data
+
+    def readline(self):
+        data = self._ser.readline()
+        self._feed(data)
+        return data
+
+    def write(self, data):
+        self._log(">", bytes(data).decode("utf-8", errors="ignore"))
+        return self._ser.write(data)
+
+    def close(self):
+        try:
+            self._ser.close()
+        finally:
+            with self._lock:
+                self._f.close()
+
+    def __getattr__(self, name):
+        return getattr(self._ser, name)
+
+
+# ====== CLI: ghi capture / benchmark ======
+def cmd_record(args):
+    import serial
+    ser = CaptureTap(serial.Serial(args.port, args.baud, timeout=0.2), args.capture)
+    print(f"🎙️ Ghi {args.port} → {args.capture} (Ctrl+C để dừng)")
+    n = 0
+    try:
+        while True:
+            if ser.readline():
+                n += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ser.close()
+    print(f"🧾 {n} dòng.")
+
+
+def cmd_bench(args):
+    from telemetry import parse_status, SeqTracker
+    # Đi hết đường xử lý: byte → dòng → parse STATUS → seq/jitter → gom trung bình theo hz
+    port = ReplayPort(args.capture, speed=0, timeout=0.05)
+    tracker = SeqTracker()
+    sums = {}
+    status = other = 0
+    while not port.finished or port.in_waiting:
+        raw = port.readline()
+        if not raw:
+            continue
+        line = raw.decode("utf-8", errors="ignore").strip()
+        rec = parse_status(line)
+        if rec is None:
+            other += 1
+            continue
+        status += 1
+        tracker.add(rec)
+        acc = sums.setdefault(rec["hz"], [0, 0.0, 0.0])
+        acc[0] += 1
+        acc[1] += rec["flow1"]
+        acc[2] += rec["volt2"]
+    print(port.report())
+    print(f"[TELEMETRY] {tracker.report()}")
+    print(f"[BENCH] STATUS={status} khác={other} | {len(sums)} mức hz")
+    for hz in sorted(sums):
+        n, f1, v2 = sums[hz]
+        print(f"  hz={hz:>5g} n={n:4d} flow1_avg={f1 / n:.3f} volt2_avg={v2 / n:.3f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Ghi / phát lại capture serial của Arduino.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("record", help="Ghi cổng serial thật ra file capture")
+    p.add_argument("port")
+    p.add_argument("capture")
+    p.add_argument("--baud", type=int, default=115200)
+    p.set_defaults(func=cmd_record)
+
+    p = sub.add_parser("bench", help="Phát lại nhanh nhất có thể qua đường parse STATUS, đo dòng/s")
+    p.add_argument("capture")
+    p.set_defaults(func=cmd_bench)
+
+    args = ap.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
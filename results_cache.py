@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Cache kết quả trung bình theo (rig, cảm biến, hz) để sweep chỉ đo lại điểm cũ / thiếu.
+#
+# Một điểm được coi là còn "tươi" khi:
+#   - đo cách đây không quá max_age giây, và
+#   - (nếu có spot check) vài điểm đo nhanh lại vẫn khớp cache trong ngưỡng trôi.
+# Lưu trong SQLite (1 file), giữ cả lịch sử; luôn lấy lần đo mới nhất.
+
+import os, sys, time, socket, sqlite3, argparse
+
+DEFAULT_PATH = "maf_results.sqlite"
+MAX_AGE_H = 24.0
+DRIFT_VOLT = 0.02        # V: chênh voltMaf tối đa khi spot check
+DRIFT_FLOW = 0.03        # tương đối: chênh flowABB tối đa khi spot check
+
+ROW_COLS = ("hz", "rpm", "flowABB", "voltABB", "voltMaf", "analog")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    rig      TEXT NOT NULL,
+    sensor   TEXT NOT NULL,
+    hz       INTEGER NOT NULL,
+    t        REAL NOT NULL,
+    rpm      REAL, flowABB REAL, voltABB REAL, voltMaf REAL, analog REAL,
+    n        INTEGER,
+    PRIMARY KEY (rig, sensor, hz, t)
+);
+"""
+
+
+def default_rig():
+    return socket.gethostname()
+
+
+class ResultsCache:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+
+    def put(self, rig, sensor, row, n=None, t=None):
+        """row: 6 cột CSV của run.py (hz, rpm, flowABB, voltABB, voltMaf, analog)."""
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?,?,?,?,?,?,?,?,?,?)",
+                (rig, sensor, int(row[0]), time.time() if t is None else t, *row[1:6], n))
+
+    def latest(self, rig, sensor, hz):
+        cur = self.db.execute(
+            "SELECT hz, rpm, flowABB, voltABB, voltMaf, analog, t, n FROM results "
+            "WHERE rig=? AND sensor=? AND hz=? ORDER BY t DESC LIMIT 1", (rig, sensor, int(hz)))
+        r = cur.fetchone()
+        if r is None:
+            return None
+        return {"row": list(r[:6]), "t": r[6], "n": r[7]}
+
+    def fresh(self, rig, sensor, hz_values, max_age_s):
+        """{hz: entry} cho các hz có kết quả đo trong vòng max_age_s giây."""
+        now = time.time()
+        out = {}
+        for hz in set(hz_values):
+            e = self.latest(rig, sensor, hz)
+            if e is not None and now - e["t"] <= max_age_s:
+                out[hz] = e
+        return out
+
+    def close(self):
+        self.db.close()
+
+
+def spot_hz(hz_values, n):
+    """Chọn n điểm trải đều trong danh sách hz (gồm cả 2 đầu)."""
+    hz_values = sorted(hz_values)
+    if n <= 0 or not hz_values:
+        return []
+    if n >= len(hz_values):
+        return hz_values
+    if n == 1:
+        return [hz_values[len(hz_values) // 2]]
+    return sorted({hz_values[round(i * (len(hz_values) - 1) / (n - 1))] for i in range(n)})
+
+
+def drifted(cached_row, new_row, tol_volt=DRIFT_VOLT, tol_flow=DRIFT_FLOW):
+    """Lý do (chuỗi) nếu điểm đo lại lệch cache quá ngưỡng, None nếu khớp."""
+    dv = abs(new_row[4] - cached_row[4])
+    if dv > tol_volt:
+        return f"hz={new_row[0]}: voltMaf lệch {dv:.3f}V > {tol_volt}V"
+    ref = max(abs(cached_row[2]), 1e-6)
+    df = abs(new_row[2] - cached_row[2]) / ref
+    if cached_row[2] > 1.0 and df > tol_flow:
+        return f"hz={new_row[0]}: flowABB lệch {df * 100:.1f}% > {tol_flow * 100:.0f}%"
+    return None
+
+
+if __name__ == "__main__":
+    # python3 results_cache.py [--db file] [--sensor ID] -> liệt kê điểm mới nhất theo rig/cảm biến
+    ap = argparse.ArgumentParser(description="Xem cache kết quả sweep")
+    ap.add_argument("--db", default=DEFAULT_PATH)
+    ap.add_argument("--rig")
+    ap.add_argument("--sensor")
+    args = ap.parse_args()
+    if not os.path.exists(args.db):
+        sys.exit(f"❌ Không có {args.db}")
+    c = ResultsCache(args.db)
+    q = ("SELECT rig, sensor, hz, MAX(t), COUNT(*) FROM results WHERE (?1 IS NULL OR rig=?1) "
+         "AND (?2 IS NULL OR sensor=?2) GROUP BY rig, sensor, hz ORDER BY rig, sensor, hz")
+    now = time.time()
+    for rig, sensor, hz, t, cnt in c.db.execute(q, (args.rig, args.sensor)):
+        e = c.latest(rig, sensor, hz)
+        print(f"{rig:12s} {sensor:12s} hz={hz:02d}  {(now - t) / 3600:6.1f}h trước  x{cnt}  "
+              + " ".join(f"{k}={v}" for k, v in zip(ROW_COLS[1:], e["row"][1:])))
+    c.close()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Thống kê trượt theo thời gian (mean, std, min, max, xu hướng) với chi phí O(1)
+# cho mỗi mẫu, không phụ thuộc độ dài cửa sổ:
+#   - tổng chạy Σx, Σx², Σt, Σt², Σt·x cộng khi vào / trừ khi ra khỏi cửa sổ
+#   - min/max bằng deque đơn điệu (mỗi mẫu vào và ra tối đa một lần)
+# Giá trị được trừ đi một mốc (mẫu đầu cửa sổ) trước khi cộng dồn để tránh mất
+# chính xác khi x lớn mà phương sai nhỏ; mốc được dời lại sau mỗi vài cửa sổ
+# (tính lại O(n) một lần cho ~4 cửa sổ mẫu -> vẫn O(1) trung bình).
+
+import math
+from collections import deque
+
+WINDOWS = (10.0, 60.0, 600.0)      # giây: 10 s, 1 phút, 10 phút
+
+
+class RollingWindow:
+    def __init__(self, window_s):
+        self.window_s = window_s
+        self.buf = deque()          # (t, x)
+        self._min = deque()         # (t, x), x tăng dần
+        self._max = deque()         # (t, x), x giảm dần
+        self._ref_t = self._ref_x = None
+        self.n = 0
+        self.sx = self.sxx = 0.0
+        self.st = self.stt = self.stx = 0.0
+
+    def _acc(self, t, x, sign):
+        dt, dx = t - self._ref_t, x - self._ref_x
+        self.n += sign
+        self.sx += sign * dx
+        self.sxx += sign * dx * dx
+        self.st += sign * dt
+        self.stt += sign * dt * dt
+        self.stx += sign * dt * dx
+
+    def add(self, t, x):
+        if not self.buf:
+            self._ref_t, self._ref_x = t, x
+            self.n = 0
+            self.sx = self.sxx = self.st = self.stt = self.stx = 0.0
+        elif t - self._ref_t > 4 * self.window_s:
+            self._rebase()
+        self.buf.append((t, x))
+        self._acc(t, x, +1)
+        while self._min and self._min[-1][1] >= x:
+            self._min.pop()
+        self._min.append((t, x))
+        while self._max and self._max[-1][1] <= x:
+            self._max.pop()
+        self._max.append((t, x))
+        self.expire(t)
+
+    def _rebase(self):
+        self._ref_t, self._ref_x = self.buf[0]
+        self.n = 0
+        self.sx = self.sxx = self.st = self.stt = self.stx = 0.0
+        for t, x in self.buf:
+            self._acc(t, x, +1)
+
+    def expire(self, now):
+        cut = now - self.window_s
+        while self.buf and self.buf[0][0] < cut:
+            t, x = self.buf.popleft()
+            self._acc(t, x, -1)
+        while self._min and self._min[0][0] < cut:
+            self._min.popleft()
+        while self._max and self._max[0][0] < cut:
+            self._max.popleft()
+
+    @property
+    def mean(self):
+        return self._ref_x + self.sx / self.n if self.n else None
+
+    @property
+    def std(self):
+        if self.n < 2:
+            return 0.0 if self.n else None
+        var = (self.sxx - self.sx * self.sx / self.n) / (self.n - 1)
+        return math.sqrt(max(0.0, var))
+
+    @property
+    def min(self):
+        return self._min[0][1] if self._min else None
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else None
+
+    @property
+    def slope(self):
+        """Độ dốc hồi quy tuyến tính x theo t (đơn vị x / giây)."""
+        if self.n < 2:
+            return None
+        den = self.n * self.stt - self.st * self.st
+        if den <= 1e-12:
+            return None
+        return (self.n * self.stx - self.st * self.sx) / den
+
+    def summary(self):
+        return {"n": self.n, "mean": self.mean, "std": self.std,
+                "min": self.min, "max": self.max, "slope": self.slope}
+
+
+class RollingStats:
+    """Nhiều đại lượng x nhiều cửa sổ. add(t, rpm=.., flow=..) bỏ qua giá trị None."""
+
+    def __init__(self, fields, windows=WINDOWS):
+        self.fields = tuple(fields)
+        self.windows = tuple(windows)
+        self._w = {f: {w: RollingWindow(w) for w in self.windows} for f in self.fields}
+
+    def add(self, t, **values):
+        for f, x in values.items():
+            if x is None or f not in self._w:
+                continue
+            for rw in self._w[f].values():
+                rw.add(t, float(x))
+
+    def summary(self, window, now=None):
+        """{field: summary} cho một cửa sổ; now (nếu có) loại mẫu quá hạn khi dữ liệu ngừng đến."""
+        out = {}
+        for f in self.fields:
+            rw = self._w[f][window]
+            if now is not None:
+                rw.expire(now)
+            out[f] = rw.summary()
+        return out
+
+
+if __name__ == "__main__":
+    # Tự kiểm tra với cách tính trực tiếp trên cửa sổ
+    import random, statistics, time
+    random.seed(1)
+    rw = RollingWindow(5.0)
+    pts = []
+    t = 0.0
+    for i in range(20000):
+        t += random.uniform(0.05, 0.3)
+        x = 5000 + 30 * math.sin(t / 7) + random.gauss(0, 2)
+        rw.add(t, x)
+        pts.append((t, x))
+        if i % 997 == 996:
+            win = [p for p in pts if p[0] >= t - 5.0]
+            xs = [p[1] for p in win]
+            assert rw.n == len(win)
+            assert abs(rw.mean - statistics.fmean(xs)) < 1e-6
+            assert abs(rw.std - statistics.stdev(xs)) < 1e-6
+            assert rw.min == min(xs) and rw.max == max(xs)
+    for w in (10.0, 600.0, 36000.0):
+        rw = RollingWindow(w)
+        t1 = time.perf_counter()
+        for i in range(200000):
+            rw.add(i * 0.1, math.sin(i))
+        print(f"cửa sổ {w:7.0f}s: {(time.perf_counter() - t1) / 200000 * 1e6:.2f} µs/mẫu")
+    print("✅ khớp cách tính trực tiếp")
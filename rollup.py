@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Tổng hợp nhiều độ phân giải cho log chạy dài ngày (save_data.py, run.py fixed).
+#
+# Mỗi mẫu (t epoch, các trường) được:
+#   - ghi vào bảng raw, chỉ giữ RAW_RETENTION_S gần nhất
+#   - cộng dồn O(1) vào bucket đang mở của từng tầng 1 s / 1 phút / 1 giờ
+#     (count, tổng, min, max mỗi trường -> mean = tổng / count khi đọc)
+# Bucket được ghi theo lô mỗi FLUSH_S giây bằng UPSERT cộng dồn, nên bucket ghi
+# dở (flush giữa chừng, chạy lại sau khi mất điện) vẫn gộp đúng với phần sau.
+# Vẽ / truy vấn nhiều tuần chỉ đọc tầng thô nhất đủ dày (Rollup.query), không
+# quét lại toàn bộ dòng raw.
+#
+#   python3 rollup.py import runlog.csv --db runlog.rollup.sqlite   # nạp bù từ CSV save_data.py
+#   python3 rollup.py info --db runlog.rollup.sqlite
+#   python3 rollup.py query --db runlog.rollup.sqlite --field flow1 --since 14d --points 500 --csv out.csv
+
+import sys, csv, time, sqlite3, argparse
+import numpy as np
+
+TIERS = (("1s", 1), ("1m", 60), ("1h", 3600))
+RAW_RETENTION_S = 2 * 86400.0
+RETENTION = {"1s": 7 * 86400.0, "1m": 365 * 86400.0, "1h": None}      # None = giữ mãi
+FLUSH_S = 5.0
+PRUNE_S = 60.0
+MAX_POINTS = 2000
+ROLLUP_SUFFIX = ".rollup.sqlite"
+
+
+class Rollup:
+    def __init__(self, path, fields, raw_retention_s=RAW_RETENTION_S, retention=RETENTION, flush_s=FLUSH_S):
+        self.path = path
+        self.fields = tuple(fields)
+        self.raw_retention_s = raw_retention_s
+        self.retention = dict(retention)
+        self.flush_s = flush_s
+        self.db = sqlite3.connect(path)
+        self._init_schema()
+        self._raw = []                       # dòng raw chờ ghi
+        self._open = {}                      # tier -> [bucket, n, sums, mins, maxs]
+        self._closed = {name: [] for name, _ in TIERS}
+        self._last_flush = self._last_prune = None
+        self.newest = None
+
+    # ====== Schema ======
+    def _init_schema(self):
+        db = self.db
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = db.execute("SELECT value FROM meta WHERE key='fields'").fetchone()
+        if row and row[0] != ",".join(self.fields):
+            raise ValueError(f"{self.path}: đã có các trường {row[0]}, khác {','.join(self.fields)}")
+        cols = ", ".join(f"{f} REAL" for f in self.fields)
+        agg = ", ".join(f"{f}_sum REAL, {f}_min REAL, {f}_max REAL" for f in self.fields)
+        with db:
+            db.execute("INSERT OR IGNORE INTO meta VALUES ('fields', ?)", (",".join(self.fields),))
+            db.execute(f"CREATE TABLE IF NOT EXISTS raw (t REAL NOT NULL, {cols})")
+            db.execute("CREATE INDEX IF NOT EXISTS raw_t ON raw (t)")
+            for name, _ in TIERS:
+                db.execute(f"CREATE TABLE IF NOT EXISTS rollup_{name} "
+                           f"(t INTEGER PRIMARY KEY, n INTEGER NOT NULL, {agg})")
+        ph = ", ".join("?" * (2 + 3 * len(self.fields)))
+        names = ", ".join(f"{f}_sum, {f}_min, {f}_max" for f in self.fields)
+        merge = ", ".join(f"{f}_sum = {f}_sum + excluded.{f}_sum, {f}_min = MIN({f}_min, excluded.{f}_min), "
+                          f"{f}_max = MAX({f}_max, excluded.{f}_max)" for f in self.fields)
+        self._upsert = {name: f"INSERT INTO rollup_{name} (t, n, {names}) VALUES ({ph}) "
+                              f"ON CONFLICT(t) DO UPDATE SET n = n + excluded.n, {merge}"
+                        for name, _ in TIERS}
+        self._insert_raw = f"INSERT INTO raw VALUES ({', '.join('?' * (1 + len(self.fields)))})"
+
+    # ====== Ghi ======
+    def add(self, t, values):
+        """1 mẫu: t = giây epoch, values = số theo đúng thứ tự fields."""
+        values = [float(v) for v in values]
+        self._raw.append((t, *values))
+        for name, size in TIERS:
+            b = int(t // size) * size
+            cur = self._open.get(name)
+            if cur is None or cur[0] != b:
+                if cur is not None and cur[1]:
+                    self._closed[name].append(cur)
+                cur = self._open[name] = [b, 0, [0.0] * len(values), list(values), list(values)]
+            cur[1] += 1
+            sums, mins, maxs = cur[2], cur[3], cur[4]
+            for i, v in enumerate(values):
+                sums[i] += v
+                if v < mins[i]:
+                    mins[i] = v
+                if v > maxs[i]:
+                    maxs[i] = v
+        self.newest = t if self.newest is None else max(self.newest, t)
+        if self._last_flush is None:
+            self._last_flush = t
+        elif t - self._last_flush >= self.flush_s:
+            self.flush()
+
+    @staticmethod
+    def _row(acc):
+        b, n, sums, mins, maxs = acc
+        out = [b, n]
+        for s, lo, hi in zip(sums, mins, maxs):
+            out += [s, lo, hi]
+        return out
+
+    def flush(self):
+        """Ghi raw + bucket đã đóng + phần đang mở (cộng dồn) trong 1 transaction."""
+        with self.db:
+            if self._raw:
+                self.db.executemany(self._insert_raw, self._raw)
+            for name, _ in TIERS:
+                rows = [self._row(a) for a in self._closed[name]]
+                cur = self._open.get(name)
+                if cur is not None and cur[1]:
+                    rows.append(self._row(cur))
+                    cur[1], cur[2] = 0, [0.0] * len(self.fields)
+                    cur[3], cur[4] = [float("inf")] * len(self.fields), [float("-inf")] * len(self.fields)
+                if rows:
+                    self.db.executemany(self._upsert[name], rows)
+                self._closed[name] = []
+        self._raw = []
+        self._last_flush = self.newest
+        if self.newest is not None and (self._last_prune is None or self.newest - self._last_prune >= PRUNE_S):
+            self.prune(self.newest)
+
+    def prune(self, now):
+        """Xóa raw / bucket quá hạn giữ (tính theo mẫu mới nhất, không theo đồng hồ máy)."""
+        self._last_prune = now
+        with self.db:
+            self.db.execute("DELETE FROM raw WHERE t < ?", (now - self.raw_retention_s,))
+            for name, _ in TIERS:
+                keep = self.retention.get(name)
+                if keep is not None:
+                    self.db.execute(f"DELETE FROM rollup_{name} WHERE t < ?", (now - keep,))
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.db.close()
+
+    # ====== Đọc ======
+    def span(self, table):
+        """(t nhỏ nhất, t lớn nhất) của 1 bảng — đều đi theo index / khóa chính."""
+        return self.db.execute(f"SELECT MIN(t), MAX(t) FROM {table}").fetchone()
+
+    def bounds(self):
+        """(t đầu, t cuối) của toàn bộ dữ liệu; (None, None) nếu chưa có.
+
+        t đầu lấy ở bảng mịn nhất còn giữ đoạn đầu (min t rơi trong bucket 1 h đầu tiên,
+        tức chưa bị prune) — không lấy mốc bucket 1 h, vốn sớm hơn mẫu đầu tới gần 1 giờ.
+        t cuối: hi + độ dài bucket nhỏ nhất (bucket cuối nào cũng chứa mẫu mới nhất).
+        """
+        coarse, size_h = TIERS[-1]
+        lo_h = self.span(f"rollup_{coarse}")[0]
+        if lo_h is None:
+            return None, None
+        t0, t1 = None, None
+        for table, size in (("raw", 0),) + tuple((f"rollup_{name}", size) for name, size in TIERS):
+            lo, hi = self.span(table)
+            if lo is None:
+                continue
+            if t0 is None and lo < lo_h + size_h:
+                t0 = lo
+            t1 = hi + size if t1 is None else min(t1, hi + size)
+        return t0, t1
+
+    def pick_tier(self, t0, t1, max_points=MAX_POINTS):
+        """Tầng mịn nhất cho ra không quá max_points điểm và còn dữ liệu từ t0."""
+        n_raw = self.db.execute("SELECT COUNT(*) FROM raw WHERE t >= ? AND t <= ?", (t0, t1)).fetchone()[0]
+        lo = self.span("raw")[0]
+        if n_raw <= max_points and lo is not None and lo <= t0:
+            return "raw"
+        for name, size in TIERS:
+            lo = self.span(f"rollup_{name}")[0]
+            if (t1 - t0) / size <= max_points and lo is not None and lo <= t0 + size:
+                return name
+        return TIERS[-1][0]
+
+    def query(self, field, t0=None, t1=None, max_points=MAX_POINTS, tier=None):
+        """-> (tầng, dict t / mean / min / max / n dạng mảng NumPy). t0/t1 None = toàn bộ."""
+        if field not in self.fields:
+            raise ValueError(f"field phải là một trong {self.fields}")
+        self.flush()
+        if t0 is None or t1 is None:
+            lo, hi = self.bounds()
+            t0 = lo if t0 is None else t0
+            t1 = hi if t1 is None else t1
+            if t0 is None:
+                return "raw", {k: np.empty(0) for k in ("t", "mean", "min", "max", "n")}
+        tier = tier or self.pick_tier(t0, t1, max_points)
+        if tier == "raw":
+            q = f"SELECT t, {field}, {field}, {field}, 1 FROM raw WHERE t >= ? AND t <= ? ORDER BY t"
+            lo = t0
+        else:
+            # bucket chứa t0 (mốc bucket < t0) cũng thuộc khoảng hỏi
+            q = (f"SELECT t, {field}_sum / n, {field}_min, {field}_max, n FROM rollup_{tier} "
+                 f"WHERE t > ? AND t <= ? ORDER BY t")
+            lo = t0 - dict(TIERS)[tier]
+        arr = np.array(self.db.execute(q, (lo, t1)).fetchall(), dtype=np.float64).reshape(-1, 5)
+        return tier, {k: arr[:, i] for i, k in enumerate(("t", "mean", "min", "max", "n"))}
+
+
+def default_path(csv_path):
+    return csv_path + ROLLUP_SUFFIX
+
+
+# ====== CLI ======
+def _parse_age(s):
+    """'90s' / '15m' / '6h' / '14d' -> giây."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if s[-1:] in units:
+        return float(s[:-1]) * units[s[-1]]
+    return float(s)
+
+
+def cmd_import(args):
+    with open(args.csv, "r", encoding="utf-8-sig", newline="") as f:
+        rows = csv.reader(f)
+        header = [c.strip() for c in next(rows)]
+        if "t" not in header:
+            sys.exit(f"❌ {args.csv}: không có cột t (epoch) — chỉ nạp được CSV mới của save_data.py")
+        fields = args.fields.split(",")
+        idx = [header.index(c) for c in fields]
+        it = header.index("t")
+        r = Rollup(args.db, fields, flush_s=3600.0)
+        n = 0
+        t1 = time.perf_counter()
+        for row in rows:
+            try:
+                r.add(float(row[it]), [float(row[i]) for i in idx])
+                n += 1
+            except (ValueError, IndexError):
+                continue
+        r.close()
+    print(f"✅ {n} mẫu → {args.db} ({time.perf_counter() - t1:.2f}s)")
+
+
+def cmd_info(args):
+    db = sqlite3.connect(args.db)
+    fields = db.execute("SELECT value FROM meta WHERE key='fields'").fetchone()[0]
+    print(f"{args.db}: trường {fields}")
+    for table in ["raw"] + [f"rollup_{n}" for n, _ in TIERS]:
+        lo, hi, cnt = db.execute(f"SELECT MIN(t), MAX(t), COUNT(*) FROM {table}").fetchone()
+        rng = "" if lo is None else (f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(lo))} → "
+                                     f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(hi))}")
+        print(f"  {table:10s} {cnt:9d} dòng  {rng}")
+    db.close()
+
+
+def cmd_query(args):
+    db = sqlite3.connect(args.db)
+    fields = db.execute("SELECT value FROM meta WHERE key='fields'").fetchone()[0].split(",")
+    db.close()
+    r = Rollup(args.db, fields)
+    hi = r.span("raw")[1] or r.span(f"rollup_{TIERS[-1][0]}")[1] or time.time()
+    t0 = hi - _parse_age(args.since) if args.since else None
+    t1 = time.perf_counter()
+    tier, d = r.query(args.field, t0, None if t0 is None else hi, args.points, args.tier)
+    ms = (time.perf_counter() - t1) * 1000
+    r.db.close()
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["t", "mean", "min", "max", "n"])
+            w.writerows(zip(d["t"], d["mean"].round(6), d["min"], d["max"], d["n"].astype(int)))
+    else:
+        for row in zip(d["t"], d["mean"], d["min"], d["max"], d["n"]):
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row[0]))}  "
+                  f"mean={row[1]:.4f} min={row[2]:.4f} max={row[3]:.4f} n={int(row[4])}")
+    print(f"🔎 {args.field}: {len(d['t'])} điểm từ tầng {tier} ({ms:.1f} ms)" + (f" → {args.csv}" if args.csv else ""))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tổng hợp 1 s / 1 phút / 1 giờ cho log chạy dài.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("import", help="Nạp bù từ CSV của save_data.py (có cột t)")
+    p.add_argument("csv")
+    p.add_argument("--db")
+    p.add_argument("--fields", default="hz,rpm,flow1,volt1,flow2,volt2")
+    p = sub.add_parser("info", help="Số dòng và khoảng thời gian mỗi tầng")
+    p.add_argument("--db", required=True)
+    p = sub.add_parser("query", help="Đọc 1 trường, tự chọn tầng theo số điểm")
+    p.add_argument("--db", required=True)
+    p.add_argument("--field", required=True)
+    p.add_argument("--since", help="Khoảng tính từ mẫu mới nhất: 90s, 15m, 6h, 14d (bỏ trống = tất cả)")
+    p.add_argument("--points", type=int, default=MAX_POINTS, help="Số điểm tối đa")
+    p.add_argument("--tier", choices=["raw"] + [n for n, _ in TIERS], help="Ép dùng 1 tầng")
+    p.add_argument("--csv", help="Xuất ra CSV thay vì in")
+    args = ap.parse_args()
+    if args.cmd == "import":
+        args.db = args.db or default_path(args.csv)
+        cmd_import(args)
+    elif args.cmd == "info":
+        cmd_info(args)
+    else:
+        cmd_query(args)
+
+
+if __name__ == "__main__":
+    main()
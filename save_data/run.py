@@ -1,18 +1,28 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import sys, os, csv, re, time, argparse, threading, queue, signal
-import serial
+import sys, os, time, argparse, threading, queue, signal
 from statistics import mean
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ports import open_port, is_replay
+from telemetry import STATUS_RE, AVG_RE, parse_hz, record_from_match, avg_from_match, SeqTracker
+from profiles import load_profile, compile_profile, sweep_profile, describe, fmt_duration, total_time
+from checkpoint import Checkpoint, fingerprint
+from results_cache import ResultsCache, default_rig, spot_hz, drifted, MAX_AGE_H, DRIFT_VOLT, DRIFT_FLOW
+from calibration import add_target_arguments, target_hz_from_args
+from rollup import Rollup, default_path as rollup_path, RAW_RETENTION_S
+import log_writer
+import interlock as safety
+
 PORT = "/dev/ttyACM0"
 FILE = "runlog.csv"
-
-STATUS_RE = re.compile(
-    r"^STATUS\s+hz=(?P<hz>\d+)\s+rpm=(?P<rpm>-?\d+(?:\.\d+)?)\s+run=(?P<run>[01])\s+hold=(?P<hold>[01])\s+"
-    r"flow1=(?P<flow1>-?\d+(?:\.\d+)?)\s+volt1=(?P<volt1>-?\d+(?:\.\d+)?)\s+"
-    r"flow2=(?P<flow2>-?\d+(?:\.\d+)?)\s+volt2=(?P<volt2>-?\d+(?:\.\d+)?)$"
-)
+STATE_SUFFIX = ".state.json"   # checkpoint cạnh file CSV
+CHECKPOINT_S = 5.0             # lưu tổng đang gom mỗi chừng này giây
+AVG_CHUNK_S = 2.0              # mỗi lệnh AVG phủ chừng này giây (stale của interlock lấy theo nhịp này)
+AVG_GAP_MS = 50                # cửa sổ AVG ngắn hơn chừng này: dòng trả về kịp trước nhịp sau
+AVG_MIN_MS = 50
+AVG_MAX_MS = 5000              # giới hạn của firmware
 
 class SerialReader(threading.Thread):
     def __init__(self, ser, line_queue):
@@ -38,11 +48,11 @@ class SerialReader(threading.Thread):
                         finally:
                             buff.clear()
                         if line:
-                            self.q.put(line)
+                            self.q.put((time.monotonic(), line))
                 else:
                     buff.extend(b)
             except Exception as e:
-                self.q.put(f"__ERR__ {e}")
+                self.q.put((time.monotonic(), f"__ERR__ {e}"))
                 time.sleep(0.2)
 
 def send_cmd(ser, cmd):
@@ -53,13 +63,233 @@ def wait_banner(q, timeout=5.0):
     t0 = time.time()
     while time.time() - t0 < timeout:
         try:
-            line = q.get(timeout=0.2)
+            _, line = q.get(timeout=0.2)
             if "Arduino Ready" in line:
                 return True
         except queue.Empty:
             pass
     return False
 
+class Accumulator:
+    """Tổng chạy (rpm, flow1, volt1, flow2, volt2) của 1 bước — đủ nhỏ để lưu vào checkpoint."""
+
+    def __init__(self, n=0, sums=None):
+        self.n = n
+        self.sums = list(sums) if sums else [0.0] * 5
+
+    def add(self, sample, w=1):
+        # w = số mẫu ADC khi sample là trung bình AVG của firmware
+        self.n += w
+        for i, x in enumerate(sample):
+            self.sums[i] += x * w
+
+    def mean(self, i):
+        return self.sums[i] / self.n
+
+    def to_dict(self):
+        return {"n": self.n, "sums": self.sums}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["n"], d["sums"])
+
+
+def average_row(target_hz, acc):
+    """Accumulator -> 6 cột CSV của chế độ sweep."""
+    rpm_avg   = round(acc.mean(0), 3)
+    flow1_avg = round(acc.mean(1) * 3.6, 2)
+    volt1_avg = round(acc.mean(2), 2)
+    volt2_avg = round(acc.mean(4), 2)
+    analog    = round((volt2_avg * 1023.0) / 5.0, 3)  # yêu cầu: analog = volt2_avg * 1023 / 5
+    return [target_hz, rpm_avg, flow1_avg, volt1_avg, volt2_avg, analog]
+
+
+class ProfileRunner:
+    """Chạy dòng thời gian đã biên dịch (profiles.compile_profile) theo hạn tuyệt đối.
+
+    Mọi mốc (SET_HZ, STATUS, cửa sổ trung bình) tính từ t0 + offset nên không
+    cộng dồn trễ như kiểu now + interval; trễ một nhịp thì bỏ nhịp đó chứ không bắn dồn.
+    Có checkpoint thì sau mỗi bước (và mỗi CHECKPOINT_S giây khi đang gom) ghi lại
+    bước kế tiếp + tổng đang gom để --resume chạy tiếp.
+    dev_avg=True: trong cửa sổ trung bình gửi "AVG <ms>" thay cho STATUS — firmware tự
+    lấy mẫu ADC liên tục ~AVG_CHUNK_S giây, chỉ 1 dòng trả về (tổng gom theo số mẫu n).
+    """
+
+    def __init__(self, ser, line_q, log, clock, tracker, should_stop, checkpoint=None, state=None,
+                 cached_rows=None, on_row=None, dev_avg=False):
+        self.ser = ser
+        self.q = line_q
+        self.log = log                   # log_writer.LogWriter (None = không ghi CSV)
+        self.clock = clock
+        self.tracker = tracker
+        self.should_stop = should_stop
+        self.checkpoint = checkpoint
+        self.state = dict(state or {})   # phần cố định của checkpoint (profile, fingerprint, csv)
+        self.cached_rows = cached_rows or {}   # hz -> dòng CSV lấy từ cache cho các bước skipped
+        self.on_row = on_row                   # on_row(step, row, n) sau mỗi dòng đo mới
+        self.dev_avg = dev_avg
+        self.late_max = 0.0          # trễ lớn nhất so với hạn (s)
+
+    def run(self, steps, t_end=None, start=0, partial=None):
+        """Chạy steps[start:]; partial = {"step", "collected_s", "acc"} từ checkpoint."""
+        if start >= len(steps):
+            return True
+        t0 = self.clock() - steps[start].t_begin
+        t_first = self.clock()
+        done = True
+        for step in steps[start:]:
+            if self.should_stop():
+                done = False
+                break
+            if t_end and self.clock() >= t_end:
+                print("⏱️ Hết thời lượng tổng.")
+                done = False
+                break
+            if step.skipped:
+                row = self.cached_rows[step.hz]
+                if self.log:
+                    self.log.writerow(row)
+                print(f"♻️ [CACHE] hz={step.hz} | " + " | ".join(str(x) for x in row[1:]))
+                self._save(step.index + 1)
+                continue
+            part = partial if partial and partial.get("step") == step.index else None
+            finished, skipped = self.run_step(step, t0, part)
+            t0 -= skipped              # bước tiếp theo tới sớm hơn phần đã gom từ lần trước
+            if not finished:
+                done = False
+                break
+        planned = total_time(steps) - steps[start].t_begin - (partial or {}).get("collected_s", 0.0)
+        print(f"[SCHED] trễ lớn nhất so với lịch: {self.late_max * 1000:.1f} ms | "
+              f"lệch tổng: {(self.clock() - t_first) - planned:+.2f}s")
+        if done and self.checkpoint:
+            self.checkpoint.clear()
+        return done
+
+    def _avg_plan(self, step, now, k, period, base, avg0, avg1):
+        """(ms của lệnh AVG, nhịp kế tiếp) — cửa sổ kết thúc đúng một mốc lịch; ms=0 = gửi STATUS."""
+        if not (self.dev_avg and step.record and avg0 <= now < avg1):
+            return 0, k
+        k_end = k + max(1, int(AVG_CHUNK_S / period)) - 1
+        ms = min(int((min(base + k_end * period, avg1) - now) * 1000) - AVG_GAP_MS, AVG_MAX_MS)
+        return (ms, k_end) if ms >= AVG_MIN_MS else (0, k)
+
+    def _late(self, now, due):
+        self.late_max = max(self.late_max, now - due)
+
+    def _save(self, next_step, partial=None):
+        # Ranh giới bước / checkpoint: dòng CSV phải xuống đĩa trước khi checkpoint trỏ qua nó
+        if self.log:
+            self.log.barrier()
+        if not self.checkpoint:
+            return
+        self.checkpoint.save(dict(self.state, next_step=next_step, partial=partial,
+                                  csv_bytes=self.log.tell()))
+
+    def run_step(self, step, t0, partial=None):
+        """Trả về (xong bước?, số giây gom đã có sẵn từ checkpoint)."""
+        acc = Accumulator.from_dict(partial["acc"]) if partial else Accumulator()
+        skipped = min(partial["collected_s"], step.t_avg1 - step.t_avg0) if partial else 0.0
+        print(f"\n=== 🔹 [{step.index}] {step.label} → HZ = {step.hz} | "
+              f"gom {step.t_avg1 - step.t_avg0 - skipped:.1f}s sau {step.t_avg0 - step.t_begin:.1f}s ===")
+        if partial:
+            print(f"↩️ Đã có {acc.n} mẫu ({skipped:.1f}s) từ lần chạy trước")
+        sets = list(step.sets)
+        period = 1.0 / step.rate
+        base = t0 + step.t_begin
+        end = t0 + step.t_end - skipped
+        avg0, avg1 = t0 + step.t_avg0, t0 + step.t_avg1 - skipped
+        next_ckpt = avg0 + CHECKPOINT_S
+        k = 0
+
+        def save_partial(now):
+            collected = skipped + max(0.0, min(now, avg1) - avg0)
+            self._save(step.index, {"step": step.index, "collected_s": collected, "acc": acc.to_dict()})
+
+        while not self.should_stop():
+            now = self.clock()
+            while sets and now >= t0 + sets[0][0]:
+                self._late(now, t0 + sets[0][0])
+                send_cmd(self.ser, f"SET_HZ {sets[0][1]}")
+                sets.pop(0)
+            if now >= end:
+                break
+            due = base + k * period
+            if now >= due:
+                self._late(now, due)
+                k = max(k + 1, int((now - base) / period) + 1)
+                win, k = self._avg_plan(step, now, k, period, base, avg0, avg1)
+                send_cmd(self.ser, f"AVG {win}" if win else "STATUS")
+            if step.record and avg0 <= now < avg1 and now >= next_ckpt:
+                save_partial(now)
+                next_ckpt = now + CHECKPOINT_S
+
+            nxt = min(base + k * period, end, t0 + sets[0][0] if sets else end)
+            try:
+                _, line = self.q.get(timeout=min(0.1, max(0.0, nxt - self.clock())))
+            except queue.Empty:
+                continue
+            t_rx = self.clock()
+
+            if line.startswith("__ERR__"):
+                print(f"[SERIAL ERR] {line}")
+                continue
+            if line.startswith("OK") or line.startswith("ERR"):
+                print(f"[CMD] {line}")
+                if self.dev_avg and line.startswith("ERR UNKNOWN_CMD"):
+                    self.dev_avg = False
+                    k = int((t_rx - base) / period) + 1     # không chờ hết cửa sổ AVG đã bỏ
+                    print("⚠️ Firmware chưa có lệnh AVG → trung bình trên host từ STATUS")
+                continue
+            m = AVG_RE.match(line)
+            if m:
+                rec = avg_from_match(m, t_rx)
+                self.tracker.add(rec)
+                t_win = t_rx - rec["ms"] / 1000.0      # đầu cửa sổ lấy mẫu (xấp xỉ, theo host)
+                if rec["hz"] == step.hz and avg0 <= t_win < avg1 and rec["n"]:
+                    acc.add((rec["rpm"], rec["flow1"], rec["volt1"], rec["flow2"], rec["volt2"]), rec["n"])
+                    print(f"[AVG] t={t_rx - avg0 + skipped:5.1f}s | hz={rec['hz']:g} n={rec['n']} | "
+                          f"f1={rec['flow1']:.3f} v1={rec['volt1']:.4f} [{rec['volt1_min']:.3f}..{rec['volt1_max']:.3f}] | "
+                          f"f2={rec['flow2']:.3f} v2={rec['volt2']:.4f} [{rec['volt2_min']:.3f}..{rec['volt2_max']:.3f}]")
+                continue
+            m = STATUS_RE.match(line)
+            if not m:
+                continue
+            lost = self.tracker.add(record_from_match(m, t_rx))
+            if lost:
+                print(f"⚠️ Mất {lost} STATUS (seq)")
+
+            hz = parse_hz(m.group("hz"))
+            rpm = float(m.group("rpm"))
+            flow1 = float(m.group("flow1"))
+            volt1 = float(m.group("volt1"))
+            flow2 = float(m.group("flow2"))
+            volt2 = float(m.group("volt2"))
+            if hz == step.hz and avg0 <= t_rx < avg1 and not self.dev_avg:
+                acc.add((rpm, flow1, volt1, flow2, volt2))
+                print(f"[READ] t={t_rx - avg0 + skipped:5.1f}s | hz={hz:g} rpm={rpm:.1f} | f1={flow1:.3f} v1={volt1:.3f} | f2={flow2:.3f} v2={volt2:.3f}")
+
+        now = self.clock()
+        if step.record and now < avg1:
+            # Bị dừng giữa cửa sổ: giữ phần đã gom cho --resume, không ghi dòng thiếu
+            save_partial(now)
+            print(f"⏸️ Dừng giữa bước {step.index}: đã lưu {acc.n} mẫu vào checkpoint")
+            return False, skipped
+        if step.record:
+            if acc.n:
+                row = average_row(step.hz, acc)
+                if self.log:
+                    self.log.writerow(row)
+                if self.on_row:
+                    self.on_row(step, row, acc.n)
+                print(f"🧾 [CSV] hz_avg={row[0]} | rpm_avg={row[1]} | flow1_avg={row[2]} | volt1_avg={row[3]} | volt2_avg={row[4]} | analog={row[5]}")
+            else:
+                print(f"⚠️ Không thu được mẫu hợp lệ cho HZ={step.hz} trong {step.t_avg1 - step.t_avg0:.1f}s")
+        finished = now >= end
+        # Đã ghi dòng CSV thì coi như xong bước (dù bị dừng trong phần hold còn lại)
+        self._save(step.index + 1 if finished or step.record else step.index)
+        return finished, skipped
+
+
 def graceful_stop(ser):
     try:
         send_cmd(ser, "SET_HZ 0")
@@ -77,6 +307,7 @@ def main():
 
     parser.add_argument("--mode", choices=["fixed", "ramp", "sweep"], default="sweep",
                         help="sweep = 0→1→2…; fixed = tần số cố định; ramp = tăng theo thời gian")
+    parser.add_argument("--profile", help="File profile (.csv/.json/.toml, xem profiles.py); thay cho --mode")
 
     # fixed
     parser.add_argument("--hz", type=int, default=30, help="Tần số đặt khi fixed (0..60)")
@@ -97,19 +328,128 @@ def main():
     # đọc/ghi
     parser.add_argument("--sample-rate", type=int, default=1, help="Tần số yêu cầu STATUS (Hz).")
     parser.add_argument("--avg-window", type=float, default=20.0, help="Cửa sổ trung bình (giây).")
+    parser.add_argument("--host-avg", action="store_true",
+                        help="Sweep/profile: trung bình trên host từ STATUS như cũ (mặc định firmware tự lấy mẫu, lệnh AVG)")
     parser.add_argument("--csv", default=FILE, help="Đường dẫn file CSV output")
+    parser.add_argument("--capture", help="Ghi toàn bộ dòng vào/ra serial ra file capture để phát lại sau")
+    parser.add_argument("--resume", action="store_true",
+                        help="Chạy tiếp sweep/profile bị ngắt từ checkpoint <csv>.state.json (cùng profile, cùng CSV)")
+    # cache kết quả theo (rig, cảm biến, hz)
+    parser.add_argument("--cache", help="File SQLite cache kết quả; bỏ qua các mức hz đã đo gần đây (cần --sensor)")
+    parser.add_argument("--sensor", help="Mã cảm biến MAF đang đo (khóa cache)")
+    parser.add_argument("--rig", default=default_rig(), help="Tên bàn thử (mặc định: hostname)")
+    parser.add_argument("--max-age", type=float, default=MAX_AGE_H, help="Tuổi tối đa của điểm trong cache (giờ)")
+    parser.add_argument("--spot-check", type=int, default=0,
+                        help="Đo nhanh lại N điểm có trong cache; lệch quá ngưỡng thì đo lại toàn bộ")
+    parser.add_argument("--spot-avg", type=float, default=5.0, help="Cửa sổ trung bình khi spot check (giây)")
+    parser.add_argument("--drift-volt", type=float, default=DRIFT_VOLT, help="Ngưỡng lệch voltMaf khi spot check (V)")
+    parser.add_argument("--drift-flow", type=float, default=DRIFT_FLOW, help="Ngưỡng lệch tương đối flowABB khi spot check")
+    parser.add_argument("--rollup", nargs="?", const="",
+                        help="Chế độ fixed: ghi thêm mọi mẫu STATUS vào tổng hợp 1s/1m/1h (mặc định <csv>.rollup.sqlite)")
+    parser.add_argument("--raw-days", type=float, default=RAW_RETENTION_S / 86400, help="Số ngày giữ mẫu raw trong file rollup")
+    add_target_arguments(parser)
+    log_writer.add_arguments(parser)
+    safety.add_arguments(parser)
     args = parser.parse_args()
+    args.hz = target_hz_from_args(args, parser)
+    if args.cache and not args.sensor:
+        parser.error("--cache cần --sensor")
+    if args.resume and not (args.profile or args.mode == "sweep"):
+        parser.error("--resume chỉ dùng với --mode sweep hoặc --profile")
+    if (args.rotate_mb or args.rotate_h) and (args.profile or args.mode == "sweep"):
+        parser.error("--rotate-mb/--rotate-h chỉ dùng với --mode fixed/ramp (checkpoint sweep trỏ vào 1 file CSV)")
+
+    # Biên dịch profile trước khi mở cổng: lỗi cú pháp báo ngay, ước tính thời gian chạy
+    steps = None
+    cache = None
+    if args.profile or args.mode == "sweep":
+        try:
+            if args.profile:
+                prof = load_profile(args.profile)
+            else:
+                prof = sweep_profile(max(0, min(60, args.sweep_start)), max(0, min(60, args.sweep_stop)),
+                                     max(1, args.sweep_step), 0.3, args.avg_window, max(1, args.sample_rate))
+            steps = compile_profile(prof)
+        except (OSError, ValueError) as e:
+            print(f"❌ Profile lỗi: {e}")
+            sys.exit(1)
+        ckpt = Checkpoint(args.csv + STATE_SUFFIX)
+        ckpt_base = {"profile": prof["name"], "csv": os.path.abspath(args.csv),
+                     "fingerprint": fingerprint([(s.hz, s.sets, s.t_avg0, s.t_avg1, s.t_end, s.rate, s.record)
+                                                 for s in steps])}
+        start, partial = 0, None
+        if args.resume:
+            state = ckpt.load()
+            if state is None:
+                print(f"❌ Không có checkpoint hợp lệ: {ckpt.path}")
+                sys.exit(1)
+            if state.get("fingerprint") != ckpt_base["fingerprint"] or state.get("csv") != ckpt_base["csv"]:
+                print(f"❌ Checkpoint {ckpt.path} thuộc profile/CSV khác ({state.get('profile')}), không resume được.")
+                sys.exit(1)
+            start, partial = state["next_step"], state.get("partial")
+            size = os.path.getsize(args.csv) if os.path.exists(args.csv) else 0
+            if size < state["csv_bytes"]:
+                print(f"❌ {args.csv} ngắn hơn lúc checkpoint ({size} < {state['csv_bytes']} byte).")
+                sys.exit(1)
+            if size > state["csv_bytes"]:
+                # dòng ghi sau checkpoint cuối (mất điện giữa chừng) -> cắt bỏ, bước đó sẽ đo lại
+                with open(args.csv, "r+b") as fcut:
+                    fcut.truncate(state["csv_bytes"])
+            print(f"↩️ Resume từ bước {start}/{len(steps)} (checkpoint {state.get('updated')})")
+        elif ckpt.exists():
+            print(f"⚠️ Có checkpoint cũ {ckpt.path} — chạy mới sẽ ghi đè (dùng --resume để chạy tiếp).")
+
+        # Cache: bước có ghi CSV mà hz đã đo gần đây thì không chạy lại
+        cache, cached = None, {}
+        if args.cache:
+            cache = ResultsCache(args.cache)
+            rec_hz = {s.hz for s in steps[start:] if s.record}
+            cached = cache.fresh(args.rig, args.sensor, rec_hz, args.max_age * 3600)
+            print(f"♻️ Cache {args.rig}/{args.sensor}: {len(cached)}/{len(rec_hz)} mức hz còn tươi (≤ {args.max_age:g}h)")
+
+        def plan(cached):
+            part_step = (partial or {}).get("step")
+            skip = {s.index for s in steps if s.index >= start and s.record and s.hz in cached
+                    and s.index != part_step}
+            return compile_profile(prof, skip=skip) if skip else steps
+
+        def estimate(run_steps):
+            est = total_time(run_steps) - (run_steps[start].t_begin if start < len(run_steps) else total_time(run_steps))
+            est -= (partial or {}).get("collected_s", 0.0)
+            if args.duration > 0:
+                est = min(est, args.duration)
+            print(f"⏱️ {prof['name']}: {describe(run_steps)} → dự kiến xong lúc "
+                  f"{time.strftime('%H:%M:%S', time.localtime(time.time() + est))} ({fmt_duration(est)})")
+
+        run_steps = plan(cached)
+        estimate(run_steps)
+
+    # Interlock: stale mặc định theo nhịp hỏi chậm nhất (STATUS mỗi bước / một khối AVG)
+    poll_s = max([AVG_CHUNK_S, 1.0 / max(1, args.sample_rate)] + [1.0 / s.rate for s in steps or ()])
+    try:
+        il = safety.from_args(args, poll_s=poll_s)
+    except ValueError as e:
+        parser.error(str(e))
 
     # Mở serial
     try:
-        ser = serial.Serial(args.port, args.baud, timeout=0.2)
+        ser = open_port(args.port, args.baud, timeout=0.2, capture=args.capture)
     except Exception as e:
         print(f"❌ Không mở được cổng {args.port}: {e}")
         sys.exit(1)
+    ser = safety.guard(ser, il)       # luật an toàn chạy trong thread đọc, trip -> STOP ngay
+
+    # Khi phát lại capture: dùng đồng hồ ảo của capture, hàng đợi ngắn để
+    # đồng hồ không chạy trước phần xử lý (chế độ @max)
+    replay = is_replay(ser)
+    clock = ser.clock if replay else time.monotonic
+    pause = ser.sleep if replay else time.sleep
 
-    line_q = queue.Queue()
+    def replay_done():
+        return replay and ser.finished and line_q.empty()
+
+    line_q = queue.Queue(maxsize=4 if replay else 0)
     reader = SerialReader(ser, line_q)
-    reader.start()
 
     stop_flag = {"v": False}
     def on_sig(sig, frame):
@@ -117,132 +457,107 @@ def main():
     signal.signal(signal.SIGINT, on_sig)
     signal.signal(signal.SIGTERM, on_sig)
 
-    # CSV header: đúng yêu cầu
-    first_create = not os.path.exists(args.csv)
-    f = open(args.csv, "a", newline="")
-    writer = csv.writer(f)
-    if first_create:
-        writer.writerow(["hz", "rpm", "flowABB", "voltABB", "voltMaf", "analog"])
+    if il:
+        def on_trip(reason, latency):
+            print(f"⛔ [INTERLOCK] {reason} → STOP sau {latency * 1000:.1f} ms")
+            stop_flag["v"] = True
+        il.on_trip = on_trip
+        print(f"🛡️ Interlock: {il.describe()}")
+    reader.start()
+
+    # CSV header: đúng yêu cầu (chỉ ghi khi file mới)
+    log = log_writer.from_args(args.csv, ["hz", "rpm", "flowABB", "voltABB", "voltMaf", "analog"], args)
+    if log.moved:
+        print(f"⚠️ {args.csv} có header khác (file của script khác / bản cũ) → đã chuyển sang {log.moved}")
 
-    wait_banner(line_q, timeout=3.0)
+    if not replay:
+        wait_banner(line_q, timeout=3.0)
 
     # Khởi động
     send_cmd(ser, "RESET")
-    time.sleep(0.2)
+    pause(0.2)
     send_cmd(ser, "RUN")
 
     status_period = 1.0 / float(max(1, args.sample_rate))
-    next_status = time.time()
+    next_status = clock()
 
-    last_run = 0
-    last_hold = 0
+    tracker = SeqTracker()
+    rollup = None
 
     print("✅ Bắt đầu. Mỗi mức HZ: đọc 1Hz trong 20s → tính trung bình → ghi CSV (hz_avg..analog) → sang HZ kế tiếp.")
-    t_end = time.time() + args.duration if args.duration > 0 else None
+    t_end = clock() + args.duration if args.duration > 0 else None
 
     try:
-        if args.mode == "sweep":
-            hz_values = list(range(
-                max(0, min(60, args.sweep_start)),
-                max(0, min(60, args.sweep_stop)) + 1,
-                max(1, args.sweep_step)
-            ))
-
-            for target_hz in hz_values:
-                if stop_flag["v"]:
-                    break
-                if t_end and time.time() >= t_end:
-                    print("⏱️ Hết thời lượng tổng.")
-                    break
-
-                # Đặt HZ
-                send_cmd(ser, f"SET_HZ {target_hz}")
-                print(f"\n=== 🔹 HZ = {target_hz} ─ BẮT ĐẦU GOM {args.avg_window:.1f}s ===")
-                time.sleep(0.3)  # cho hệ ổn định nhẹ
-
-                bucket = []
-                t0 = time.time()
-                next_status = t0
-
-                while (time.time() - t0) < args.avg_window and not stop_flag["v"]:
-                    now = time.time()
-                    if now >= next_status:
-                        send_cmd(ser, "STATUS")
-                        next_status = now + status_period
-
-                    try:
-                        line = line_q.get(timeout=0.1)
-                    except queue.Empty:
-                        continue
-
-                    if line.startswith("__ERR__"):
-                        print(f"[SERIAL ERR] {line}")
-                        continue
-                    if line.startswith("OK") or line.startswith("ERR"):
-                        print(f"[CMD] {line}")
-                        continue
-
-                    m = STATUS_RE.match(line)
-                    if not m:
-                        continue
-
-                    hz = int(m.group("hz"))
-                    rpm = float(m.group("rpm"))
-                    flow1 = float(m.group("flow1"))
-                    volt1 = float(m.group("volt1"))
-                    flow2 = float(m.group("flow2"))
-                    volt2 = float(m.group("volt2"))
-                    last_run = int(m.group("run"))
-                    last_hold = int(m.group("hold"))
-
-                    if hz == target_hz:
-                        bucket.append((rpm, flow1, volt1, flow2, volt2))
-                        elapsed = time.time() - t0
-                        print(f"[READ] t={elapsed:5.1f}s | hz={hz:02d} rpm={rpm:.1f} | f1={flow1:.3f} v1={volt1:.3f} | f2={flow2:.3f} v2={volt2:.3f}")
-
-                # Trung bình & ghi CSV (đúng 6 cột yêu cầu)
-                if bucket:
-                    rpms = [x[0] for x in bucket]
-                    f1s  = [x[1] for x in bucket]
-                    v1s  = [x[2] for x in bucket]
-                    f2s  = [x[3] for x in bucket]
-                    v2s  = [x[4] for x in bucket]
+        if steps is not None:
+            should_stop = lambda: stop_flag["v"] or replay_done()
+            # Capture cũ chỉ có STATUS -> phát lại thì trung bình trên host
+            dev_avg = not (args.host_avg or replay)
+            if cached and args.spot_check > 0:
+                # Spot check: đo nhanh vài điểm có trong cache, lệch thì bỏ cache đo lại hết
+                spot = spot_hz(list(cached), args.spot_check)
+                first = {}
+                for st in steps:
+                    first.setdefault(st.hz, st)
+                sp = compile_profile({"name": "spot", "steps": [
+                    {"hz": h, "dwell": first[h].t_avg0 - first[h].sets[-1][0], "avg": args.spot_avg,
+                     "rate": first[h].rate} for h in spot]})
+                print(f"\n🔎 Spot check {spot}: {describe(sp)}")
+                measured = {}
+                ProfileRunner(ser, line_q, None, clock, tracker, should_stop,
+                              on_row=lambda st, row, n: measured.__setitem__(st.hz, row), dev_avg=dev_avg).run(sp)
+                reasons = [r for h in spot for r in
+                           [drifted(cached[h]["row"], measured[h], args.drift_volt, args.drift_flow)
+                            if h in measured else f"hz={h}: không đo được"] if r]
+                if reasons:
+                    print("⚠️ Spot check lệch cache → đo lại toàn bộ:\n   " + "\n   ".join(reasons))
+                    cached = {}
+                    run_steps = plan(cached)
+                    estimate(run_steps)
+                else:
+                    print("✅ Spot check khớp cache.")
 
-                    rpm_avg   = round(mean(rpms), 3)
-                    flow1_avg = round(mean(f1s) *3.6, 2)
-                    volt1_avg = round(mean(v1s), 2)
-                    volt2_avg = round(mean(v2s), 2)
-                    analog    = round((volt2_avg * 1023.0) / 5.0, 3)  # yêu cầu: analog = volt2_avg * 1023 / 5
+            def on_row(step, row, n):
+                if cache:
+                    cache.put(args.rig, args.sensor, row, n)
 
-                    row = [target_hz, rpm_avg, flow1_avg, volt1_avg, volt2_avg, analog]
-                    writer.writerow(row)
-                    f.flush()
-                    print(f"🧾 [CSV] hz_avg={target_hz} | rpm_avg={rpm_avg} | flow1_avg={flow1_avg} | volt1_avg={volt1_avg} | volt2_avg={volt2_avg} | analog={analog}")
-                else:
-                    print(f"⚠️ Không thu được mẫu hợp lệ cho HZ={target_hz} trong {args.avg_window:.1f}s")
+            runner = ProfileRunner(ser, line_q, log, clock, tracker, should_stop, ckpt, ckpt_base,
+                                   cached_rows={h: e["row"] for h, e in cached.items()}, on_row=on_row,
+                                   dev_avg=dev_avg)
+            if not runner.run(run_steps, t_end, start, partial):
+                print(f"💾 Chưa xong — chạy lại với --resume để tiếp tục ({ckpt.path})")
 
         elif args.mode == "fixed":
             target_hz = max(0, min(60, args.hz))
             send_cmd(ser, f"SET_HZ {target_hz}")
             print(f"[FIXED] HZ={target_hz}")
             bucket = []
-            t0 = time.time()
-            while not stop_flag["v"]:
-                now = time.time()
+            t0 = clock()
+            if args.rollup is not None:
+                rollup = Rollup(args.rollup or rollup_path(args.csv), ("hz", "rpm", "flow1", "volt1", "flow2", "volt2"),
+                                raw_retention_s=args.raw_days * 86400)
+                wall0 = time.time() - t0            # giây epoch = wall0 + clock() (cả khi phát lại capture)
+            while not stop_flag["v"] and not replay_done():
+                now = clock()
+                log.tick()
                 if t_end and now >= t_end:
                     print("⏱️ Hết thời lượng.")
                     break
                 if now >= next_status:
                     send_cmd(ser, "STATUS")
-                    next_status = now + status_period
+                    next_status += status_period        # lịch tuyệt đối, không trôi
+                    if next_status <= now:
+                        next_status = now + status_period
                 try:
-                    line = line_q.get(timeout=0.1)
+                    t_rx, line = line_q.get(timeout=0.1)
                 except queue.Empty:
                     continue
                 m = STATUS_RE.match(line or "")
                 if not m:
                     continue
-                hz = int(m.group("hz"))
+                lost = tracker.add(record_from_match(m, t_rx))
+                if lost:
+                    print(f"⚠️ Mất {lost} STATUS (seq)")
+                hz = parse_hz(m.group("hz"))
                 if hz != target_hz:
                     continue
                 rpm = float(m.group("rpm"))
@@ -251,7 +566,9 @@ def main():
                 flow2 = float(m.group("flow2"))
                 volt2 = float(m.group("volt2"))
                 bucket.append((rpm, flow1, volt1, flow2, volt2))
-                print(f"[READ] hz={hz:02d} rpm={rpm:.1f} | f1={flow1:.3f} v1={volt1:.3f} | f2={flow2:.3f} v2={volt2:.3f}")
+                if rollup:
+                    rollup.add(wall0 + now, (hz, rpm, flow1, volt1, flow2, volt2))
+                print(f"[READ] hz={hz:g} rpm={rpm:.1f} | f1={flow1:.3f} v1={volt1:.3f} | f2={flow2:.3f} v2={volt2:.3f}")
                 if (now - t0) >= args.avg_window and bucket:
                     rpms = [x[0] for x in bucket]
                     f1s  = [x[1] for x in bucket]
@@ -264,8 +581,7 @@ def main():
                     volt2_avg = round(mean(v2s), 6)
                     analog    = round((volt2_avg * 1023.0) / 5.0, 3)
                     row = [target_hz, rpm_avg, flow1_avg, volt1_avg, volt2_avg, analog]
-                    writer.writerow(row)
-                    f.flush()
+                    log.writerow(row)
                     print(f"🧾 [CSV] hz_avg={target_hz} | rpm_avg={rpm_avg} | flow1_avg={flow1_avg} | volt1_avg={volt1_avg} | volt2_avg={volt2_avg} | analog={analog}")
                     bucket = []
                     t0 = now
@@ -273,17 +589,20 @@ def main():
         else:  # ramp
             target_hz = max(0, min(60, args.ramp_start))
             send_cmd(ser, f"SET_HZ {target_hz}")
-            next_ramp = time.time() + args.ramp_interval
+            next_ramp = clock() + args.ramp_interval
             bucket = []
-            t0 = time.time()
-            while not stop_flag["v"]:
-                now = time.time()
+            t0 = clock()
+            while not stop_flag["v"] and not replay_done():
+                now = clock()
+                log.tick()
                 if t_end and now >= t_end:
                     print("⏱️ Hết thời lượng.")
                     break
                 if now >= next_status:
                     send_cmd(ser, "STATUS")
-                    next_status = now + status_period
+                    next_status += status_period        # lịch tuyệt đối, không trôi
+                    if next_status <= now:
+                        next_status = now + status_period
                 if now >= next_ramp and target_hz < args.ramp_stop:
                     # ghi 1 dòng nếu đủ cửa sổ trước khi tăng
                     if (now - t0) >= args.avg_window and bucket:
@@ -298,24 +617,27 @@ def main():
                         volt2_avg = round(mean(v2s), 6)
                         analog    = round((volt2_avg * 1023.0) / 5.0, 3)
                         row = [target_hz, rpm_avg, flow1_avg, volt1_avg, volt2_avg, analog]
-                        writer.writerow(row)
-                        f.flush()
+                        log.writerow(row)
                         print(f"🧾 [CSV] hz_avg={target_hz} | rpm_avg={rpm_avg} | flow1_avg={flow1_avg} | volt1_avg={volt1_avg} | volt2_avg={volt2_avg} | analog={analog}")
+                    log.barrier()                       # hết 1 mức hz
                     # tăng HZ
                     target_hz = min(args.ramp_stop, target_hz + args.ramp_step)
                     send_cmd(ser, f"SET_HZ {target_hz}")
                     print(f"[RAMP] → SET_HZ {target_hz}")
                     bucket = []
                     t0 = now
-                    next_ramp = now + args.ramp_interval
+                    next_ramp += args.ramp_interval
                 try:
-                    line = line_q.get(timeout=0.1)
+                    t_rx, line = line_q.get(timeout=0.1)
                 except queue.Empty:
                     continue
                 m = STATUS_RE.match(line or "")
                 if not m:
                     continue
-                hz = int(m.group("hz"))
+                lost = tracker.add(record_from_match(m, t_rx))
+                if lost:
+                    print(f"⚠️ Mất {lost} STATUS (seq)")
+                hz = parse_hz(m.group("hz"))
                 if hz != target_hz:
                     continue
                 rpm = float(m.group("rpm"))
@@ -324,7 +646,7 @@ def main():
                 flow2 = float(m.group("flow2"))
                 volt2 = float(m.group("volt2"))
                 bucket.append((rpm, flow1, volt1, flow2, volt2))
-                print(f"[READ] hz={hz:02d} rpm={rpm:.1f} | f1={flow1:.3f} v1={volt1:.3f} | f2={flow2:.3f} v2={volt2:.3f}")
+                print(f"[READ] hz={hz:g} rpm={rpm:.1f} | f1={flow1:.3f} v1={volt1:.3f} | f2={flow2:.3f} v2={volt2:.3f}")
                 if (now - t0) >= args.avg_window and bucket:
                     rpms = [x[0] for x in bucket]
                     f1s  = [x[1] for x in bucket]
@@ -337,8 +659,7 @@ def main():
                     volt2_avg = round(mean(v2s), 6)
                     analog    = round((volt2_avg * 1023.0) / 5.0, 3)
                     row = [target_hz, rpm_avg, flow1_avg, volt1_avg, volt2_avg, analog]
-                    writer.writerow(row)
-                    f.flush()
+                    log.writerow(row)
                     print(f"🧾 [CSV] hz_avg={target_hz} | rpm_avg={rpm_avg} | flow1_avg={flow1_avg} | volt1_avg={volt1_avg} | volt2_avg={volt2_avg} | analog={analog}")
                     bucket = []
                     t0 = now
@@ -353,8 +674,17 @@ def main():
                 ser.close()
             except Exception:
                 pass
-            f.close()
-
+            log.close()
+            if cache:
+                cache.close()
+            if rollup:
+                rollup.close()
+            if replay:
+                print(ser.report())
+
+    print(f"[TELEMETRY] {tracker.report()}")
+    if il:
+        print(f"[SAFETY] {il.report()}")
     print(f"\n🏁 STOP. Đã đưa HZ về 0. CSV: {os.path.abspath(args.csv)}")
 
 if __name__ == "__main__":
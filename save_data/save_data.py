@@ -1,18 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import sys, os, csv, re, time, argparse, threading, queue, signal
-import serial
+import sys, os, time, argparse, threading, queue, signal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ports import open_port, is_replay
+from telemetry import STATUS_RE, parse_hz, record_from_match, SeqTracker, BinLogWriter
+from calibration import add_target_arguments, target_hz_from_args
+from rollup import Rollup, default_path as rollup_path, RAW_RETENTION_S
+import log_writer
+import interlock as safety
 
 PORT = "/dev/ttyACM0"
 # PORT = "COM3"
 FILE = "runlog.csv"
-
-STATUS_RE = re.compile(
-    r"^STATUS\s+hz=(?P<hz>\d+)\s+rpm=(?P<rpm>-?\d+(?:\.\d+)?)\s+run=(?P<run>[01])\s+hold=(?P<hold>[01])\s+"
-    r"flow1=(?P<flow1>-?\d+(?:\.\d+)?)\s+volt1=(?P<volt1>-?\d+(?:\.\d+)?)\s+"
-    r"flow2=(?P<flow2>-?\d+(?:\.\d+)?)\s+volt2=(?P<volt2>-?\d+(?:\.\d+)?)$"
-)
+STATUS_PERIOD_S = 10.0       # hỏi STATUS mỗi chừng này giây
 
 class SerialReader(threading.Thread):
     def __init__(self, ser, line_queue):
@@ -38,11 +40,11 @@ class SerialReader(threading.Thread):
                         finally:
                             buff.clear()
                         if line:
-                            self.q.put(line)
+                            self.q.put((time.monotonic(), line))
                 else:
                     buff.extend(b)
             except Exception as e:
-                self.q.put(f"__ERR__ {e}")
+                self.q.put((time.monotonic(), f"__ERR__ {e}"))
                 time.sleep(0.2)
 
 def send_cmd(ser, cmd):
@@ -53,7 +55,7 @@ def wait_banner(q, timeout=5.0):
     t0 = time.time()
     while time.time() - t0 < timeout:
         try:
-            line = q.get(timeout=0.2)
+            _, line = q.get(timeout=0.2)
             if "Arduino Ready" in line:
                 return True
         except queue.Empty:
@@ -80,18 +82,39 @@ def main():
     parser.add_argument("--ramp-interval", type=float, default=10.0)
     parser.add_argument("--duration", type=float, default=0.0, help="Thời lượng chạy (0 = vô hạn)")
     parser.add_argument("--csv", default=FILE, help="Đường dẫn file CSV output")
+    parser.add_argument("--bin", help="Ghi thêm log nhị phân gọn (thời gian/seq mã hóa delta)")
+    parser.add_argument("--capture", help="Ghi toàn bộ dòng vào/ra serial ra file capture để phát lại sau")
+    parser.add_argument("--rollup", nargs="?", const="", help="Ghi thêm tổng hợp 1s/1m/1h (SQLite, mặc định <csv>.rollup.sqlite)")
+    parser.add_argument("--raw-days", type=float, default=RAW_RETENTION_S / 86400, help="Số ngày giữ mẫu raw trong file rollup")
+    add_target_arguments(parser)
+    log_writer.add_arguments(parser)
+    safety.add_arguments(parser)
     args = parser.parse_args()
+    args.hz = target_hz_from_args(args, parser)
+    try:
+        il = safety.from_args(args, poll_s=STATUS_PERIOD_S)
+    except ValueError as e:
+        parser.error(str(e))
 
     # Mở cổng serial
     try:
-        ser = serial.Serial(args.port, args.baud, timeout=0.2)
+        ser = open_port(args.port, args.baud, timeout=0.2, capture=args.capture)
     except Exception as e:
         print(f"❌ Không mở được cổng {args.port}: {e}")
         sys.exit(1)
+    ser = safety.guard(ser, il)       # luật an toàn chạy trong thread đọc, trip -> STOP ngay
+
+    # Khi phát lại capture: dùng đồng hồ ảo của capture, hàng đợi ngắn để
+    # đồng hồ không chạy trước phần xử lý (chế độ @max)
+    replay = is_replay(ser)
+    clock = ser.clock if replay else time.time
+    pause = ser.sleep if replay else time.sleep
 
-    line_q = queue.Queue()
+    def replay_done():
+        return replay and ser.finished and line_q.empty()
+
+    line_q = queue.Queue(maxsize=4 if replay else 0)
     reader = SerialReader(ser, line_q)
-    reader.start()
 
     stop_flag = {"v": False}
     def on_sigint(sig, frame):
@@ -99,18 +122,35 @@ def main():
     signal.signal(signal.SIGINT, on_sigint)
     signal.signal(signal.SIGTERM, on_sigint)
 
-    # CSV (không có cột thời gian)
-    first_create = not os.path.exists(args.csv)
-    f = open(args.csv, "a", newline="")
-    writer = csv.writer(f)
-    if first_create:
-        writer.writerow(["hz", "rpm", "flow1", "volt1", "flow2", "volt2"])
+    if il:
+        def on_trip(reason, latency):
+            print(f"⛔ [INTERLOCK] {reason} → STOP sau {latency * 1000:.1f} ms")
+            stop_flag["v"] = True
+        il.on_trip = on_trip
+        print(f"🛡️ Interlock: {il.describe()}")
+    reader.start()
 
-    wait_banner(line_q, timeout=3.0)
+    # CSV: t = unix time suy ra từ đồng hồ monotonic (không nhảy khi chỉnh giờ),
+    # seq / t_dev_ms = số thứ tự và millis() của Arduino,
+    # t_dev = millis() quy về unix time qua ClockSync (không dính trễ USB / hàng đợi như t)
+    log = log_writer.from_args(args.csv, ["t", "t_dev", "seq", "t_dev_ms", "hz", "rpm", "flow1", "volt1",
+                                          "flow2", "volt2"], args)
+    if log.moved:
+        print(f"⚠️ {args.csv} có header khác (bản cũ) → đã chuyển sang {log.moved}, ghi file mới")
+    binlog = BinLogWriter(args.bin) if args.bin else None
+    rollup = None
+    if args.rollup is not None:
+        rollup = Rollup(args.rollup or rollup_path(args.csv), ("hz", "rpm", "flow1", "volt1", "flow2", "volt2"),
+                        raw_retention_s=args.raw_days * 86400)
+    tracker = SeqTracker()
+    t0_epoch, t0_mono = time.time(), time.monotonic()
+
+    if not replay:
+        wait_banner(line_q, timeout=3.0)
 
     # Khởi động
     send_cmd(ser, "RESET")
-    time.sleep(0.2)
+    pause(0.2)
     send_cmd(ser, "RUN")
 
     if args.mode == "fixed":
@@ -119,31 +159,33 @@ def main():
         target_hz = max(0, min(60, args.ramp_start))
     send_cmd(ser, f"SET_HZ {target_hz}")
 
-    next_status = time.time()
-    next_ramp = time.time() + (args.ramp_interval if args.mode == "ramp" else 1e9)
-    t_end = time.time() + args.duration if args.duration > 0 else None
+    next_status = clock()
+    next_ramp = clock() + (args.ramp_interval if args.mode == "ramp" else 1e9)
+    t_end = clock() + args.duration if args.duration > 0 else None
 
-    print("✅ Bắt đầu chạy (đọc mỗi 10 giây). Nhấn Ctrl+C để dừng an toàn…")
+    print(f"✅ Bắt đầu chạy (đọc mỗi {STATUS_PERIOD_S:g} giây). Nhấn Ctrl+C để dừng an toàn…")
 
     try:
-        while not stop_flag["v"]:
-            now = time.time()
+        while not stop_flag["v"] and not replay_done():
+            now = clock()
+            log.tick()
 
-            # Gửi STATUS mỗi 10 giây
+            # Gửi STATUS mỗi STATUS_PERIOD_S giây
             if now >= next_status:
                 send_cmd(ser, "STATUS")
-                next_status = now + 10.0  # 10 giây
+                next_status = now + STATUS_PERIOD_S
 
             # Ramp nếu cần
             if args.mode == "ramp" and now >= next_ramp:
                 if target_hz < args.ramp_stop:
                     target_hz = min(args.ramp_stop, target_hz + args.ramp_step)
                     send_cmd(ser, f"SET_HZ {target_hz}")
+                    log.barrier()           # ranh giới bước ramp
                 next_ramp = now + args.ramp_interval
 
             # Đọc phản hồi
             try:
-                line = line_q.get(timeout=0.1)
+                t_rx, line = line_q.get(timeout=0.1)
             except queue.Empty:
                 line = None
 
@@ -155,14 +197,27 @@ def main():
                 else:
                     m = STATUS_RE.match(line)
                     if m:
-                        hz = int(m.group("hz"))
+                        rec = record_from_match(m, t_rx)
+                        lost = tracker.add(rec)
+                        if lost:
+                            print(f"⚠️ Mất {lost} STATUS (seq)")
+                        hz = parse_hz(m.group("hz"))
                         rpm = float(m.group("rpm"))
                         flow1 = float(m.group("flow1"))
                         volt1 = float(m.group("volt1"))
                         flow2 = float(m.group("flow2"))
                         volt2 = float(m.group("volt2"))
-                        writer.writerow([hz, rpm, flow1, volt1, flow2, volt2])
-                        f.flush()
+                        t = round(t0_epoch + (t_rx - t0_mono), 3)
+                        seq = "" if rec["seq"] is None else rec["seq"]
+                        t_dev_ms = "" if rec["t_dev_ms"] is None else rec["t_dev_ms"]
+                        t_dev = rec.get("t_dev_host")
+                        t_dev = "" if t_dev is None else round(t0_epoch + (t_dev - t0_mono), 3)
+                        log.writerow([t, t_dev, seq, t_dev_ms, hz, rpm, flow1, volt1, flow2, volt2])
+                        if binlog:
+                            binlog.write(rec)
+                            binlog.flush()
+                        if rollup:
+                            rollup.add(t, (hz, rpm, flow1, volt1, flow2, volt2))
                         print(f"[LOG] hz={hz} rpm={rpm} f1={flow1} v1={volt1} f2={flow2} v2={volt2}")
 
             # if t_end and now >= t_end:
@@ -179,8 +234,17 @@ def main():
                 ser.close()
             except Exception:
                 pass
-            f.close()
-
+            log.close()
+            if binlog:
+                binlog.close()
+            if rollup:
+                rollup.close()
+            if replay:
+                print(ser.report())
+
+    print(f"[TELEMETRY] {tracker.report()}")
+    if il:
+        print(f"[SAFETY] {il.report()}")
     print(f"🧾 Đã ghi log vào: {os.path.abspath(args.csv)}")
     print("🏁 Đã STOP và đưa tần số về 0 Hz.")
 
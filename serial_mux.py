@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Bộ chia cổng serial qua socket local: daemon giữ cổng Arduino và phục vụ
+# Unix socket hoặc TCP localhost. Nhiều client (main.py, test/chart.py,
+# save_data.py, script lẻ) cùng nhận luồng telemetry và gửi lệnh.
+#
+#   python3 serial_mux.py --port /dev/ttyACM0 --listen /tmp/maf_mux.sock
+#   python3 serial_mux.py --port /dev/ttyACM0 --listen 127.0.0.1:5485
+#   python3 main.py --port mux:/tmp/maf_mux.sock     (ports.open_port hiểu "mux:<địa chỉ>")
+#
+# Mỗi client có hàng đợi riêng giới hạn độ dài; client chậm không làm nghẽn
+# việc đọc serial: dòng cũ bị bỏ (drop) hoặc STATUS bị lấy thưa (decimate).
+# OK/ERR không bao giờ bị lấy thưa. Dòng client gửi bắt đầu bằng '#' là lệnh của mux:
+#   #POLICY drop|decimate     #STATS (trả về 1 dòng '#STATS {...json...}')
+
+import os, sys, json, time, socket, argparse, threading
+from collections import deque
+
+DEFAULT_LISTEN = "/tmp/maf_mux.sock"
+QUEUE_MAX = 2000
+DECIMATE_HIGH = 0.5         # hàng đợi quá 50% -> chỉ giữ 1/N dòng STATUS
+
+
+def parse_addr(addr):
+    """'/tmp/x.sock' -> (AF_UNIX, path); 'host:port' -> (AF_INET, (host, port))."""
+    if addr.startswith("unix:"):
+        addr = addr[len("unix:"):]
+    if addr.startswith("tcp:"):
+        addr = addr[len("tcp:"):]
+    elif "/" in addr or addr.endswith(".sock"):
+        return socket.AF_UNIX, addr
+    host, _, port = addr.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+# ====== Phía server ======
+class MuxClient:
+    def __init__(self, sock, name, policy, queue_max):
+        self.sock = sock
+        self.name = name
+        self.policy = policy
+        self.queue_max = queue_max
+        self.q = deque()
+        self.cv = threading.Condition()
+        self.alive = True
+        self.sent = 0
+        self.dropped = 0
+        self.decimated = 0
+        self.lag_max = 0.0
+        self.lag_sum = 0.0
+        self._dec_count = 0
+
+    def offer(self, t, data, is_status):
+        """Gọi từ luồng đọc serial: không bao giờ chặn."""
+        with self.cv:
+            n = len(self.q)
+            if is_status and self.policy == "decimate" and n > self.queue_max * DECIMATE_HIGH:
+                # Càng đầy càng lấy thưa: giữ 1/2, 1/3, ... dòng STATUS
+                step = 2 + int(4 * (n / self.queue_max - DECIMATE_HIGH) / (1 - DECIMATE_HIGH))
+                self._dec_count += 1
+                if self._dec_count % step:
+                    self.decimated += 1
+                    return
+            if n >= self.queue_max:
+                self.q.popleft()
+                self.dropped += 1
+            self.q.append((t, data))
+            self.cv.notify()
+
+    def writer_loop(self):
+        while self.alive:
+            with self.cv:
+                while self.alive and not self.q:
+                    self.cv.wait(0.5)
+                if not self.alive:
+                    break
+                batch = list(self.q)
+                self.q.clear()
+            now = time.monotonic()
+            lag = now - batch[0][0]
+            self.lag_max = max(self.lag_max, lag)
+            self.lag_sum += sum(now - t for t, _ in batch)
+            try:
+                self.sock.sendall(b"".join(d for _, d in batch))
+                self.sent += len(batch)
+            except OSError:
+                self.alive = False
+
+    def queue_lag(self):
+        with self.cv:
+            return (time.monotonic() - self.q[0][0]) if self.q else 0.0
+
+    def stats(self):
+        return {
+            "client": self.name, "policy": self.policy,
+            "sent": self.sent, "dropped": self.dropped, "decimated": self.decimated,
+            "queued": len(self.q),
+            "lag_now_ms": round(self.queue_lag() * 1000, 1),
+            "lag_avg_ms": round(self.lag_sum / self.sent * 1000, 1) if self.sent else 0.0,
+            "lag_max_ms": round(self.lag_max * 1000, 1),
+        }
+
+    def close(self):
+        self.alive = False
+        with self.cv:
+            self.cv.notify_all()
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class SerialMux:
+    def __init__(self, ser, listen=DEFAULT_LISTEN, policy="drop", queue_max=QUEUE_MAX):
+        self.ser = ser
+        self.listen = listen
+        self.policy = policy
+        self.queue_max = queue_max
+        self.clients = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._running = True
+        self.rx_lines = 0
+        self.rx_bytes = 0
+        self.tx_cmds = 0
+        self.t_start = time.monotonic()
+
+        family, addr = parse_addr(listen)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.unlink(addr)
+        self.srv = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.srv.bind(addr)
+        self.srv.listen(16)
+        self.srv.settimeout(0.5)
+        self._unix_path = addr if family == socket.AF_UNIX else None
+
+    # --- serial -> clients ---
+    def _serial_loop(self):
+        while self._running:
+            try:
+                raw = self.ser.readline()
+            except Exception as e:
+                raw = f"__ERR__ {e}\n".encode()
+                time.sleep(0.2)
+            line = raw.strip()
+            if not line:
+                continue
+            data = line + b"\n"
+            t = time.monotonic()
+            self.rx_lines += 1
+            self.rx_bytes += len(data)
+            is_status = line.startswith(b"STATUS")
+            with self._lock:
+                clients = list(self.clients)
+            for c in clients:
+                if c.alive:
+                    c.offer(t, data, is_status)
+
+    # --- client -> serial ---
+    def write_cmd(self, cmd):
+        with self._write_lock:
+            self.ser.write((cmd.strip() + "\n").encode("utf-8"))
+            self.ser.flush()
+        self.tx_cmds += 1
+
+    def _client_reader(self, c):
+        buf = b""
+        while c.alive and self._running:
+            try:
+                chunk = c.sock.recv(4096)
+            except OSError:
+                break
+            if not chunk:
+                break
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            for raw in lines:
+                line = raw.decode("utf-8", errors="ignore").strip()
+                if not line:
+                    continue
+                if line.startswith("#"):
+                    self._control(c, line)
+                else:
+                    self.write_cmd(line)
+        self._drop_client(c)
+
+    def _control(self, c, line):
+        parts = line[1:].split()
+        if not parts:
+            return
+        if parts[0].upper() == "POLICY" and len(parts) > 1 and parts[1].lower() in ("drop", "decimate"):
+            c.policy = parts[1].lower()
+        elif parts[0].upper() == "STATS":
+            c.offer(time.monotonic(), ("#STATS " + json.dumps(self.stats()) + "\n").encode(), False)
+
+    def _drop_client(self, c):
+        c.close()
+        with self._lock:
+            if c in self.clients:
+                self.clients.remove(c)
+        print(f"[MUX] - {c.name} | {c.stats()}")
+
+    def stats(self):
+        up = max(1e-9, time.monotonic() - self.t_start)
+        with self._lock:
+            clients = [c.stats() for c in self.clients]
+        return {
+            "uptime_s": round(up, 1),
+            "rx_lines": self.rx_lines, "rx_lines_per_s": round(self.rx_lines / up, 1),
+            "rx_bytes_per_s": round(self.rx_bytes / up, 1),
+            "tx_cmds": self.tx_cmds,
+            "clients": clients,
+        }
+
+    def serve(self, report_s=10.0):
+        threading.Thread(target=self._serial_loop, daemon=True).start()
+        next_report = time.monotonic() + report_s
+        n = 0
+        while self._running:
+            try:
+                sock, peer = self.srv.accept()
+            except socket.timeout:
+                sock = None
+            if sock is not None:
+                n += 1
+                c = MuxClient(sock, f"#{n} {peer or 'unix'}", self.policy, self.queue_max)
+                with self._lock:
+                    self.clients.append(c)
+                threading.Thread(target=c.writer_loop, daemon=True).start()
+                threading.Thread(target=self._client_reader, args=(c,), daemon=True).start()
+                print(f"[MUX] + {c.name}")
+            if report_s > 0 and time.monotonic() >= next_report:
+                next_report += report_s
+                s = self.stats()
+                print(f"[MUX] {s['rx_lines_per_s']} dòng/s | " + " | ".join(
+                    f"{c['client']}: lag {c['lag_now_ms']}ms (max {c['lag_max_ms']}) "
+                    f"drop={c['dropped']} dec={c['decimated']}" for c in s["clients"]))
+
+    def close(self):
+        self._running = False
+        with self._lock:
+            clients = list(self.clients)
+        for c in clients:
+            c.close()
+        self.srv.close()
+        if self._unix_path and os.path.exists(self._unix_path):
+            os.unlink(self._unix_path)
+
+
+# ====== Phía client: giả lập serial.Serial ======
+class MuxPort:
+    def __init__(self, addr=DEFAULT_LISTEN, timeout=1.0, policy=None):
+        family, a = parse_addr(addr)
+        self.port = f"mux:{addr}"
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(a)
+        self.timeout = timeout
+        self.is_open = True
+        self._buf = bytearray()
+        if policy:
+            self.sock.sendall(f"#POLICY {policy}\n".encode())
+
+    def _recv(self, timeout):
+        self.sock.settimeout(timeout)
+        try:
+            chunk = self.sock.recv(65536)
+        except socket.timeout:
+            return False
+        if not chunk:
+            self.is_open = False
+            return False
+        self._buf.extend(chunk)
+        return True
+
+    def _left(self, deadline):
+        return max(0.0, deadline - time.monotonic())
+
+    def read(self, size=1):
+        deadline = time.monotonic() + (self.timeout if self.timeout is not None else 1e9)
+        while len(self._buf) < size and self.is_open and self._recv(self._left(deadline) or 0.001):
+            pass
+        out = bytes(self._buf[:size])
+        del self._buf[:size]
+        return out
+
+    def readline(self):
+        deadline = time.monotonic() + (self.timeout if self.timeout is not None else 1e9)
+        while b"\n" not in self._buf and self.is_open:
+            left = self._left(deadline)
+            if left <= 0 or not self._recv(left):
+                break
+        i = self._buf.find(b"\n")
+        n = len(self._buf) if i < 0 else i + 1
+        out = bytes(self._buf[:n])
+        del self._buf[:n]
+        return out
+
+    @property
+    def in_waiting(self):
+        self.sock.setblocking(False)
+        try:
+            chunk = self.sock.recv(65536)
+            if chunk:
+                self._buf.extend(chunk)
+        except (BlockingIOError, InterruptedError):
+            pass
+        finally:
+            self.sock.setblocking(True)
+        return len(self._buf)
+
+    def write(self, data):
+        self.sock.sendall(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self._buf.clear()
+
+    def close(self):
+        self.is_open = False
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def main():
+    import signal
+    from ports import open_port
+    ap = argparse.ArgumentParser(description="Chia 1 cổng serial Arduino cho nhiều client qua socket local.")
+    ap.add_argument("--port", default="/dev/ttyACM0", help="Cổng serial (hoặc replay:file.cap)")
+    ap.add_argument("--baud", type=int, default=115200)
+    ap.add_argument("--listen", default=DEFAULT_LISTEN, help="Đường dẫn Unix socket hoặc host:port TCP")
+    ap.add_argument("--policy", choices=["drop", "decimate"], default="drop",
+                    help="Client chậm: drop = bỏ dòng cũ nhất, decimate = lấy thưa STATUS")
+    ap.add_argument("--queue", type=int, default=QUEUE_MAX, help="Số dòng tối đa đợi gửi cho mỗi client")
+    ap.add_argument("--report", type=float, default=10.0, help="In thống kê mỗi N giây (0 = tắt)")
+    args = ap.parse_args()
+
+    ser = open_port(args.port, args.baud, timeout=0.2)
+    mux = SerialMux(ser, args.listen, args.policy, args.queue)
+    signal.signal(signal.SIGTERM, lambda *_: setattr(mux, "_running", False))
+    print(f"🔀 {args.port} → {args.listen} (policy={args.policy}, queue={args.queue})")
+    try:
+        mux.serve(args.report)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"[MUX] {json.dumps(mux.stats(), ensure_ascii=False)}")
+        mux.close()
+        ser.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
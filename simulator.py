@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Giả lập firmware RS485.ino trên một pty: chạy main.py / run.py / burst.py ... không cần Arduino.
+#
+#   python3 simulator.py                          -> in /dev/pts/N, dùng làm --port
+#   python3 simulator.py --link /tmp/maf_sim      -> thêm symlink cố định (--port /tmp/maf_sim)
+#   python3 simulator.py --calib maf_calib.npz --no-auto-inc --seed 1
+#
+# Giao thức như firmware: RUN, STOP, SET_HZ, RESET, STATUS, HOLD_STOP, AVG <ms>,
+# BURST <n> <rate> [1|2], '!' (dừng khẩn cấp, vượt hàng đợi lệnh), tự tăng 1 Hz mỗi 2 s
+# khi đang chạy mà không HOLD_STOP (hzIncrease; tắt bằng --no-auto-inc).
+# Mô hình: lưu lượng = FLOW_PER_HZ * Hz qua khâu quán tính TAU_S; điện áp suy ngược từ LUT
+# firmware (calibration.model_luts), kênh MAF thêm dao động xung theo vòng quay; nhiễu; ADC 10 bit.
+
+import os, re, sys, tty, time, select, argparse, threading, queue, binascii
+import numpy as np
+
+from calibration import model_luts, ADC_SIZE, ADC_VREF, FW_SCALE
+from burst import pack10, BURST_MAX, RATE_MIN, RATE_MAX
+
+BANNER = "OK Arduino Ready (Modbus bridge)."
+MAX_RPM = 3000
+FLOW_PER_HZ = 1.8          # g/s mỗi Hz (60 Hz -> 108 g/s)
+TAU_S = 0.8                # quán tính quạt + đường ống
+PULSES_PER_REV = 2
+PULSE_V = 0.04             # biên độ dao động xung ở 60 Hz (V)
+NOISE_V = (0.004, 0.01)    # nhiễu kênh 1 (ABB), kênh 2 (MAF)
+AVG_RATE = 4400            # mẫu/s của vòng AVG trên Arduino (2 analogRead / vòng)
+AVG_MAX_MS = 5000
+TIMER1_HZ = 16e6 / 8       # Timer1 clk/8 của BURST
+CMD_QUEUE = 8
+AUTO_INC_S = 2.0
+
+_INT_RE = re.compile(r"^\s*-?\d+")
+
+
+def _to_int(s):
+    # String.toInt(): lấy phần số ở đầu, rác -> 0
+    m = _INT_RE.match(s)
+    return int(m.group()) if m else 0
+
+
+def _to_float(s):
+    try:
+        return float(s)
+    except ValueError:
+        return 0.0
+
+
+def fmt_hz(hz):
+    # printHz(): Hz nguyên in như cũ, lẻ in 2 chữ số
+    return str(int(hz)) if hz == int(hz) else f"{hz:.2f}"
+
+
+class FirmwareSim:
+    """Trạng thái + xử lý lệnh của firmware; write(bytes) là chiều gửi lên host."""
+
+    def __init__(self, write, luts, auto_inc=True, seed=None, log=None):
+        self.write = write
+        self.lut1, self.lut2 = (np.asarray(l, dtype=float) for l in luts)
+        self.auto_inc = auto_inc
+        self.log = log
+        self.rng = np.random.default_rng(seed)
+        self.t0 = time.monotonic()
+        self.hz = 0.0
+        self.running = False
+        self.hold = False
+        self.seq = 0
+        self._last_inc = 0.0
+        self._f0 = self._ft = self._tf = 0.0       # lưu lượng tại _tf, lưu lượng đích
+        self._rx = bytearray()
+        self._cmds = queue.Queue()
+        self._estop = threading.Event()
+
+    # ====== Thời gian / mô hình ======
+    def now(self):
+        return time.monotonic() - self.t0
+
+    def millis(self):
+        return int(self.now() * 1000)
+
+    def flow_at(self, t):
+        return self._ft + (self._f0 - self._ft) * np.exp(-(np.asarray(t, dtype=float) - self._tf) / TAU_S)
+
+    def _retarget(self):
+        now = self.now()
+        self._f0 = float(self.flow_at(now))
+        self._tf = now
+        self._ft = FLOW_PER_HZ * self.hz if self.running else 0.0
+
+    def _set_hz(self, hz):
+        # writeFreqHz(): kẹp 0..60, phân giải 0.01 Hz
+        self.hz = round(min(60.0, max(0.0, hz)), 2)
+        self._retarget()
+
+    def adc(self, ch, t):
+        """Giá trị analogRead kênh ch tại các thời điểm t (mảng)."""
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        lut = self.lut1 if ch == 1 else self.lut2
+        v = np.interp(self.flow_at(t) * FW_SCALE, lut, np.arange(ADC_SIZE)) * (ADC_VREF / (ADC_SIZE - 1))
+        if ch == 2 and self.running and self.hz > 0:
+            f = self.hz * MAX_RPM / 60.0 / 60.0 * PULSES_PER_REV
+            v = v + PULSE_V * self.hz / 60.0 * np.sin(2 * np.pi * f * t)
+        v = v + self.rng.normal(0.0, NOISE_V[ch - 1], len(t))
+        return np.clip(np.rint(v * (ADC_SIZE - 1) / ADC_VREF), 0, ADC_SIZE - 1).astype(np.int64)
+
+    def _flow(self, ch, a):
+        return (self.lut1 if ch == 1 else self.lut2)[a] / FW_SCALE
+
+    # ====== Chiều host -> thiết bị (thread đọc pty) ======
+    def feed(self, data):
+        """Như pollSerial(): gom dòng vào hàng đợi; '!' bỏ hàng đợi + dòng dở, dừng khẩn cấp."""
+        for c in data:
+            if c == 0x21:                           # '!'
+                self._estop.set()
+                self._rx.clear()
+                while not self._cmds.empty():
+                    self._cmds.get_nowait()
+            elif c == 0x0D:
+                continue
+            elif c == 0x0A:
+                line = self._rx.decode("ascii", errors="ignore").strip().upper()
+                self._rx.clear()
+                if line:
+                    if self._cmds.qsize() < CMD_QUEUE:
+                        self._cmds.put(line)
+                    else:
+                        self.println("ERR BUSY")
+            else:
+                self._rx.append(c)
+                if len(self._rx) > 100:
+                    self._rx.clear()
+
+    # ====== Vòng loop() ======
+    def println(self, s):
+        self.write(s.encode("ascii") + b"\r\n")
+
+    def setup(self):
+        self.println(BANNER)
+        self.status()
+
+    def run(self, stop):
+        while not stop.is_set():
+            if self._estop.is_set():
+                self._estop.clear()
+                self.running = False
+                self._set_hz(0)
+                self.println("OK ESTOP")
+            else:
+                try:
+                    cmd = self._cmds.get(timeout=0.02)
+                except queue.Empty:
+                    cmd = None
+                if cmd:
+                    if self.log:
+                        self.log(cmd)
+                    self.handle(cmd)
+            self._auto_inc()
+
+    def _auto_inc(self):
+        now = self.now()
+        if self.auto_inc and self.running and not self.hold and now - self._last_inc >= AUTO_INC_S:
+            self._last_inc = now
+            if self.hz < 60:
+                self._set_hz(self.hz + 1)
+                self.println(f"OK AUTO_INC {fmt_hz(self.hz)}")
+
+    def handle(self, cmd):
+        arg = cmd.partition(" ")[2]
+        if cmd == "RUN":
+            self.running = True
+            self._retarget()
+            self.println("OK RUN")
+        elif cmd == "STOP":
+            self.running = False
+            self._set_hz(0)
+            self.println("OK STOP")
+        elif cmd.startswith("SET_HZ"):
+            if not arg:
+                self.println("ERR ARG_REQUIRED")
+            else:
+                val = _to_float(arg)
+                if val < 0 or val > 60:
+                    self.println("ERR HZ_RANGE(0..60)")
+                else:
+                    self._set_hz(val)
+                    self.println("OK SET_HZ")
+        elif cmd == "RESET":
+            self.running = False
+            self._set_hz(0)
+            self.println("OK RESET")
+        elif cmd == "STATUS":
+            self.status()
+        elif cmd.startswith("AVG"):
+            ms = _to_int(arg) if arg else None
+            if ms is None:
+                self.println("ERR ARG_REQUIRED")
+            elif ms < 1 or ms > AVG_MAX_MS:
+                self.println("ERR AVG_RANGE(1..5000)")
+            else:
+                self.average(ms)
+        elif cmd.startswith("BURST"):
+            parts = arg.split()
+            if len(parts) < 2:
+                self.println("ERR ARG_REQUIRED")
+                return
+            n, rate = _to_int(parts[0]), _to_int(parts[1])
+            ch = _to_int(parts[2]) if len(parts) > 2 else 2
+            if n < 1 or n > BURST_MAX:
+                self.println(f"ERR BURST_N(1..{BURST_MAX})")
+            elif rate < RATE_MIN or rate > RATE_MAX:
+                self.println(f"ERR BURST_RATE({RATE_MIN}..{RATE_MAX})")
+            elif ch not in (1, 2):
+                self.println("ERR BURST_CH(1|2)")
+            else:
+                self.burst(n, rate, ch)
+        elif cmd.startswith("HOLD_STOP"):
+            if not arg:
+                self.println("ERR ARG_REQUIRED")
+            elif arg.strip() == "ON":
+                self.hold = True
+                self.println("OK HOLD_STOP ON")
+            elif arg.strip() == "OFF":
+                self.hold = False
+                self.println("OK HOLD_STOP OFF")
+            else:
+                self.println("ERR HOLD_ARG(ON|OFF)")
+        else:
+            self.println("ERR UNKNOWN_CMD")
+
+    def _fields(self):
+        return (f"hz={fmt_hz(self.hz)} rpm={round(self.hz * MAX_RPM / 60)} "
+                f"run={int(self.running)} hold={int(self.hold)}")
+
+    def status(self):
+        t = self.now()
+        a1, a2 = int(self.adc(1, t)[0]), int(self.adc(2, t)[0])
+        k = ADC_VREF / (ADC_SIZE - 1)
+        self.println(f"STATUS {self._fields()} flow1={self._flow(1, a1):.2f} volt1={a1 * k:.2f} "
+                     f"flow2={self._flow(2, a2):.2f} volt2={a2 * k:.2f} seq={self.seq} t={self.millis()}")
+        self.seq += 1
+
+    def average(self, ms):
+        t0 = self.now()
+        if self._estop.wait(ms / 1000.0):
+            self.println("ERR AVG_ABORT")
+            return
+        t = t0 + np.arange(max(1, int(ms * AVG_RATE / 1000))) / AVG_RATE
+        a1, a2 = self.adc(1, t), self.adc(2, t)
+        k = ADC_VREF / (ADC_SIZE - 1)
+        self.println(f"AVG {self._fields()} flow1={self._flow(1, a1).mean():.3f} volt1={a1.mean() * k:.4f} "
+                     f"flow2={self._flow(2, a2).mean():.3f} volt2={a2.mean() * k:.4f} n={len(t)} "
+                     f"ms={int((self.now() - t0) * 1000)} v1min={a1.min() * k:.3f} v1max={a1.max() * k:.3f} "
+                     f"v2min={a2.min() * k:.3f} v2max={a2.max() * k:.3f} seq={self.seq} t={self.millis()}")
+        self.seq += 1
+
+    def burst(self, n, rate, ch):
+        top = int(TIMER1_HZ / rate - 1)
+        real = TIMER1_HZ / (top + 1)
+        t0, t0_ms = self.now(), self.millis()
+        if self._estop.wait(n / real):
+            self.println("ERR BURST_ABORT")
+            return
+        data = pack10(self.adc(ch, t0 + np.arange(n) / real))
+        self.write(f"BURST n={n} rate={real:.2f} ch={ch} len={len(data)} "
+                   f"crc={binascii.crc_hqx(data, 0)} t={t0_ms}\r\n".encode("ascii") + data + b"\r\n")
+
+
+# ====== pty ======
+class PtyLink:
+    """Đầu master của pty; giữ luôn đầu slave mở để host mở/đóng lại cổng không gây EIO."""
+
+    def __init__(self, link=None):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)                     # không dịch \n, không echo: khối BURST đi nguyên vẹn
+        os.set_blocking(self.master, False)
+        self.path = os.ttyname(self.slave)
+        self.link = link
+        self.dropped = 0
+        self._wlock = threading.Lock()
+        if link:
+            if os.path.islink(link):
+                os.unlink(link)
+            os.symlink(self.path, link)
+
+    def write(self, data):
+        # Không ai đọc thì bộ đệm pty đầy: bỏ dữ liệu như UART thật, không chặn firmware
+        with self._wlock:
+            view = memoryview(data)
+            while view:
+                try:
+                    view = view[os.write(self.master, view):]
+                except BlockingIOError:
+                    if not select.select([], [self.master], [], 0.5)[1]:
+                        self.dropped += len(view)
+                        return
+
+    def read(self, timeout=0.2):
+        if not select.select([self.master], [], [], timeout)[0]:
+            return b""
+        try:
+            return os.read(self.master, 1024)
+        except (BlockingIOError, OSError):
+            return b""
+
+    def close(self):
+        if self.link and os.path.islink(self.link):
+            os.unlink(self.link)
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Giả lập firmware RS485.ino (Arduino + biến tần + cảm biến) trên pty")
+    ap.add_argument("--link", help="Tạo symlink cố định tới pty (vd /tmp/maf_sim)")
+    ap.add_argument("--calib", help="Bảng hiệu chuẩn .npz cho LUT cảm biến 2 (như calibration.py header --calib)")
+    ap.add_argument("--no-auto-inc", action="store_true", help="Tắt tự tăng 1 Hz mỗi 2 s của hzIncrease()")
+    ap.add_argument("--seed", type=int, help="Seed nhiễu (lặp lại được)")
+    ap.add_argument("--quiet", action="store_true", help="Không in lệnh nhận được")
+    args = ap.parse_args()
+
+    lut1, lut2, src = model_luts(args.calib)
+    pty = PtyLink(args.link)
+    log = None if args.quiet else (lambda cmd: print(f"> {cmd}", flush=True))
+    fw = FirmwareSim(pty.write, (lut1, lut2), auto_inc=not args.no_auto_inc, seed=args.seed, log=log)
+    stop = threading.Event()
+    worker = threading.Thread(target=fw.run, args=(stop,), daemon=True)
+
+    print(f"🔌 Simulator: {pty.path}" + (f" (→ {args.link})" if args.link else "") + f" | LUT: {src}", flush=True)
+    fw.setup()
+    worker.start()
+    try:
+        while True:
+            data = pty.read()
+            if data:
+                fw.feed(data)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        worker.join(1.0)
+        pty.close()
+        print(f"🏁 Dừng simulator (bỏ {pty.dropped} byte không ai đọc)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Phân tích phổ tín hiệu cảm biến bằng NumPy: Welch / FFT cửa sổ trượt, tần số dao động
+# xung trội, nền nhiễu (V/√Hz), SNR, RMS xoay chiều.
+#
+# Nguồn dữ liệu:
+#   *.npz   burst tốc độ cao của burst.py (mỗi lần chụp phân tích riêng)
+#   *.cap   capture serial (replay.py): dòng STATUS, lấy lại mẫu đều theo t thiết bị
+#   *.bin   log nhị phân của telemetry.BinLogWriter
+#
+#   python3 spectrum.py b.npz logs/ --field volt2 --nperseg 256 --fmin 2 --out spectrum.csv
+#   python3 spectrum.py --bench          # SlidingWelch tăng dần so với tính lại cả cửa sổ
+#
+# Bảng trực tiếp: tab "Phổ" trong test/chart.py dùng SlidingWelch — mỗi hop mẫu mới chỉ
+# FFT đúng 1 khung, trung bình K khung gần nhất bằng tổng chạy (không tính lại cả cửa sổ).
+
+import os, sys, glob, time, argparse
+from collections import deque
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+NPERSEG = 256
+OVERLAP = 0.5
+N_AVG = 8                   # số khung trung bình của SlidingWelch
+FMIN = 1.0                  # bỏ vùng gần DC khi tìm đỉnh / nền nhiễu
+RATE_SPAN_S = 30.0
+SUFFIXES = (".npz", ".cap", ".bin")
+FIELDS = ("volt1", "volt2", "flow1", "flow2", "rpm")
+
+SUMMARY_COLS = ("file", "src", "idx", "fs", "n", "nperseg", "frames", "peak_hz", "peak_min", "peak_max",
+                "peak_psd", "floor", "snr_db", "rms", "error")
+
+WINDOWS = {"hann": np.hanning, "hamming": np.hamming, "blackman": np.blackman, "rect": np.ones}
+
+
+# ====== Lõi tính phổ ======
+def window_array(name, n):
+    if name not in WINDOWS:
+        raise ValueError(f"cửa sổ không hỗ trợ: {name} ({', '.join(WINDOWS)})")
+    return WINDOWS[name](n)
+
+
+def frames(x, nperseg, hop):
+    """Các khung nperseg mẫu cách nhau hop (view, không chép dữ liệu)."""
+    return sliding_window_view(np.asarray(x, dtype=float), nperseg)[::hop]
+
+
+def frame_power(seg, win):
+    """|rFFT|² từng khung (hàng) sau khi bỏ trung bình và nhân cửa sổ."""
+    seg = seg - seg.mean(axis=-1, keepdims=True)
+    spec = np.fft.rfft(seg * win, axis=-1)
+    return spec.real ** 2 + spec.imag ** 2
+
+
+def to_psd(power, fs, win):
+    """Công suất khung -> mật độ phổ một phía (V²/Hz)."""
+    psd = power / (fs * (win ** 2).sum())
+    last = -1 if len(win) % 2 == 0 else None        # bin Nyquist chỉ có khi nperseg chẵn
+    psd[..., 1:last] *= 2
+    return psd
+
+
+def welch(x, fs, nperseg=NPERSEG, overlap=OVERLAP, window="hann"):
+    """(f, psd) trung bình mọi khung; tín hiệu ngắn hơn nperseg thì dùng 1 khung cả tín hiệu."""
+    x = np.asarray(x, dtype=float)
+    nperseg = min(nperseg, len(x))
+    hop = max(1, int(nperseg * (1 - overlap)))
+    win = window_array(window, nperseg)
+    power = frame_power(frames(x, nperseg, hop), win).mean(axis=0)
+    return np.fft.rfftfreq(nperseg, 1.0 / fs), to_psd(power, fs, win)
+
+
+def stft_psd(x, fs, nperseg=NPERSEG, overlap=OVERLAP, window="hann"):
+    """FFT cửa sổ trượt: (f, t tâm khung, psd[khung, f]) — cả lô một lần."""
+    x = np.asarray(x, dtype=float)
+    nperseg = min(nperseg, len(x))
+    hop = max(1, int(nperseg * (1 - overlap)))
+    win = window_array(window, nperseg)
+    psd = to_psd(frame_power(frames(x, nperseg, hop), win), fs, win)
+    t = (np.arange(len(psd)) * hop + nperseg / 2) / fs
+    return np.fft.rfftfreq(nperseg, 1.0 / fs), t, psd
+
+
+def _band(f, fmin, fmax):
+    sel = f >= max(fmin, f[1] if len(f) > 1 else 0.0)
+    if fmax:
+        sel &= f <= fmax
+    if not sel.any():
+        raise ValueError(f"không có bin nào trong {fmin:g}..{fmax or f[-1]:g} Hz (fs quá thấp / khung quá ngắn?)")
+    return sel
+
+
+def peak_track(f, psd, fmin=FMIN, fmax=None):
+    """Tần số đỉnh của từng khung (vector hóa, chưa nội suy)."""
+    sel = _band(f, fmin, fmax)
+    return f[sel][np.argmax(psd[..., sel], axis=-1)]
+
+
+def analyze(f, psd, fmin=FMIN, fmax=None):
+    """Đỉnh trội (nội suy parabol trên log psd), nền nhiễu = median psd, SNR, RMS xoay chiều."""
+    sel = _band(f, fmin, fmax)
+    fb, pb = f[sel], psd[sel]
+    k = int(np.argmax(pb))
+    peak = fb[k]
+    if 0 < k < len(pb) - 1:
+        a, b, c = np.log(np.maximum(pb[k - 1:k + 2], 1e-30))
+        den = a - 2 * b + c
+        if den < 0:
+            peak += 0.5 * (a - c) / den * (f[1] - f[0])
+    floor = float(np.median(pb))
+    return {
+        "peak_hz": float(peak),
+        "peak_psd": float(pb[k]),
+        "floor": float(np.sqrt(floor)),                       # V/√Hz
+        "snr_db": float(10 * np.log10(pb[k] / floor)) if floor > 0 else float("inf"),
+        "rms": float(np.sqrt(psd[1:].sum() * (f[1] - f[0]))) if len(f) > 1 else 0.0,
+    }
+
+
+# ====== Tăng dần cho luồng trực tiếp ======
+class SlidingWelch:
+    """Welch trượt: push() chỉ FFT các khung mới đủ mẫu, trung bình n_avg khung gần nhất bằng tổng chạy.
+
+    fs có thể đổi (luồng telemetry ước lượng tần số mẫu dần): công suất lưu chưa chia fs.
+    """
+
+    def __init__(self, fs, nperseg=NPERSEG, hop=None, n_avg=N_AVG, window="hann"):
+        self.fs = float(fs)
+        self.nperseg = nperseg
+        self.hop = hop or nperseg // 2
+        self.n_avg = n_avg
+        self.win = window_array(window, nperseg)
+        self.frames = 0
+        self._buf = np.empty(0)
+        self._ring = np.zeros((n_avg, nperseg // 2 + 1))
+        self._sum = np.zeros(nperseg // 2 + 1)
+        self._k = 0
+
+    def push(self, x):
+        """Thêm mẫu; trả về số khung mới."""
+        buf = np.concatenate((self._buf, np.asarray(x, dtype=float)))
+        m = (len(buf) - self.nperseg) // self.hop + 1 if len(buf) >= self.nperseg else 0
+        if m:
+            for row in frame_power(frames(buf, self.nperseg, self.hop)[:m][-self.n_avg:], self.win):
+                self._sum += row - self._ring[self._k]
+                self._ring[self._k] = row
+                self._k = (self._k + 1) % self.n_avg
+                if self._k == 0:
+                    self._sum = self._ring.sum(axis=0)        # chặn sai số cộng dồn
+            self.frames += m
+            buf = buf[m * self.hop:]
+        self._buf = buf
+        return m
+
+    @property
+    def freqs(self):
+        return np.fft.rfftfreq(self.nperseg, 1.0 / self.fs)
+
+    def psd(self):
+        n = min(self.frames, self.n_avg)
+        return None if not n else to_psd(self._sum / n, self.fs, self.win)
+
+    def result(self, fmin=FMIN, fmax=None):
+        psd = self.psd()
+        return None if psd is None else analyze(self.freqs, psd, fmin, fmax)
+
+
+class RateMeter:
+    """Tần số mẫu thực của luồng telemetry (mẫu/giây) theo span_s giây gần nhất."""
+
+    def __init__(self, span_s=RATE_SPAN_S):
+        self.span_s = span_s
+        self.total = 0
+        self._hist = deque()          # (t, tổng mẫu tới t)
+
+    def add(self, t, n):
+        self.total += n
+        self._hist.append((t, self.total))
+        while len(self._hist) > 2 and t - self._hist[0][0] > self.span_s:
+            self._hist.popleft()
+
+    @property
+    def rate(self):
+        if len(self._hist) < 2:
+            return None
+        (t0, n0), (t1, n1) = self._hist[0], self._hist[-1]
+        return (n1 - n0) / (t1 - t0) if t1 > t0 else None
+
+
+# ====== Nguồn dữ liệu ======
+def uniform(t, x, fs=None):
+    """Mẫu không đều (telemetry) -> lưới đều fs (mặc định 1 / median Δt), nội suy tuyến tính."""
+    t, x = np.asarray(t, dtype=float), np.asarray(x, dtype=float)
+    order = np.argsort(t, kind="stable")
+    t, x = t[order], x[order]
+    keep = np.concatenate(([True], np.diff(t) > 0))
+    t, x = t[keep], x[keep]
+    if len(t) < 4:
+        raise ValueError(f"quá ít mẫu ({len(t)})")
+    fs = fs or 1.0 / float(np.median(np.diff(t)))
+    grid = t[0] + np.arange(int((t[-1] - t[0]) * fs) + 1) / fs
+    return np.interp(grid, t, x), fs
+
+
+def records_series(records, field):
+    """Record STATUS (telemetry) -> (x đều, fs); ưu tiên đồng hồ thiết bị nếu mọi dòng có t."""
+    recs = list(records)
+    if not recs:
+        raise ValueError("không có dòng STATUS")
+    if all(r.get("t_dev_ms") is not None for r in recs):
+        t = np.array([r["t_dev_ms"] for r in recs], dtype=float) / 1000.0
+    else:
+        t = np.array([r["t_host"] for r in recs], dtype=float)
+    return uniform(t, [r[field] for r in recs])
+
+
+def load_sources(path, field="volt2"):
+    """File -> list (src, idx, x, fs). Burst: 1 phần tử / lần chụp, đúng kênh đã chụp."""
+    if path.endswith(".npz"):
+        from burst import load_bursts
+        return [("burst", i, b.volts, b.rate) for i, b in enumerate(load_bursts(path))]
+    if path.endswith(".cap"):
+        from replay import load_capture
+        from telemetry import parse_status
+        recs = [r for r in (parse_status(line, t) for t, line in load_capture(path)) if r]
+        return [("status", 0) + records_series(recs, field)]
+    if path.endswith(".bin"):
+        from telemetry import read_binlog
+        return [("binlog", 0) + records_series(read_binlog(path), field)]
+    raise ValueError(f"không hỗ trợ {path} ({', '.join(SUFFIXES)})")
+
+
+def find_files(inputs):
+    files = []
+    for p in inputs:
+        if os.path.isdir(p):
+            found = [f for f in glob.glob(os.path.join(p, "**", "*"), recursive=True) if f.endswith(SUFFIXES)]
+        else:
+            found = glob.glob(p) or [p]
+        files.extend(found)
+    return sorted(set(files))
+
+
+def analyze_file(path, field="volt2", nperseg=NPERSEG, overlap=OVERLAP, window="hann", fmin=FMIN, fmax=None):
+    """Mỗi nguồn trong file -> 1 dòng SUMMARY_COLS (lỗi ghi vào cột error, không dừng cả lô)."""
+    try:
+        sources = load_sources(path, field)
+    except (OSError, ValueError, KeyError) as e:
+        return [{"file": path, "error": str(e)}]
+    rows = []
+    for src, idx, x, fs in sources:
+        row = {"file": path, "src": src, "idx": idx, "fs": round(fs, 3), "n": len(x), "error": ""}
+        try:
+            f, _, p = stft_psd(x, fs, nperseg, overlap, window)
+            track = peak_track(f, p, fmin, fmax)
+            res = analyze(f, p.mean(axis=0), fmin, fmax)
+            row.update(nperseg=min(nperseg, len(x)), frames=len(p),
+                       peak_min=float(track.min()), peak_max=float(track.max()), **res)
+        except ValueError as e:
+            row["error"] = str(e)
+        rows.append(row)
+    return rows
+
+
+def fmt_result(res):
+    return (f"đỉnh {res['peak_hz']:.2f} Hz | nền {res['floor']:.2e} V/√Hz | "
+            f"SNR {res['snr_db']:.1f} dB | rms {res['rms']:.4f}")
+
+
+# ====== Đo: tăng dần vs tính lại ======
+def bench(fs=5000.0, seconds=60.0, chunk=50, nperseg=NPERSEG, n_avg=N_AVG):
+    """Luồng chunk mẫu mỗi lần: SlidingWelch.push so với welch() lại cả cửa sổ n_avg khung."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(fs * seconds)) / fs
+    x = 2.0 + 0.05 * np.sin(2 * np.pi * 50.0 * t) + rng.normal(0, 0.01, len(t))
+    hop = nperseg // 2
+    span = nperseg + (n_avg - 1) * hop
+
+    sw = SlidingWelch(fs, nperseg, hop, n_avg)
+    t0 = time.perf_counter()
+    for i in range(0, len(x), chunk):
+        sw.push(x[i:i + chunk])
+        sw.psd()
+    dt_inc = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for i in range(chunk, len(x) + 1, chunk):
+        if i >= span:
+            welch(x[i - span:i], fs, nperseg)
+    dt_full = time.perf_counter() - t0
+
+    # cùng n_avg khung cuối mà SlidingWelch đang giữ
+    last = (len(x) - nperseg) // hop * hop
+    _, p_full = welch(x[last - (n_avg - 1) * hop:last + nperseg], fs, nperseg)
+    err = np.max(np.abs(sw.psd() - p_full) / p_full.max())
+    n = len(x) // chunk
+    print(f"⏱️ {len(x)} mẫu @ {fs:g} Hz, {n} lần push {chunk} mẫu | nperseg={nperseg} n_avg={n_avg}")
+    print(f"   tăng dần : {dt_inc * 1000:8.1f} ms ({dt_inc / n * 1e6:6.1f} µs/lần)")
+    print(f"   tính lại : {dt_full * 1000:8.1f} ms ({dt_full / n * 1e6:6.1f} µs/lần)  x{dt_full / dt_inc:.1f}")
+    print(f"   {fmt_result(sw.result())} | lệch psd so với welch: {err:.1e}")
+
+
+def main():
+    from batch_analyze import write_table
+    ap = argparse.ArgumentParser(description="Phổ Welch / FFT cửa sổ trượt của burst và telemetry đã lưu.")
+    ap.add_argument("inputs", nargs="*", help="File / glob / thư mục (*.npz burst, *.cap capture, *.bin log)")
+    ap.add_argument("--field", choices=FIELDS, default="volt2", help="Trường STATUS phân tích (capture / log)")
+    ap.add_argument("--nperseg", type=int, default=NPERSEG, help="Số mẫu mỗi khung FFT")
+    ap.add_argument("--overlap", type=float, default=OVERLAP, help="Tỉ lệ chồng khung (0..<1)")
+    ap.add_argument("--window", choices=list(WINDOWS), default="hann")
+    ap.add_argument("--fmin", type=float, default=FMIN, help="Bỏ tần số thấp hơn (Hz) khi tìm đỉnh / nền")
+    ap.add_argument("--fmax", type=float, help="Bỏ tần số cao hơn (Hz)")
+    ap.add_argument("--out", help="Bảng tóm tắt CSV (1 dòng / nguồn)")
+    ap.add_argument("--bench", action="store_true", help="Đo SlidingWelch tăng dần so với tính lại rồi thoát")
+    args = ap.parse_args()
+
+    if args.bench:
+        bench(nperseg=args.nperseg)
+        return 0
+    if not 0 <= args.overlap < 1:
+        ap.error("--overlap phải trong 0..<1")
+    files = find_files(args.inputs)
+    if not files:
+        sys.exit("❌ Không tìm thấy file nào")
+
+    rows = []
+    for path in files:
+        for r in analyze_file(path, args.field, args.nperseg, args.overlap, args.window, args.fmin, args.fmax):
+            rows.append(r)
+            if r["error"]:
+                print(f"⚠️ {path}: {r['error']}")
+                continue
+            print(f"📈 {os.path.basename(path)} [{r['src']} #{r['idx']}] fs={r['fs']:g} Hz n={r['n']} "
+                  f"({r['frames']} khung) | {fmt_result(r)} | đỉnh theo khung {r['peak_min']:.1f}..{r['peak_max']:.1f} Hz")
+    if args.out:
+        write_table(args.out, SUMMARY_COLS, rows)
+        print(f"🧾 Tóm tắt → {os.path.abspath(args.out)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
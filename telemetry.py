@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Parse dòng STATUS, gắn thời gian host, theo dõi seq (mất gói / jitter),
+# đồng bộ đồng hồ Arduino (millis) với đồng hồ host, và log nhị phân gọn.
+#
+# STATUS từ firmware:
+#   STATUS hz=.. rpm=.. run=.. hold=.. flow1=.. volt1=.. flow2=.. volt2=.. [seq=..] [t=..]
+# AVG <ms> (firmware lấy mẫu liên tục trong cửa sổ, trả trung bình + min/max điện áp):
+#   AVG hz=.. rpm=.. run=.. hold=.. flow1=.. volt1=.. flow2=.. volt2=.. n=.. ms=..
+#       v1min=.. v1max=.. v2min=.. v2max=.. seq=.. t=..
+
+import os, re, struct, time, math
+from collections import deque
+
+_F = r"-?\d+(?:\.\d+)?"
+
+STATUS_RE = re.compile(
+    rf"^STATUS\s+hz=(?P<hz>\d+(?:\.\d+)?)\s+rpm=(?P<rpm>{_F})\s+run=(?P<run>[01])\s+hold=(?P<hold>[01])\s+"
+    rf"flow1=(?P<flow1>{_F})\s+volt1=(?P<volt1>{_F})\s+"
+    rf"flow2=(?P<flow2>{_F})\s+volt2=(?P<volt2>{_F})"
+    r"(?:\s+seq=(?P<seq>\d+))?(?:\s+t=(?P<t>\d+))?\s*$"
+)
+
+AVG_RE = re.compile(
+    rf"^AVG\s+hz=(?P<hz>\d+(?:\.\d+)?)\s+rpm=(?P<rpm>{_F})\s+run=(?P<run>[01])\s+hold=(?P<hold>[01])\s+"
+    rf"flow1=(?P<flow1>{_F})\s+volt1=(?P<volt1>{_F})\s+"
+    rf"flow2=(?P<flow2>{_F})\s+volt2=(?P<volt2>{_F})\s+"
+    rf"n=(?P<n>\d+)\s+ms=(?P<ms>\d+)\s+"
+    rf"v1min=(?P<v1min>{_F})\s+v1max=(?P<v1max>{_F})\s+v2min=(?P<v2min>{_F})\s+v2max=(?P<v2max>{_F})"
+    r"(?:\s+seq=(?P<seq>\d+))?(?:\s+t=(?P<t>\d+))?\s*$"
+)
+
+FIELDS = ("hz", "rpm", "flow1", "volt1", "flow2", "volt2")
+
+
+def parse_hz(s):
+    """hz trong STATUS: số nguyên như cũ, hoặc số lẻ khi host đặt Hz lẻ (vòng PID)."""
+    v = float(s)
+    return int(v) if v.is_integer() else v
+
+
+def parse_status(line, t_host=None):
+    """Dòng STATUS -> dict (hz, rpm, run, hold, flow1.., seq, t_dev_ms, t_host); None nếu không khớp."""
+    m = STATUS_RE.match(line)
+    if not m:
+        return None
+    return record_from_match(m, t_host)
+
+
+def record_from_match(m, t_host=None):
+    rec = {
+        "hz": parse_hz(m.group("hz")),
+        "rpm": float(m.group("rpm")),
+        "run": int(m.group("run")),
+        "hold": int(m.group("hold")),
+        "flow1": float(m.group("flow1")),
+        "volt1": float(m.group("volt1")),
+        "flow2": float(m.group("flow2")),
+        "volt2": float(m.group("volt2")),
+        "seq": int(m.group("seq")) if m.group("seq") is not None else None,
+        "t_dev_ms": int(m.group("t")) if m.group("t") is not None else None,
+        "t_host": time.monotonic() if t_host is None else t_host,
+    }
+    return rec
+
+
+def parse_avg(line, t_host=None):
+    """Dòng AVG -> record như parse_status + n (số mẫu ADC), ms, volt1_min/max, volt2_min/max."""
+    m = AVG_RE.match(line)
+    if not m:
+        return None
+    return avg_from_match(m, t_host)
+
+
+def avg_from_match(m, t_host=None):
+    rec = record_from_match(m, t_host)
+    rec.update(n=int(m.group("n")), ms=int(m.group("ms")),
+               volt1_min=float(m.group("v1min")), volt1_max=float(m.group("v1max")),
+               volt2_min=float(m.group("v2min")), volt2_max=float(m.group("v2max")))
+    return rec
+
+
+# ====== Đồng bộ đồng hồ thiết bị -> host ======
+class ClockSync:
+    """Ước lượng t_host ≈ offset + drift * t_dev.
+
+    Trễ truyền luôn dương nên dùng đường bao dưới: mỗi khoảng bin_s giây (theo
+    đồng hồ thiết bị) giữ điểm có (t_host - t_dev) nhỏ nhất, rồi fit đường thẳng
+    qua các điểm đó. millis() tràn sau ~49 ngày được tự nối lại.
+    """
+
+    WRAP_MS = 1 << 32
+
+    def __init__(self, bin_s=10.0, max_bins=60):
+        self.bin_s = bin_s
+        self.bins = deque(maxlen=max_bins)     # [bin_idx, t_dev, t_host, t_host - t_dev]
+        self._last_raw = None
+        self._wraps = 0
+        self.offset = None
+        self.drift = 1.0
+
+    def _unwrap(self, t_dev_ms):
+        if self._last_raw is not None and t_dev_ms < self._last_raw - self.WRAP_MS // 2:
+            self._wraps += 1
+        self._last_raw = t_dev_ms
+        return (t_dev_ms + self._wraps * self.WRAP_MS) / 1000.0
+
+    def add(self, t_dev_ms, t_host):
+        t_dev = self._unwrap(t_dev_ms)
+        d = t_host - t_dev
+        idx = int(t_dev // self.bin_s)
+        if self.bins and self.bins[-1][0] == idx:
+            if d < self.bins[-1][3]:
+                self.bins[-1] = [idx, t_dev, t_host, d]
+        elif self.bins and idx < self.bins[-1][0]:
+            # Arduino reset (millis về 0) -> bỏ lịch sử cũ
+            self.bins.clear()
+            self.bins.append([idx, t_dev, t_host, d])
+        else:
+            self.bins.append([idx, t_dev, t_host, d])
+        self._fit()
+        return self.to_host(t_dev_ms)
+
+    def _fit(self):
+        n = len(self.bins)
+        if n == 1:
+            self.drift = 1.0
+            self.offset = self.bins[0][3]
+            return
+        sx = sum(b[1] for b in self.bins)
+        sy = sum(b[2] for b in self.bins)
+        mx, my = sx / n, sy / n
+        sxx = sum((b[1] - mx) ** 2 for b in self.bins)
+        sxy = sum((b[1] - mx) * (b[2] - my) for b in self.bins)
+        self.drift = sxy / sxx if sxx > 0 else 1.0
+        # Đẩy đường fit xuống sát đường bao dưới
+        self.offset = min(b[2] - self.drift * b[1] for b in self.bins)
+
+    def to_host(self, t_dev_ms):
+        if self.offset is None:
+            return None
+        t_dev = (t_dev_ms + self._wraps * self.WRAP_MS) / 1000.0
+        return self.offset + self.drift * t_dev
+
+    def drift_ppm(self):
+        return (self.drift - 1.0) * 1e6
+
+
+# ====== Theo dõi seq: mất gói, lặp, jitter ======
+class _RunStats:
+    # Welford: mean/std không cần giữ mảng
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+
+class SeqTracker:
+    def __init__(self):
+        self.received = 0
+        self.lost = 0
+        self.dup = 0
+        self.resets = 0
+        self.gaps = []                 # (seq_trước, seq_sau) của 20 lần mất gần nhất
+        self.host_dt = _RunStats()     # khoảng cách giữa 2 mẫu theo host (s)
+        self.dev_dt = _RunStats()      # khoảng cách theo thiết bị (s)
+        self.sync = ClockSync()
+        self._last = None
+
+    def add(self, rec):
+        """Nhận record từ parse_status. Trả về số gói bị mất ngay trước record này."""
+        self.received += 1
+        lost = 0
+        seq, t_dev, t_host = rec.get("seq"), rec.get("t_dev_ms"), rec["t_host"]
+        if t_dev is not None:
+            rec["t_dev_host"] = self.sync.add(t_dev, t_host)
+        last = self._last
+        if last is not None:
+            self.host_dt.add(t_host - last["t_host"])
+            if t_dev is not None and last.get("t_dev_ms") is not None and t_dev >= last["t_dev_ms"]:
+                self.dev_dt.add((t_dev - last["t_dev_ms"]) / 1000.0)
+            if seq is not None and last.get("seq") is not None:
+                if seq == last["seq"]:
+                    self.dup += 1
+                elif seq < last["seq"]:
+                    self.resets += 1
+                elif seq > last["seq"] + 1:
+                    lost = seq - last["seq"] - 1
+                    self.lost += lost
+                    self.gaps.append((last["seq"], seq))
+                    del self.gaps[:-20]
+        self._last = rec
+        return lost
+
+    def report(self):
+        total = self.received + self.lost
+        loss = 100.0 * self.lost / total if total else 0.0
+        parts = [f"nhận={self.received} mất={self.lost} ({loss:.2f}%) lặp={self.dup} reset={self.resets}"]
+        if self.host_dt.n:
+            parts.append(f"Δt host={self.host_dt.mean * 1000:.1f}±{self.host_dt.std * 1000:.1f}ms "
+                         f"[{self.host_dt.min * 1000:.1f}..{self.host_dt.max * 1000:.1f}]")
+        if self.dev_dt.n:
+            parts.append(f"Δt dev={self.dev_dt.mean * 1000:.1f}±{self.dev_dt.std * 1000:.1f}ms")
+        if self.sync.offset is not None:
+            parts.append(f"drift={self.sync.drift_ppm():+.0f}ppm")
+        return " | ".join(parts)
+
+
+# ====== Log nhị phân: thời gian/seq mã hóa delta (varint zigzag) ======
+# Sau BIN_MAGIC là các byte tag: 0x00 = đầu đoạn (file cũ, không có mốc epoch),
+# 0x02 + (time.time(), time.monotonic()) = đầu đoạn có mốc, 0x01 = 1 record.
+BIN_MAGIC = b"MAFT1\n"
+_BODY = struct.Struct("<Bffffff")   # flags, hz, rpm, flow1, volt1, flow2, volt2
+_BASE = struct.Struct("<dd")        # epoch, monotonic lúc mở đoạn
+_F_RUN, _F_HOLD, _F_SEQ, _F_TDEV = 1, 2, 4, 8
+
+
+def _zz(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def _unzz(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+def _put_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(buf, pos):
+    shift = n = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+class BinLogWriter:
+    """Mỗi record ~28 byte: Δt_host (µs), Δseq, Δt_dev (ms) dạng varint + 6 float32.
+
+    t_host là time.monotonic() (không nhảy khi chỉnh giờ); đầu mỗi đoạn ghi cặp mốc
+    (time.time(), time.monotonic()) để read_binlog đổi ra giờ epoch.
+    """
+
+    def __init__(self, path, base=None):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.f = open(path, "ab")
+        if new:
+            self.f.write(BIN_MAGIC)
+        # Mỗi lần mở file là một đoạn mới: delta tính lại từ 0
+        self._prev = (0, 0, 0)
+        base = base or (time.time(), time.monotonic())
+        self.f.write(b"\x02" + _BASE.pack(*base))     # marker đầu đoạn + mốc epoch
+
+    def write(self, rec):
+        t_us = int(round(rec["t_host"] * 1e6))
+        seq = rec.get("seq")
+        t_dev = rec.get("t_dev_ms")
+        flags = (_F_RUN if rec["run"] else 0) | (_F_HOLD if rec["hold"] else 0)
+        flags |= (_F_SEQ if seq is not None else 0) | (_F_TDEV if t_dev is not None else 0)
+        seq = seq or 0
+        t_dev = t_dev or 0
+        out = bytearray(b"\x01")
+        p_t, p_s, p_d = self._prev
+        _put_varint(out, _zz(t_us - p_t))
+        _put_varint(out, _zz(seq - p_s))
+        _put_varint(out, _zz(t_dev - p_d))
+        out += _BODY.pack(flags, rec["hz"], rec["rpm"], rec["flow1"], rec["volt1"], rec["flow2"], rec["volt2"])
+        self._prev = (t_us, seq, t_dev)
+        self.f.write(out)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def read_binlog(path):
+    """Generator các record (dict) từ file của BinLogWriter.
+
+    "t" là giờ epoch suy từ mốc đầu đoạn (None với đoạn ghi bởi bản cũ, không có mốc);
+    "t_host" giữ nguyên giá trị monotonic đã ghi.
+    """
+    with open(path, "rb") as f:
+        buf = f.read()
+    if not buf.startswith(BIN_MAGIC):
+        raise ValueError(f"{path}: không phải log nhị phân MAFT1")
+    pos = len(BIN_MAGIC)
+    p_t = p_s = p_d = 0
+    t_off = None                    # epoch - monotonic của đoạn hiện tại
+    while pos < len(buf):
+        tag = buf[pos]
+        pos += 1
+        if tag == 0:
+            p_t = p_s = p_d = 0
+            t_off = None
+            continue
+        if tag == 2:
+            if pos + _BASE.size > len(buf):
+                return
+            epoch, mono = _BASE.unpack_from(buf, pos)
+            pos += _BASE.size
+            p_t = p_s = p_d = 0
+            t_off = epoch - mono
+            continue
+        try:
+            d, pos = _get_varint(buf, pos); p_t += _unzz(d)
+            d, pos = _get_varint(buf, pos); p_s += _unzz(d)
+            d, pos = _get_varint(buf, pos); p_d += _unzz(d)
+            flags, hz, rpm, f1, v1, f2, v2 = _BODY.unpack_from(buf, pos)
+        except (IndexError, struct.error):
+            return    # record cuối bị cắt (mất điện giữa chừng)
+        pos += _BODY.size
+        yield {
+            "t": p_t / 1e6 + t_off if t_off is not None else None,
+            "t_host": p_t / 1e6,
+            "seq": p_s if flags & _F_SEQ else None,
+            "t_dev_ms": p_d if flags & _F_TDEV else None,
+            "hz": hz, "rpm": rpm,
+            "run": 1 if flags & _F_RUN else 0, "hold": 1 if flags & _F_HOLD else 0,
+            "flow1": f1, "volt1": v1, "flow2": f2, "volt2": v2,
+        }
+
+
+if __name__ == "__main__":
+    import sys
+    # python3 telemetry.py file.bin -> in thống kê seq/jitter của log nhị phân
+    tr = SeqTracker()
+    for r in read_binlog(sys.argv[1]):
+        tr.add(r)
+    print(tr.report())
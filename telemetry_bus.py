@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Bus telemetry qua shared memory: một daemon giữ cổng serial (/dev/ttyACM0),
+# parse từng dòng và ghi vào ring buffer trong multiprocessing.shared_memory.
+# Bao nhiêu tiến trình đọc cũng được (GUI, chart, logger) — attach bằng view NumPy
+# trực tiếp trên vùng nhớ chung, không copy. Lệnh gửi ngược về Arduino qua FIFO.
+#
+#   python3 telemetry_bus.py serve --port /dev/ttyACM0 --poll 1.0
+#   python3 main.py --port shm:maf_bus          (ports.open_port hiểu "shm:<tên>")
+#   python3 telemetry_bus.py tail
+#
+# Ring buffer: 1 writer duy nhất, không khóa.
+#   - Writer ghi slot (head % capacity): đặt seq của slot = -1, ghi dữ liệu, đặt seq = n,
+#     rồi mới tăng bộ đếm write_seq = n + 1 ở header.
+#   - Reader đọc write_seq, copy các slot cần, rồi đọc lại write_seq: slot có seq copy
+#     không đúng số mong đợi, hoặc nằm trong vùng writer có thể đã đè trong lúc copy
+#     (seq <= write_seq sau copy - capacity), bị bỏ (tính là overrun).
+
+import os, sys, time, errno, argparse, threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from telemetry import parse_status
+
+DEFAULT_NAME = "maf_bus"
+DEFAULT_CAPACITY = 1 << 16
+MAGIC = 0x4D414642          # "MAFB"
+VERSION = 1
+LINE_LEN = 160
+
+KIND_STATUS = 0
+KIND_LINE = 1               # OK/ERR/banner... (chỉ có text)
+
+RECORD_DTYPE = np.dtype([
+    ("seq", "<i8"),         # số thứ tự trên bus (= index toàn cục)
+    ("t_host", "<f8"),      # time.monotonic() lúc daemon nhận dòng
+    ("dev_seq", "<i8"),     # seq= của STATUS (-1 nếu không có)
+    ("t_dev_ms", "<i8"),    # t= của STATUS (-1 nếu không có)
+    ("hz", "<f4"), ("rpm", "<f4"),
+    ("flow1", "<f4"), ("volt1", "<f4"),
+    ("flow2", "<f4"), ("volt2", "<f4"),
+    ("kind", "u1"), ("run", "u1"), ("hold", "u1"),
+    ("line", f"S{LINE_LEN}"),
+], align=True)
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "<u4"), ("version", "<u4"),
+    ("capacity", "<u8"), ("record_size", "<u8"),
+    ("write_seq", "<i8"),
+    ("writer_pid", "<i8"),
+    ("t_start", "<f8"),
+])
+HEADER_SIZE = 64
+
+
+def cmd_fifo_path(name):
+    return os.path.join("/tmp", f"{name}.cmd")
+
+
+def _attach_untracked(name):
+    shm = shared_memory.SharedMemory(name=name)
+    # Reader không sở hữu vùng nhớ: tránh resource_tracker xóa nó khi reader thoát
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+# ====== Writer (daemon) ======
+class BusWriter:
+    def __init__(self, name=DEFAULT_NAME, capacity=DEFAULT_CAPACITY):
+        size = HEADER_SIZE + capacity * RECORD_DTYPE.itemsize
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Daemon trước chết không dọn -> tạo lại
+            old = shared_memory.SharedMemory(name=name)
+            old.close()
+            old.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = name
+        self.capacity = capacity
+        self.header = np.ndarray((), HEADER_DTYPE, buffer=self.shm.buf, offset=0)
+        self.ring = np.ndarray((capacity,), RECORD_DTYPE, buffer=self.shm.buf, offset=HEADER_SIZE)
+        self.ring["seq"] = -1
+        self.header["magic"] = MAGIC
+        self.header["version"] = VERSION
+        self.header["capacity"] = capacity
+        self.header["record_size"] = RECORD_DTYPE.itemsize
+        self.header["writer_pid"] = os.getpid()
+        self.header["t_start"] = time.monotonic()
+        self.header["write_seq"] = 0
+        self._n = 0
+
+    def publish(self, line, t_host=None):
+        t_host = time.monotonic() if t_host is None else t_host
+        n = self._n
+        slot = self.ring[n % self.capacity]
+        slot["seq"] = -1
+        rec = parse_status(line, t_host)
+        slot["t_host"] = t_host
+        slot["line"] = line.encode("utf-8", errors="ignore")[:LINE_LEN]
+        if rec is not None:
+            slot["kind"] = KIND_STATUS
+            for k in ("hz", "rpm", "flow1", "volt1", "flow2", "volt2", "run", "hold"):
+                slot[k] = rec[k]
+            slot["dev_seq"] = -1 if rec["seq"] is None else rec["seq"]
+            slot["t_dev_ms"] = -1 if rec["t_dev_ms"] is None else rec["t_dev_ms"]
+        else:
+            slot["kind"] = KIND_LINE
+            slot["dev_seq"] = -1
+            slot["t_dev_ms"] = -1
+        slot["seq"] = n
+        self._n = n + 1
+        self.header["write_seq"] = self._n
+        return rec
+
+    def close(self):
+        self.header["writer_pid"] = 0
+        del self.header, self.ring
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# ====== Reader ======
+class BusReader:
+    """Attach vào bus. `ring` là view NumPy trực tiếp (zero-copy) trên shared memory."""
+
+    def __init__(self, name=DEFAULT_NAME, from_start=False):
+        self.shm = _attach_untracked(name)
+        self.name = name
+        self.header = np.ndarray((), HEADER_DTYPE, buffer=self.shm.buf, offset=0)
+        if int(self.header["magic"]) != MAGIC or int(self.header["record_size"]) != RECORD_DTYPE.itemsize:
+            raise RuntimeError(f"shm '{name}' không phải telemetry bus v{VERSION}")
+        self.capacity = int(self.header["capacity"])
+        self.ring = np.ndarray((self.capacity,), RECORD_DTYPE, buffer=self.shm.buf, offset=HEADER_SIZE)
+        ws = self.write_seq()
+        self.next_seq = max(0, ws - self.capacity) if from_start else ws
+        self.overruns = 0
+
+    def write_seq(self):
+        return int(self.header["write_seq"])
+
+    def writer_alive(self):
+        pid = int(self.header["writer_pid"])
+        if pid <= 0:
+            return False
+        try:
+            os.kill(pid, 0)
+            return True
+        except OSError as e:
+            return e.errno == errno.EPERM
+
+    def read_new(self, max_records=None):
+        """Copy các record mới (đã kiểm tra không bị ghi đè) -> mảng RECORD_DTYPE."""
+        ws = self.write_seq()
+        start = self.next_seq
+        if ws - start > self.capacity:
+            self.overruns += ws - self.capacity - start
+            start = ws - self.capacity
+        if max_records is not None:
+            ws = min(ws, start + max_records)
+        if ws <= start:
+            return self.ring[:0].copy()
+        seqs = np.arange(start, ws)
+        out = self.ring[seqs % self.capacity]   # fancy index -> bản copy
+        # seqlock: seq copy được có thể còn đúng trong khi dữ liệu đã bị ghi dở. Đọc lại
+        # write_seq sau khi copy: writer đang ghi record ws2 (chưa tăng write_seq) là đang
+        # đè slot của seq ws2 - capacity, nên chỉ seq > ws2 - capacity là chắc chắn nguyên vẹn.
+        ws2 = self.write_seq()
+        ok = (out["seq"] == seqs) & (seqs > ws2 - self.capacity)
+        if not ok.all():
+            self.overruns += int((~ok).sum())
+            out = out[ok]
+        self.next_seq = ws
+        return out
+
+    def latest(self, n=1):
+        """n record gần nhất dạng view (zero-copy, có thể bị ghi đè nếu giữ lâu)."""
+        ws = self.write_seq()
+        n = min(n, ws, self.capacity)
+        i0 = (ws - n) % self.capacity
+        if i0 + n <= self.capacity:
+            return self.ring[i0:i0 + n]
+        return np.concatenate([self.ring[i0:], self.ring[:(i0 + n) - self.capacity]])
+
+    def send(self, cmd):
+        send_command(cmd, self.name)
+
+    def close(self):
+        del self.header, self.ring
+        self.shm.close()
+
+
+def send_command(cmd, name=DEFAULT_NAME):
+    # Ghi < PIPE_BUF byte vào FIFO là nguyên tử -> nhiều client gửi cùng lúc không lẫn dòng
+    data = (cmd.strip() + "\n").encode("utf-8")
+    fd = os.open(cmd_fifo_path(name), os.O_WRONLY | os.O_NONBLOCK)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+class BusPort:
+    """Giả lập serial.Serial trên bus: script cũ (readline/read/write) chạy không cần sửa."""
+
+    def __init__(self, name=DEFAULT_NAME, timeout=1.0, poll_s=0.005):
+        self.port = f"shm:{name}"
+        self.reader = BusReader(name)
+        self.timeout = timeout
+        self.poll_s = poll_s
+        self.is_open = True
+        self._buf = bytearray()
+
+    def _fill(self, deadline):
+        while True:
+            recs = self.reader.read_new(256)
+            if recs.size:
+                for line in recs["line"]:
+                    self._buf.extend(line + b"\n")
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_s)
+
+    def _deadline(self):
+        return time.monotonic() + (self.timeout if self.timeout is not None else 1e9)
+
+    def read(self, size=1):
+        deadline = self._deadline()
+        while len(self._buf) < size and self._fill(deadline):
+            pass
+        out = bytes(self._buf[:size])
+        del self._buf[:size]
+        return out
+
+    def readline(self):
+        deadline = self._deadline()
+        while b"\n" not in self._buf and self._fill(deadline):
+            pass
+        i = self._buf.find(b"\n")
+        n = len(self._buf) if i < 0 else i + 1
+        out = bytes(self._buf[:n])
+        del self._buf[:n]
+        return out
+
+    @property
+    def in_waiting(self):
+        recs = self.reader.read_new(256)
+        for line in recs["line"]:
+            self._buf.extend(line + b"\n")
+        return len(self._buf)
+
+    def write(self, data):
+        for line in bytes(data).decode("utf-8", errors="ignore").splitlines():
+            if line.strip():
+                self.reader.send(line)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self._buf.clear()
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self.reader.close()
+
+
+# ====== Daemon ======
+class BusDaemon:
+    def __init__(self, ser, name=DEFAULT_NAME, capacity=DEFAULT_CAPACITY, poll_s=0.0):
+        self.ser = ser
+        self.name = name
+        self.poll_s = poll_s
+        self.writer = BusWriter(name, capacity)
+        self.fifo = cmd_fifo_path(name)
+        if os.path.exists(self.fifo):
+            os.unlink(self.fifo)
+        os.mkfifo(self.fifo, 0o666)
+        # O_RDWR: FIFO không báo EOF khi client đóng
+        self._fifo_fd = os.open(self.fifo, os.O_RDWR | os.O_NONBLOCK)
+        self._write_lock = threading.Lock()
+        self._running = True
+        self.rx_lines = 0
+        self.tx_cmds = 0
+
+    def write_cmd(self, cmd):
+        with self._write_lock:
+            self.ser.write((cmd.strip() + "\n").encode("utf-8"))
+            self.ser.flush()
+        self.tx_cmds += 1
+
+    def _cmd_loop(self):
+        pending = b""
+        next_poll = time.monotonic()
+        while self._running:
+            try:
+                chunk = os.read(self._fifo_fd, 4096)
+            except BlockingIOError:
+                chunk = b""
+            if chunk:
+                pending += chunk
+                *lines, pending = pending.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        self.write_cmd(line.decode("utf-8", errors="ignore"))
+            if self.poll_s > 0 and time.monotonic() >= next_poll:
+                self.write_cmd("STATUS")
+                next_poll += self.poll_s
+                if next_poll < time.monotonic():
+                    next_poll = time.monotonic() + self.poll_s
+            if not chunk:
+                time.sleep(0.005)
+
+    def run(self):
+        t_cmd = threading.Thread(target=self._cmd_loop, daemon=True)
+        t_cmd.start()
+        while self._running:
+            try:
+                raw = self.ser.readline()
+            except Exception as e:
+                self.writer.publish(f"__ERR__ {e}")
+                time.sleep(0.2)
+                continue
+            line = raw.decode("utf-8", errors="ignore").strip()
+            if line:
+                self.writer.publish(line)
+                self.rx_lines += 1
+
+    def stop(self):
+        self._running = False
+
+    def close(self):
+        self._running = False
+        try:
+            os.close(self._fifo_fd)
+            os.unlink(self.fifo)
+        except OSError:
+            pass
+        self.writer.close()
+
+
+def cmd_serve(args):
+    import signal
+    from ports import open_port
+    ser = open_port(args.port, args.baud, timeout=0.2)
+    d = BusDaemon(ser, args.name, args.capacity, args.poll)
+    signal.signal(signal.SIGTERM, lambda *_: d.stop())
+    print(f"🚌 Bus '{args.name}' ({args.capacity} record × {RECORD_DTYPE.itemsize} B) ← {args.port} | "
+          f"lệnh: {d.fifo}")
+    try:
+        d.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        d.close()
+        ser.close()
+    print(f"🏁 rx={d.rx_lines} dòng, tx={d.tx_cmds} lệnh")
+
+
+def cmd_tail(args):
+    r = BusReader(args.name, from_start=args.from_start)
+    try:
+        while True:
+            for rec in r.read_new():
+                print(f"[{rec['seq']:7d}] {rec['line'].decode('utf-8', errors='ignore')}")
+            time.sleep(0.05)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"overruns={r.overruns}")
+        r.close()
+
+
+def cmd_send(args):
+    send_command(" ".join(args.cmd), args.name)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Bus telemetry shared memory cho nhiều ứng dụng dùng chung 1 cổng serial.")
+    ap.add_argument("--name", default=DEFAULT_NAME, help="Tên vùng shared memory")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("serve", help="Chạy daemon giữ cổng serial")
+    p.add_argument("--port", default="/dev/ttyACM0")
+    p.add_argument("--baud", type=int, default=115200)
+    p.add_argument("--capacity", type=int, default=DEFAULT_CAPACITY, help="Số record trong ring")
+    p.add_argument("--poll", type=float, default=0.0, help="Tự gửi STATUS mỗi N giây (0 = không)")
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("tail", help="In các dòng mới trên bus")
+    p.add_argument("--from-start", action="store_true")
+    p.set_defaults(func=cmd_tail)
+
+    p = sub.add_parser("send", help="Gửi 1 lệnh tới Arduino qua daemon")
+    p.add_argument("cmd", nargs="+")
+    p.set_defaults(func=cmd_send)
+
+    args = ap.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,27 @@
 #!/usr/bin/env python3
 
 import sys
-import csv
+import os
 import serial
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QPushButton, QMessageBox,
     QVBoxLayout, QHBoxLayout, QSplitter
 )
 from PyQt5.QtGui import QFont, QColor, QPainter, QFontDatabase
-from PyQt5.QtCore import QTimer, QPointF, Qt
+from PyQt5.QtCore import QTimer, QPointF, Qt, pyqtSignal
 from PyQt5.QtChart import QChart, QChartView, QLineSeries, QAreaSeries, QValueAxis
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from csv_recorder import CsvRecorder
+
 MAIN_FONT = "~/.fonts/maf.ttf"  # Đường dẫn font tùy biến của bạn
 MAX_VALUE = 120               # Trục Y cho biểu đồ lưu lượng khí nạp (g/s)
+CSV_PATH = "data.csv"         # dữ liệu đang ghi nằm ở data.csv.part
+SERIES_POINTS = 600           # số điểm gần nhất giữ trên mỗi series (cũ hơn thì bỏ)
 
 class ChartReadData(QMainWindow):
+    saved = pyqtSignal(str, int, object)   # (path, số dòng, lỗi) từ thread ghi CSV
+
     def __init__(self):
         super().__init__()
 
@@ -42,8 +49,16 @@ class ChartReadData(QMainWindow):
 
         # Bộ đếm thời gian theo trục X
         self.x = 0
-        self.data1 = []  # (x, y1) – điện áp
-        self.data2 = []  # (x, y2) – lưu lượng
+
+        # Ghi CSV liên tục ở thread nền (không giữ lịch sử trong RAM)
+        try:
+            self.recorder = CsvRecorder(CSV_PATH, ["Voltage(V)", "Flow(g/s)"])
+            if self.recorder.recovered:
+                print(f"↩️ Dữ liệu chưa lưu của lần chạy trước: {self.recorder.recovered}")
+        except OSError as e:
+            self.recorder = None
+            print(f"Không ghi được {CSV_PATH}: {e}")
+        self.saved.connect(self.on_saved)
 
         # =====================================================================
         # Biểu đồ 1: ĐIỆN ÁP (LineSeries)
@@ -174,8 +189,8 @@ class ChartReadData(QMainWindow):
             y2 = float(parts[1])   # Lưu lượng (g/s)
 
             self.x += 1
-            self.data1.append((y2, y1))
-            self.data2.append((self.x, y2))
+            if self.recorder:
+                self.recorder.append((y1, y2))
 
             # Cập nhật biểu đồ 1 (điện áp)
             self.line_series.append(QPointF(y2, y1))
@@ -183,6 +198,9 @@ class ChartReadData(QMainWindow):
             # Cập nhật biểu đồ 2 (area: upper = y2, lower = 0)
             self.upper_series.append(QPointF(self.x, y2))
             self.lower_series.append(QPointF(self.x, 0))
+            for series in (self.line_series, self.upper_series, self.lower_series):
+                if series.count() > SERIES_POINTS:
+                    series.removePoints(0, series.count() - SERIES_POINTS)
 
             # Cuộn trục X để luôn thấy 50 điểm gần nhất
             if self.x > 50:
@@ -193,18 +211,19 @@ class ChartReadData(QMainWindow):
             print("Lỗi khi đọc dữ liệu:", e)
 
     def save_csv(self):
-        """Lưu dữ liệu ra data.csv"""
-        try:
-            with open('data.csv', 'w', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow(["Voltage(V)", "Flow(g/s)"])
-                for i in range(max(len(self.data1), len(self.data2))):
-                    s1 = self.data1[i][1] if i < len(self.data1) else ''
-                    s2 = self.data2[i][1] if i < len(self.data2) else ''
-                    writer.writerow([s1, s2])
-            QMessageBox.information(self, "Lưu thành công", "Dữ liệu đã được lưu vào data.csv")
-        except Exception as e:
-            QMessageBox.critical(self, "Lỗi", f"Không thể lưu dữ liệu: {e}")
+        """Chốt data.csv.part thành data.<mốc thời gian>.csv (thread ghi làm, GUI không chờ)"""
+        if not self.recorder:
+            QMessageBox.critical(self, "Lỗi", f"Không ghi được {CSV_PATH}")
+            return
+        self.save_button.setEnabled(False)
+        self.recorder.save(lambda path, n, err: self.saved.emit(path, n, err))
+
+    def on_saved(self, path, rows, err):
+        self.save_button.setEnabled(True)
+        if err:
+            QMessageBox.critical(self, "Lỗi", f"Không thể lưu dữ liệu: {err}")
+        else:
+            QMessageBox.information(self, "Lưu thành công", f"{rows} dòng đã được lưu vào {path}")
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
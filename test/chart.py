@@ -1,24 +1,90 @@
 #!/usr/bin/env python3
-import sys, os, csv, serial
+import sys, os, re, time, argparse, serial
+import numpy as np
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QWidget, QVBoxLayout, QTabWidget,
-    QPushButton, QMessageBox, QSplitter, QLabel
+    QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTabWidget,
+    QPushButton, QMessageBox, QSplitter, QLabel, QFileDialog
 )
 from PyQt5.QtGui import QFont, QColor, QPainter, QFontDatabase
-from PyQt5.QtCore import Qt, QTimer, QPointF
+from PyQt5.QtCore import Qt, QTimer, QPointF, QThread, pyqtSignal
 from PyQt5.QtChart import QChart, QChartView, QLineSeries, QAreaSeries, QValueAxis
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ports import open_port
+from csv_loader import load_columns, decimate
+from csv_recorder import CsvRecorder, latest_saved
+from history import SampleHistory
+from spectrum import SlidingWelch, RateMeter, welch, analyze, fmt_result, FMIN
+from burst import load_bursts
+
 MAIN_FONT = "fonts/font.ttf"
 MAX_VALUE = 120
 CSV_PATH   = "/home/pi/build/main/data.csv"   # đổi nếu cần
-SERIAL_DEV = "/dev/ttyACM0"
+SERIAL_DEV = "/dev/ttyACM0"                   # hoặc replay:file.cap[@tốc độ|@max], shm:maf_bus
 BAUDRATE   = 9600
+MAX_LINES_PER_TICK = 200                      # số dòng tối đa xử lý mỗi lần timer
+MAX_PLOT_POINTS = 20000                       # số điểm tối đa vẽ từ CSV (giảm mẫu min/max)
+SERIES_POINTS = 600                           # số mẫu gần nhất giữ trên biểu đồ realtime
+SPEC_NPERSEG = 64                             # khung FFT của phổ trực tiếp (luồng STATUS vài Hz)
+SPEC_HOP = 16
+SPEC_REFRESH_MS = 1000
+
+_FNUM = r"([-+]?\d+(?:\.\d+)?)"
+STATUS_VOLT_RE = re.compile(rf"volt2={_FNUM}")
+STATUS_FLOW_RE = re.compile(rf"flow2={_FNUM}")
+
+
+def parse_sample(line: str):
+    """'volt,flow' hoặc dòng STATUS của Arduino -> (volt, flow); None nếu không phải mẫu."""
+    if line.startswith("STATUS"):
+        m_v = STATUS_VOLT_RE.search(line)
+        m_f = STATUS_FLOW_RE.search(line)
+        if m_v and m_f:
+            return float(m_v.group(1)), float(m_f.group(1))
+        return None
+    parts = line.split(",")
+    if len(parts) != 2:
+        return None
+    return float(parts[0]), float(parts[1])
+
+
+def read_samples(ser, calib=None):
+    """Các mẫu (volt, flow) đã có; nếu có bảng hiệu chuẩn thì tính flow cả lô một lần."""
+    samples = []
+    for line in read_lines(ser):
+        try:
+            sample = parse_sample(line)
+        except ValueError:
+            continue
+        if sample is not None:
+            samples.append(sample)
+    if calib is not None and samples:
+        volts = [v for v, _ in samples]
+        samples = list(zip(volts, calib.flow_array(volts).tolist()))
+    return samples
+
+
+def read_lines(ser):
+    """Đọc 1 dòng (chờ theo timeout) rồi vét thêm các dòng đã có sẵn trong buffer."""
+    lines = []
+    line = ser.readline().decode('utf-8', errors='ignore').strip()
+    if line:
+        lines.append(line)
+    while len(lines) < MAX_LINES_PER_TICK and ser.in_waiting:
+        line = ser.readline().decode('utf-8', errors='ignore').strip()
+        if line:
+            lines.append(line)
+    return lines
 
 
 # ====================== TAB 1: RealTime ======================
 class ChartReadData(QWidget):
-    def __init__(self):
+    saved = pyqtSignal(str, int, object)   # (path, số dòng, lỗi) từ thread ghi CSV
+    samples_read = pyqtSignal(float, object)   # (t đọc, list điện áp) cho tab Phổ
+
+    def __init__(self, port: str = SERIAL_DEV, calib=None):
         super().__init__()
+        self.calib = calib    # CalibrationTable: tính lưu lượng từ điện áp thay cho giá trị gửi lên
 
         # Font
         try:
@@ -30,16 +96,23 @@ class ChartReadData(QWidget):
 
         # Serial
         try:
-            self.serial = serial.Serial(SERIAL_DEV, BAUDRATE, timeout=1)
+            self.serial = open_port(port, BAUDRATE, timeout=1)
         except Exception as e:
             self.serial = None
             QMessageBox.warning(self, "Cảnh báo",
-                                f"Không mở được cổng Serial {SERIAL_DEV}: {e}\nChạy chế độ không có dữ liệu.")
+                                f"Không mở được cổng Serial {port}: {e}\nChạy chế độ không có dữ liệu.")
 
-        # dữ liệu
+        # dữ liệu: lịch sử dạng cột (RAM giới hạn, phần cũ tràn ra file) + ghi liên tục ra CSV_PATH.part
         self.x = 0
-        self.data1 = []   # (flow, volt)
-        self.data2 = []   # (t, flow)
+        self.history = SampleHistory(("t", "volt", "flow"))
+        try:
+            self.recorder = CsvRecorder(CSV_PATH, ["Voltage(V)", "Flow(g/s)"])
+            if self.recorder.recovered:
+                print(f"↩️ Dữ liệu chưa lưu của lần chạy trước: {self.recorder.recovered}")
+        except OSError as e:
+            self.recorder = None
+            print(f"⚠️ Không ghi được CSV {CSV_PATH}: {e}")
+        self.saved.connect(self.on_saved)
 
         # --- Biểu đồ 1: Voltage theo Flow (Line) ---
         self.line_series = QLineSeries()
@@ -122,50 +195,70 @@ class ChartReadData(QWidget):
         if not self.serial:
             return
         try:
-            line = self.serial.readline().decode('utf-8', errors='ignore').strip()
-            if not line:
-                return
-            parts = line.split(",")
-            if len(parts) != 2:
-                return
-
-            y1 = float(parts[0])   # Volt
-            y2 = float(parts[1])   # Flow
-
+            samples = read_samples(self.serial, self.calib)
+        except Exception as e:
+            print("Lỗi khi đọc dữ liệu:", e)
+            return
+        if not samples:
+            return
+        self.samples_read.emit(time.monotonic(), [v for v, _ in samples])
+        for y1, y2 in samples:     # Volt, Flow
             self.x += 1
-            self.data1.append((y2, y1))
-            self.data2.append((self.x, y2))
+            self.history.append(self.x, y1, y2)
+            if self.recorder:
+                self.recorder.append((y1, y2))
 
-            self.line_series.append(QPointF(y2, y1))
-            self.upper_series.append(QPointF(self.x, y2))
-            self.lower_series.append(QPointF(self.x, 0))
+        # Vẽ lại từ lịch sử: series chỉ giữ SERIES_POINTS điểm, thay cả khối một lần
+        t, volt, flow = self.history.tail(SERIES_POINTS).T.tolist()
+        self.line_series.replace([QPointF(f, v) for f, v in zip(flow, volt)])
+        self.upper_series.replace([QPointF(x, f) for x, f in zip(t, flow)])
+        self.lower_series.replace([QPointF(x, 0) for x in t])
 
-            if self.x > 120:
-                self.axis_x1.setRange(self.x - 120, self.x)
-            if self.x > 50:
-                self.axis_x2.setRange(self.x - 50, self.x)
-        except Exception as e:
-            print("Lỗi khi đọc dữ liệu:", e)
+        if self.x > 120:
+            self.axis_x1.setRange(self.x - 120, self.x)
+        if self.x > 50:
+            self.axis_x2.setRange(self.x - 50, self.x)
 
     def save_csv(self):
+        # Chỉ gửi lệnh chốt file; thread ghi báo lại qua signal saved
+        if not self.recorder:
+            QMessageBox.critical(self, "Lỗi", f"Không ghi được CSV {CSV_PATH}")
+            return
+        self.save_button.setEnabled(False)
+        self.recorder.save(lambda path, n, err: self.saved.emit(path, n, err))
+
+    def on_saved(self, path, rows, err):
+        self.save_button.setEnabled(True)
+        if err:
+            QMessageBox.critical(self, "Lỗi", str(err))
+        else:
+            QMessageBox.information(self, "OK", f"Đã lưu: {path} ({rows} dòng)")
+
+
+# ====================== TAB 2: So sánh (CSV + realtime) ======================
+class CsvLoadThread(QThread):
+    """Parse CSV (có cache nhị phân) và dựng sẵn list QPointF ngoài GUI thread."""
+    loaded = pyqtSignal(object)    # (data, points)
+    failed = pyqtSignal(str)
+
+    def __init__(self, path: str, parent=None):
+        super().__init__(parent)
+        self.path = path
+
+    def run(self):
         try:
-            os.makedirs(os.path.dirname(CSV_PATH), exist_ok=True)
-            with open(CSV_PATH, 'w', newline='', encoding='utf-8') as f:
-                w = csv.writer(f)
-                w.writerow(["Voltage(V)", "Flow(g/s)"])
-                for i in range(max(len(self.data1), len(self.data2))):
-                    s1 = self.data1[i][1] if i < len(self.data1) else ''
-                    s2 = self.data2[i][1] if i < len(self.data2) else ''
-                    w.writerow([s1, s2])
-            QMessageBox.information(self, "OK", f"Đã lưu: {CSV_PATH}")
+            data = load_columns(self.path)
+            xs, ys = decimate(data["x"], data["y"], MAX_PLOT_POINTS)
+            points = [QPointF(x, y) for x, y in zip(xs.tolist(), ys.tolist())]
+            self.loaded.emit((data, points))
         except Exception as e:
-            QMessageBox.critical(self, "Lỗi", str(e))
+            self.failed.emit(str(e))
 
 
-# ====================== TAB 2: So sánh (CSV + realtime) ======================
 class ChartSSData(QWidget):
-    def __init__(self):
+    def __init__(self, port: str = SERIAL_DEV, calib=None):
         super().__init__()
+        self.calib = calib
 
         # Font
         try:
@@ -177,11 +270,11 @@ class ChartSSData(QWidget):
 
         # Serial
         try:
-            self.serial = serial.Serial(SERIAL_DEV, BAUDRATE, timeout=1)
+            self.serial = open_port(port, BAUDRATE, timeout=1)
         except Exception as e:
             self.serial = None
             QMessageBox.warning(self, "Cảnh báo",
-                                f"Không mở được cổng Serial {SERIAL_DEV}: {e}\nBiểu đồ realtime sẽ không cập nhật.")
+                                f"Không mở được cổng Serial {port}: {e}\nBiểu đồ realtime sẽ không cập nhật.")
 
         self.x = 0
 
@@ -237,8 +330,8 @@ class ChartSSData(QWidget):
         root_layout.addWidget(splitter)
         self.setStyleSheet("background-color: #282A36;")
 
-        # Nạp CSV cho biểu đồ 1
-        self.load_csv_to_linechart(CSV_PATH)
+        # Nạp CSV cho biểu đồ 1: lần save() mới nhất của CSV_PATH
+        self.load_csv_to_linechart(latest_saved(CSV_PATH) or CSV_PATH)
 
         # Timer realtime cho biểu đồ 2
         self.timer = QTimer(self)
@@ -246,110 +339,177 @@ class ChartSSData(QWidget):
         self.timer.start(500)
 
     def load_csv_to_linechart(self, path: str):
-        try:
-            if not os.path.exists(path):
-                QMessageBox.critical(self, "Lỗi CSV", f"Không tìm thấy file:\n{path}")
-                return
-
-            with open(path, "r", encoding="utf-8-sig", newline="") as f:
-                sample = f.read(4096); f.seek(0)
-                try:
-                    dialect = csv.Sniffer().sniff(sample, delimiters=[",", ";", "\t", "|"])
-                except Exception:
-                    dialect = csv.excel
-                rows = list(csv.reader(f, dialect))
-
-            if not rows:
-                QMessageBox.warning(self, "CSV rỗng", "File CSV không có dữ liệu.")
-                return
-
-            # Tìm header trong 10 dòng đầu
-            header_row_idx = None
-            for i, row in enumerate(rows[:10]):
-                low = [c.strip().lower() for c in row]
-                has_flow = any(k in c for c in low for k in ["lưu lượng", "luu luong", "flow"])
-                has_volt = any(k in c for c in low for k in ["volt", "điện áp", "dien ap", "voltage"])
-                if has_flow and has_volt:
-                    header_row_idx = i; break
-            if header_row_idx is None:
-                header_row_idx = 2 if len(rows) > 2 else 0  # fallback
-
-            header = [c.strip() for c in rows[header_row_idx]]
-            header_low = [c.lower() for c in header]
-
-            def find_idx(keys):
-                for j, name in enumerate(header_low):
-                    if any(k in name for k in keys):
-                        return j
-                return None
-
-            idx_flow = find_idx(["lưu lượng", "luu luong", "flow"]) or 0
-            idx_volt = find_idx(["volt", "điện áp", "dien ap", "voltage"]) or 1
-
-            xs, ys = [], []
-            for r in rows[header_row_idx + 1:]:
-                if len(r) <= max(idx_flow, idx_volt): continue
-                try:
-                    x = float(str(r[idx_flow]).replace(",", "."))
-                    y = float(str(r[idx_volt]).replace(",", "."))
-                except Exception:
-                    continue
-                xs.append(x); ys.append(y)
-
-            self.line_series.clear()
-            for x, y in zip(xs, ys):
-                self.line_series.append(QPointF(x, y))
-
-            if xs and ys:
-                xmin, xmax = min(xs), max(xs)
-                ymin, ymax = min(ys), max(ys)
-                if xmin == xmax: xmin -= 1; xmax += 1
-                if ymin == ymax: ymin -= 0.5; ymax += 0.5
-                self.axis_x1.setRange(xmin, xmax)
-                self.axis_y1.setRange(ymin, ymax)
-                self.axis_x1.setTitleText(header[idx_flow] or "Lưu lượng")
-                self.axis_y1.setTitleText(header[idx_volt] or "Volt (V)")
-
-        except Exception as e:
-            QMessageBox.critical(self, "Lỗi CSV", f"Không thể đọc CSV: {e}")
+        if not os.path.exists(path):
+            QMessageBox.critical(self, "Lỗi CSV", f"Không tìm thấy file:\n{path}")
+            return
+        # Đọc CSV ở thread nền, widget hiện ngay
+        self.csv_loader = CsvLoadThread(path, self)
+        self.csv_loader.loaded.connect(self.apply_csv)
+        self.csv_loader.failed.connect(lambda msg: QMessageBox.critical(self, "Lỗi CSV", f"Không thể đọc CSV: {msg}"))
+        self.csv_loader.start()
+
+    def apply_csv(self, result):
+        data, points = result
+        if not points:
+            QMessageBox.warning(self, "CSV rỗng", "File CSV không có dữ liệu.")
+            return
+        self.line_series.replace(points)      # 1 lần thay cả series thay vì append từng điểm
+
+        xs, ys = data["x"], data["y"]
+        xmin, xmax = float(xs.min()), float(xs.max())
+        ymin, ymax = float(ys.min()), float(ys.max())
+        if xmin == xmax: xmin -= 1; xmax += 1
+        if ymin == ymax: ymin -= 0.5; ymax += 0.5
+        self.axis_x1.setRange(xmin, xmax)
+        self.axis_y1.setRange(ymin, ymax)
+        self.axis_x1.setTitleText(data["x_name"])
+        self.axis_y1.setTitleText(data["y_name"])
 
     def update_data(self):
         if not self.serial:
             return
         try:
-            line = self.serial.readline().decode('utf-8', errors='ignore').strip()
-            if not line: return
-            parts = line.split(",")
-            if len(parts) != 2: return
-
-            # y1 = voltage, y2 = flow
-            y2 = float(parts[1])
+            samples = read_samples(self.serial, self.calib)
+        except Exception as e:
+            print("Lỗi khi đọc dữ liệu:", e)
+            return
+        for _, y2 in samples:      # y1 = voltage, y2 = flow
 
             self.x += 1
             self.upper_series.append(QPointF(self.x, y2))
             self.lower_series.append(QPointF(self.x, 0))
-            if self.x > 50:
-                self.axis_x2.setRange(self.x - 50, self.x)
+        # Chỉ giữ SERIES_POINTS điểm gần nhất: bỏ 1 khối đầu series sau mỗi lô mẫu
+        for series in (self.upper_series, self.lower_series):
+            if series.count() > SERIES_POINTS:
+                series.removePoints(0, series.count() - SERIES_POINTS)
+        if self.x > 50:
+            self.axis_x2.setRange(self.x - 50, self.x)
+
+
+# ====================== TAB 3: Phổ (Welch trượt) ======================
+class ChartSpectrum(QWidget):
+    """Phổ điện áp: luồng STATUS của tab RealTime (SlidingWelch tăng dần) hoặc file burst .npz."""
+
+    def __init__(self):
+        super().__init__()
+        self.rate = RateMeter()
+        self.sw = None             # tạo khi đã ước lượng được tần số mẫu của luồng
+        self.frozen = False        # đang xem burst: không vẽ đè bằng phổ trực tiếp
+
+        self.series = QLineSeries()
+        self.series.setName("PSD (dB V²/Hz)")
+        self.chart = QChart()
+        self.chart.addSeries(self.series)
+        self.chart.setTitle("Phổ điện áp cảm biến")
+        self.chart.setBackgroundBrush(QColor("white"))
+        self.axis_x = QValueAxis()
+        self.axis_x.setTitleText("Tần số (Hz)")
+        self.axis_y = QValueAxis()
+        self.axis_y.setTitleText("dB (V²/Hz)")
+        self.chart.addAxis(self.axis_x, Qt.AlignBottom)
+        self.chart.addAxis(self.axis_y, Qt.AlignLeft)
+        self.series.attachAxis(self.axis_x)
+        self.series.attachAxis(self.axis_y)
+        self.view = QChartView(self.chart)
+        self.view.setRenderHint(QPainter.Antialiasing)
+
+        self.info = QLabel("Chờ dữ liệu từ tab RealTime...")
+        self.btn_open = QPushButton("Mở burst .npz")
+        self.btn_open.clicked.connect(self.open_burst)
+        self.btn_live = QPushButton("Trực tiếp")
+        self.btn_live.clicked.connect(self.go_live)
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.btn_open)
+        buttons.addWidget(self.btn_live)
+
+        root_layout = QVBoxLayout(self)
+        root_layout.addWidget(self.view)
+        root_layout.addWidget(self.info)
+        root_layout.addLayout(buttons)
+
+        # Tính phổ đã tăng dần trong feed(); timer chỉ vẽ lại
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(SPEC_REFRESH_MS)
+
+    def feed(self, t, volts):
+        self.rate.add(t, len(volts))
+        fs = self.rate.rate
+        if not fs:
+            return
+        if self.sw is None:
+            self.sw = SlidingWelch(fs, SPEC_NPERSEG, SPEC_HOP)
+        self.sw.fs = fs            # fs chỉ đổi trục tần số / thang psd, không phải tính lại khung
+        self.sw.push(volts)
+
+    def refresh(self):
+        if self.frozen or self.sw is None:
+            return
+        psd = self.sw.psd()
+        if psd is None:
+            self.info.setText(f"Đang gom {self.rate.total}/{SPEC_NPERSEG} mẫu @ {self.sw.fs:.2f} Hz")
+            return
+        self.plot(self.sw.freqs, psd, f"Trực tiếp @ {self.sw.fs:.2f} Hz, {self.sw.frames} khung", fmin=0)
+
+    def plot(self, f, psd, title, fmin=FMIN):
+        db = 10 * np.log10(np.maximum(psd[1:], 1e-20))
+        self.series.replace([QPointF(x, y) for x, y in zip(f[1:].tolist(), db.tolist())])
+        self.axis_x.setRange(0, float(f[-1]))
+        self.axis_y.setRange(float(db.min()) - 3, float(db.max()) + 3)
+        try:
+            self.info.setText(f"{title} | {fmt_result(analyze(f, psd, fmin))}")
+        except ValueError as e:
+            self.info.setText(f"{title} | {e}")
+
+    def open_burst(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Mở burst", "", "Burst (*.npz)")
+        if not path:
+            return
+        try:
+            bursts = load_bursts(path)
         except Exception as e:
-            print("Lỗi khi đọc dữ liệu:", e)
+            QMessageBox.critical(self, "Lỗi", f"Không đọc được {path}: {e}")
+            return
+        b = bursts[-1]
+        f, psd = welch(b.volts, b.rate)
+        self.frozen = True
+        self.plot(f, psd, f"{os.path.basename(path)} #{len(bursts) - 1} kênh {b.ch} @ {b.rate:.0f} Hz")
+
+    def go_live(self):
+        self.frozen = False
+        self.refresh()
 
 
 # ====================== MAIN ======================
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, port: str = SERIAL_DEV, calib=None):
         super().__init__()
         self.setWindowTitle("Đồ Án Tốt Nghiệp")
         self.resize(1000, 800)
 
         tabs = QTabWidget()
-        tabs.addTab(ChartReadData(), "Biểu đồ RealTime")
-        tabs.addTab(ChartSSData(), "Biểu đồ So sánh")
+        realtime = ChartReadData(port, calib)
+        spectrum = ChartSpectrum()
+        realtime.samples_read.connect(spectrum.feed)
+        tabs.addTab(realtime, "Biểu đồ RealTime")
+        tabs.addTab(ChartSSData(port, calib), "Biểu đồ So sánh")
+        tabs.addTab(spectrum, "Phổ")
         self.setCentralWidget(tabs)
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    w = MainWindow()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", default=SERIAL_DEV, help="Cổng serial, replay:file.cap[@tốc độ|@max] hoặc shm:maf_bus")
+    ap.add_argument("--calib", help="Bảng tra hiệu chuẩn (.npz từ calibration.py)")
+    args, qt_args = ap.parse_known_args()
+
+    calib = None
+    if args.calib:
+        from calibration import CalibrationTable
+        calib = CalibrationTable.load(args.calib)
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    w = MainWindow(args.port, calib)
     w.show()
     sys.exit(app.exec_())
 
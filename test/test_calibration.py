@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# Hiệu chuẩn: fit poly/pwl/pchip, LUT runtime, bảng tra ngược Hz và header firmware biên dịch được.
+#   python3 -m pytest -q test/test_calibration.py
+
+import sys, os, csv, shutil
+import numpy as np
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+import calibration as cal
+
+CC = shutil.which("cc") or shutil.which("gcc")
+
+
+def maf(v):
+    """Đường cong MAF giả: lưu lượng tăng kiểu hàm mũ theo điện áp (kg/h)."""
+    return 12.0 * (np.exp(1.1 * (v - 0.5)) - 1.0)
+
+
+def sweep(n=200, noise=0.5, seed=0):
+    rng = np.random.default_rng(seed)
+    v = np.sort(rng.uniform(0.8, 4.3, n))
+    return v, maf(v) + rng.normal(0.0, noise, n)
+
+
+@pytest.mark.parametrize("method", cal.METHODS)
+def test_fit_follows_curve(method):
+    v, y = sweep()
+    fit = cal.fit_curve(v, y, method)
+    grid = np.linspace(1.0, 4.0, 301)
+    rel = np.abs(fit(grid) - maf(grid)) / maf(grid).max()
+    assert rel.max() < 0.03
+    assert np.all(np.diff(fit(np.linspace(0.0, 5.0, 5001))) >= -1e-9)
+    # ngoài khoảng đã đo giữ giá trị biên, không ngoại suy
+    assert fit(0.0) == pytest.approx(float(fit(v[0])))
+    assert fit(5.0) == pytest.approx(float(fit(v[-1])))
+
+
+def test_pchip_monotonic_with_noise():
+    v, y = sweep(n=60, noise=8.0, seed=2)     # nhiễu lớn: knot lstsq có chỗ đi xuống
+    knots = cal._knots(v, 12)
+    raw, *_ = np.linalg.lstsq(cal._pwl_basis(v, knots), y, rcond=None)
+    assert np.any(np.diff(raw) < 0)
+    fit = cal.fit_curve(v, y, "pchip")
+    assert np.all(np.diff(fit(np.linspace(0.0, 5.0, 5001))) >= -1e-9)
+
+
+def test_table_flow_matches_flow_array():
+    v, y = sweep()
+    t = cal.CalibrationTable.from_fit(cal.fit_curve(v, y, "pchip"))
+    probe = np.concatenate([np.linspace(-1.0, 6.0, 7001), t.v0 + np.arange(t._n) / t._scale])
+    assert np.array_equal(np.array([t.flow(x) for x in probe]), t.flow_array(probe))
+    assert t.flow(-1.0) == t.table[0] and t.flow(6.0) == t.table[-1]
+
+
+def test_table_save_load(tmp_path):
+    v, y = sweep()
+    t = cal.CalibrationTable.from_fit(cal.fit_curve(v, y, "pwl"), unit="kg/h")
+    path = str(tmp_path / "calib.npz")
+    t.save(path)
+    t2 = cal.CalibrationTable.load(path)
+    assert np.array_equal(t2.table, t.table) and (t2.method, t2.unit) == ("pwl", "kg/h")
+
+
+@pytest.fixture
+def sweep_csv(tmp_path):
+    path = str(tmp_path / "sweep.csv")
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["hz", "rpm", "flowABB", "voltABB", "voltMaf", "analog"])
+        for hz in range(5, 61, 5):
+            w.writerow([hz, hz * 50, 0.05 * hz ** 2 + 2 * hz, 1 + hz / 30, 1 + hz / 40, 0])
+    return path
+
+
+@pytest.mark.parametrize("method", cal.METHODS)
+def test_setpoint_table_inverts_sweep(sweep_csv, tmp_path, method):
+    tab = cal.SetpointTable.from_sweeps([sweep_csv], method=method)
+    path = str(tmp_path / "tab.npz")
+    tab.save(path)
+    tab = cal.SetpointTable.load(path)
+    assert set(tab.tables) == {"flow", "rpm"} and tab.n_points == 12
+    for hz in (7.5, 20.0, 33.3, 55.0):
+        assert tab.hz_for_rpm(hz * 50) == pytest.approx(hz, abs=0.05)
+        assert tab(0.05 * hz ** 2 + 2 * hz) == pytest.approx(hz, abs=0.3)
+    lo, hi = tab.range("flow")
+    assert tab(lo - 100) == pytest.approx(5.0, abs=0.05) and tab(hi + 100) == pytest.approx(60.0, abs=0.05)
+    ff = tab.feedforward("g/s")
+    assert ff(100 / cal.KGH_PER_GS) == pytest.approx(tab(100))
+
+
+@pytest.mark.skipif(CC is None, reason="không có C compiler")
+def test_generated_header_compiles_and_matches(tmp_path):
+    v, y = sweep()
+    calib = str(tmp_path / "calib.npz")
+    cal.CalibrationTable.from_fit(cal.fit_curve(v, y, "pchip")).save(calib)
+    lut1, lut2, src = cal.model_luts(calib)
+    header = tmp_path / "maf_lut.h"
+    header.write_text(cal.render_header(lut1, lut2, src), encoding="ascii")
+    assert cal.check_header(str(header), lut1, lut2, CC) == []
+    lut2_bad = lut2.copy()
+    lut2_bad[512] += 1
+    assert cal.check_header(str(header), lut1, lut2_bad, CC)[0].startswith("FLOW2_LUT: 1 phần tử lệch")
+
+
+@pytest.mark.skipif(CC is None, reason="không có C compiler")
+def test_committed_header_matches_model():
+    lut1, lut2, _ = cal.model_luts()
+    assert cal.check_header(os.path.join(ROOT, "RS485", "maf_lut.h"), lut1, lut2, CC) == []
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# Catalog.history: mốc gốc là lần chạy sớm nhất thật của rig + cảm biến, kể cả khi lọc ngày.
+#   python3 -m pytest -q test/test_catalog.py
+
+import sys, os
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from catalog import Catalog
+
+RUNS = [  # (ngày, rig, cảm biến, voltMaf ở 40 Hz)
+    ("2024-01-10", "rig2", "maf-07", 2.00),
+    ("2024-03-05", "rig2", "maf-07", 2.04),
+    ("2024-05-20", "rig2", "maf-07", 2.10),
+    ("2024-02-01", "rig2", "maf-09", 3.00),
+    ("2024-05-21", "rig2", "maf-09", 3.03),
+]
+
+
+@pytest.fixture
+def cat(tmp_path):
+    c = Catalog(str(tmp_path / "cat.sqlite"))
+    with c.db:
+        for i, (date, rig, sensor, v) in enumerate(RUNS, 1):
+            c.db.execute("INSERT INTO runs (id, path, rig, sensor, kind, date, t_start, mtime_ns, size, ingested) "
+                         "VALUES (?, ?, ?, ?, 'sw', ?, ?, 0, 0, 0)",
+                         (i, f"/logs/{i}.csv", rig, sensor, date, f"{date} 09:00:00"))
+            c.db.execute("INSERT INTO setpoints (run_id, hz, voltMaf) VALUES (?, 40, ?)", (i, v))
+    yield c
+    c.close()
+
+
+def test_baseline_ignores_date_filter(cat):
+    rows = cat.history(40, since="2024-05-01")
+    assert [(r[0], r[5]) for r in rows] == [(3, 2.00), (5, 3.00)]
+    assert rows[0][6] == pytest.approx(5.0)
+    assert rows[1][6] == pytest.approx(1.0)
+
+
+def test_baseline_unfiltered_and_explicit(cat):
+    rows = cat.history(40, sensor="maf-07")
+    assert [r[5] for r in rows] == [2.00, 2.00, 2.00]
+    rows = cat.history(40, sensor="maf-07", since="2024-03-01", baseline=2)
+    assert [(r[0], r[5]) for r in rows] == [(2, 2.04), (3, 2.04)]
+    assert [r[0] for r in cat.drift(40, 2.5, since="2024-03-01")] == [3]
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# csv_loader.parse_csv: ô trong ngoặc kép có dấu phẩy thập phân, dòng tiêu đề trước bảng.
+#   python3 -m pytest -q test/test_csv_loader.py
+
+import sys, os
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from csv_loader import parse_csv, load_columns, sniff_delimiter
+
+
+def write(tmp_path, text):
+    p = tmp_path / "data.csv"
+    p.write_text(text, encoding="utf-8")
+    return str(p)
+
+
+@pytest.mark.parametrize("text", [
+    '"Flow (g/s)","Voltage (V)"\n"1,5","2,25"\n"3,5","2,75"\n',
+    '"Lưu lượng";"Điện áp"\n"1,5";"2,25"\n"3,5";"2,75"\n',
+    'Flow;Voltage\n"1,5";2,25\n3,5;"2,75"\n',
+])
+def test_quoted_decimal_comma(tmp_path, text):
+    d = parse_csv(write(tmp_path, text))
+    assert d["x"].tolist() == [1.5, 3.5]
+    assert d["y"].tolist() == [2.25, 2.75]
+
+
+def test_semicolon_with_title_lines(tmp_path):
+    lines = ["Báo cáo đo cảm biến MAF", "Ngày đo: 19/10/2026, bàn 2", "Flow (g/s);Voltage (V)",
+             "1,5;2,25", "3,5;2,75", "5,0;3,10"]
+    assert sniff_delimiter(lines) == ";"
+    d = parse_csv(write(tmp_path, "\n".join(lines) + "\n"))
+    assert d["x_name"] == "Flow (g/s)" and d["y_name"] == "Voltage (V)"
+    assert d["x"].tolist() == [1.5, 3.5, 5.0]
+    assert d["y"].tolist() == [2.25, 2.75, 3.1]
+
+
+def test_plain_csv_and_cache(tmp_path):
+    path = write(tmp_path, "flow,volt\n10,1.0\n20,2.0\n")
+    first = load_columns(path)
+    again = load_columns(path)
+    assert not first["cached"] and again["cached"]
+    assert again["x"].tolist() == [10.0, 20.0] and again["y"].tolist() == [1.0, 2.0]
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# CsvRecorder không làm mất dữ liệu: .part sót lại được chốt, mỗi lần save() ra file riêng.
+#   python3 -m pytest -q test/test_csv_recorder.py
+
+import sys, os, csv, threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from csv_recorder import CsvRecorder, latest_saved
+
+HEADER = ["Voltage(V)", "Flow(g/s)"]
+
+
+def read_rows(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+
+def save(rec):
+    done, out = threading.Event(), {}
+    rec.save(lambda path, n, err: (out.update(path=path, n=n, err=err), done.set()))
+    assert done.wait(5)
+    assert out["err"] is None
+    return out["path"], out["n"]
+
+
+def test_leftover_part_is_recovered(tmp_path):
+    path = str(tmp_path / "data.csv")
+    with open(path + ".part", "w", newline="") as f:
+        csv.writer(f).writerows([HEADER, ["1.5", "20.0"], ["1.6", "21.0"]])
+    rec = CsvRecorder(path, HEADER)
+    rec.close()
+    assert rec.recovered and rec.recovered != path
+    assert read_rows(rec.recovered)[1:] == [["1.5", "20.0"], ["1.6", "21.0"]]
+    assert read_rows(path + ".part") == [HEADER]
+
+
+def test_header_only_part_is_reused(tmp_path):
+    path = str(tmp_path / "data.csv")
+    with open(path + ".part", "w", newline="") as f:
+        csv.writer(f).writerow(HEADER)
+    rec = CsvRecorder(path, HEADER)
+    rec.close()
+    assert rec.recovered is None
+    assert os.listdir(tmp_path) == ["data.csv.part"]
+
+
+def test_saves_do_not_overwrite(tmp_path):
+    path = str(tmp_path / "data.csv")
+    with open(path, "w") as f:
+        f.write("old recording\n")
+    rec = CsvRecorder(path, HEADER)
+    try:
+        rec.append((1.0, 10.0))
+        p1, n1 = save(rec)
+        rec.append((2.0, 20.0))
+        rec.append((3.0, 30.0))
+        p2, n2 = save(rec)
+    finally:
+        rec.close()
+    assert len({path, p1, p2}) == 3 and (n1, n2) == (1, 2)
+    assert open(path).read() == "old recording\n"
+    assert read_rows(p1) == [HEADER, ["1.0", "10.0"]]
+    assert read_rows(p2) == [HEADER, ["2.0", "20.0"], ["3.0", "30.0"]]
+    os.utime(p2, (os.path.getmtime(p1) + 1,) * 2)
+    assert latest_saved(path) == p2
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# PID (D theo mẫu đo, chống bão hòa, giới hạn tốc độ) và StepMonitor (xác lập, vọt lố).
+#   python3 -m pytest -q test/test_flow_control.py
+
+import sys, os, threading
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from flow_control import PID, StepMonitor, FlowController
+
+TICK = 0.05
+STATUS_S = 0.2
+
+
+def test_derivative_only_on_new_measurement():
+    pid = PID(kp=0.0, ki=0.0, kd=1.0, out_min=-100, out_max=100, rate_limit=0, d_tau=0.0)
+    outs = []
+    for k in range(40):
+        t = k * TICK
+        t_meas = (k // 4) * STATUS_S            # STATUS mới mỗi 4 nhịp
+        outs.append(pid.update(0.0, 5.0 * t_meas, TICK, t_meas=t_meas))
+    # lưu lượng tăng đều 5 đơn vị/s -> D = -5 ổn định, không giật -20 ở nhịp có mẫu mới rồi về 0
+    assert outs[4:] == pytest.approx([-5.0] * 36)
+
+
+def test_anti_windup_when_output_saturated():
+    pid = PID(kp=0.1, ki=1.0, out_max=10.0, rate_limit=0)
+    for _ in range(2000):                       # 100 s đòi lưu lượng không thể đạt
+        assert pid.update(1000.0, 0.0, TICK) == 10.0
+    assert pid.i <= 10.0
+    # vượt setpoint: đầu ra rời biên ngay, không phải chờ xả tích phân
+    assert pid.update(50.0, 60.0, TICK) < 10.0
+
+
+def test_rate_limit():
+    pid = PID(kp=10.0, ki=0.0, rate_limit=6.0)
+    prev = pid.output
+    for _ in range(40):
+        u = pid.update(100.0, 0.0, TICK)
+        assert u - prev <= 6.0 * TICK + 1e-9
+        prev = u
+    assert prev == pytest.approx(40 * 6.0 * TICK)
+
+
+def test_step_monitor_settle_and_overshoot():
+    m = StepMonitor(band=0.02, abs_band=0.1, hold_s=1.0)
+    m.start(0.0, 10.0, 0.0)
+    ys = [0, 2, 5, 9, 12, 11, 10.1, 10.0, 10.05, 9.95, 10.0, 10.0]   # mỗi 0.5 s
+    reps = [m.add(0.5 * i, y) for i, y in enumerate(ys)]
+    rep = next(r for r in reps if r)
+    assert rep["settle_s"] == pytest.approx(3.0)        # vào dải ±0.2 lúc 3.0 s, giữ đủ 1 s
+    assert rep["overshoot_pct"] == pytest.approx(20.0)
+    assert rep["rise_s"] == pytest.approx(1.0)          # 10% lúc 0.5 s, 90% lúc 1.5 s
+    assert not m.active
+
+
+def test_step_monitor_timeout():
+    m = StepMonitor(hold_s=1.0, timeout_s=5.0)
+    m.start(0.0, 10.0, 0.0)
+    reps = [m.add(0.5 * i, 5.0) for i in range(11)]
+    assert reps[-1]["settle_s"] is None and not any(reps[:-1])
+
+
+def test_set_target_from_callback_does_not_deadlock():
+    clock = {"t": 0.0}
+    ctl = FlowController(lambda hz: None, clock=lambda: clock["t"])
+    ctl.on_event = lambda msg, rep=None: ctl.set_target(None)
+    ctl.feed(0.0, 0.0, 0.0)
+    ctl.set_target(0.0)                         # đã ở setpoint: StepMonitor xác lập sau SETTLE_HOLD_S
+    done = threading.Event()
+
+    def run():
+        for k in range(100):
+            clock["t"] = k * TICK
+            ctl.feed(clock["t"], 0.0, 0.0)
+            ctl.step(clock["t"])
+        done.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    assert done.wait(5)
+    assert ctl.target is None
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# SampleHistory: RAM giữ quanh ram_budget + 1 chunk, dữ liệu tràn ra file đọc lại đúng.
+#   python3 -m pytest -q test/test_history.py
+
+import sys, os, tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from history import SampleHistory
+
+N = 300_000
+CHUNK = 4096
+ROW_B = 2 * 8
+BUDGET = 4 * CHUNK * ROW_B
+
+
+def reference(n=N):
+    return np.column_stack([np.arange(n) * 0.001, np.arange(n) * 0.01])
+
+
+def test_spill_reads_back_across_chunks():
+    ref = reference()
+    h = SampleHistory(("volt", "flow"), chunk_rows=CHUNK, ram_budget=BUDGET)
+    try:
+        h.extend(ref[:N // 3])
+        for row in ref[N // 3:N // 2]:
+            h.append(*row)
+        h.extend(ref[N // 2:])
+        assert len(h) == N and h._n_spilled > 0
+        rng = np.random.default_rng(0)
+        for _ in range(200):
+            a, b = sorted(rng.integers(0, N + 1, 2))
+            assert np.array_equal(h[a:b], ref[a:b]), (a, b)
+        assert np.array_equal(h.tail(1000), ref[-1000:])
+        assert np.array_equal(h["flow"], ref[:, 1])
+    finally:
+        h.close()
+
+
+def test_memory_bound():
+    ref = reference()
+    h = SampleHistory(("volt", "flow"), chunk_rows=CHUNK, ram_budget=BUDGET)
+    tracemalloc.start()
+    try:
+        for i in range(0, N, 1000):
+            h.extend(ref[i:i + 1000])
+            assert h.memory_bytes() <= BUDGET + CHUNK * ROW_B
+        held, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        h.close()
+    data = N * ROW_B
+    # RAM được theo dõi (heap Python + NumPy) không lớn dần theo số mẫu: phần tràn nằm trong file
+    assert held < BUDGET + 2 * CHUNK * ROW_B < data / 10
+    assert peak < data / 4
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# Luật mặc định của interlock theo nhịp hỏi STATUS thật của từng script.
+#   python3 -m pytest -q test/test_interlock.py
+
+import sys, os, time, threading
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "save_data"))
+import interlock as safety
+from save_data import STATUS_PERIOD_S
+
+LINE = "STATUS hz=20 rpm=1200 run=1 hold=0 flow1=10.00 volt1=1.20 flow2=10.00 volt2=1.30 seq={} t={}"
+
+
+def drive(il, period, duration, jitter=0.3, tick=0.05):
+    """STATUS mỗi `period` giây (trả lời trễ tới `jitter`), watchdog kiểm tra mỗi `tick`."""
+    t0, seq, k = 1000.0, 0, 0
+    next_line = t0
+    for i in range(int(duration / tick)):
+        now = t0 + i * tick
+        if now >= next_line:
+            il.on_line(now, LINE.format(seq, int((now - t0) * 1000)))
+            seq += 1
+            k += 1
+            next_line = t0 + k * period + (jitter if k % 2 else 0.0)
+        il.check_stale(now)
+        if il.tripped:
+            return now - t0
+    return None
+
+
+def test_default_rules_save_data_cadence_no_trip():
+    il = safety.Interlock(safety.default_rules(STATUS_PERIOD_S))
+    assert drive(il, STATUS_PERIOD_S, 600) is None
+    assert il.trips == 0 and il.samples >= 59
+
+
+def test_default_rules_still_trip_when_status_stops():
+    il = safety.Interlock(safety.default_rules(STATUS_PERIOD_S))
+    il.on_line(0.0, LINE.format(0, 0))
+    il.check_stale(2 * STATUS_PERIOD_S - 0.1)
+    assert not il.tripped
+    il.check_stale(2 * STATUS_PERIOD_S)
+    assert il.tripped and il.tripped.startswith(f"stale>{2 * STATUS_PERIOD_S:g}")
+
+
+def test_default_stale_floor_for_fast_pollers():
+    assert "stale>5" in safety.default_rules()
+    assert "stale>5" in safety.default_rules(0.5)
+    il = safety.Interlock(safety.default_rules(1.0))
+    assert drive(il, 1.0, 60) is None
+
+
+def test_stale_trips_when_status_never_starts():
+    il = safety.Interlock(("stale>5",))
+    il.start(now=100.0)
+    il.check_stale(104.9)
+    assert not il.tripped
+    il.check_stale(105.0)
+    assert il.tripped
+    il.reset(now=200.0)           # người vận hành reset nhưng luồng STATUS vẫn chết
+    il.check_stale(204.9)
+    assert not il.tripped
+    il.check_stale(205.0)
+    assert il.tripped and il.trips == 2
+    il.close()
+
+
+class RecordingSerial:
+    """Cổng giả: ghi lại thứ tự các lần write; mỗi lần ghi mất ~0.1 ms như trên dây."""
+
+    def __init__(self):
+        self.log = []
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        time.sleep(0.0001)
+        with self._lock:
+            self.log.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_no_unsafe_command_after_estop():
+    fake = RecordingSerial()
+    il = safety.Interlock(("volt2>=4.5",), watchdog_s=1.0)
+    port = safety.GuardedPort(fake, il)
+    stop = threading.Event()
+
+    def sender(cmd):
+        while not stop.is_set():
+            port.write(cmd)
+
+    threads = [threading.Thread(target=sender, args=(c,), daemon=True)
+               for c in (b"RUN\n", b"SET_HZ 23\n", b"SET_HZ 24\n")]
+    for th in threads:
+        th.start()
+    bad = LINE.replace("volt2=1.30", "volt2=4.60")
+    try:
+        for k in range(200):
+            time.sleep(0.0005)
+            il.on_line(time.monotonic(), bad.format(k, k))
+            assert il.tripped
+            time.sleep(0.0005)
+            with port._wlock:         # mốc reset trong log, cùng thứ tự với các lần ghi
+                fake.log.append(b"<reset>")
+                il.reset()
+    finally:
+        stop.set()
+        for th in threads:
+            th.join()
+        port.close()
+    assert fake.log.count(safety.ESTOP_BYTES) == 200
+    tripped = False
+    for data in fake.log:
+        if data in (safety.ESTOP_BYTES, b"<reset>"):
+            tripped = data == safety.ESTOP_BYTES
+        elif tripped:
+            assert data.split()[0].decode() in safety.SAFE_CMDS, f"{data!r} lọt qua sau ESTOP"
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# LogWriter ghi tiếp vào file có sẵn: cùng header thì nối, khác header thì chuyển file cũ đi.
+#   python3 -m pytest -q test/test_log_writer.py
+
+import sys, os, csv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from log_writer import LogWriter
+from batch_analyze import load_run
+
+OLD = ["t", "seq", "t_dev_ms", "hz", "rpm", "flow1", "volt1", "flow2", "volt2"]
+NEW = ["t", "t_dev", "seq", "t_dev_ms", "hz", "rpm", "flow1", "volt1", "flow2", "volt2"]
+
+
+def rows(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_append_same_header(tmp_path):
+    path = str(tmp_path / "runlog.csv")
+    for i in range(2):
+        lw = LogWriter(path, NEW)
+        lw.writerow([i, i, i, i, 20, 1200, 1, 1, 1, 1])
+        lw.close()
+        assert lw.moved is None
+    r = rows(path)
+    assert r[0] == NEW and len(r) == 3
+
+
+def test_header_mismatch_moves_old_file(tmp_path):
+    path = str(tmp_path / "runlog.csv")
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerows([OLD, [1.0, 1, 1000, 20, 1200, 1, 1, 1, 1]])
+    lw = LogWriter(path, NEW)
+    lw.writerow([2.0, 2.0, 2, 2000, 20, 1200, 1, 1, 1, 1])
+    lw.close()
+    assert lw.moved and lw.moved != path
+    assert rows(lw.moved)[0] == OLD and len(rows(lw.moved)) == 2
+    assert rows(path)[0] == NEW and len(rows(path)) == 2
+    kind, cols = load_run(path)
+    assert kind == "log" and cols["t_dev"].tolist() == [2.0]
+
+
+def test_tell_counts_utf8_bytes(tmp_path):
+    path = str(tmp_path / "runlog.csv")
+    lw = LogWriter(path, ["t", "ghi chú"])
+    lw.writerow([1.0, "lưu lượng µ"])
+    lw.close()
+    assert lw.tell() == os.path.getsize(path)
+    lw = LogWriter(path, ["t", "ghi chú"])       # mở lại nối tiếp: mốc bắt đầu từ kích thước file
+    lw.writerows([[2.0, "điện áp"], [3.0, "ổn định"]])
+    lw.close()
+    assert lw.tell() == os.path.getsize(path)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# Rollup.query khi không cho t0 (toàn bộ lịch sử) phải chọn tầng mịn nhất đủ dày.
+#   python3 -m pytest -q test/test_rollup.py
+
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rollup import Rollup
+
+HOUR0 = 1_760_000_400.0          # mốc tròn giờ
+START = HOUR0 + 17 * 60 + 23.5   # log bắt đầu giữa giờ, không trùng mốc bucket 1 phút
+
+
+def make(tmp_path, seconds):
+    r = Rollup(str(tmp_path / "log.rollup.sqlite"), ("hz", "flow1"))
+    for i in range(seconds):
+        r.add(START + i, (20, 10.0 + i % 7))
+    r.flush()
+    return r
+
+
+def test_query_whole_history_uses_fine_tier(tmp_path):
+    r = make(tmp_path, 3000)          # 50 phút: raw / 1 s quá max_points, 1 phút vừa
+    try:
+        assert r.bounds()[0] == START
+        tier, d = r.query("flow1", max_points=2000)
+        assert tier == "1m"
+        assert d["t"][0] == HOUR0 + 17 * 60          # gồm cả bucket chứa mẫu đầu
+        assert d["n"].sum() == 3000
+    finally:
+        r.close()
+
+
+def test_query_short_log_returns_raw(tmp_path):
+    r = make(tmp_path, 600)
+    try:
+        tier, d = r.query("flow1", max_points=2000)
+        assert tier == "raw" and len(d["t"]) == 600 and d["t"][0] == START
+    finally:
+        r.close()
+
+
+def test_query_empty(tmp_path):
+    r = Rollup(str(tmp_path / "empty.rollup.sqlite"), ("hz",))
+    try:
+        tier, d = r.query("hz")
+        assert len(d["t"]) == 0
+    finally:
+        r.close()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# run.py --mode fixed --flow/--rpm chạy thật với simulator.py (pty): Hz tra bảng là số lẻ.
+#   python3 -m pytest -q test/test_run_target.py
+
+import sys, os, csv, time, subprocess
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+from calibration import SetpointTable
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="simulator.py cần pty")
+
+
+@pytest.fixture
+def sim(tmp_path):
+    link = str(tmp_path / "maf_sim")
+    p = subprocess.Popen([sys.executable, os.path.join(ROOT, "simulator.py"), "--link", link,
+                          "--no-auto-inc", "--seed", "1", "--quiet"],
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 5
+    while not os.path.exists(link) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    yield link
+    p.terminate()
+    p.wait(5)
+
+
+@pytest.fixture
+def hz_table(tmp_path):
+    sweep = tmp_path / "sweep.csv"
+    with open(sweep, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["hz", "rpm", "flowABB", "voltABB", "voltMaf", "analog"])
+        for hz in range(5, 61, 5):
+            w.writerow([hz, hz * 50, hz * 6.48, 1 + hz / 30, 1 + hz / 40, 0])
+    path = str(tmp_path / "tab.npz")
+    SetpointTable.from_sweeps([str(sweep)]).save(path)
+    return path
+
+
+@pytest.mark.parametrize("target", [["--flow", "100"], ["--rpm", "777"]])
+def test_fixed_mode_fractional_hz(sim, hz_table, tmp_path, target):
+    out = str(tmp_path / "run.csv")
+    r = subprocess.run([sys.executable, os.path.join(ROOT, "save_data", "run.py"), "--port", sim,
+                        "--mode", "fixed", *target, "--hz-table", hz_table,
+                        "--duration", "3", "--avg-window", "1", "--csv", out],
+                       capture_output=True, text=True, timeout=30)
+    assert r.returncode == 0, r.stdout + r.stderr
+    hz = SetpointTable.load(hz_table).hz_for(target[0][2:], float(target[1]))
+    assert not float(round(hz, 2)).is_integer()
+    assert f"[READ] hz={round(hz, 2):g} " in r.stdout
+    with open(out, newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0][0] == "hz" and len(rows) > 1
+    assert all(float(row[0]) == round(hz, 2) for row in rows[1:])
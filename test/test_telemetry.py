@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# Log nhị phân: mỗi đoạn mang mốc (epoch, monotonic) -> read_binlog trả giờ epoch "t".
+#   python3 -m pytest -q test/test_telemetry.py
+
+import sys, os, time
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from telemetry import parse_status, read_binlog, BinLogWriter, BIN_MAGIC
+
+LINE = "STATUS hz=20 rpm=1200 run=1 hold=0 flow1=10.00 volt1=1.20 flow2=10.00 volt2=1.30 seq={} t={}"
+
+
+def write_segment(path, base, t_hosts, seq0=0):
+    w = BinLogWriter(path, base)
+    for k, t in enumerate(t_hosts):
+        w.write(parse_status(LINE.format(seq0 + k, 1000 * k), t_host=t))
+    w.close()
+
+
+def test_epoch_from_segment_base(tmp_path):
+    path = str(tmp_path / "log.bin")
+    write_segment(path, (1_760_000_000.0, 500.0), [500.25, 501.25, 502.5])
+    write_segment(path, (1_760_086_400.0, 20.0), [20.0, 21.0])      # máy khởi động lại: monotonic về gần 0
+    recs = list(read_binlog(path))
+    assert [r["t"] for r in recs] == pytest.approx(
+        [1_760_000_000.25, 1_760_000_001.25, 1_760_000_002.5, 1_760_086_400.0, 1_760_086_401.0])
+    assert [r["t_host"] for r in recs] == pytest.approx([500.25, 501.25, 502.5, 20.0, 21.0])
+    assert [r["seq"] for r in recs] == [0, 1, 2, 0, 1]
+
+
+def test_default_base_is_now(tmp_path):
+    path = str(tmp_path / "log.bin")
+    now = time.monotonic()
+    write_segment(path, None, [now, now + 1.0])
+    recs = list(read_binlog(path))
+    assert recs[0]["t"] == pytest.approx(time.time(), abs=1.0)
+    assert recs[1]["t"] - recs[0]["t"] == pytest.approx(1.0)
+
+
+def test_old_segment_without_base(tmp_path):
+    path = str(tmp_path / "log.bin")
+    write_segment(path, (1_760_000_000.0, 0.0), [3.0])
+    with open(path, "rb") as f:
+        buf = f.read()
+    with open(path, "wb") as f:            # đoạn do bản cũ ghi: marker 0x00, không có mốc
+        f.write(BIN_MAGIC + b"\x00" + buf[len(BIN_MAGIC) + 1 + 16:])
+    recs = list(read_binlog(path))
+    assert len(recs) == 1 and recs[0]["t"] is None and recs[0]["t_host"] == pytest.approx(3.0)
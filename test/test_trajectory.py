@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# trajectory.py --run với simulator.py (pty) bật hzIncrease: giữ mức không bị trôi +1 Hz / 2 s.
+#   python3 -m pytest -q test/test_trajectory.py
+
+import sys, os, csv, time, subprocess
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="simulator.py cần pty")
+
+
+@pytest.fixture
+def sim(tmp_path):
+    link = str(tmp_path / "maf_sim")
+    p = subprocess.Popen([sys.executable, os.path.join(ROOT, "simulator.py"), "--link", link,
+                          "--seed", "1", "--quiet"],
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 5
+    while not os.path.exists(link) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    yield link
+    p.terminate()
+    p.wait(5)
+
+
+def test_hold_does_not_drift_with_auto_increment(sim, tmp_path):
+    out = str(tmp_path / "traj.csv")
+    r = subprocess.run([sys.executable, os.path.join(ROOT, "trajectory.py"), "--port", sim,
+                        "--run", "--from", "0", "--to", "10", "--hold", "5", "--stop", "--csv", out],
+                       capture_output=True, text=True, timeout=60)
+    assert r.returncode == 0, r.stdout + r.stderr
+    assert "HOLD_STOP OFF" in r.stdout and "không xác nhận" not in r.stdout
+    with open(out, newline="") as f:
+        rows = list(csv.DictReader(f))
+    hold = [row for row in rows if float(row["hz_cmd"]) == 10.0 and row["hz_rep"]]
+    assert len(hold) > 20
+    # vài nhịp đầu STATUS còn báo mức cũ; sau đó báo cáo phải bám đúng lệnh tới hết pha giữ
+    assert all(float(row["hz_rep"]) == 10.0 for row in hold[-20:])
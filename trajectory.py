@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Quỹ đạo tần số S-curve (giới hạn jerk) chạy trên host, gửi SET_HZ nội suy theo nhịp cố định.
+#
+# Thay cho hzIncrease(1, 2000) của firmware (+1 Hz mỗi 2 s) và --ramp-step/--ramp-interval
+# của run.py (nhảy bậc): Hz đi theo đường 7 đoạn (jerk ±J, gia tốc ≤ A, tốc độ ≤ V) từ
+# nghỉ tới nghỉ, nên vừa nhanh hơn vừa không giật biến tần.
+#
+# - Nhịp gửi (tick) được chọn theo độ trễ thật của 1 chu kỳ "SET_HZ → OK SET_HZ" +
+#   "STATUS → STATUS" (ghi Modbus + đọc về), đo trước khi chạy: mỗi nhịp có đúng 1
+#   lệnh ghi đang chờ, không dồn hàng đợi ở Arduino.
+# - Mỗi nhịp ghi 1 dòng CSV: Hz lệnh, Hz Arduino báo lại, sai lệch, thời gian ghi.
+#
+#   python3 trajectory.py --plan 0 50 20 --v-max 8 --a-max 6 --j-max 12       -> chỉ in kế hoạch
+#   python3 trajectory.py --port /dev/ttyACM0 --to 50 20 --hold 10 --csv traj.csv
+#   python3 trajectory.py --port mux:/tmp/maf_mux.sock --to 35               (chạy song song main.py)
+
+import sys, math, time, queue, signal, argparse, threading
+
+from telemetry import STATUS_RE, parse_hz
+import log_writer
+import interlock as safety
+
+HZ_MIN, HZ_MAX = 0.0, 60.0
+V_MAX = 8.0                 # Hz/s
+A_MAX = 6.0                 # Hz/s²
+J_MAX = 12.0                # Hz/s³
+HZ_RES = 0.01               # độ phân giải SET_HZ của firmware
+
+MIN_TICK_S = 0.05
+DEFAULT_TICK_S = 0.2        # khi không đo được độ trễ (vd phát lại capture)
+TICK_MARGIN = 1.25          # tick = p95 chu kỳ ghi+đọc × hệ số này
+LATENCY_PROBES = 8
+REPLY_TIMEOUT_S = 1.0
+
+FW_RAMP_S_PER_HZ = 2.0      # hzIncrease(1, 2000) của firmware
+
+
+# ====== Lập quỹ đạo ======
+def scurve_phases(dist, v_max=V_MAX, a_max=A_MAX, j_max=J_MAX):
+    """[(dt, jerk)] của profile 7 đoạn đối xứng đi quãng dist ≥ 0 từ nghỉ tới nghỉ."""
+    if dist <= 0:
+        return []
+    if v_max * j_max >= a_max ** 2:
+        tj, ta = a_max / j_max, a_max / j_max + v_max / a_max
+    else:
+        tj = math.sqrt(v_max / j_max)
+        ta = 2 * tj
+    tv = dist / v_max - ta
+    if tv < 0:
+        # Quãng ngắn: không có đoạn tốc độ đều, tốc độ đỉnh < v_max
+        tv = 0.0
+        if dist >= 2 * a_max ** 3 / j_max ** 2:
+            tj = a_max / j_max
+            ta = tj / 2 + math.sqrt((tj / 2) ** 2 + dist / a_max)
+        else:
+            tj = (dist / (2 * j_max)) ** (1 / 3)
+            ta = 2 * tj
+    tc = max(0.0, ta - 2 * tj)
+    return [(tj, j_max), (tc, 0.0), (tj, -j_max), (tv, 0.0), (tj, -j_max), (tc, 0.0), (tj, j_max)]
+
+
+class SCurve:
+    """Một đoạn h0 -> h1; gọi seg(t) -> Hz (t tính từ đầu đoạn, kẹp về [0, duration])."""
+
+    def __init__(self, h0, h1, v_max=V_MAX, a_max=A_MAX, j_max=J_MAX):
+        self.h0, self.h1 = float(h0), float(h1)
+        sign = 1.0 if h1 >= h0 else -1.0
+        self.phases = [(dt, sign * j) for dt, j in scurve_phases(abs(h1 - h0), v_max, a_max, j_max) if dt > 0]
+        # Trạng thái (t, p, v, a) ở đầu mỗi đoạn jerk hằng
+        self._knots = []
+        t, p, v, a = 0.0, self.h0, 0.0, 0.0
+        for dt, j in self.phases:
+            self._knots.append((t, p, v, a, j))
+            p += v * dt + a * dt * dt / 2 + j * dt ** 3 / 6
+            v += a * dt + j * dt * dt / 2
+            a += j * dt
+            t += dt
+        self.duration = t
+        self.v_peak = max((abs(k[2]) for k in self._knots), default=0.0)
+        self.a_peak = max((abs(k[3]) for k in self._knots), default=0.0)
+
+    def __call__(self, t):
+        if t >= self.duration:
+            return self.h1
+        if t <= 0:
+            return self.h0
+        for t0, p, v, a, j in reversed(self._knots):
+            if t >= t0:
+                dt = t - t0
+                return p + v * dt + a * dt * dt / 2 + j * dt ** 3 / 6
+        return self.h0
+
+
+class Trajectory:
+    """Chuỗi setpoint: S-curve giữa các mức, giữ hold_s giây ở mỗi mức."""
+
+    def __init__(self, start_hz, targets, hold_s=0.0, v_max=V_MAX, a_max=A_MAX, j_max=J_MAX):
+        self.segments = []          # [(t_bắt_đầu, SCurve)]
+        t, h = 0.0, _clamp_hz(start_hz)
+        for target in targets:
+            seg = SCurve(h, _clamp_hz(target), v_max, a_max, j_max)
+            self.segments.append((t, seg))
+            t += seg.duration + hold_s
+            h = seg.h1
+        self.final_hz = h
+        self.duration = t
+
+    def __call__(self, t):
+        hz = self.segments[0][1].h0 if self.segments else self.final_hz
+        for t0, seg in self.segments:
+            if t < t0:
+                break
+            hz = seg(t - t0)
+        return hz
+
+    def sample(self, tick):
+        n = int(math.ceil(self.duration / tick))
+        return [(k * tick, self(k * tick)) for k in range(n + 1)]
+
+
+def _clamp_hz(hz):
+    return min(HZ_MAX, max(HZ_MIN, float(hz)))
+
+
+def quantize(hz):
+    return round(round(hz / HZ_RES) * HZ_RES, 2)
+
+
+def compare_ramps(h0, h1, seg, ramp_step=5, ramp_interval=10.0):
+    """Thời gian đi h0 -> h1: S-curve so với firmware +1 Hz/2 s và ramp bậc của run.py."""
+    d = abs(h1 - h0)
+    return {"scurve": seg.duration, "firmware": math.ceil(d) * FW_RAMP_S_PER_HZ,
+            "run.py": math.ceil(d / ramp_step) * ramp_interval if d else 0.0}
+
+
+# ====== Gửi lệnh / đọc trả lời ======
+class LineReader(threading.Thread):
+    def __init__(self, ser, q):
+        super().__init__(daemon=True)
+        self.ser, self.q = ser, q
+        self._run = True
+
+    def stop(self):
+        self._run = False
+
+    def run(self):
+        while self._run:
+            try:
+                raw = self.ser.readline()
+            except Exception as e:
+                self.q.put((time.monotonic(), f"__ERR__ {e}"))
+                time.sleep(0.2)
+                continue
+            line = raw.decode("utf-8", errors="ignore").strip() if raw else ""
+            if line:
+                self.q.put((time.monotonic(), line))
+
+
+def send_cmd(ser, cmd):
+    ser.write((cmd.strip() + "\n").encode("utf-8"))
+    ser.flush()
+
+
+def await_reply(q, want, deadline):
+    """Chờ dòng bắt đầu bằng một tiền tố trong want (hoặc ERR) tới deadline; trả (t, dòng) hay None."""
+    while True:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            return None
+        try:
+            t, line = q.get(timeout=left)
+        except queue.Empty:
+            return None
+        if line.startswith(want) or line.startswith("ERR"):
+            return t, line
+
+
+def measure_cycle(ser, q, hz, n=LATENCY_PROBES):
+    """Đo n chu kỳ SET_HZ(hz hiện tại) + STATUS; trả list giây (bỏ các lần không có trả lời)."""
+    out = []
+    for _ in range(n):
+        t0 = time.monotonic()
+        send_cmd(ser, f"SET_HZ {hz:.2f}")
+        if not await_reply(q, ("OK SET_HZ",), t0 + REPLY_TIMEOUT_S):
+            if not out:
+                break               # không có trả lời ngay lần đầu (capture / firmware cũ): thôi đo
+            continue
+        send_cmd(ser, "STATUS")
+        r = await_reply(q, ("STATUS",), t0 + 2 * REPLY_TIMEOUT_S)
+        if r:
+            out.append(r[0] - t0)
+    return out
+
+
+def tick_from_latency(samples):
+    if not samples:
+        return DEFAULT_TICK_S
+    s = sorted(samples)
+    p95 = s[min(len(s) - 1, int(math.ceil(0.95 * len(s))) - 1)]
+    return max(MIN_TICK_S, math.ceil(p95 * TICK_MARGIN * 100) / 100)
+
+
+def current_status(ser, q):
+    """(hz, hold) hiện tại từ 1 STATUS; (None, None) nếu không có trả lời."""
+    send_cmd(ser, "STATUS")
+    r = await_reply(q, ("STATUS",), time.monotonic() + REPLY_TIMEOUT_S)
+    m = STATUS_RE.search(r[1]) if r else None
+    return (parse_hz(m.group("hz")), m.group("hold") == "1") if m else (None, None)
+
+
+def set_hold(ser, q, on):
+    """HOLD_STOP ON|OFF: tắt/bật hzIncrease(1, 2000) của firmware; True nếu firmware xác nhận."""
+    send_cmd(ser, f"HOLD_STOP {'ON' if on else 'OFF'}")
+    r = await_reply(q, ("OK HOLD_STOP", "ERR"), time.monotonic() + REPLY_TIMEOUT_S)
+    return bool(r) and r[1].startswith("OK")
+
+
+class TrajectoryStreamer:
+    """Phát quỹ đạo: mỗi tick gửi SET_HZ (khi đổi ≥ 0.01 Hz) + STATUS, ghi lệnh vs báo cáo.
+
+    Khi Hz báo về lệch lệnh cuối (firmware tự tăng, lệnh bị mất...) thì gửi lại SET_HZ ở nhịp
+    sau, kể cả lúc đang giữ mức.
+    """
+
+    HEADER = ["t", "hz_cmd", "hz_rep", "err_hz", "write_ms", "rpm", "flow1", "flow2", "late"]
+
+    def __init__(self, ser, q, traj, tick, log=None, should_stop=lambda: False):
+        self.ser, self.q = ser, q
+        self.traj = traj
+        self.tick = tick
+        self.log = log
+        self.should_stop = should_stop
+        self.sent = self.ticks = self.late = self.missing = self.reasserts = 0
+        self.err_max = 0.0
+        self.write_ms = []
+
+    def run(self):
+        t0 = time.monotonic()
+        last = rep = None
+        k = 0
+        while not self.should_stop():
+            due = t0 + k * self.tick
+            now = time.monotonic()
+            if now < due:
+                time.sleep(due - now)
+            t = k * self.tick
+            hz = quantize(self.traj(t))
+            write_ms = ""
+            t_send = time.monotonic()
+            drift = hz == last and rep is not None and abs(rep - hz) >= HZ_RES / 2
+            if hz != last or drift:
+                self.reasserts += drift
+                send_cmd(self.ser, f"SET_HZ {hz:.2f}")
+                last = hz
+                self.sent += 1
+                r = await_reply(self.q, ("OK SET_HZ",), due + self.tick)
+                if r:
+                    write_ms = round((r[0] - t_send) * 1000, 1)
+                    self.write_ms.append(write_ms)
+            send_cmd(self.ser, "STATUS")
+            r = await_reply(self.q, ("STATUS",), due + self.tick)
+            m = STATUS_RE.search(r[1]) if r else None
+            rep = None
+            late = time.monotonic() > due + self.tick
+            self.late += late
+            self.ticks += 1
+            if m:
+                rep = parse_hz(m.group("hz"))
+                err = round(rep - hz, 2)
+                self.err_max = max(self.err_max, abs(err))
+                row = [round(t, 3), hz, rep, err, write_ms, m.group("rpm"), m.group("flow1"), m.group("flow2"), int(late)]
+            else:
+                self.missing += 1
+                row = [round(t, 3), hz, "", "", write_ms, "", "", "", int(late)]
+            if self.log:
+                self.log.writerow(row)
+                self.log.tick()
+            if t >= self.traj.duration:
+                break
+            k += 1
+            # Trễ quá 1 nhịp: dời lịch, không bắn dồn
+            if time.monotonic() > t0 + k * self.tick + self.tick:
+                t0 = time.monotonic() - k * self.tick
+        return last
+
+    def report(self):
+        w = sorted(self.write_ms)
+        p95 = w[int(0.95 * (len(w) - 1))] if w else float("nan")
+        return (f"{self.ticks} nhịp × {self.tick * 1000:.0f} ms | SET_HZ gửi {self.sent} "
+                f"(gửi lại {self.reasserts}) | trễ nhịp {self.late} | "
+                f"mất STATUS {self.missing} | |lệnh - báo cáo| max {self.err_max:.2f} Hz | ghi p95 {p95:.0f} ms")
+
+
+# ====== CLI ======
+def print_plan(traj, tick):
+    print(f"🎯 {len(traj.segments)} đoạn, tổng {traj.duration:.2f} s, tick {tick * 1000:.0f} ms")
+    for t0, seg in traj.segments:
+        c = compare_ramps(seg.h0, seg.h1, seg)
+        print(f"  {seg.h0:5.2f} → {seg.h1:5.2f} Hz @ {t0:6.2f}s: {seg.duration:5.2f} s "
+              f"(v đỉnh {seg.v_peak:.2f} Hz/s, a đỉnh {seg.a_peak:.2f} Hz/s²) | "
+              f"firmware +1Hz/2s {c['firmware']:.0f} s, run.py ramp {c['run.py']:.0f} s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Ramp S-curve giới hạn jerk, gửi SET_HZ theo nhịp cố định.")
+    ap.add_argument("--port", help="Cổng (xem ports.py); bỏ trống cùng --plan để chỉ in kế hoạch")
+    ap.add_argument("--baud", type=int, default=115200)
+    ap.add_argument("--plan", type=float, nargs="+", metavar="HZ", help="Chỉ lập kế hoạch: Hz đầu rồi các mức đích")
+    ap.add_argument("--to", type=float, nargs="+", metavar="HZ", help="Các mức Hz đích (lần lượt)")
+    ap.add_argument("--from", dest="start", type=float, help="Hz xuất phát (mặc định: hỏi STATUS)")
+    ap.add_argument("--hold", type=float, default=0.0, help="Giây giữ ở mỗi mức")
+    ap.add_argument("--v-max", type=float, default=V_MAX, help="Tốc độ tối đa (Hz/s)")
+    ap.add_argument("--a-max", type=float, default=A_MAX, help="Gia tốc tối đa (Hz/s²)")
+    ap.add_argument("--j-max", type=float, default=J_MAX, help="Jerk tối đa (Hz/s³)")
+    ap.add_argument("--tick", type=float, help="Nhịp gửi cố định (giây); mặc định đo độ trễ ghi Modbus")
+    ap.add_argument("--run", action="store_true", help="Gửi RESET + RUN trước khi chạy")
+    ap.add_argument("--stop", action="store_true", help="Về 0 Hz và STOP khi xong")
+    ap.add_argument("--csv", default="trajectory.csv", help="CSV lệnh vs báo cáo mỗi nhịp")
+    log_writer.add_arguments(ap)
+    safety.add_arguments(ap)
+    args = ap.parse_args()
+    if min(args.v_max, args.a_max, args.j_max) <= 0:
+        ap.error("--v-max/--a-max/--j-max phải > 0")
+
+    if args.plan:
+        traj = Trajectory(args.plan[0], args.plan[1:], args.hold, args.v_max, args.a_max, args.j_max)
+        print_plan(traj, args.tick or DEFAULT_TICK_S)
+        return 0
+    if not (args.port and args.to):
+        ap.error("cần --port và --to (hoặc --plan để chỉ in kế hoạch)")
+    stop_flag = {"v": False}
+    try:
+        il = safety.from_args(args, on_trip=lambda reason, lat: (
+            print(f"⛔ [INTERLOCK] {reason} → STOP sau {lat * 1000:.1f} ms"), stop_flag.update(v=True)))
+    except ValueError as e:
+        ap.error(str(e))
+
+    from ports import open_port
+    try:
+        ser = open_port(args.port, args.baud, timeout=0.2)
+    except Exception as e:
+        print(f"❌ Không mở được cổng {args.port}: {e}")
+        return 1
+    ser = safety.guard(ser, il)
+    q = queue.Queue()
+    reader = LineReader(ser, q)
+    reader.start()
+    if args.run:
+        send_cmd(ser, "RESET")
+        time.sleep(0.2)
+        send_cmd(ser, "RUN")
+        await_reply(q, ("OK RUN",), time.monotonic() + REPLY_TIMEOUT_S)
+
+    hz_now, hold0 = current_status(ser, q)
+    # Giữ tần số firmware (HOLD_STOP ON) trong lúc phát, không thì hzIncrease +1 Hz mỗi 2 s
+    # cộng dồn vào quỹ đạo; trả lại trạng thái cũ khi thoát
+    hold_set = not hold0 and set_hold(ser, q, True)
+    if not hold0 and not hold_set:
+        print("⚠️ Firmware không xác nhận HOLD_STOP ON — sai lệch do tự tăng Hz sẽ được gửi lại SET_HZ")
+    start = args.start if args.start is not None else hz_now
+    if start is None:
+        print("⚠️ Không đọc được Hz hiện tại (STATUS) — dùng --from; tạm coi là 0 Hz")
+        start = 0.0
+    tick = args.tick
+    if not tick:
+        samples = measure_cycle(ser, q, start)
+        tick = tick_from_latency(samples)
+        if samples:
+            print(f"⏱️ Chu kỳ SET_HZ + STATUS: {len(samples)} lần, "
+                  f"{min(samples) * 1000:.0f}..{max(samples) * 1000:.0f} ms → tick {tick * 1000:.0f} ms")
+        else:
+            print(f"⚠️ Không đo được độ trễ ghi (không có OK SET_HZ) → tick mặc định {tick * 1000:.0f} ms")
+    traj = Trajectory(start, args.to, args.hold, args.v_max, args.a_max, args.j_max)
+    print_plan(traj, tick)
+
+    def on_sig(sig, frame):
+        stop_flag["v"] = True
+    signal.signal(signal.SIGINT, on_sig)
+    signal.signal(signal.SIGTERM, on_sig)
+
+    log = log_writer.from_args(args.csv, TrajectoryStreamer.HEADER, args)
+    streamer = TrajectoryStreamer(ser, q, traj, tick, log, lambda: stop_flag["v"])
+    try:
+        last = streamer.run()
+        if il and il.tripped:
+            print(f"⛔ Interlock đã STOP biến tần: {il.tripped}")
+        elif stop_flag["v"]:
+            print(f"↩️ Dừng giữa chừng — biến tần giữ lệnh cuối {last} Hz")
+    finally:
+        log.close()
+        print(f"🏁 {streamer.report()}")
+        if il:
+            print(f"[SAFETY] {il.report()}")
+        print(f"🧾 {args.csv}")
+        if args.stop:
+            send_cmd(ser, "SET_HZ 0")
+            time.sleep(0.1)
+            send_cmd(ser, "STOP")
+        if hold_set:
+            set_hold(ser, q, False)
+            print("↩️ HOLD_STOP OFF (trả lại trạng thái trước khi chạy)")
+        reader.stop()
+        ser.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())